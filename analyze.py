@@ -0,0 +1,473 @@
+#!/usr/bin/env python
+"""
+Bulk analysis for Productivity Engines
+
+Runs an agent over every row of a CSV or JSONL file without going through
+the HTTP API. It handles:
+1. Streaming the input rows (the file is never loaded into memory)
+2. Running the agent on a bounded number of rows at once, through the
+   same per-agent pool the server uses
+3. Appending one JSON line per row to the output as soon as it finishes
+4. Checkpointing progress, so a crash or Ctrl+C resumes where it stopped
+5. Printing live throughput and ETA
+
+Each row is a request for the agent (for the marketing agent:
+business_name, website_url and optionally model, temperature, ...). CSV
+files need a header row; empty cells are left out so defaults apply.
+Output lines look like
+{"row": 12, "id": ..., "status": "ok", "response": {...}}, or carry
+"error" instead of "response"; they are written in completion order.
+
+Resuming: the checkpoint records the output size it covers, and the
+output past that point is read back on start, so every row ends up in the
+output exactly once. Ctrl+C finishes the rows in flight first; a second
+Ctrl+C abandons them (they are run again on resume).
+
+Examples:
+    python analyze.py businesses.csv -o results.jsonl
+    python analyze.py businesses.jsonl -o results.jsonl --concurrency 16
+    python analyze.py businesses.csv -o results.jsonl --restart
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import signal
+import asyncio
+import argparse
+from collections import deque
+from typing import Any, Dict, Iterator, Optional, Set, Tuple
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Get the path to the backend agents package
+backend_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend")
+
+# Exit code of an interrupted run (resume by running the same command again)
+EXIT_INTERRUPTED = 130
+
+
+def parse_args(argv=None):
+    """Parse command line options, defaulting to environment settings."""
+    parser = argparse.ArgumentParser(description="Analyze a CSV or JSONL file of businesses")
+    parser.add_argument("input", help="CSV or JSONL file with one request per row")
+    parser.add_argument("-o", "--output", required=True, help="JSONL file results are appended to")
+    parser.add_argument("--format", choices=["csv", "jsonl"],
+                        help="Input format (default: from the file extension)")
+    parser.add_argument("--agent", default="marketing", help="Agent to run (default marketing)")
+    parser.add_argument("--id-field", default="id",
+                        help="Input field copied to each result to identify it (default id)")
+    parser.add_argument("--concurrency", type=int, default=int(os.environ.get("BULK_CONCURRENCY", "8")),
+                        help="Rows analyzed at once (BULK_CONCURRENCY, default 8)")
+    parser.add_argument("--retries", type=int, default=int(os.environ.get("BULK_RETRIES", "2")),
+                        help="Extra attempts for rows that fail (BULK_RETRIES, default 2)")
+    parser.add_argument("--checkpoint", help="Checkpoint file (default: the output path + .checkpoint)")
+    parser.add_argument("--checkpoint-interval", type=float, default=5.0,
+                        help="Seconds between checkpoint writes (default 5)")
+    parser.add_argument("--progress-interval", type=float, default=2.0,
+                        help="Seconds between progress lines (default 2)")
+    parser.add_argument("--no-count", dest="count", action="store_false",
+                        help="Don't count the input rows up front (no ETA)")
+    parser.add_argument("--restart", action="store_true",
+                        help="Discard the output and checkpoint and start from the first row")
+    return parser.parse_args(argv)
+
+
+def input_format(options) -> str:
+    if options.format:
+        return options.format
+    return "csv" if options.input.lower().endswith(".csv") else "jsonl"
+
+
+# ----------------------------------------------------------------
+# Input
+# ----------------------------------------------------------------
+def read_rows(path: str, fmt: str) -> Iterator[Tuple[int, Any]]:
+    """
+    Stream the input rows.
+
+    Yields:
+        Tuples of (row number from 0, request dict); a row that can't be
+        parsed yields an error message instead of a dict
+    """
+    if fmt == "csv":
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            for row, record in enumerate(csv.DictReader(f)):
+                yield row, {key: value for key, value in record.items() if key and value not in (None, "")}
+        return
+
+    with open(path, encoding="utf-8") as f:
+        row = 0
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                record = f"Invalid JSON: {e}"
+            if not isinstance(record, (dict, str)):
+                record = f"Expected a JSON object, got {type(record).__name__}"
+            yield row, record
+            row += 1
+
+
+def count_rows(path: str, fmt: str) -> int:
+    """Number of input rows, counted without parsing them."""
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        if fmt == "csv":
+            return max(sum(1 for _ in csv.reader(f)) - 1, 0)
+        return sum(1 for line in f if line.strip())
+
+
+# ----------------------------------------------------------------
+# Checkpoint
+# ----------------------------------------------------------------
+class Progress:
+    """
+    Rows done so far, as a watermark (every row below it is done) plus the
+    finished rows above it.
+    """
+
+    def __init__(self):
+        self.next_row = 0
+        self.done: Set[int] = set()
+        self.ok = 0
+        self.errors = 0
+
+    def is_done(self, row: int) -> bool:
+        return row < self.next_row or row in self.done
+
+    def add(self, row: int, ok: bool):
+        if self.is_done(row):
+            return
+        self.done.add(row)
+        while self.next_row in self.done:
+            self.done.remove(self.next_row)
+            self.next_row += 1
+        if ok:
+            self.ok += 1
+        else:
+            self.errors += 1
+
+    @property
+    def completed(self) -> int:
+        return self.ok + self.errors
+
+
+def input_identity(path: str) -> Dict[str, Any]:
+    stat = os.stat(path)
+    return {"input": path, "input_size": stat.st_size, "input_mtime": stat.st_mtime}
+
+
+def load_checkpoint(checkpoint_path: str, input_path: str) -> Tuple[Progress, int]:
+    """
+    Read the checkpoint of an earlier run.
+
+    Returns:
+        Tuple of (progress, output offset the checkpoint covers)
+
+    Raises:
+        SystemExit: The input changed since the checkpoint was written
+    """
+    progress = Progress()
+    if not os.path.exists(checkpoint_path):
+        return progress, 0
+    with open(checkpoint_path, encoding="utf-8") as f:
+        state = json.load(f)
+
+    identity = input_identity(input_path)
+    if any(state.get(key) != value for key, value in identity.items()):
+        print(f"The input changed since {checkpoint_path} was written; "
+              "rerun with --restart to start over.")
+        sys.exit(1)
+
+    progress.next_row = state["next_row"]
+    progress.done = set(state["done"])
+    progress.ok = state["ok"]
+    progress.errors = state["errors"]
+    return progress, state["output_offset"]
+
+
+def recover_output(output_path: str, offset: int, progress: Progress):
+    """
+    Add the results written after the checkpoint to the progress.
+
+    A partly written last line (from a crash mid-write) is cut off.
+    """
+    if not os.path.exists(output_path):
+        return
+    if os.path.getsize(output_path) < offset:
+        print("Warning: the output is shorter than the checkpoint; reading all of it")
+        offset = 0
+    with open(output_path, "r+b") as f:
+        f.seek(offset)
+        position = offset
+        for line in f:
+            try:
+                result = json.loads(line) if line.endswith(b"\n") else None
+            except ValueError:
+                result = None
+            if result is None:
+                print(f"Warning: discarding an incomplete result line at byte {position}")
+                f.truncate(position)
+                break
+            progress.add(result["row"], result.get("status") == "ok")
+            position += len(line)
+
+
+def save_checkpoint(checkpoint_path: str, input_path: str, progress: Progress, output):
+    """Write the checkpoint atomically, covering everything written to the output."""
+    output.flush()
+    state = {
+        **input_identity(input_path),
+        "output_offset": output.tell(),
+        "next_row": progress.next_row,
+        "done": sorted(progress.done),
+        "ok": progress.ok,
+        "errors": progress.errors,
+        "updated_at": time.time(),
+    }
+    temporary = checkpoint_path + ".tmp"
+    with open(temporary, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(temporary, checkpoint_path)
+
+
+# ----------------------------------------------------------------
+# Progress Reporting
+# ----------------------------------------------------------------
+def format_duration(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return "--:--"
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+class Meter:
+    """Throughput over the last minute and the ETA it implies."""
+
+    WINDOW = 60.0
+
+    def __init__(self, total: Optional[int], progress: Progress):
+        self.total = total
+        self.progress = progress
+        self.started = time.monotonic()
+        self.resumed_at = progress.completed
+        self.samples = deque([(self.started, progress.completed)])
+
+    def rate(self) -> float:
+        now = time.monotonic()
+        self.samples.append((now, self.progress.completed))
+        while len(self.samples) > 2 and self.samples[1][0] < now - self.WINDOW:
+            self.samples.popleft()
+        (first_time, first_count), (last_time, last_count) = self.samples[0], self.samples[-1]
+        elapsed = last_time - first_time
+        return (last_count - first_count) / elapsed if elapsed > 0 else 0.0
+
+    def line(self) -> str:
+        rate = self.rate()
+        completed = self.progress.completed
+        if self.total:
+            remaining = max(self.total - completed, 0)
+            eta = remaining / rate if rate > 0 else None
+            position = f"{completed}/{self.total} {completed / self.total:6.1%}"
+        else:
+            eta = None
+            position = f"{completed}"
+        return (
+            f"[{position}] {rate:6.2f} rows/s  errors {self.progress.errors}  "
+            f"elapsed {format_duration(time.monotonic() - self.started)}  ETA {format_duration(eta)}"
+        )
+
+    def summary(self) -> str:
+        elapsed = time.monotonic() - self.started
+        ran = self.progress.completed - self.resumed_at
+        return (
+            f"{ran} rows in {format_duration(elapsed)} "
+            f"({ran / elapsed if elapsed > 0 else 0.0:.2f} rows/s); "
+            f"{self.progress.ok} ok, {self.progress.errors} errors in total"
+        )
+
+
+# ----------------------------------------------------------------
+# Runner
+# ----------------------------------------------------------------
+class BulkRun:
+    """Feeds the input rows to the workers and records their results."""
+
+    def __init__(self, options, progress: Progress, output, checkpoint_path: str):
+        self.options = options
+        self.progress = progress
+        self.output = output
+        self.checkpoint_path = checkpoint_path
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=options.concurrency * 2)
+        self.stopping = asyncio.Event()
+        self.interrupts = 0
+        self.workers = []
+
+    def interrupt(self):
+        """First Ctrl+C: finish the rows in flight; second: abandon them."""
+        self.interrupts += 1
+        if self.interrupts == 1:
+            print("\nStopping after the rows in flight (Ctrl+C again to stop now)...", file=sys.stderr)
+            self.stopping.set()
+        else:
+            for worker in self.workers:
+                worker.cancel()
+
+    async def feed(self):
+        fmt = input_format(self.options)
+        try:
+            for row, record in read_rows(self.options.input, fmt):
+                if self.stopping.is_set():
+                    break
+                if not self.progress.is_done(row):
+                    await self.queue.put((row, record))
+        except (OSError, UnicodeDecodeError, csv.Error) as e:
+            print(f"\nCould not read {self.options.input}: {e}", file=sys.stderr)
+            self.stopping.set()
+        finally:
+            for _ in self.workers:
+                await self.queue.put(None)
+
+    async def analyze(self, record: Any) -> Dict[str, Any]:
+        """Run the agent on one row, retrying failures."""
+        from pydantic import ValidationError
+        from agents.executor import arun_agent_payload
+
+        if isinstance(record, str):
+            return {"status": "error", "error": record}
+        error = None
+        for attempt in range(self.options.retries + 1):
+            if attempt:
+                await asyncio.sleep(min(2 ** attempt, 30))
+            try:
+                response = await arun_agent_payload(self.options.agent, record)
+            except ValidationError as e:
+                return {"status": "error", "error": f"Invalid request: {e.errors(include_url=False)}"}
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                continue
+            result = {"response": response.model_dump(mode="json")}
+            error = getattr(response, "error", None)
+            if not error:
+                return {"status": "ok", **result}
+        return {"status": "error", "error": error}
+
+    async def work(self):
+        while True:
+            item = await self.queue.get()
+            if item is None:
+                return
+            if self.stopping.is_set():
+                # Left for the next run
+                continue
+            row, record = item
+            result = await self.analyze(record)
+            identifier = record.get(self.options.id_field) if isinstance(record, dict) else None
+            line = json.dumps({"row": row, "id": identifier, **result}, ensure_ascii=False)
+            self.output.write(line.encode("utf-8") + b"\n")
+            self.progress.add(row, result["status"] == "ok")
+
+    async def report(self, meter: Meter):
+        """Print progress and write the checkpoint periodically."""
+        last_checkpoint = time.monotonic()
+        while True:
+            await asyncio.sleep(self.options.progress_interval)
+            print(meter.line(), file=sys.stderr, flush=True)
+            if time.monotonic() - last_checkpoint >= self.options.checkpoint_interval:
+                save_checkpoint(self.checkpoint_path, self.options.input, self.progress, self.output)
+                last_checkpoint = time.monotonic()
+
+    async def run(self, meter: Meter) -> bool:
+        """
+        Process the remaining rows.
+
+        Returns:
+            True if every row was processed, False if interrupted
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            loop.add_signal_handler(signal.SIGINT, self.interrupt)
+        except (NotImplementedError, RuntimeError):
+            pass  # Windows: Ctrl+C raises KeyboardInterrupt instead
+
+        self.workers = [asyncio.create_task(self.work()) for _ in range(max(1, self.options.concurrency))]
+        feeder = asyncio.create_task(self.feed())
+        reporter = asyncio.create_task(self.report(meter))
+        try:
+            await asyncio.gather(*self.workers, return_exceptions=True)
+        finally:
+            feeder.cancel()
+            reporter.cancel()
+            save_checkpoint(self.checkpoint_path, self.options.input, self.progress, self.output)
+        return not self.stopping.is_set() and self.interrupts == 0
+
+
+async def amain(options) -> int:
+    from agents import http_client
+    from agents.executor import shutdown as shutdown_agent_pools
+    from agents.usage import get_usage_writer
+
+    checkpoint_path = options.checkpoint or options.output + ".checkpoint"
+    if options.restart:
+        for path in (options.output, checkpoint_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    progress, offset = load_checkpoint(checkpoint_path, options.input)
+    recover_output(options.output, offset, progress)
+    if progress.completed:
+        print(f"Resuming: {progress.completed} rows already done "
+              f"({progress.ok} ok, {progress.errors} errors)")
+
+    fmt = input_format(options)
+    total = count_rows(options.input, fmt) if options.count else None
+    if total is not None:
+        print(f"{total} rows in {options.input}")
+
+    await get_usage_writer().start()
+    try:
+        with open(options.output, "ab") as output:
+            run = BulkRun(options, progress, output, checkpoint_path)
+            meter = Meter(total, progress)
+            finished = await run.run(meter)
+            print(meter.line(), file=sys.stderr)
+    finally:
+        await get_usage_writer().stop()
+        shutdown_agent_pools()
+        await http_client.aclose()
+
+    print(meter.summary())
+    print(f"Results: {options.output}")
+    if not finished:
+        print("Interrupted; run the same command again to resume.")
+        return EXIT_INTERRUPTED
+    return 0
+
+
+if __name__ == "__main__":
+    options = parse_args()
+    if not os.path.exists(options.input):
+        print(f"Input file not found: {options.input}")
+        sys.exit(1)
+
+    # Relative paths in the backend (cache, result and spill files) resolve
+    # from the backend directory, as they do for the server
+    options.input = os.path.abspath(options.input)
+    options.output = os.path.abspath(options.output)
+    if options.checkpoint:
+        options.checkpoint = os.path.abspath(options.checkpoint)
+    os.chdir(backend_path)
+    sys.path.insert(0, backend_path)
+
+    try:
+        sys.exit(asyncio.run(amain(options)))
+    except KeyboardInterrupt:
+        print("\nInterrupted; run the same command again to resume.")
+        sys.exit(EXIT_INTERRUPTED)
@@ -5,33 +5,85 @@ Adaptor server that connects the working basic server with our marketing agent l
 
 import os
 import sys
+import time
+import asyncio
 import uvicorn
-from fastapi import FastAPI, Body
-from pydantic import BaseModel
-from typing import Optional
+from fastapi import FastAPI, Body, Depends, Header, HTTPException, Query, Request
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel, ValidationError
+from typing import Any, Dict, Optional
 
 # Create paths
 current_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, current_dir)
 
 # Import agent directly from the file
-from agents.marketing import (
-    run_analysis,
-    MarketingAgentRequest,
-    MarketingAgentResponse,
-    init as init_marketing
+from agents import awarm_up, discover, get_agent_info, warmup_agent_ids
+from agents import http_client
+from agents.governor import get_governor
+from agents.llm_router import get_llm_router
+from agents import metrics
+from agents import responses
+from agents.responses import FastJSONResponse, json_response
+from agents.usage import get_usage_writer
+from agents.sessions import Session, SessionNotFoundError, get_session_store
+from agents.deadline import parse_deadline_header, with_deadline
+from agents.prewarm import PREWARM_ENABLED, get_prewarm_scheduler
+from agents.results import (
+    DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE,
+    ResultOwner,
+    ResultQuery,
+    StoredResult,
+    get_result_store,
 )
+from agents.sse import SSE_HEADERS, encode_events
+from agents.executor import (
+    AgentBusyError,
+    AgentTimeoutError,
+    agent_run_stats,
+    aget_agent,
+    arun_agent,
+    arun_agent_payload,
+    shutdown as shutdown_agent_pools,
+)
+from agents.jobs import (
+    JOB_SUCCEEDED,
+    JobInfo,
+    JobNotFoundError,
+    QueueFullError,
+    get_job_queue,
+)
+
+async def marketing_agent() -> Dict[str, Any]:
+    """The marketing agent's registry entry, imported and initialized on its first request"""
+    return await aget_agent("marketing")
 
-# Initialize the agent
-init_marketing()
+def validate_request(model, payload: Dict[str, Any]) -> BaseModel:
+    """Validate a request body against an agent's model, answering 422 if it doesn't fit"""
+    try:
+        return model.model_validate(payload)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_context=False))
+
+def request_deadline(x_request_deadline: Optional[str] = Header(None)) -> Optional[float]:
+    """Time budget in seconds from the X-Request-Deadline header, if sent"""
+    try:
+        return parse_deadline_header(x_request_deadline)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid X-Request-Deadline header: {e}")
 
 # Create a new FastAPI app
 app = FastAPI(
     title="Marketing Agent API",
     description="API for the Marketing Research Agent",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=FastJSONResponse
 )
 
+# Compress large responses (analyses, batch results) for clients that accept it
+responses.install(app)
+
 # Add routes
 @app.get("/")
 def root():
@@ -41,10 +93,339 @@ def root():
 def health():
     return {"status": "healthy", "agent": "marketing"}
 
-@app.post("/run_agent", response_model=MarketingAgentResponse)
-def run_marketing_agent(request: MarketingAgentRequest = Body(...)):
+@app.post("/run_agent")
+async def run_marketing_agent(
+    payload: Dict[str, Any] = Body(...),
+    agent: Dict[str, Any] = Depends(marketing_agent),
+    deadline: Optional[float] = Depends(request_deadline),
+):
     """Run the marketing research agent"""
-    return run_analysis(request)
+    request = validate_request(agent["request_model"], payload)
+    try:
+        return json_response(await arun_agent("marketing", with_deadline(request, deadline)))
+    except SessionNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired session: {request.session_id}")
+    except AgentBusyError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+    except AgentTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+
+@app.post("/run_agent/stream")
+async def stream_marketing_agent(
+    payload: Dict[str, Any] = Body(...),
+    agent: Dict[str, Any] = Depends(marketing_agent),
+    deadline: Optional[float] = Depends(request_deadline),
+):
+    """Run the marketing research agent, streaming progress and tokens as Server-Sent Events"""
+    request = validate_request(agent["request_model"], payload)
+    return StreamingResponse(
+        encode_events(agent["module"].astream_analysis(with_deadline(request, deadline))),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
+@app.post("/run_agent/batch")
+async def run_marketing_agent_batch(
+    payload: Dict[str, Any] = Body(...),
+    agent: Dict[str, Any] = Depends(marketing_agent),
+):
+    """Run the marketing research agent for many businesses at once"""
+    module = agent["module"]
+    batch = validate_request(module.MarketingBatchRequest, payload)
+    if len(batch.requests) > module.BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch too large: {len(batch.requests)} requests (maximum {module.BATCH_MAX_ITEMS})"
+        )
+    return json_response(await module.arun_batch(batch))
+
+@app.get("/agents")
+def list_agents():
+    """Registered agents, described from their manifest entries without loading them"""
+    return get_agent_info()
+
+@app.get("/agents/stats")
+def list_agent_stats():
+    """Load state, concurrency, queue depth and latency of every registered agent"""
+    return agent_run_stats()
+
+@app.post("/agents/{agent_id}/warmup")
+async def warm_up_agent(agent_id: str):
+    """Import and initialize an agent ahead of its first request"""
+    try:
+        return await awarm_up([agent_id])
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown agent: {agent_id}")
+
+@app.post("/agents/{agent_id}/run")
+async def run_agent(
+    agent_id: str,
+    payload: Dict[str, Any] = Body(...),
+    deadline: Optional[float] = Depends(request_deadline),
+):
+    """Run any registered agent within its concurrency pool"""
+    if deadline is not None:
+        payload = {**payload, "deadline": deadline}
+    try:
+        return json_response(await arun_agent_payload(agent_id, payload))
+    except SessionNotFoundError as e:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired session: {e.args[0]}")
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown agent: {agent_id}")
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_context=False))
+    except AgentBusyError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+    except AgentTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+
+@app.post("/jobs/{agent_id}", response_model=JobInfo, status_code=202)
+async def submit_job(agent_id: str, payload: Dict[str, Any] = Body(...)):
+    """Queue an agent request and return its job ID immediately"""
+    try:
+        job = await get_job_queue().submit(agent_id, payload)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown agent: {agent_id}")
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_context=False))
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "5"})
+    return job.info()
+
+@app.get("/jobs")
+def job_stats():
+    """Job queue depth and counts"""
+    return get_job_queue().stats()
+
+@app.get("/jobs/{job_id}", response_model=JobInfo)
+async def get_job(job_id: str):
+    """Poll the status of a job"""
+    try:
+        return (await get_job_queue().get(job_id)).info()
+    except JobNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str, http_request: Request):
+    """Get the result of a finished job (supports If-None-Match)"""
+    try:
+        job = await get_job_queue().get(job_id)
+    except JobNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    if job.status != JOB_SUCCEEDED:
+        raise HTTPException(status_code=409, detail=job.info().model_dump())
+    return json_response(job.result, http_request)
+
+@app.delete("/jobs/{job_id}", response_model=JobInfo)
+async def cancel_job(job_id: str):
+    """Cancel a queued or running job"""
+    try:
+        return (await get_job_queue().cancel(job_id)).info()
+    except JobNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+
+@app.get("/sessions")
+def session_stats():
+    """Session store counters"""
+    return get_session_store().stats()
+
+@app.get("/sessions/{session_id}", response_model=Session)
+def get_session(session_id: str, http_request: Request):
+    """Get a conversation session and its rolling summary (supports If-None-Match)"""
+    try:
+        return json_response(get_session_store().get(session_id), http_request)
+    except SessionNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired session: {session_id}")
+
+@app.delete("/sessions/{session_id}", status_code=204)
+def delete_session(session_id: str):
+    """End a conversation session"""
+    try:
+        get_session_store().delete(session_id)
+    except SessionNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired session: {session_id}")
+    return Response(status_code=204)
+
+def _result_store():
+    """The result store, or 503 when storing results is disabled"""
+    store = get_result_store()
+    if store is None:
+        raise HTTPException(status_code=503, detail="The result store is disabled (RESULT_STORE=off)")
+    return store
+
+def result_owner(
+    x_user_id: Optional[str] = Header(None),
+    x_company_id: Optional[str] = Header(None),
+) -> ResultOwner:
+    """The caller from the X-User-Id or X-Company-Id header; stored results are only served to their owner"""
+    if not x_user_id and not x_company_id:
+        raise HTTPException(status_code=401, detail="X-User-Id or X-Company-Id header is required")
+    if x_user_id and x_company_id:
+        raise HTTPException(status_code=400, detail="Send only one of X-User-Id and X-Company-Id")
+    return ResultOwner(user_id=x_user_id or None, company_id=x_company_id or None)
+
+def _owned_result(result_id: str, owner: ResultOwner) -> StoredResult:
+    """A stored result of the caller, or 404 (also for other owners' results)"""
+    result = _result_store().get(result_id)
+    if result is None or not owner.owns(result):
+        raise HTTPException(status_code=404, detail=f"Unknown result: {result_id}")
+    return result
+
+@app.get("/results")
+def list_results(
+    business_name: Optional[str] = None,
+    domain: Optional[str] = None,
+    user_id: Optional[str] = None,
+    company_id: Optional[str] = None,
+    agent_id: Optional[str] = None,
+    since: Optional[float] = None,
+    until: Optional[float] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    owner: ResultOwner = Depends(result_owner),
+):
+    """Stored analyses matching the filters, newest first; pass next_cursor to get the next page"""
+    store = _result_store()
+    query = ResultQuery(
+        agent_id=agent_id, business_name=business_name, domain=domain,
+        user_id=user_id, company_id=company_id, since=since, until=until
+    )
+    try:
+        query = owner.scope(query)
+    except PermissionError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    try:
+        results, next_cursor = store.list(query, limit=limit, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"results": [result.summary() for result in results], "next_cursor": next_cursor}
+
+@app.get("/results/stats")
+def result_stats():
+    """Result store backend and size"""
+    return _result_store().stats()
+
+@app.get("/results/lookup")
+def lookup_result(
+    http_request: Request,
+    business_name: Optional[str] = None,
+    website_url: Optional[str] = None,
+    agent_id: str = "marketing",
+    max_age: Optional[float] = Query(None, gt=0),
+    owner: ResultOwner = Depends(result_owner),
+):
+    """Latest stored analysis of a business and/or website, optionally no older than max_age seconds"""
+    if not business_name and not website_url:
+        raise HTTPException(status_code=400, detail="business_name or website_url is required")
+    query = ResultQuery(
+        agent_id=agent_id,
+        business_name=business_name,
+        domain=website_url,
+        since=time.time() - max_age if max_age else None
+    )
+    results, _ = _result_store().list(owner.scope(query), limit=1)
+    if not results:
+        raise HTTPException(status_code=404, detail="No stored result matches")
+    return json_response(results[0], http_request)
+
+@app.get("/results/{result_id}", response_model=StoredResult)
+def get_result(result_id: str, http_request: Request, owner: ResultOwner = Depends(result_owner)):
+    """A stored analysis with its inputs, sources, timings and token counts (supports If-None-Match)"""
+    result = _owned_result(result_id, owner)
+    # Stored results never change
+    return json_response(result, http_request, cache_control="private, max-age=86400")
+
+@app.delete("/results/{result_id}", status_code=204)
+def delete_result(result_id: str, owner: ResultOwner = Depends(result_owner)):
+    """Delete a stored analysis"""
+    _owned_result(result_id, owner)
+    if not _result_store().delete(result_id):
+        raise HTTPException(status_code=404, detail=f"Unknown result: {result_id}")
+    return Response(status_code=204)
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """Phase latencies, cache, upstream and token counters in Prometheus format"""
+    return Response(content=metrics.render_metrics(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/usage/stats")
+def usage_stats():
+    """Buffered, written and spilled token usage records"""
+    return get_usage_writer().stats()
+
+@app.get("/upstreams")
+def upstream_state():
+    """Rate limiter, retry and circuit breaker state per upstream provider"""
+    return get_governor().snapshot()
+
+@app.get("/llm/backends")
+def llm_backends():
+    """Latency, error rate and circuit state per LLM backend, plus hedge and failover counts"""
+    return get_llm_router().snapshot()
+
+@app.get("/cache/stats")
+def cache_stats():
+    """Hit/miss counters for the agent caches (empty until the agent has loaded)"""
+    spec = discover().get("marketing")
+    return spec.entry["module"].get_cache_stats() if spec is not None and spec.loaded else {}
+
+@app.get("/prewarm")
+def prewarm_schedule():
+    """Pre-warm windows, budget, hit rate and the most requested analyses"""
+    return {"enabled": PREWARM_ENABLED, **get_prewarm_scheduler().snapshot()}
+
+@app.post("/prewarm/run")
+async def run_prewarm():
+    """Refresh the due analyses now, inside the current window budget"""
+    return await get_prewarm_scheduler().run_once(force=True)
+
+@app.on_event("startup")
+async def start_agent_warmup():
+    """Load the agents listed in AGENT_WARMUP in the background"""
+    agent_ids = warmup_agent_ids()
+    if agent_ids is None or agent_ids:
+        app.state.agent_warmup = asyncio.create_task(awarm_up(agent_ids))
+
+@app.on_event("startup")
+async def start_job_queue():
+    """Start the background job workers"""
+    await get_job_queue().start()
+
+@app.on_event("shutdown")
+async def stop_job_queue():
+    """Cancel running jobs and stop the workers"""
+    await get_job_queue().stop()
+
+@app.on_event("startup")
+async def start_prewarm_scheduler():
+    """Start refreshing popular analyses off-peak (PREWARM_ENABLED=1)"""
+    if PREWARM_ENABLED:
+        await get_prewarm_scheduler().start()
+
+@app.on_event("shutdown")
+async def stop_prewarm_scheduler():
+    """Stop the pre-warm scheduler"""
+    await get_prewarm_scheduler().stop()
+
+@app.on_event("startup")
+async def start_usage_writer():
+    """Start the token usage flush task"""
+    await get_usage_writer().start()
+
+@app.on_event("shutdown")
+async def stop_usage_writer():
+    """Flush remaining token usage records"""
+    await get_usage_writer().stop()
+
+@app.on_event("shutdown")
+async def stop_agent_pools():
+    """Stop the thread pools of synchronous agents"""
+    shutdown_agent_pools()
+
+@app.on_event("shutdown")
+async def close_http_client():
+    """Close pooled upstream connections"""
+    await http_client.aclose()
 
 if __name__ == "__main__":
     print("Starting Marketing Agent API on port 8000...")
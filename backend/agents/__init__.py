@@ -2,56 +2,352 @@
 Agent Registry
 
 This module serves as a central registry for all available agents.
-New agents can be added here to make them discoverable by the main application.
+
+Agents are declared, not imported: the registry knows each agent from its
+manifest entry (built in, a JSON manifest file, or a Python entry point)
+and only imports and initializes an agent's module the first time the
+agent is used. Listing agents and health checks therefore stay instant no
+matter how many agents are installed, and each worker only pays for the
+agents it actually serves.
+
+New agents can be added to BUILTIN_AGENTS, to a manifest file named by
+AGENT_MANIFEST, or by a separate package declaring an entry point in the
+"productivity_engines.agents" group (name = agent ID, value = module).
+Entry point modules describe themselves with an AGENT_INFO dictionary
+holding the same fields as a manifest entry.
 """
 
-# Import all agent modules here
-from . import marketing
+import os
+import json
+import time
+import inspect
+import threading
+import importlib
+from typing import Any, Dict, Iterable, List, Optional
+
+# Entry point group scanned for agents installed as separate packages
+ENTRY_POINT_GROUP = "productivity_engines.agents"
 
-# Registry of available agents
-AVAILABLE_AGENTS = {
+# Agents shipped with the backend. Modules are given relative to this package;
+# request_model, response_model and runner are attribute names in the module.
+BUILTIN_AGENTS = {
     "marketing": {
         "name": "Marketing Research Agent",
-        "module": marketing,
+        "module": ".marketing",
         "description": "Analyzes businesses and provides marketing insights",
         "version": "1.0.0",
+        "request_model": "MarketingAgentRequest",
+        "response_model": "MarketingAgentResponse",
+        "runner": "arun_analysis",
+        "max_concurrency": 32,
+        "max_queue": 200,
+        "timeout": 180,
     }
     # Add new agents to this registry as they are created
     # "agent_name": {
     #     "name": "Human-Readable Name",
-    #     "module": module_reference,
+    #     "module": ".module_name",             # imported on first use
     #     "description": "Description of what the agent does",
     #     "version": "1.0.0",
+    #     "request_model": "RequestModel",      # pydantic model accepted by the runner
+    #     "response_model": "ResponseModel",    # pydantic model returned by the runner
+    #     "runner": "arun",                     # async callable(request) -> response
+    #     "max_concurrency": 16,                # runs at once (see executor)
+    #     "max_queue": 100,                     # requests waiting for a slot
+    #     "timeout": 120,                       # seconds per run
     # }
 }
 
 
+class AgentSpec:
+    """
+    A registered agent: its manifest entry, and the loaded agent once used.
+
+    Args:
+        agent_id: Registry key of the agent
+        module: Module path (relative paths are resolved against this package)
+        source: Where the agent was declared: "builtin", "manifest" or "entry_point"
+        info: Manifest fields (name, description, version, request_model,
+            response_model, runner, and the pool settings max_concurrency,
+            max_queue and timeout)
+    """
+
+    def __init__(self, agent_id: str, module: str, source: str, info: Optional[Dict[str, Any]] = None):
+        self.agent_id = agent_id
+        self.module = module
+        self.source = source
+        self.info = dict(info or {})
+
+        self.entry: Optional[Dict[str, Any]] = None
+        self.load_seconds: Optional[float] = None
+        self.warmed_up = False
+        self.error: Optional[str] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self.entry is not None
+
+    def describe(self) -> Dict[str, Any]:
+        """Public information about the agent, without loading it."""
+        info = self.entry or self.info
+        return {
+            "id": self.agent_id,
+            "name": info.get("name", self.agent_id),
+            "description": info.get("description", ""),
+            "version": info.get("version", ""),
+            "loaded": self.loaded,
+        }
+
+
+# Registered agents by ID, filled by discover()
+AVAILABLE_AGENTS: Dict[str, AgentSpec] = {}
+
+# API keys passed to each agent's init() when it is loaded
+_init_kwargs: Dict[str, Any] = {}
+
+_discovered = False
+_lock = threading.RLock()
+
+
+# ----------------------------------------------------------------
+# Discovery
+# ----------------------------------------------------------------
+def _entry_points() -> List[Any]:
+    """Entry points of the agent group (importlib.metadata API differs before 3.10)."""
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:  # Python < 3.8
+        return []
+    found = entry_points()
+    if hasattr(found, "select"):
+        return list(found.select(group=ENTRY_POINT_GROUP))
+    return list(found.get(ENTRY_POINT_GROUP, []))
+
+
+def _manifest_agents(path: str) -> Dict[str, Dict[str, Any]]:
+    """Agents declared in a JSON manifest file ({agent_id: entry})."""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Warning: could not read agent manifest {path}: {e}")
+        return {}
+
+
+def discover(refresh: bool = False) -> Dict[str, AgentSpec]:
+    """
+    Find every declared agent, without importing any of them.
+
+    Later sources override earlier ones: built-in agents, then the
+    AGENT_MANIFEST file, then entry points.
+
+    Args:
+        refresh: Scan again even if agents were discovered already
+
+    Returns:
+        The registered agents by ID
+    """
+    global _discovered
+    with _lock:
+        if _discovered and not refresh:
+            return AVAILABLE_AGENTS
+
+        specs = {
+            agent_id: AgentSpec(agent_id, info["module"], "builtin", info)
+            for agent_id, info in BUILTIN_AGENTS.items()
+        }
+
+        manifest_path = os.environ.get("AGENT_MANIFEST")
+        if manifest_path:
+            for agent_id, info in _manifest_agents(manifest_path).items():
+                specs[agent_id] = AgentSpec(agent_id, info["module"], "manifest", info)
+
+        for entry_point in _entry_points():
+            # "package.module" or "package.module:attribute"; only the module matters
+            module = entry_point.value.split(":")[0].strip()
+            specs[entry_point.name] = AgentSpec(entry_point.name, module, "entry_point")
+
+        # Keep agents that were loaded already
+        for agent_id, spec in AVAILABLE_AGENTS.items():
+            if spec.loaded and agent_id in specs and specs[agent_id].module == spec.module:
+                specs[agent_id] = spec
+
+        AVAILABLE_AGENTS.clear()
+        AVAILABLE_AGENTS.update(specs)
+        _discovered = True
+        return AVAILABLE_AGENTS
+
+
+# ----------------------------------------------------------------
+# Loading
+# ----------------------------------------------------------------
+def configure(openai_api_key=None, tavily_api_key=None):
+    """
+    Set the API keys agents are initialized with when they are loaded.
+
+    Args:
+        openai_api_key: OpenAI API key
+        tavily_api_key: Tavily API key
+    """
+    _init_kwargs.update(openai_api_key=openai_api_key, tavily_api_key=tavily_api_key)
+
+
+def _resolve(module, value):
+    """A manifest attribute: either the object itself or its name in the module."""
+    return getattr(module, value) if isinstance(value, str) else value
+
+
+def _load(spec: AgentSpec) -> Dict[str, Any]:
+    """Import and initialize an agent (caller holds the lock)."""
+    start = time.perf_counter()
+    try:
+        module = importlib.import_module(spec.module, package=__name__)
+        info = {**getattr(module, "AGENT_INFO", {}), **spec.info}
+        entry = {
+            "name": info.get("name", spec.agent_id),
+            "module": module,
+            "description": info.get("description", ""),
+            "version": info.get("version", ""),
+            "request_model": _resolve(module, info["request_model"]),
+            "response_model": _resolve(module, info["response_model"]),
+            "runner": _resolve(module, info["runner"]),
+        }
+        if hasattr(module, "init"):
+            module.init(**_init_kwargs)
+    except Exception as e:
+        spec.error = f"{type(e).__name__}: {e}"
+        raise
+    spec.entry = entry
+    spec.error = None
+    spec.load_seconds = time.perf_counter() - start
+    return entry
+
+
+def get_agent(agent_id):
+    """
+    Look up a registered agent, loading and initializing it on first use.
+
+    Args:
+        agent_id: Registry key of the agent
+
+    Returns:
+        The agent's registry entry (name, module, description, version,
+        request_model, response_model, runner)
+
+    Raises:
+        KeyError: If no agent is registered under agent_id
+    """
+    spec = discover().get(agent_id)
+    if spec is None:
+        raise KeyError(f"Unknown agent: {agent_id}")
+    if spec.entry is not None:
+        return spec.entry
+    with _lock:
+        if spec.entry is None:
+            _load(spec)
+    return spec.entry
+
+
 def get_agent_info():
     """
     Get information about all available agents.
-    
+
+    Agents are described from their manifest entries; none is imported.
+
     Returns:
         List of agent information dictionaries
     """
-    return [{
-        "id": agent_id,
-        "name": agent_info["name"],
-        "description": agent_info["description"],
-        "version": agent_info["version"]
-    } for agent_id, agent_info in AVAILABLE_AGENTS.items()]
+    return [spec.describe() for spec in discover().values()]
+
+
+def agent_stats() -> Dict[str, Any]:
+    """Load state of every registered agent."""
+    return {
+        agent_id: {
+            "source": spec.source,
+            "module": spec.module,
+            "loaded": spec.loaded,
+            "warmed_up": spec.warmed_up,
+            "load_seconds": round(spec.load_seconds, 4) if spec.load_seconds is not None else None,
+            "error": spec.error,
+        }
+        for agent_id, spec in discover().items()
+    }
+
+
+async def awarm_up(agent_ids: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+    """
+    Load agents ahead of their first request.
+
+    Each agent is imported and initialized, then its module's optional
+    awarm_up() hook runs (e.g. to open connections or load tokenizers).
+
+    Args:
+        agent_ids: Agents to warm up (default: all registered agents)
+
+    Returns:
+        Load state of the warmed agents (see agent_stats); failures are
+        reported in their "error" field
+
+    Raises:
+        KeyError: If one of agent_ids is not registered
+    """
+    specs = discover()
+    agent_ids = list(specs) if agent_ids is None else list(agent_ids)
+    for agent_id in agent_ids:
+        if agent_id not in specs:
+            raise KeyError(f"Unknown agent: {agent_id}")
+
+    for agent_id in agent_ids:
+        try:
+            module = get_agent(agent_id)["module"]
+            hook = getattr(module, "awarm_up", None)
+            if hook is not None:
+                result = hook()
+                if inspect.isawaitable(result):
+                    await result
+            specs[agent_id].warmed_up = True
+        except Exception as e:
+            specs[agent_id].error = f"{type(e).__name__}: {e}"
+            print(f"Warning: warm-up of agent {agent_id} failed: {specs[agent_id].error}")
+
+    stats = agent_stats()
+    return {agent_id: stats[agent_id] for agent_id in agent_ids}
+
+
+def warmup_agent_ids() -> Optional[List[str]]:
+    """
+    Agents to warm up at startup, from AGENT_WARMUP.
+
+    Returns:
+        None for "all", otherwise the listed agent IDs (empty when unset);
+        unknown IDs are skipped with a warning
+    """
+    value = os.environ.get("AGENT_WARMUP", "").strip()
+    if value == "all":
+        return None
+
+    specs = discover()
+    agent_ids = []
+    for agent_id in (part.strip() for part in value.split(",")):
+        if agent_id and agent_id not in specs:
+            print(f"Warning: AGENT_WARMUP names unknown agent {agent_id!r}")
+        elif agent_id:
+            agent_ids.append(agent_id)
+    return agent_ids
 
 
 def initialize_all(openai_api_key=None, tavily_api_key=None):
     """
-    Initialize all registered agents with the provided API keys.
-    
+    Load and initialize all registered agents with the provided API keys.
+
+    Kept for callers that want everything loaded up front; servers should
+    call configure() and let agents load on first use.
+
     Args:
         openai_api_key: OpenAI API key
         tavily_api_key: Tavily API key
     """
-    for agent_id, agent_info in AVAILABLE_AGENTS.items():
-        if hasattr(agent_info["module"], "init"):
-            agent_info["module"].init(
-                openai_api_key=openai_api_key,
-                tavily_api_key=tavily_api_key
-            ) 
\ No newline at end of file
+    configure(openai_api_key=openai_api_key, tavily_api_key=tavily_api_key)
+    for agent_id in discover():
+        get_agent(agent_id)
@@ -0,0 +1,465 @@
+"""
+Result Caches
+
+Small, dependency-free caches used by agents to avoid repeating paid
+upstream calls. Every cache implements the CacheBackend interface so the
+tiers can be swapped or combined:
+
+- MemoryCache: in-process LRU with per-entry TTL and entry/byte caps
+- SQLiteCache: on-disk store that survives restarts
+- TieredCache: a memory tier in front of a persistent tier
+
+Values must be JSON-serializable.
+"""
+
+import os
+import json
+import time
+import queue
+import atexit
+import weakref
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+
+def make_cache_key(namespace: str, params: Dict[str, Any]) -> str:
+    """
+    Build a content-addressed cache key.
+
+    Args:
+        namespace: Key prefix identifying what is cached (e.g. "tavily")
+        params: Everything that influences the cached value
+
+    Returns:
+        "<namespace>:<sha256 of the canonical JSON of params>"
+    """
+    canonical = json.dumps(params, sort_keys=True, separators=(",", ":"), default=str)
+    digest = hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+    return f"{namespace}:{digest}"
+
+
+class CacheBackend:
+    """Interface shared by all cache tiers."""
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value, or None on a miss or expired entry."""
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        """Store a value; ttl overrides the cache's default TTL (seconds)."""
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        """Remove a single entry if present."""
+        raise NotImplementedError
+
+    def clear(self):
+        """Remove all entries."""
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and size information."""
+        raise NotImplementedError
+
+
+# ----------------------------------------------------------------
+# In-Process LRU Tier
+# ----------------------------------------------------------------
+class MemoryCache(CacheBackend):
+    """
+    Thread-safe in-process LRU cache with TTL.
+
+    Entries are evicted least-recently-used first once either max_entries
+    or max_bytes (measured as the JSON size of the values) is exceeded.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        max_bytes: Optional[int] = None,
+        default_ttl: Optional[float] = 3600,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+
+        # key -> (expires_at or None, size in bytes, value)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, size, value = entry
+            if expires_at is not None and expires_at <= time.time():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        ttl = self.default_ttl if ttl is None else ttl
+        expires_at = time.time() + ttl if ttl else None
+        size = len(json.dumps(value, default=str))
+
+        # A single value larger than the whole budget is never stored
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            self._entries[key] = (expires_at, size, value)
+            self._bytes += size
+
+            while len(self._entries) > self.max_entries or (
+                self.max_bytes is not None and self._bytes > self.max_bytes
+            ):
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self.evictions += 1
+
+    def delete(self, key: str):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "tier": "memory",
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+    def _remove(self, key: str):
+        """Drop an entry; caller must hold the lock."""
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+
+# ----------------------------------------------------------------
+# On-Disk Tier
+# ----------------------------------------------------------------
+class SQLiteCache(CacheBackend):
+    """
+    Persistent cache stored in a single SQLite file.
+
+    Writes (including the access times updated by reads) are queued and
+    applied by a background writer thread in batches, so set() never waits
+    for the disk; queued values are served to reads until they are written.
+    Expired rows are ignored on read and purged by the writer. When the
+    entry count exceeds max_entries the least recently accessed rows are
+    deleted. The count is kept up to date as rows are written and deleted
+    instead of being counted on every write.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_entries: int = 100000,
+        default_ttl: Optional[float] = 3600,
+        table: str = "cache",
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.table = table
+
+        self._connect()
+        _sqlite_caches.add(self)
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.write_errors = 0
+
+    def _connect(self):
+        """Open the database connection and create the table if needed."""
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table} ("
+            "key TEXT PRIMARY KEY, "
+            "value TEXT NOT NULL, "
+            "expires_at REAL, "
+            "accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            f"CREATE INDEX IF NOT EXISTS {self.table}_accessed_at ON {self.table} (accessed_at)"
+        )
+        self._conn.execute(
+            f"CREATE INDEX IF NOT EXISTS {self.table}_expires_at ON {self.table} (expires_at)"
+        )
+        self._conn.commit()
+        self._entries = self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+        # Writes waiting for the writer thread, and the values they carry
+        self._queue: "queue.Queue[Tuple]" = queue.Queue()
+        self._pending: Dict[str, Tuple[str, Optional[float]]] = {}
+        self._writer: Optional[threading.Thread] = None
+
+    def get(self, key: str) -> Optional[Any]:
+        return self.get_with_ttl(key)[0]
+
+    def get_with_ttl(self, key: str) -> Tuple[Optional[Any], Optional[float]]:
+        """
+        Return the cached value and its remaining TTL in seconds.
+
+        The TTL is None for entries that never expire.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._pending.get(key)
+            if row is None:
+                row = self._conn.execute(
+                    f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)
+                ).fetchone()
+
+            if row is None or (row[1] is not None and row[1] <= now):
+                self.misses += 1
+                return None, None
+            self.hits += 1
+
+        self._enqueue(("touch", key, now))
+        remaining = row[1] - now if row[1] is not None else None
+        return json.loads(row[0]), remaining
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        ttl = self.default_ttl if ttl is None else ttl
+        now = time.time()
+        entry = (json.dumps(value, default=str), now + ttl if ttl else None)
+
+        with self._lock:
+            self._pending[key] = entry
+        self._enqueue(("set", key, entry, now))
+
+    def delete(self, key: str):
+        self._enqueue(("delete", key))
+        self.flush()
+
+    def clear(self):
+        self._enqueue(("clear",))
+        self.flush()
+
+    def flush(self):
+        """Wait until every queued write has been applied."""
+        self._queue.join()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            count = self._entries
+            pending = self._queue.qsize()
+        return {
+            "tier": "sqlite",
+            "path": self.path,
+            "entries": count,
+            "max_entries": self.max_entries,
+            "pending_writes": pending,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "write_errors": self.write_errors,
+        }
+
+    def _enqueue(self, op: Tuple):
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(
+                    target=self._write_loop, name=f"sqlite-cache-{self.table}", daemon=True
+                )
+                self._writer.start()
+        self._queue.put(op)
+
+    def _write_loop(self):
+        """Apply queued writes in batches, one transaction per batch (writer thread)."""
+        conn = sqlite3.connect(self.path)
+        while True:
+            ops = [self._queue.get()]
+            while True:
+                try:
+                    ops.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._apply(conn, ops)
+            except sqlite3.Error as e:
+                conn.rollback()
+                self.write_errors += 1
+                print(f"Warning: cache write to {self.path} failed: {e}")
+            finally:
+                with self._lock:
+                    for op in ops:
+                        if op[0] == "set" and self._pending.get(op[1]) is op[2]:
+                            del self._pending[op[1]]
+                for _ in ops:
+                    self._queue.task_done()
+
+    def _apply(self, conn: sqlite3.Connection, ops: list):
+        added = removed = 0
+        for op in ops:
+            if op[0] == "set":
+                _, key, (payload, expires_at), now = op
+                exists = conn.execute(f"SELECT 1 FROM {self.table} WHERE key = ?", (key,)).fetchone()
+                conn.execute(
+                    f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at, accessed_at) "
+                    "VALUES (?, ?, ?, ?)",
+                    (key, payload, expires_at, now),
+                )
+                added += exists is None
+            elif op[0] == "touch":
+                conn.execute(f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?", (op[2], op[1]))
+            elif op[0] == "delete":
+                removed += conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (op[1],)).rowcount
+            elif op[0] == "clear":
+                removed += conn.execute(f"DELETE FROM {self.table}").rowcount
+
+        removed += conn.execute(
+            f"DELETE FROM {self.table} WHERE expires_at IS NOT NULL AND expires_at <= ?",
+            (time.time(),),
+        ).rowcount
+
+        count = self._entries + added - removed
+        evicted = 0
+        if count > self.max_entries:
+            evicted = conn.execute(
+                f"DELETE FROM {self.table} WHERE key IN ("
+                f"SELECT key FROM {self.table} ORDER BY accessed_at LIMIT ?)",
+                (count - self.max_entries,),
+            ).rowcount
+        conn.commit()
+
+        with self._lock:
+            self._entries = count - evicted
+            self.evictions += evicted
+
+
+# SQLite connections must not be shared with forked worker processes
+_sqlite_caches: "weakref.WeakSet[SQLiteCache]" = weakref.WeakSet()
+
+
+def _reconnect_after_fork():
+    for cache in list(_sqlite_caches):
+        cache._connect()
+
+
+def _flush_at_exit():
+    for cache in list(_sqlite_caches):
+        cache.flush()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reconnect_after_fork)
+atexit.register(_flush_at_exit)
+
+
+# ----------------------------------------------------------------
+# Combined Tiers
+# ----------------------------------------------------------------
+class TieredCache(CacheBackend):
+    """
+    Memory tier in front of a persistent tier.
+
+    Reads check memory first and promote persistent hits into memory;
+    writes go to both tiers.
+    """
+
+    def __init__(self, memory: CacheBackend, persistent: CacheBackend):
+        self.memory = memory
+        self.persistent = persistent
+        self.default_ttl = getattr(persistent, "default_ttl", None)
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self.memory.get(key)
+        if value is not None:
+            return value
+
+        if hasattr(self.persistent, "get_with_ttl"):
+            value, ttl = self.persistent.get_with_ttl(key)
+        else:
+            value, ttl = self.persistent.get(key), None
+
+        # Promote without outliving the persistent entry
+        if value is not None:
+            self.memory.set(key, value, ttl)
+        return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        self.memory.set(key, value, ttl)
+        self.persistent.set(key, value, ttl)
+
+    def delete(self, key: str):
+        self.memory.delete(key)
+        self.persistent.delete(key)
+
+    def clear(self):
+        self.memory.clear()
+        self.persistent.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        memory = self.memory.stats()
+        persistent = self.persistent.stats()
+        # A request is a miss only if both tiers missed
+        return {
+            "tier": "tiered",
+            "hits": memory["hits"] + persistent["hits"],
+            "misses": persistent["misses"],
+            "memory": memory,
+            "persistent": persistent,
+        }
+
+
+def build_cache(
+    max_entries: int = 1024,
+    max_bytes: Optional[int] = None,
+    default_ttl: Optional[float] = 3600,
+    path: Optional[str] = None,
+    table: str = "cache",
+) -> CacheBackend:
+    """
+    Build a memory cache, optionally backed by SQLite.
+
+    Args:
+        max_entries: Entry cap for the memory tier
+        max_bytes: Byte cap for the memory tier (None for no cap)
+        default_ttl: Default time-to-live in seconds (None or 0 to never expire)
+        path: SQLite file for the persistent tier; memory-only if not set
+        table: Table name inside the SQLite file
+
+    Returns:
+        A CacheBackend
+    """
+    memory = MemoryCache(max_entries=max_entries, max_bytes=max_bytes, default_ttl=default_ttl)
+    if not path:
+        return memory
+    return TieredCache(memory, SQLiteCache(path, default_ttl=default_ttl, table=table))
@@ -0,0 +1,616 @@
+"""
+Website Crawler
+
+Fetches a business's own website so analyses can quote what the business
+says about itself instead of relying only on third-party search snippets.
+
+A crawl reads the homepage and then a bounded number of same-site pages
+it links to (about, products, pricing, ... first), concurrently and within
+a time and byte budget: pages still loading when the budget runs out are
+dropped, never waited for. Along the way the crawler
+
+- honors robots.txt (RFC 9309) for its user agent,
+- limits concurrent requests per host,
+- parses HTML as it streams in, keeping compact visible text and stopping
+  the download once a page's byte or text cap is reached,
+- caches pages by URL and revalidates stale ones with their ETag /
+  Last-Modified validators, so unchanged pages cost a 304.
+
+Hosts resolving to private, loopback or link-local addresses are refused
+unless CRAWL_ALLOW_PRIVATE=1, since the URL comes from API callers.
+"""
+
+import os
+import time
+import codecs
+import socket
+import asyncio
+import ipaddress
+from html.parser import HTMLParser
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urldefrag, urljoin, urlsplit
+from urllib.robotparser import RobotFileParser
+
+import httpx
+
+from .http_client import get_http_client
+from .cache import CacheBackend, build_cache, make_cache_key
+
+# Crawl budget: pages per crawl, seconds per crawl, bytes downloaded per
+# crawl and per page, and characters of text kept per page
+CRAWL_ENABLED = os.environ.get("CRAWL_ENABLED", "1") != "0"
+CRAWL_MAX_PAGES = int(os.environ.get("CRAWL_MAX_PAGES", "5"))
+CRAWL_TIME_BUDGET = float(os.environ.get("CRAWL_TIME_BUDGET", "4"))
+CRAWL_MAX_BYTES = int(os.environ.get("CRAWL_MAX_BYTES", str(1024 * 1024)))
+CRAWL_MAX_PAGE_BYTES = int(os.environ.get("CRAWL_MAX_PAGE_BYTES", str(256 * 1024)))
+CRAWL_MAX_PAGE_CHARS = int(os.environ.get("CRAWL_MAX_PAGE_CHARS", "6000"))
+
+# Seconds a crawl may go on after its caller signals stop (see acrawl_site)
+CRAWL_STOP_GRACE = float(os.environ.get("CRAWL_STOP_GRACE", "0.5"))
+
+# Concurrent requests per host, and per-request timeout in seconds
+CRAWL_HOST_CONCURRENCY = int(os.environ.get("CRAWL_HOST_CONCURRENCY", "3"))
+CRAWL_REQUEST_TIMEOUT = float(os.environ.get("CRAWL_REQUEST_TIMEOUT", "3"))
+
+CRAWL_USER_AGENT = os.environ.get(
+    "CRAWL_USER_AGENT", "ProductivityEnginesBot/1.0 (+marketing research; respects robots.txt)"
+)
+CRAWL_ALLOW_PRIVATE = os.environ.get("CRAWL_ALLOW_PRIVATE", "0") == "1"
+
+# Seconds a cached page (or robots.txt) is used without asking the site again
+CRAWL_CACHE_FRESH = float(os.environ.get("CRAWL_CACHE_FRESH", "3600"))
+
+# Redirects followed per page (each hop is checked like the original URL)
+MAX_REDIRECTS = 3
+
+# Linked pages most worth reading, by path keyword (earlier is better)
+PRIORITY_KEYWORDS = (
+    "about", "product", "service", "solution", "pricing", "feature",
+    "customer", "case-stud", "team", "company", "industr", "blog", "contact",
+)
+
+# Links that never lead to readable HTML
+SKIP_EXTENSIONS = (
+    ".jpg", ".jpeg", ".png", ".gif", ".svg", ".webp", ".ico", ".pdf", ".zip",
+    ".mp4", ".mp3", ".css", ".js", ".json", ".xml", ".rss", ".woff", ".woff2",
+)
+SKIP_PATH_PARTS = ("login", "signin", "sign-in", "signup", "cart", "checkout", "account", "wp-admin")
+
+# Elements whose text is never visible, and elements that end a line of text
+_HIDDEN_TAGS = {"script", "style", "noscript", "svg", "template", "iframe", "canvas"}
+_BLOCK_TAGS = {
+    "p", "div", "section", "article", "header", "footer", "main", "aside", "nav",
+    "li", "ul", "ol", "br", "tr", "table", "h1", "h2", "h3", "h4", "h5", "h6",
+    "blockquote", "pre", "form", "dd", "dt", "figcaption",
+}
+_HTML_TYPES = ("text/html", "application/xhtml+xml")
+
+# Cache status of a fetched page
+PAGE_HIT = "hit"
+PAGE_REVALIDATED = "revalidated"
+PAGE_MISS = "miss"
+
+# Page and robots.txt cache (see set_crawl_cache)
+crawl_cache: Optional[CacheBackend] = None
+
+
+class CrawlError(Exception):
+    """Raised when a page can't be crawled (refused, blocked or failed)."""
+
+
+# ----------------------------------------------------------------
+# Page Cache
+# ----------------------------------------------------------------
+def build_crawl_cache() -> CacheBackend:
+    """
+    Build the page cache from environment settings.
+
+    CRAWL_CACHE_TTL: Seconds a page is kept for revalidation (default 7 days)
+    CRAWL_CACHE_MAX_ENTRIES: Entry cap for the memory tier (default 2048)
+    CRAWL_CACHE_MAX_BYTES: Byte cap for the memory tier (default 32 MB)
+    CRAWL_CACHE_PATH: SQLite file for an on-disk tier (memory only if unset)
+    """
+    return build_cache(
+        max_entries=int(os.environ.get("CRAWL_CACHE_MAX_ENTRIES", "2048")),
+        max_bytes=int(os.environ.get("CRAWL_CACHE_MAX_BYTES", str(32 * 1024 * 1024))),
+        default_ttl=float(os.environ.get("CRAWL_CACHE_TTL", str(7 * 86400))),
+        path=os.environ.get("CRAWL_CACHE_PATH"),
+        table="crawl_cache",
+    )
+
+
+def get_crawl_cache() -> CacheBackend:
+    """Get the page cache, building the default one on first use."""
+    global crawl_cache
+    if crawl_cache is None:
+        crawl_cache = build_crawl_cache()
+    return crawl_cache
+
+
+def set_crawl_cache(cache: Optional[CacheBackend]):
+    """
+    Install the cache used for crawled pages and robots.txt files.
+
+    Args:
+        cache: Any CacheBackend, or None to go back to the default one
+    """
+    global crawl_cache
+    crawl_cache = cache
+
+
+def page_cache_key(url: str) -> str:
+    return make_cache_key("page", {"url": url})
+
+
+# ----------------------------------------------------------------
+# HTML Extraction
+# ----------------------------------------------------------------
+class TextExtractor(HTMLParser):
+    """
+    Incremental HTML parser collecting a page's title, description,
+    visible text and links.
+
+    Feed it chunks as they arrive; once `full` is set the text cap has been
+    reached and the rest of the page can be skipped.
+
+    Args:
+        base_url: URL of the page, used to resolve relative links
+        max_chars: Characters of text to keep
+    """
+
+    def __init__(self, base_url: str, max_chars: int = CRAWL_MAX_PAGE_CHARS):
+        super().__init__(convert_charrefs=True)
+        self.base_url = base_url
+        self.max_chars = max_chars
+        self.title = ""
+        self.description = ""
+        self.links: List[str] = []
+        self._lines: List[str] = []
+        self._line: List[str] = []
+        self._chars = 0
+        self._hidden = 0
+        self._in_title = False
+
+    @property
+    def full(self) -> bool:
+        return self._chars >= self.max_chars
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _HIDDEN_TAGS:
+            self._hidden += 1
+            return
+        if tag == "title":
+            self._in_title = True
+        elif tag == "meta":
+            attributes = dict(attrs)
+            name = (attributes.get("name") or attributes.get("property") or "").lower()
+            if name in ("description", "og:description") and not self.description:
+                self.description = " ".join((attributes.get("content") or "").split())
+        elif tag == "a":
+            href = dict(attrs).get("href")
+            if href and len(self.links) < 500:
+                self.links.append(urldefrag(urljoin(self.base_url, href.strip()))[0])
+        elif tag in _BLOCK_TAGS:
+            self._end_line()
+
+    def handle_endtag(self, tag):
+        if tag in _HIDDEN_TAGS:
+            self._hidden = max(self._hidden - 1, 0)
+        elif tag == "title":
+            self._in_title = False
+        elif tag in _BLOCK_TAGS:
+            self._end_line()
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title = " ".join(f"{self.title} {data}".split())
+        elif not self._hidden and not self.full:
+            self._line.append(data)
+
+    def _end_line(self):
+        line = " ".join("".join(self._line).split())
+        self._line = []
+        if line and not self.full:
+            self._lines.append(line[:self.max_chars - self._chars])
+            self._chars += len(line) + 1
+
+    def lines(self) -> List[str]:
+        """The page's visible text, one line per block element."""
+        self._end_line()
+        return self._lines
+
+
+# ----------------------------------------------------------------
+# Fetching
+# ----------------------------------------------------------------
+def site_root(website_url: str) -> str:
+    """Homepage URL of a website given with or without a scheme."""
+    url = website_url.strip()
+    if "://" not in url:
+        url = f"https://{url}"
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}{parts.path or '/'}"
+
+
+def _bare_host(url: str) -> str:
+    host = (urlsplit(url).hostname or "").lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+async def _check_public_host(host: str):
+    """Refuse hosts that resolve to non-public addresses (unless allowed)."""
+    if CRAWL_ALLOW_PRIVATE:
+        return
+    try:
+        infos = await asyncio.get_running_loop().getaddrinfo(host, None, type=socket.SOCK_STREAM)
+    except OSError as e:
+        raise CrawlError(f"Cannot resolve {host}: {e}")
+    for info in infos:
+        address = ipaddress.ip_address(info[4][0])
+        if not address.is_global:
+            raise CrawlError(f"Refusing to crawl non-public address {address} of {host}")
+
+
+class Crawler:
+    """
+    One site crawl: shares per-host limits, robots.txt rules and the byte
+    budget between the pages it fetches.
+
+    Args:
+        max_bytes: Bytes the whole crawl may download
+        deadline: time.monotonic() value after which no request is started
+    """
+
+    def __init__(self, max_bytes: int = CRAWL_MAX_BYTES, deadline: Optional[float] = None):
+        self.max_bytes = max_bytes
+        self.deadline = deadline
+        self.bytes_read = 0
+        self.blocked: List[str] = []
+        self._robots: Dict[str, Any] = {}
+        self._robots_locks: Dict[str, asyncio.Lock] = {}
+        self._host_limits: Dict[str, asyncio.Semaphore] = {}
+        self._checked_hosts: Dict[str, bool] = {}
+
+    def _host_limit(self, host: str) -> asyncio.Semaphore:
+        if host not in self._host_limits:
+            self._host_limits[host] = asyncio.Semaphore(CRAWL_HOST_CONCURRENCY)
+        return self._host_limits[host]
+
+    def _timeout(self) -> float:
+        if self.deadline is None:
+            return CRAWL_REQUEST_TIMEOUT
+        return max(min(CRAWL_REQUEST_TIMEOUT, self.deadline - time.monotonic()), 0.01)
+
+    async def _check_host(self, host: str):
+        if host not in self._checked_hosts:
+            await _check_public_host(host)
+            self._checked_hosts[host] = True
+
+    async def _get(self, url: str, headers: Dict[str, str]) -> Tuple[httpx.Response, str]:
+        """
+        Open a streamed GET, following redirects after checking each hop.
+
+        Returns:
+            Tuple of (open response, final URL); the caller closes the response
+        """
+        client = get_http_client()
+        for _ in range(MAX_REDIRECTS + 1):
+            host = (urlsplit(url).hostname or "").lower()
+            if urlsplit(url).scheme not in ("http", "https") or not host:
+                raise CrawlError(f"Not a web URL: {url}")
+            await self._check_host(host)
+            request = client.build_request(
+                "GET", url, headers={"User-Agent": CRAWL_USER_AGENT, **headers}, timeout=self._timeout()
+            )
+            try:
+                async with self._host_limit(host):
+                    response = await client.send(request, stream=True)
+            except (httpx.HTTPError, OSError) as e:
+                # OSError: e.g. TLS handshake failures surfacing as ssl.SSLError
+                raise CrawlError(f"{type(e).__name__} fetching {url}")
+            if response.status_code not in (301, 302, 303, 307, 308) or "location" not in response.headers:
+                return response, url
+            await response.aclose()
+            url = urldefrag(urljoin(url, response.headers.get("location", "")))[0]
+        raise CrawlError(f"Too many redirects: {url}")
+
+    async def _robots_for(self, url: str) -> Optional[RobotFileParser]:
+        """
+        Robots rules of a URL's origin (None: everything is allowed).
+
+        Raises:
+            CrawlError: robots.txt couldn't be requested at all, i.e. the
+                site is unreachable
+        """
+        parts = urlsplit(url)
+        origin = f"{parts.scheme}://{parts.netloc}"
+        lock = self._robots_locks.setdefault(origin, asyncio.Lock())
+        async with lock:
+            if origin not in self._robots:
+                try:
+                    self._robots[origin] = await self._load_robots(origin)
+                except CrawlError as e:
+                    self._robots[origin] = e
+        rules = self._robots[origin]
+        if isinstance(rules, CrawlError):
+            raise rules
+        return rules
+
+    async def _load_robots(self, origin: str) -> Optional[RobotFileParser]:
+        cache = get_crawl_cache()
+        key = make_cache_key("robots", {"origin": origin})
+        cached = cache.get(key)
+        if cached is None or time.time() - cached["fetched_at"] > CRAWL_CACHE_FRESH:
+            cached = {"status": 0, "text": "", "fetched_at": time.time()}
+            response, _ = await self._get(f"{origin}/robots.txt", {})
+            try:
+                cached["status"] = response.status_code
+                if response.status_code == 200:
+                    body = await _read_capped(response, 512 * 1024)
+                    cached["text"] = body.decode("utf-8", errors="replace")
+            except (httpx.HTTPError, OSError) as e:
+                raise CrawlError(f"{type(e).__name__} reading {origin}/robots.txt")
+            finally:
+                await response.aclose()
+            cache.set(key, cached)
+
+        if cached["status"] == 200:
+            rules = RobotFileParser()
+            rules.parse(cached["text"].splitlines())
+            return rules
+        if cached["status"] >= 500:
+            # RFC 9309: a failing robots.txt disallows everything for now
+            rules = RobotFileParser()
+            rules.disallow_all = True
+            return rules
+        # No robots.txt (4xx): everything is allowed
+        return None
+
+    async def allowed(self, url: str) -> bool:
+        """Whether robots.txt lets the crawler fetch a URL."""
+        rules = await self._robots_for(url)
+        return rules is None or rules.can_fetch(CRAWL_USER_AGENT, url)
+
+    async def fetch_page(self, url: str) -> Dict[str, Any]:
+        """
+        Fetch and extract one page through the page cache.
+
+        Fresh cached pages are used as they are; stale ones are revalidated
+        with their ETag / Last-Modified.
+
+        Returns:
+            Page dictionary with "url", "title", "description", "lines",
+            "links" and the "cache_status" of the fetch
+
+        Raises:
+            CrawlError: robots.txt disallows the page, it isn't HTML, or the
+                request failed
+        """
+        cache = get_crawl_cache()
+        key = page_cache_key(url)
+        cached = cache.get(key)
+        if cached is not None and time.time() - cached["fetched_at"] <= CRAWL_CACHE_FRESH:
+            return dict(cached, cache_status=PAGE_HIT)
+
+        await self._check_host((urlsplit(url).hostname or "").lower())
+        if not await self.allowed(url):
+            self.blocked.append(url)
+            raise CrawlError(f"Disallowed by robots.txt: {url}")
+        if self.bytes_read >= self.max_bytes:
+            raise CrawlError("Crawl byte budget exhausted")
+
+        headers = {"Accept": "text/html,application/xhtml+xml;q=0.9,*/*;q=0.1"}
+        if cached is not None:
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        response, final_url = await self._get(url, headers)
+        try:
+            if response.status_code == 304 and cached is not None:
+                page = dict(cached, fetched_at=time.time())
+                cache.set(key, page)
+                return dict(page, cache_status=PAGE_REVALIDATED)
+            if response.status_code != 200:
+                raise CrawlError(f"{url} returned status code {response.status_code}")
+            content_type = response.headers.get("content-type", "text/html").lower()
+            if not content_type.startswith(_HTML_TYPES):
+                raise CrawlError(f"{url} is not HTML ({content_type})")
+            page = await self._extract(response, final_url)
+        except (httpx.HTTPError, OSError) as e:
+            raise CrawlError(f"{type(e).__name__} reading {url}")
+        finally:
+            await response.aclose()
+
+        page.update(
+            url=final_url,
+            etag=response.headers.get("etag"),
+            last_modified=response.headers.get("last-modified"),
+            fetched_at=time.time(),
+        )
+        cache.set(key, page)
+        return dict(page, cache_status=PAGE_MISS)
+
+    async def _extract(self, response: httpx.Response, url: str) -> Dict[str, Any]:
+        """Parse a page as it downloads, stopping at the page or crawl byte cap."""
+        parser = TextExtractor(url)
+        try:
+            decoder = codecs.getincrementaldecoder(response.charset_encoding or "utf-8")(errors="replace")
+        except LookupError:
+            decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        # aiter_bytes() undoes the Content-Encoding, so the caps apply to
+        # the decoded page
+        page_bytes = 0
+        async for chunk in response.aiter_bytes():
+            chunk = chunk[:CRAWL_MAX_PAGE_BYTES - page_bytes]
+            page_bytes += len(chunk)
+            self.bytes_read += len(chunk)
+            parser.feed(decoder.decode(chunk))
+            if parser.full or page_bytes >= CRAWL_MAX_PAGE_BYTES or self.bytes_read >= self.max_bytes:
+                break
+        parser.feed(decoder.decode(b"", final=True))
+        return {
+            "title": parser.title,
+            "description": parser.description,
+            "lines": parser.lines(),
+            "links": parser.links,
+        }
+
+
+async def _read_capped(response: httpx.Response, limit: int) -> bytes:
+    body = b""
+    async for chunk in response.aiter_bytes():
+        body += chunk
+        if len(body) >= limit:
+            break
+    return body[:limit]
+
+
+def rank_links(links: List[str], host: str, exclude: List[str]) -> List[str]:
+    """
+    Same-site links worth crawling, most informative first.
+
+    Pages whose path names a priority keyword come first (in keyword order),
+    then the rest by path depth; assets, login pages and query-string
+    variants are skipped.
+    """
+    site = host[4:] if host.startswith("www.") else host
+    seen = set(url.rstrip("/") for url in exclude)
+    ranked = []
+    for url in links:
+        parts = urlsplit(url)
+        path = parts.path.lower()
+        key = url.rstrip("/")
+        if (
+            parts.scheme not in ("http", "https")
+            or parts.query
+            or key in seen
+            or _bare_host(url) != site
+            or path.endswith(SKIP_EXTENSIONS)
+            or any(part in path for part in SKIP_PATH_PARTS)
+        ):
+            continue
+        seen.add(key)
+        priority = next((i for i, word in enumerate(PRIORITY_KEYWORDS) if word in path), len(PRIORITY_KEYWORDS))
+        ranked.append((priority, path.count("/"), len(path), url))
+    return [url for *_, url in sorted(ranked)]
+
+
+# ----------------------------------------------------------------
+# Site Crawl
+# ----------------------------------------------------------------
+async def acrawl_site(
+    website_url: str,
+    max_pages: int = CRAWL_MAX_PAGES,
+    time_budget: float = CRAWL_TIME_BUDGET,
+    max_bytes: int = CRAWL_MAX_BYTES,
+    stop: Optional[asyncio.Event] = None,
+    grace: float = CRAWL_STOP_GRACE,
+) -> Dict[str, Any]:
+    """
+    Crawl a website's homepage and its most informative same-site pages.
+
+    The homepage is fetched first; the pages it links to are then fetched
+    concurrently. Whatever has arrived when the time budget runs out, or
+    grace seconds after stop is set, is returned. Lines repeated across
+    pages (navigation, footers) are kept only on the first page they
+    appear on.
+
+    Args:
+        website_url: The website, with or without a scheme
+        max_pages: Pages to read, including the homepage
+        time_budget: Seconds the whole crawl may take
+        max_bytes: Bytes the whole crawl may download
+        stop: Event ending the crawl early, e.g. once the work it runs
+            alongside is done
+        grace: Seconds the crawl may go on after stop is set
+
+    Returns:
+        Dictionary with the crawled "pages" (url, title, description, text,
+        cache_status) in crawl order, plus "errors", "blocked" URLs,
+        "bytes" downloaded and "seconds" taken. Crawling never raises; a
+        site that can't be read yields no pages.
+    """
+    start = time.monotonic()
+    crawler = Crawler(max_bytes=max_bytes, deadline=start + time_budget)
+    report = {"pages": [], "errors": [], "blocked": crawler.blocked, "bytes": 0, "seconds": 0.0}
+    if not website_url or max_pages <= 0:
+        return report
+
+    website_url = website_url.strip()
+    root = site_root(website_url)
+    host = (urlsplit(root).hostname or "").lower()
+    pages: List[Dict[str, Any]] = []
+
+    async def fetch(url: str):
+        try:
+            pages.append(await crawler.fetch_page(url))
+        except CrawlError as e:
+            report["errors"].append(str(e))
+        except Exception as e:
+            report["errors"].append(f"{type(e).__name__} crawling {url}: {e}")
+
+    async def crawl():
+        await fetch(root)
+        if not pages and "://" not in website_url:
+            # Sites given without a scheme may only serve plain HTTP
+            await fetch("http://" + root.split("://", 1)[1])
+        if not pages or max_pages <= 1:
+            return
+        links = rank_links(pages[0]["links"], host, [root, pages[0]["url"]])
+        await asyncio.gather(*(fetch(url) for url in links[:max_pages - 1]))
+
+    task = asyncio.ensure_future(crawl())
+    waiters = [task]
+    if stop is not None:
+        waiters.append(asyncio.ensure_future(stop.wait()))
+    await asyncio.wait(waiters, timeout=time_budget, return_when=asyncio.FIRST_COMPLETED)
+    if not task.done() and stop is not None and stop.is_set():
+        await asyncio.wait([task], timeout=min(grace, max(start + time_budget - time.monotonic(), 0)))
+    for waiter in waiters:
+        waiter.cancel()
+    if not task.done() or task.cancelled():
+        stopped = stop is not None and stop.is_set()
+        reason = "once its caller was done" if stopped else f"at its {time_budget:g}s time budget"
+        report["errors"].append(f"Crawl stopped {reason}")
+
+    seen_lines = set()
+    for page in pages:
+        lines = []
+        for line in page["lines"]:
+            if line not in seen_lines:
+                seen_lines.add(line)
+                lines.append(line)
+        report["pages"].append({
+            "url": page["url"],
+            "title": page["title"],
+            "description": page["description"],
+            "text": "\n".join(lines),
+            "cache_status": page["cache_status"],
+        })
+    report["bytes"] = crawler.bytes_read
+    report["seconds"] = round(time.monotonic() - start, 3)
+    return report
+
+
+def format_pages(pages: List[Dict[str, Any]]) -> str:
+    """
+    Format crawled pages for a prompt.
+
+    Args:
+        pages: Pages as returned in acrawl_site()'s "pages"
+
+    Returns:
+        Formatted string of the pages, or "" if there are none
+    """
+    formatted = []
+    for page in pages:
+        header = page["title"] or page["url"]
+        parts = [f"[{header}]", f"URL: {page['url']}"]
+        if page.get("description"):
+            parts.append(page["description"])
+        if page.get("text"):
+            parts.append(page["text"])
+        formatted.append("\n".join(parts) + "\n")
+    return "\n".join(formatted)
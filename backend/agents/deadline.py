@@ -0,0 +1,161 @@
+"""
+Request Deadlines
+
+An end-to-end time budget for one request, split across its phases so
+that a slow upstream degrades the answer instead of stalling it.
+
+A request carries its budget in seconds, either in its "deadline" field
+or in the X-Request-Deadline header (see with_deadline); without
+either, REQUEST_DEADLINE applies. The clock starts when the agent begins
+the request. The search phase may use a share of the budget; when it
+runs out, the analysis goes ahead with the results that have arrived.
+The completion gets what is left: if that is too little for a full
+answer the model is asked for a brief one, and a completion still running
+at the deadline is cut off and returned as partial.
+
+Degraded responses say why in their "degraded" list (see the DEGRADED_*
+reasons) and set "partial" when the analysis text was cut off.
+"""
+
+import os
+import time
+import asyncio
+from typing import AsyncIterator, Optional, TypeVar
+
+from pydantic import BaseModel
+
+# Header carrying a request's time budget in seconds
+DEADLINE_HEADER = "X-Request-Deadline"
+
+# Budget of requests that don't set one (0: none), and the largest allowed
+REQUEST_DEADLINE = float(os.environ.get("REQUEST_DEADLINE", "0"))
+REQUEST_DEADLINE_MAX = float(os.environ.get("REQUEST_DEADLINE_MAX", "300"))
+
+# Share of the budget the search phase may use; seconds kept back at the
+# end for assembling and storing the response
+DEADLINE_SEARCH_SHARE = float(os.environ.get("DEADLINE_SEARCH_SHARE", "0.4"))
+DEADLINE_RESERVE = float(os.environ.get("DEADLINE_RESERVE", "0.25"))
+
+# Generation speed assumed when sizing an answer to the remaining time,
+# and the smallest answer worth asking for
+DEADLINE_TOKENS_PER_SECOND = float(os.environ.get("DEADLINE_TOKENS_PER_SECOND", "40"))
+DEADLINE_MIN_TOKENS = int(os.environ.get("DEADLINE_MIN_TOKENS", "120"))
+
+# Reasons a response was degraded to meet its deadline
+DEGRADED_SEARCH = "search_timeout"  # some searches were still running
+DEGRADED_BRIEF = "brief"  # the model was asked for a shorter answer
+DEGRADED_PARTIAL = "partial"  # the completion was cut off
+DEGRADED_STALE = "stale"  # the previous analysis was returned unchanged
+
+T = TypeVar("T")
+
+
+class DeadlineExceeded(Exception):
+    """The request's deadline passed before the operation finished."""
+
+
+class Deadline:
+    """
+    Point in time a request has to be answered by.
+
+    Args:
+        seconds: Time budget from now
+        reserve: Seconds kept back for finishing the response
+    """
+
+    def __init__(self, seconds: float, reserve: float = DEADLINE_RESERVE):
+        self.seconds = seconds
+        self.reserve = min(reserve, seconds / 4)
+        self.started = time.monotonic()
+        self.expires_at = self.started + seconds
+
+    @classmethod
+    def after(cls, seconds: Optional[float]) -> Optional["Deadline"]:
+        """A deadline for the requested budget (see resolve_budget), or None."""
+        budget = resolve_budget(seconds)
+        return cls(budget) if budget is not None else None
+
+    def remaining(self) -> float:
+        """Seconds left for work, excluding the reserve."""
+        return max(self.expires_at - self.reserve - time.monotonic(), 0.0)
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def share(self, fraction: float) -> float:
+        """Seconds of the original budget a phase may use, capped by what is left."""
+        return min(self.seconds * fraction, self.remaining())
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+
+def resolve_budget(seconds: Optional[float]) -> Optional[float]:
+    """The budget a request gets: its own or REQUEST_DEADLINE, capped at REQUEST_DEADLINE_MAX."""
+    budget = seconds if seconds else REQUEST_DEADLINE
+    if not budget or budget <= 0:
+        return None
+    return min(budget, REQUEST_DEADLINE_MAX) if REQUEST_DEADLINE_MAX > 0 else budget
+
+
+def parse_deadline_header(value: Optional[str]) -> Optional[float]:
+    """
+    Parse an X-Request-Deadline header value.
+
+    Raises:
+        ValueError: The value is not a positive number of seconds
+    """
+    if value is None or not value.strip():
+        return None
+    seconds = float(value)
+    if not seconds > 0:
+        raise ValueError(f"{DEADLINE_HEADER} must be a positive number of seconds")
+    return seconds
+
+
+def with_deadline(request: BaseModel, seconds: Optional[float]) -> BaseModel:
+    """
+    Set the budget of a request whose model has a "deadline" field.
+
+    Used for the header, which wins over the field. Requests of models
+    without the field are returned unchanged.
+    """
+    if seconds is None or "deadline" not in type(request).model_fields:
+        return request
+    return request.model_copy(update={"deadline": seconds})
+
+
+def tokens_within(deadline: Deadline, max_tokens: int) -> int:
+    """Completion tokens that fit into the remaining time (at most max_tokens)."""
+    fit = int(deadline.remaining() * DEADLINE_TOKENS_PER_SECOND)
+    return min(max(fit, DEADLINE_MIN_TOKENS), max_tokens)
+
+
+async def until(iterator: AsyncIterator[T], deadline: Optional[Deadline]) -> AsyncIterator[T]:
+    """
+    Yield from an async iterator until the deadline passes.
+
+    Raises:
+        DeadlineExceeded: The deadline passed first; the iterator is closed
+    """
+    if deadline is None:
+        async for item in iterator:
+            yield item
+        return
+
+    try:
+        while True:
+            try:
+                item = await asyncio.wait_for(iterator.__anext__(), timeout=deadline.remaining())
+            except StopAsyncIteration:
+                return
+            except asyncio.TimeoutError:
+                raise DeadlineExceeded(f"deadline of {deadline.seconds:g}s exceeded") from None
+            yield item
+    finally:
+        aclose = getattr(iterator, "aclose", None)
+        if aclose is not None:
+            try:
+                await aclose()
+            except Exception:
+                pass
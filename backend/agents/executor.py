@@ -0,0 +1,312 @@
+"""
+Agent Execution
+
+Runs registered agents behind per-agent concurrency pools, so a slow or
+overloaded agent queues its own requests instead of starving the others.
+
+Each agent declares in its manifest entry (see the agent registry) how
+many requests it runs at once, how many may wait for a slot, and how long
+a run may take. Requests beyond the waiting limit are rejected right away
+with AgentBusyError, and runs over the timeout are cancelled with
+AgentTimeoutError. Agents with a synchronous runner get their own bounded
+thread pool rather than sharing the server's default one.
+"""
+
+import os
+import time
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Deque, Dict, Optional
+
+from pydantic import BaseModel
+
+from . import agent_stats, discover, get_agent
+from . import metrics
+
+# Defaults for agents whose manifest entry doesn't set them
+AGENT_MAX_CONCURRENCY = int(os.environ.get("AGENT_MAX_CONCURRENCY", "16"))
+AGENT_MAX_QUEUE = int(os.environ.get("AGENT_MAX_QUEUE", "100"))
+AGENT_TIMEOUT = float(os.environ.get("AGENT_TIMEOUT", "120"))
+
+# Recent run latencies kept per agent for percentiles
+LATENCY_WINDOW = 1000
+
+
+class AgentBusyError(Exception):
+    """Raised when an agent's waiting queue is full."""
+
+
+class AgentTimeoutError(Exception):
+    """Raised when an agent run exceeds its timeout."""
+
+
+def _setting(agent_id: str, name: str, declared: Any, default: Any, cast):
+    """A pool setting: AGENT_<ID>_<NAME> env var, then the manifest entry, then the default."""
+    value = os.environ.get(f"AGENT_{agent_id.upper()}_{name}")
+    if value is not None:
+        return cast(value)
+    return cast(declared) if declared is not None else default
+
+
+def percentile(values, p: float) -> Optional[float]:
+    """Nearest-rank percentile of a collection of values, rounded for reporting."""
+    value = metrics.percentile(values, p)
+    return round(value, 4) if value is not None else None
+
+
+class AgentPool:
+    """
+    Concurrency limit, waiting queue and timeout of one agent.
+
+    Args:
+        agent_id: Registry key of the agent
+        max_concurrency: Runs in progress at once
+        max_queue: Requests allowed to wait for a slot (0 rejects when all slots are busy)
+        timeout: Seconds a run may take, excluding time spent waiting (None for no limit)
+    """
+
+    def __init__(self, agent_id: str, max_concurrency: int, max_queue: int, timeout: Optional[float]):
+        self.agent_id = agent_id
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.timeout = timeout
+
+        # One semaphore per event loop (asyncio primitives are bound to a loop)
+        self._semaphores: Dict[asyncio.AbstractEventLoop, asyncio.Semaphore] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+        self.waiting = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self._latencies: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self._waits: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        return semaphore
+
+    def executor(self) -> ThreadPoolExecutor:
+        """Thread pool for synchronous runners, sized to the concurrency limit."""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_concurrency,
+                    thread_name_prefix=f"agent-{self.agent_id}"
+                )
+            return self._executor
+
+    async def run(self, runner, request: BaseModel):
+        """
+        Run the agent on a request within the pool's limits.
+
+        Raises:
+            AgentBusyError: The waiting queue is full
+            AgentTimeoutError: The run took longer than the timeout
+        """
+        semaphore = self._semaphore()
+        if semaphore.locked() and self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise AgentBusyError(
+                f"Agent {self.agent_id} is busy ({self.running} running, {self.waiting} waiting)"
+            )
+
+        queued_at = time.perf_counter()
+        self.waiting += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            self.waiting -= 1
+
+        started_at = time.perf_counter()
+        self._waits.append(started_at - queued_at)
+        metrics.record_phase(self.agent_id, "queue_wait", started_at - queued_at)
+        self.running += 1
+        try:
+            if asyncio.iscoroutinefunction(runner):
+                call = runner(request)
+            else:
+                call = asyncio.get_running_loop().run_in_executor(self.executor(), runner, request)
+            try:
+                response = await asyncio.wait_for(call, timeout=self.timeout)
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                raise AgentTimeoutError(f"Agent {self.agent_id} timed out after {self.timeout:g}s")
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.running -= 1
+            semaphore.release()
+
+        self.completed += 1
+        self._latencies.append(time.perf_counter() - started_at)
+        return response
+
+    def stats(self) -> Dict[str, Any]:
+        latencies = list(self._latencies)
+        waits = list(self._waits)
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "timeout": self.timeout,
+            "running": self.running,
+            "queue_depth": self.waiting,
+            "completed": self.completed,
+            "failed": self.failed,
+            "timeouts": self.timeouts,
+            "rejected": self.rejected,
+            "latency": {
+                "p50": percentile(latencies, 50),
+                "p95": percentile(latencies, 95),
+                "max": round(max(latencies), 4) if latencies else None,
+            },
+            "queue_wait": {
+                "p50": percentile(waits, 50),
+                "p95": percentile(waits, 95),
+            },
+        }
+
+
+# ----------------------------------------------------------------
+# Pools
+# ----------------------------------------------------------------
+_pools: Dict[str, AgentPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_agent_pool(agent_id: str) -> AgentPool:
+    """
+    Get the pool of an agent, created from its manifest settings on first use.
+
+    Raises:
+        KeyError: If no agent is registered under agent_id
+    """
+    pool = _pools.get(agent_id)
+    if pool is not None:
+        return pool
+
+    spec = discover().get(agent_id)
+    if spec is None:
+        raise KeyError(f"Unknown agent: {agent_id}")
+    # Entry point agents declare their settings in the module's AGENT_INFO
+    declared = dict(spec.info)
+    if spec.entry is not None:
+        declared = {**getattr(spec.entry["module"], "AGENT_INFO", {}), **declared}
+
+    with _pools_lock:
+        if agent_id not in _pools:
+            timeout = _setting(agent_id, "TIMEOUT", declared.get("timeout"), AGENT_TIMEOUT, float)
+            _pools[agent_id] = AgentPool(
+                agent_id,
+                max_concurrency=_setting(
+                    agent_id, "MAX_CONCURRENCY", declared.get("max_concurrency"), AGENT_MAX_CONCURRENCY, int
+                ),
+                max_queue=_setting(agent_id, "MAX_QUEUE", declared.get("max_queue"), AGENT_MAX_QUEUE, int),
+                timeout=timeout if timeout > 0 else None,
+            )
+        return _pools[agent_id]
+
+
+async def aget_agent(agent_id: str) -> Dict[str, Any]:
+    """
+    Look up an agent like get_agent(), loading it off the event loop on first use.
+
+    Raises:
+        KeyError: If no agent is registered under agent_id
+    """
+    spec = discover().get(agent_id)
+    if spec is not None and spec.entry is not None:
+        return spec.entry
+    return await asyncio.get_running_loop().run_in_executor(None, get_agent, agent_id)
+
+
+async def arun_agent(agent_id: str, request: BaseModel) -> BaseModel:
+    """
+    Run an agent on a validated request within its pool.
+
+    Args:
+        agent_id: Registry key of the agent
+        request: Instance of the agent's request model
+
+    Returns:
+        The agent's response model instance
+
+    Raises:
+        KeyError: If no agent is registered under agent_id
+        AgentBusyError: The agent's waiting queue is full
+        AgentTimeoutError: The run took longer than the agent's timeout
+    """
+    agent = await aget_agent(agent_id)
+    return await get_agent_pool(agent_id).run(agent["runner"], request)
+
+
+async def arun_agent_payload(agent_id: str, payload: Dict[str, Any]) -> BaseModel:
+    """
+    Validate a JSON payload against an agent's request model and run it.
+
+    Raises:
+        pydantic.ValidationError: The payload doesn't fit the request model
+        (and everything arun_agent raises)
+    """
+    agent = await aget_agent(agent_id)
+    request = agent["request_model"].model_validate(payload)
+    return await get_agent_pool(agent_id).run(agent["runner"], request)
+
+
+def agent_run_stats() -> Dict[str, Any]:
+    """Load state (see agent_stats) and pool state of every registered agent."""
+    stats = agent_stats()
+    for agent_id, pool in list(_pools.items()):
+        if agent_id in stats:
+            stats[agent_id]["pool"] = pool.stats()
+    return stats
+
+
+def shutdown():
+    """Stop the thread pools of synchronous agents."""
+    for pool in list(_pools.values()):
+        if pool._executor is not None:
+            pool._executor.shutdown(wait=False)
+            pool._executor = None
+
+
+def _pool_collector():
+    """Expose running and waiting requests per agent."""
+    lines = [
+        "# HELP agent_running_requests Agent runs in progress",
+        "# TYPE agent_running_requests gauge",
+    ]
+    pools = list(_pools.values())
+    for pool in pools:
+        lines.append(f'agent_running_requests{{agent="{pool.agent_id}"}} {pool.running}')
+    lines += [
+        "# HELP agent_queue_depth Agent requests waiting for a concurrency slot",
+        "# TYPE agent_queue_depth gauge",
+    ]
+    for pool in pools:
+        lines.append(f'agent_queue_depth{{agent="{pool.agent_id}"}} {pool.waiting}')
+    lines += [
+        "# HELP agent_rejected_total Agent requests rejected because the queue was full",
+        "# TYPE agent_rejected_total counter",
+    ]
+    for pool in pools:
+        lines.append(f'agent_rejected_total{{agent="{pool.agent_id}"}} {pool.rejected}')
+    lines += [
+        "# HELP agent_timeouts_total Agent runs cancelled at their timeout",
+        "# TYPE agent_timeouts_total counter",
+    ]
+    for pool in pools:
+        lines.append(f'agent_timeouts_total{{agent="{pool.agent_id}"}} {pool.timeouts}')
+    return lines
+
+
+metrics.REGISTRY.register_collector(_pool_collector)
@@ -0,0 +1,449 @@
+"""
+Upstream Call Governor
+
+Every call to a paid upstream (Tavily, OpenAI, ...) goes through one
+UpstreamGovernor, which combines:
+
+- Token buckets per provider and per API key. The refill rate adapts:
+  it is halved when the upstream answers 429 and recovers gradually on
+  success, so throughput settles at the real quota instead of oscillating.
+- Retries with exponential backoff and full jitter on 429, 5xx and
+  connection errors, honoring Retry-After when the upstream sends it.
+- A circuit breaker per provider that fails fast after repeated failures
+  and lets a single probe through once the reset timeout has passed.
+
+Providers are configured from the environment, e.g. for "openai":
+OPENAI_RATE_LIMIT, OPENAI_BURST, OPENAI_KEY_RATE_LIMIT, OPENAI_KEY_BURST.
+"""
+
+import os
+import time
+import random
+import asyncio
+import hashlib
+import threading
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+# Circuit breaker states
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half_open"
+
+
+class UpstreamError(Exception):
+    """An upstream answered with an error status."""
+
+    def __init__(self, message: str, status_code: Optional[int] = None, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling the upstream while its circuit is open."""
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Parse a Retry-After header (seconds or HTTP date) into seconds.
+
+    Returns:
+        Seconds to wait, or None if the header is missing or malformed
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def classify_error(error: BaseException) -> Tuple[bool, Optional[int], Optional[float]]:
+    """
+    Decide whether a failed upstream call is worth retrying.
+
+    Understands UpstreamError, the openai SDK exceptions (new and legacy)
+    and httpx transport errors.
+
+    Returns:
+        Tuple of (retryable, status code, Retry-After seconds)
+    """
+    status = getattr(error, "status_code", None) or getattr(error, "http_status", None)
+    retry_after = getattr(error, "retry_after", None)
+
+    if retry_after is None:
+        # openai>=1 keeps the httpx response, the legacy SDK keeps the headers
+        response = getattr(error, "response", None)
+        headers = getattr(response, "headers", None) or getattr(error, "headers", None)
+        if headers:
+            retry_after = parse_retry_after(headers.get("retry-after") or headers.get("Retry-After"))
+
+    if status is not None:
+        return status == 429 or status >= 500, status, retry_after
+
+    # No status: connection failures and timeouts are transient
+    name = type(error).__name__
+    transient = any(word in name for word in ("Timeout", "Connect", "Network", "Transport", "Protocol"))
+    return transient, None, retry_after
+
+
+# ----------------------------------------------------------------
+# Building Blocks
+# ----------------------------------------------------------------
+class TokenBucket:
+    """
+    Async token bucket with an adaptive refill rate.
+
+    The rate drops by half on every throttle() and climbs back towards
+    max_rate by 5% of max_rate per successful call.
+    """
+
+    def __init__(self, rate: float, capacity: float, min_rate: Optional[float] = None):
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min_rate if min_rate is not None else rate / 20
+        self.capacity = capacity
+
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+        self.waited_seconds = 0.0
+
+    async def acquire(self):
+        """Wait until a token is available and take it."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self._blocked_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                delay = max(self._blocked_until - now, (1 - self._tokens) / self.rate)
+                self.waited_seconds += delay
+            await asyncio.sleep(delay)
+
+    def throttle(self, retry_after: Optional[float] = None):
+        """Upstream said slow down: halve the rate and pause for retry_after seconds."""
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            if retry_after:
+                self._blocked_until = max(self._blocked_until, time.monotonic() + retry_after)
+
+    def recover(self):
+        """A call succeeded: nudge the rate back towards its maximum."""
+        with self._lock:
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            return {
+                "rate": round(self.rate, 3),
+                "max_rate": self.max_rate,
+                "capacity": self.capacity,
+                "tokens": round(self._tokens, 3),
+                "blocked_for": round(max(0.0, self._blocked_until - now), 3),
+                "waited_seconds": round(self.waited_seconds, 3),
+            }
+
+    def _refill(self, now: float):
+        """Add tokens for the time elapsed; caller must hold the lock."""
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+
+class CircuitBreaker:
+    """Opens after failure_threshold consecutive failures, half-opens after reset_timeout."""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self.state = CIRCUIT_CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+        self.times_opened = 0
+
+    def allow(self) -> bool:
+        """Whether a call may go upstream now."""
+        with self._lock:
+            if self.state == CIRCUIT_CLOSED:
+                return True
+            if self.state == CIRCUIT_OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = CIRCUIT_HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == CIRCUIT_HALF_OPEN and not self._probe_in_flight:
+                # Let exactly one probe through
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def release(self, probe: bool):
+        """
+        Give back a call allowed by allow() that ended without an outcome,
+        e.g. because it was cancelled. A half-open probe's slot is freed so
+        the next call can probe instead.
+        """
+        with self._lock:
+            if probe and self.state == CIRCUIT_HALF_OPEN:
+                self._probe_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self.state = CIRCUIT_CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == CIRCUIT_HALF_OPEN or self._failures >= self.failure_threshold:
+                if self.state != CIRCUIT_OPEN:
+                    self.times_opened += 1
+                self.state = CIRCUIT_OPEN
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self._failures,
+                "times_opened": self.times_opened,
+            }
+
+
+# ----------------------------------------------------------------
+# Governor
+# ----------------------------------------------------------------
+class ProviderLimits:
+    """Rate limit, retry and breaker settings for one provider."""
+
+    def __init__(
+        self,
+        rate: float = 10,
+        burst: float = 20,
+        key_rate: Optional[float] = None,
+        key_burst: Optional[float] = None,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 20,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30,
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.key_rate = key_rate if key_rate is not None else rate
+        self.key_burst = key_burst if key_burst is not None else burst
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+    @classmethod
+    def from_env(cls, provider: str, rate: float = 10, burst: float = 20) -> "ProviderLimits":
+        """Read <PROVIDER>_* and UPSTREAM_* settings, using rate/burst as defaults."""
+        prefix = provider.upper()
+        env = os.environ.get
+        key_rate = env(f"{prefix}_KEY_RATE_LIMIT")
+        key_burst = env(f"{prefix}_KEY_BURST")
+        return cls(
+            rate=float(env(f"{prefix}_RATE_LIMIT", str(rate))),
+            burst=float(env(f"{prefix}_BURST", str(burst))),
+            key_rate=float(key_rate) if key_rate else None,
+            key_burst=float(key_burst) if key_burst else None,
+            max_retries=int(env("UPSTREAM_MAX_RETRIES", "3")),
+            backoff_base=float(env("UPSTREAM_BACKOFF_BASE", "0.5")),
+            backoff_max=float(env("UPSTREAM_BACKOFF_MAX", "20")),
+            failure_threshold=int(env("UPSTREAM_BREAKER_THRESHOLD", "5")),
+            reset_timeout=float(env("UPSTREAM_BREAKER_RESET", "30")),
+        )
+
+
+class UpstreamGovernor:
+    """Rate limiting, retries and circuit breaking for upstream providers."""
+
+    def __init__(self, providers: Optional[Dict[str, ProviderLimits]] = None):
+        self.providers = providers or {}
+        self._buckets: Dict[Tuple[str, Optional[str]], TokenBucket] = {}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._counters: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    async def call(
+        self,
+        provider: str,
+        fn: Callable[[], Awaitable[Any]],
+        api_key: Optional[str] = None,
+    ) -> Any:
+        """
+        Call an upstream under the provider's limits.
+
+        Args:
+            provider: Provider name, e.g. "tavily" or "openai"
+            fn: Zero-argument coroutine function making the call; called
+                again for each retry
+            api_key: Key used for the call, for per-key rate limiting
+
+        Returns:
+            Whatever fn() returns
+
+        Raises:
+            CircuitOpenError: The provider's circuit is open
+            Exception: The last error once retries are exhausted or the
+                error is not retryable
+        """
+        limits = self._limits(provider)
+        breaker = self._breaker(provider)
+        provider_bucket = self._bucket(provider, None)
+        key_bucket = self._bucket(provider, self._key_id(api_key)) if api_key else None
+
+        attempt = 0
+        while True:
+            if not breaker.allow():
+                self._count(provider, "rejected")
+                raise CircuitOpenError(f"Circuit for {provider} is open; not calling upstream")
+
+            # Whether this call is the half-open probe; read right after allow()
+            probe = breaker.state == CIRCUIT_HALF_OPEN
+            try:
+                await provider_bucket.acquire()
+                if key_bucket is not None:
+                    await key_bucket.acquire()
+
+                self._count(provider, "calls")
+                result = await fn()
+            except Exception as e:
+                retryable, status, retry_after = classify_error(e)
+                self._count(provider, f"status_{status}" if status else "errors")
+
+                if status == 429:
+                    provider_bucket.throttle(retry_after)
+                    if key_bucket is not None:
+                        key_bucket.throttle(retry_after)
+
+                # Client errors (bad request, auth) say nothing about upstream
+                # health: they neither count as failures nor close the circuit
+                if retryable:
+                    breaker.record_failure()
+                else:
+                    breaker.release(probe)
+
+                if not retryable or attempt >= limits.max_retries:
+                    self._count(provider, "failures")
+                    raise
+
+                attempt += 1
+                self._count(provider, "retries")
+                backoff = random.uniform(0, min(limits.backoff_max, limits.backoff_base * 2 ** attempt))
+                await asyncio.sleep(max(backoff, retry_after or 0))
+                continue
+            except BaseException:
+                # Cancelled (or interrupted): the call says nothing about the
+                # upstream, but a probe must not hold the half-open slot forever
+                breaker.release(probe)
+                raise
+
+            breaker.record_success()
+            provider_bucket.recover()
+            if key_bucket is not None:
+                key_bucket.recover()
+            return result
+
+    def circuit_state(self, provider: str) -> str:
+        """Breaker state of a provider: "closed", "open" or "half_open"."""
+        return self._breaker(provider).state
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Current limiter, breaker and counter state per provider."""
+        with self._lock:
+            providers = set(self._breakers) | set(self.providers)
+            buckets = dict(self._buckets)
+            counters = {provider: dict(counts) for provider, counts in self._counters.items()}
+
+        state = {}
+        for provider in sorted(providers):
+            state[provider] = {
+                "circuit": self._breaker(provider).snapshot(),
+                "rate_limit": self._bucket(provider, None).snapshot(),
+                "keys": {
+                    key_id: bucket.snapshot()
+                    for (name, key_id), bucket in buckets.items()
+                    if name == provider and key_id is not None
+                },
+                "counters": counters.get(provider, {}),
+            }
+        return state
+
+    def _limits(self, provider: str) -> ProviderLimits:
+        with self._lock:
+            if provider not in self.providers:
+                self.providers[provider] = ProviderLimits.from_env(provider)
+            return self.providers[provider]
+
+    def _bucket(self, provider: str, key_id: Optional[str]) -> TokenBucket:
+        limits = self._limits(provider)
+        with self._lock:
+            bucket = self._buckets.get((provider, key_id))
+            if bucket is None:
+                if key_id is None:
+                    bucket = TokenBucket(limits.rate, limits.burst)
+                else:
+                    bucket = TokenBucket(limits.key_rate, limits.key_burst)
+                self._buckets[(provider, key_id)] = bucket
+            return bucket
+
+    def _breaker(self, provider: str) -> CircuitBreaker:
+        limits = self._limits(provider)
+        with self._lock:
+            breaker = self._breakers.get(provider)
+            if breaker is None:
+                breaker = CircuitBreaker(limits.failure_threshold, limits.reset_timeout)
+                self._breakers[provider] = breaker
+            return breaker
+
+    def _count(self, provider: str, name: str):
+        with self._lock:
+            counts = self._counters.setdefault(provider, {})
+            counts[name] = counts.get(name, 0) + 1
+
+    @staticmethod
+    def _key_id(api_key: str) -> str:
+        """Short, non-reversible identifier for an API key."""
+        return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12]
+
+
+# ----------------------------------------------------------------
+# Shared Governor
+# ----------------------------------------------------------------
+governor: Optional[UpstreamGovernor] = None
+
+
+def get_governor() -> UpstreamGovernor:
+    """Get the shared governor, configuring the known providers on first use."""
+    global governor
+    if governor is None:
+        governor = UpstreamGovernor({
+            "tavily": ProviderLimits.from_env("tavily", rate=5, burst=10),
+            "openai": ProviderLimits.from_env("openai", rate=10, burst=20),
+        })
+    return governor
+
+
+def set_governor(new_governor: UpstreamGovernor):
+    """Install a differently configured governor."""
+    global governor
+    governor = new_governor
@@ -0,0 +1,173 @@
+"""
+Shared HTTP Client
+
+This module owns the long-lived httpx.AsyncClient used by agents for all
+outbound calls (Tavily, OpenAI, ...). Connections are kept alive and pooled
+so repeated requests to the same upstream skip the TCP/TLS handshake.
+
+An httpx.AsyncClient is bound to the event loop it was first used on, so one
+client is kept per running loop. Synchronous callers are served by a single
+background event loop thread, which keeps its own pool warm between calls.
+"""
+
+import os
+import asyncio
+import threading
+from typing import Any, Coroutine, Dict, Optional
+
+import httpx
+
+# ----------------------------------------------------------------
+# Pool Configuration
+# ----------------------------------------------------------------
+MAX_CONNECTIONS = int(os.environ.get("HTTP_MAX_CONNECTIONS", "100"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+KEEPALIVE_EXPIRY = float(os.environ.get("HTTP_KEEPALIVE_EXPIRY", "30"))
+REQUEST_TIMEOUT = float(os.environ.get("HTTP_TIMEOUT", "60"))
+
+# One client per event loop, keyed by the loop object
+_clients: Dict[asyncio.AbstractEventLoop, httpx.AsyncClient] = {}
+_clients_lock = threading.Lock()
+
+# Background loop used by run_sync()
+_sync_loop: Optional[asyncio.AbstractEventLoop] = None
+_sync_loop_lock = threading.Lock()
+
+
+def configure(
+    max_connections: Optional[int] = None,
+    max_keepalive_connections: Optional[int] = None,
+    keepalive_expiry: Optional[float] = None,
+    timeout: Optional[float] = None,
+):
+    """
+    Override the connection pool settings.
+
+    Only clients created after this call pick up the new limits.
+
+    Args:
+        max_connections: Maximum number of concurrent connections
+        max_keepalive_connections: Maximum number of idle connections kept open
+        keepalive_expiry: Seconds an idle connection is kept open
+        timeout: Default request timeout in seconds
+    """
+    global MAX_CONNECTIONS, MAX_KEEPALIVE_CONNECTIONS, KEEPALIVE_EXPIRY, REQUEST_TIMEOUT
+
+    if max_connections is not None:
+        MAX_CONNECTIONS = max_connections
+    if max_keepalive_connections is not None:
+        MAX_KEEPALIVE_CONNECTIONS = max_keepalive_connections
+    if keepalive_expiry is not None:
+        KEEPALIVE_EXPIRY = keepalive_expiry
+    if timeout is not None:
+        REQUEST_TIMEOUT = timeout
+
+
+def get_pool_limits() -> httpx.Limits:
+    """Get the connection pool limits for new clients."""
+    return httpx.Limits(
+        max_connections=MAX_CONNECTIONS,
+        max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=KEEPALIVE_EXPIRY,
+    )
+
+
+# ----------------------------------------------------------------
+# Client Access
+# ----------------------------------------------------------------
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Get the shared AsyncClient for the running event loop.
+
+    Must be called from within a coroutine.
+
+    Returns:
+        A pooled httpx.AsyncClient
+    """
+    loop = asyncio.get_running_loop()
+
+    with _clients_lock:
+        client = _clients.get(loop)
+        if client is None or client.is_closed:
+            # Drop clients whose loops are gone before adding a new one
+            for stale_loop in [l for l in _clients if l.is_closed()]:
+                del _clients[stale_loop]
+
+            client = httpx.AsyncClient(
+                limits=get_pool_limits(),
+                timeout=REQUEST_TIMEOUT,
+            )
+            _clients[loop] = client
+
+    return client
+
+
+async def aclose():
+    """Close the shared client for the running event loop, if any."""
+    loop = asyncio.get_running_loop()
+
+    with _clients_lock:
+        client = _clients.pop(loop, None)
+
+    if client is not None:
+        await client.aclose()
+
+
+# ----------------------------------------------------------------
+# Sync Bridge
+# ----------------------------------------------------------------
+def _get_sync_loop() -> asyncio.AbstractEventLoop:
+    """Start (once) and return the background loop used by run_sync()."""
+    global _sync_loop
+
+    with _sync_loop_lock:
+        if _sync_loop is None or _sync_loop.is_closed():
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(
+                target=loop.run_forever,
+                name="agents-sync-loop",
+                daemon=True,
+            )
+            thread.start()
+            _sync_loop = loop
+
+    return _sync_loop
+
+
+def run_sync(coro: Coroutine[Any, Any, Any]) -> Any:
+    """
+    Run a coroutine to completion from synchronous code.
+
+    The coroutine runs on a shared background loop so its pooled
+    connections survive between calls.
+
+    Args:
+        coro: The coroutine to run
+
+    Returns:
+        The coroutine's result
+    """
+    future = asyncio.run_coroutine_threadsafe(coro, _get_sync_loop())
+    return future.result()
+
+
+# ----------------------------------------------------------------
+# Fork Safety
+# ----------------------------------------------------------------
+def _reset_after_fork():
+    """
+    Forget the parent's clients and sync loop in a forked worker.
+
+    Pooled sockets and the loop thread belong to the parent process; the
+    worker builds its own on first use.
+    """
+    global _clients_lock, _sync_loop, _sync_loop_lock
+
+    _clients.clear()
+    _clients_lock = threading.Lock()
+    _sync_loop = None
+    _sync_loop_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,252 @@
+"""
+Incremental Analysis
+
+Helpers for re-running an analysis only as far as its sources changed.
+
+The sources of a run (search results and crawled website pages) are
+reduced to content hashes keyed by canonical URL and stored with the
+result. On the next run of the same business, comparing the new hashes
+with the stored ones decides the path:
+
+- "reused": nothing changed, the stored analysis is returned as is
+- "delta": a small share of the sources changed, so the model is only
+  shown what changed and asked to rewrite the affected sections
+- "full": too much changed (or there is no usable earlier run), so the
+  analysis is computed from scratch
+
+Analyses are markdown documents made of "## HEADING" sections; a delta
+update returns only the sections that change, which are merged into the
+earlier text.
+"""
+
+import os
+import json
+import time
+import asyncio
+import hashlib
+from typing import Any, Dict, List, Optional, Tuple
+
+from .search import canonical_url
+from .results import ResultQuery, StoredResult, get_result_store
+
+# Paths an analysis can take, reported as analysis_path
+PATH_FULL = "full"
+PATH_REUSED = "reused"
+PATH_DELTA = "delta"
+
+# Largest share of changed sources still handled with a delta update, and
+# the age past which an earlier analysis is not built on
+INCREMENTAL_DELTA_MAX_CHANGE = float(os.environ.get("INCREMENTAL_DELTA_MAX_CHANGE", "0.5"))
+INCREMENTAL_MAX_AGE = float(os.environ.get("INCREMENTAL_MAX_AGE", str(30 * 86400)))
+
+# Answer of a delta update that finds nothing to change
+NO_CHANGES = "NO CHANGES"
+
+# Prefix of crawled page keys, keeping them apart from search results on the same URL
+PAGE_KEY_PREFIX = "site:"
+
+# Earlier results scanned for one the current run can build on
+PREVIOUS_RESULT_CANDIDATES = 10
+
+
+def content_hash(*parts: Optional[str]) -> str:
+    """Hash of text that ignores case and whitespace differences."""
+    normalized = "\n".join(" ".join((part or "").casefold().split()) for part in parts)
+    return hashlib.blake2b(normalized.encode("utf-8"), digest_size=12).hexdigest()
+
+
+def source_hashes(search_results: Dict[str, Any], pages: List[Dict[str, Any]]) -> Dict[str, str]:
+    """
+    Content hashes of a run's sources, by canonical URL.
+
+    Args:
+        search_results: Merged search response
+        pages: Crawled website pages (see crawler.acrawl_site)
+
+    Returns:
+        {canonical URL: hash of title and content}; crawled pages are keyed
+        with PAGE_KEY_PREFIX
+    """
+    hashes = {
+        canonical_url(result.get("url", "")): content_hash(result.get("title"), result.get("content"))
+        for result in search_results.get("results", [])
+    }
+    for page in pages:
+        key = PAGE_KEY_PREFIX + canonical_url(page["url"])
+        hashes[key] = content_hash(page.get("title"), page.get("description"), page.get("text"))
+    return hashes
+
+
+def fingerprint(hashes: Dict[str, str]) -> str:
+    """Fingerprint of a whole source set (equal for equal sources in any order)."""
+    canonical = json.dumps(hashes, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:32]
+
+
+def diff_sources(previous: Dict[str, str], current: Dict[str, str]) -> Dict[str, List[str]]:
+    """
+    Source keys that were added, changed or removed since the previous run.
+
+    Crawled pages missing from the current run don't count as removed: a
+    crawl cut short by its time budget reads fewer pages without the site
+    having changed.
+    """
+    return {
+        "added": [key for key in current if key not in previous],
+        "changed": [key for key in current if key in previous and previous[key] != current[key]],
+        "removed": [
+            key for key in previous
+            if key not in current and not key.startswith(PAGE_KEY_PREFIX)
+        ],
+    }
+
+
+def choose_path(
+    previous: Optional[StoredResult],
+    current: Dict[str, str],
+    max_change: float = INCREMENTAL_DELTA_MAX_CHANGE,
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    Decide how to re-run an analysis given the previous result.
+
+    Args:
+        previous: The earlier result to build on, if any
+        current: Source hashes of the current run
+        max_change: Largest share of changed sources for a delta update
+
+    Returns:
+        Tuple of (path, diff) where diff holds the "added", "changed" and
+        "removed" source keys and the "change_ratio"
+    """
+    if previous is None or not previous.source_hashes:
+        return PATH_FULL, {"added": list(current), "changed": [], "removed": [], "change_ratio": 1.0}
+
+    diff = diff_sources(previous.source_hashes, current)
+    touched = len(diff["added"]) + len(diff["changed"]) + len(diff["removed"])
+    compared = len(set(current) | set(diff["removed"]))
+    diff["change_ratio"] = round(touched / compared, 3) if compared else 0.0
+
+    if touched == 0:
+        return PATH_REUSED, diff
+    if diff["change_ratio"] <= max_change:
+        return PATH_DELTA, diff
+    return PATH_FULL, diff
+
+
+# ----------------------------------------------------------------
+# Previous Results
+# ----------------------------------------------------------------
+def find_previous_result(
+    agent_id: str,
+    business_name: str,
+    website_url: str,
+    model: Optional[str] = None,
+    user_id: Optional[str] = None,
+    company_id: Optional[str] = None,
+    max_age: float = INCREMENTAL_MAX_AGE,
+) -> Optional[StoredResult]:
+    """
+    The latest stored full analysis of a business that a new run can build on.
+
+    Only results of the same owner are considered; a request without a user
+    or company builds only on results stored without one. Follow-up answers
+    (session or question), failed or degraded runs (see deadline), results
+    of other models and results stored without source hashes are skipped.
+
+    Returns:
+        The result, or None if there is none (or no result store)
+    """
+    store = get_result_store()
+    if store is None:
+        return None
+    query = ResultQuery(
+        agent_id=agent_id,
+        business_name=business_name,
+        domain=website_url,
+        user_id=user_id,
+        company_id=company_id,
+        unowned=user_id is None and company_id is None,
+        since=time.time() - max_age if max_age > 0 else None,
+    )
+    results, _ = store.list(query, limit=PREVIOUS_RESULT_CANDIDATES)
+    for result in results:
+        if (
+            result.source_hashes
+            and not result.inputs.get("question")
+            and not result.inputs.get("session_id")
+            and not result.response.get("error")
+            and not result.response.get("degraded")
+            and (model is None or result.model == model)
+        ):
+            return result
+    return None
+
+
+async def afind_previous_result(*args, **kwargs) -> Optional[StoredResult]:
+    """find_previous_result() without blocking the event loop; store errors count as no result."""
+    try:
+        return await asyncio.get_running_loop().run_in_executor(
+            None, lambda: find_previous_result(*args, **kwargs)
+        )
+    except Exception as e:
+        print(f"Warning: could not look up the previous result: {type(e).__name__}: {e}")
+        return None
+
+
+# ----------------------------------------------------------------
+# Section Merging
+# ----------------------------------------------------------------
+def _heading_key(line: str) -> str:
+    return " ".join(line.lstrip("#").split()).upper()
+
+
+def split_sections(text: str) -> Tuple[str, List[Tuple[str, str]]]:
+    """
+    Split a markdown analysis into its "## " sections.
+
+    Returns:
+        Tuple of (text before the first section, [(heading line, body)])
+    """
+    preamble: List[str] = []
+    sections: List[Tuple[str, List[str]]] = []
+    for line in text.splitlines():
+        if line.startswith("## "):
+            sections.append((line.strip(), []))
+        elif sections:
+            sections[-1][1].append(line)
+        else:
+            preamble.append(line)
+    return "\n".join(preamble), [(heading, "\n".join(body).strip("\n")) for heading, body in sections]
+
+
+def merge_sections(analysis: str, update: str) -> Tuple[str, List[str]]:
+    """
+    Replace the sections of an analysis with the rewritten ones of an update.
+
+    Sections of the update that the analysis doesn't have are appended.
+
+    Returns:
+        Tuple of (merged analysis, headings that were rewritten or added)
+    """
+    if update.strip().upper().startswith(NO_CHANGES):
+        return analysis, []
+    _, updated = split_sections(update)
+    if not updated:
+        return analysis, []
+    replacements = {_heading_key(heading): (heading, body) for heading, body in updated}
+
+    preamble, sections = split_sections(analysis)
+    merged, touched = [], []
+    for heading, body in sections:
+        key = _heading_key(heading)
+        if key in replacements:
+            heading, body = replacements.pop(key)
+            touched.append(heading)
+        merged.append((heading, body))
+    for heading, body in replacements.values():
+        merged.append((heading, body))
+        touched.append(heading)
+
+    parts = [preamble.strip("\n")] if preamble.strip() else []
+    parts += [f"{heading}\n{body}" for heading, body in merged]
+    return "\n\n".join(parts), touched
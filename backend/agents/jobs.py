@@ -0,0 +1,302 @@
+"""
+Background Jobs
+
+Runs agent requests outside the HTTP request/response cycle. A client
+submits a request, receives a job ID right away, and polls for the status
+and result (or cancels the job).
+
+JobQueue is the interface the API depends on; InProcessJobQueue implements
+it with asyncio workers inside the server process. An external broker
+(Redis, SQS, ...) can implement the same interface, which is why jobs carry
+plain JSON payloads and results rather than Python objects.
+"""
+
+import os
+import time
+import uuid
+import asyncio
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel
+
+from . import get_agent
+from .executor import arun_agent_payload
+
+# Job states
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+
+FINISHED_STATES = (JOB_SUCCEEDED, JOB_FAILED, JOB_CANCELLED)
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at capacity."""
+
+
+class JobNotFoundError(KeyError):
+    """Raised for unknown or expired job IDs."""
+
+
+class JobInfo(BaseModel):
+    job_id: str
+    agent_id: str
+    status: str
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    error: Optional[str] = None
+
+
+class Job:
+    """A submitted agent request and its outcome."""
+
+    def __init__(self, agent_id: str, payload: Dict[str, Any]):
+        self.job_id = uuid.uuid4().hex
+        self.agent_id = agent_id
+        self.payload = payload
+        self.status = JOB_QUEUED
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+
+        # Task running the agent, set while the job is running
+        self._task: Optional[asyncio.Task] = None
+
+    def info(self) -> JobInfo:
+        """Public view of the job, without its payload and result."""
+        return JobInfo(
+            job_id=self.job_id,
+            agent_id=self.agent_id,
+            status=self.status,
+            created_at=self.created_at,
+            started_at=self.started_at,
+            finished_at=self.finished_at,
+            error=self.error,
+        )
+
+
+class JobQueue:
+    """Interface for job backends."""
+
+    async def start(self):
+        """Start processing jobs."""
+
+    async def stop(self):
+        """Stop processing jobs, cancelling any that are running."""
+
+    async def submit(self, agent_id: str, payload: Dict[str, Any]) -> Job:
+        """
+        Validate and enqueue an agent request.
+
+        Raises:
+            KeyError: Unknown agent
+            pydantic.ValidationError: Payload does not match the agent's request model
+            QueueFullError: The queue is at capacity
+        """
+        raise NotImplementedError
+
+    async def get(self, job_id: str) -> Job:
+        """Look up a job. Raises JobNotFoundError."""
+        raise NotImplementedError
+
+    async def cancel(self, job_id: str) -> Job:
+        """Cancel a queued or running job. Raises JobNotFoundError."""
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth and job counts."""
+        raise NotImplementedError
+
+
+async def run_job_payload(agent_id: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Run an agent on a JSON payload (within its pool) and return its JSON result.
+
+    Args:
+        agent_id: Registry key of the agent
+        payload: Request fields for the agent's request model
+
+    Returns:
+        The agent response as a dictionary
+    """
+    response = await arun_agent_payload(agent_id, payload)
+    return response.model_dump()
+
+
+# ----------------------------------------------------------------
+# In-Process Backend
+# ----------------------------------------------------------------
+class InProcessJobQueue(JobQueue):
+    """
+    Job queue served by asyncio worker tasks in this process.
+
+    Submissions beyond max_queue_depth waiting jobs are rejected with
+    QueueFullError. Finished jobs are kept for result_ttl seconds.
+    """
+
+    def __init__(self, workers: int = 4, max_queue_depth: int = 100, result_ttl: float = 3600):
+        self.workers = workers
+        self.max_queue_depth = max_queue_depth
+        self.result_ttl = result_ttl
+
+        self._jobs: Dict[str, Job] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker_tasks: List[asyncio.Task] = []
+        self._stopping = False
+
+        self.submitted = 0
+        self.rejected = 0
+
+    async def start(self):
+        if self._worker_tasks:
+            return
+        self._stopping = False
+        self._queue = asyncio.Queue(maxsize=self.max_queue_depth)
+        self._worker_tasks = [
+            asyncio.create_task(self._worker(), name=f"job-worker-{i}")
+            for i in range(self.workers)
+        ]
+
+    async def stop(self):
+        self._stopping = True
+        for job in self._jobs.values():
+            if job.status not in FINISHED_STATES:
+                self._mark_cancelled(job)
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+        self._queue = None
+
+    async def submit(self, agent_id: str, payload: Dict[str, Any]) -> Job:
+        # Validate up front so bad requests fail at submission, not in a worker
+        agent = get_agent(agent_id)
+        request = agent["request_model"].model_validate(payload)
+
+        await self.start()
+        self._prune()
+
+        job = Job(agent_id, request.model_dump())
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise QueueFullError(f"Job queue is full ({self.max_queue_depth} jobs waiting)")
+
+        self._jobs[job.job_id] = job
+        self.submitted += 1
+        return job
+
+    async def get(self, job_id: str) -> Job:
+        self._prune()
+        job = self._jobs.get(job_id)
+        if job is None:
+            raise JobNotFoundError(job_id)
+        return job
+
+    async def cancel(self, job_id: str) -> Job:
+        job = await self.get(job_id)
+        if job.status not in FINISHED_STATES:
+            self._mark_cancelled(job)
+        return job
+
+    def stats(self) -> Dict[str, Any]:
+        counts = {state: 0 for state in (JOB_QUEUED, JOB_RUNNING) + FINISHED_STATES}
+        for job in self._jobs.values():
+            counts[job.status] += 1
+        return {
+            "backend": "in_process",
+            "workers": self.workers,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "max_queue_depth": self.max_queue_depth,
+            "result_ttl": self.result_ttl,
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "jobs": counts,
+        }
+
+    async def _worker(self):
+        """Take jobs off the queue and run them until cancelled."""
+        while True:
+            job = await self._queue.get()
+            try:
+                if job.status == JOB_CANCELLED:
+                    continue
+
+                job.status = JOB_RUNNING
+                job.started_at = time.time()
+                job._task = asyncio.create_task(run_job_payload(job.agent_id, job.payload))
+                try:
+                    job.result = await job._task
+                    job.status = JOB_SUCCEEDED
+                except asyncio.CancelledError:
+                    # Either the job was cancelled, or the worker is shutting down
+                    if job.status != JOB_CANCELLED:
+                        self._mark_cancelled(job)
+                    if self._stopping:
+                        raise
+                except Exception as e:
+                    job.status = JOB_FAILED
+                    job.error = f"{type(e).__name__}: {e}"
+                finally:
+                    job._task = None
+                    if job.finished_at is None:
+                        job.finished_at = time.time()
+            finally:
+                self._queue.task_done()
+
+    def _mark_cancelled(self, job: Job):
+        job.status = JOB_CANCELLED
+        job.finished_at = time.time()
+        if job._task is not None:
+            job._task.cancel()
+
+    def _prune(self):
+        """Forget finished jobs older than the retention period."""
+        cutoff = time.time() - self.result_ttl
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.status in FINISHED_STATES and job.finished_at is not None and job.finished_at < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+# ----------------------------------------------------------------
+# Shared Queue
+# ----------------------------------------------------------------
+job_queue: Optional[JobQueue] = None
+
+
+def build_job_queue() -> JobQueue:
+    """
+    Build the in-process job queue from environment settings.
+
+    JOB_WORKERS: Number of concurrent jobs (default 4)
+    JOB_MAX_QUEUE: Jobs allowed to wait before submissions get 429 (default 100)
+    JOB_RESULT_TTL: Seconds finished jobs and results are kept (default 3600)
+    """
+    return InProcessJobQueue(
+        workers=int(os.environ.get("JOB_WORKERS", "4")),
+        max_queue_depth=int(os.environ.get("JOB_MAX_QUEUE", "100")),
+        result_ttl=float(os.environ.get("JOB_RESULT_TTL", "3600")),
+    )
+
+
+def get_job_queue() -> JobQueue:
+    """Get the shared job queue, building the default one on first use."""
+    global job_queue
+    if job_queue is None:
+        job_queue = build_job_queue()
+    return job_queue
+
+
+def set_job_queue(queue: JobQueue):
+    """Install a different job backend (e.g. one backed by an external broker)."""
+    global job_queue
+    job_queue = queue
@@ -0,0 +1,494 @@
+"""
+LLM Router
+
+Routes chat completions across several OpenAI-compatible backends: OpenAI
+itself, Azure OpenAI deployments, and local or self-hosted servers that
+speak the OpenAI API.
+
+Each request goes to the backend with the lowest expected latency: an
+exponentially weighted moving average (EWMA) of its latency, inflated by
+its recent error rate. Backends whose circuit is open are tried last. A
+request that fails on one backend fails over to the next, and a request
+still running after the hedge delay is duplicated on the next backend;
+the first answer wins and the other call is cancelled.
+
+Every backend is its own provider in the upstream governor, so it gets its
+own rate limits, retries and circuit breaker.
+"""
+
+import os
+import json
+import time
+import random
+import asyncio
+import threading
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import openai
+
+from .http_client import get_http_client
+from .governor import CIRCUIT_OPEN, get_governor
+from . import metrics
+
+# Backend kinds
+KIND_OPENAI = "openai"
+KIND_AZURE = "azure"
+KIND_OPENAI_COMPATIBLE = "openai_compatible"
+
+# Azure API version used when a backend doesn't set one
+DEFAULT_AZURE_API_VERSION = "2024-02-01"
+
+
+class NoBackendError(Exception):
+    """Raised when no configured backend serves the requested model."""
+
+
+class BackendStats:
+    """Latency and error EWMAs of one backend."""
+
+    def __init__(self, alpha: float = 0.2):
+        self.alpha = alpha
+        self.latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.calls = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def record(self, latency: Optional[float], ok: bool):
+        """Fold a finished call into the averages (latency only counts for successes)."""
+        with self._lock:
+            self.calls += 1
+            if not ok:
+                self.errors += 1
+            self.error_rate += self.alpha * ((0.0 if ok else 1.0) - self.error_rate)
+            if ok and latency is not None:
+                self.latency = latency if self.latency is None else self.latency + self.alpha * (latency - self.latency)
+
+    def expected_latency(self) -> float:
+        """Latency estimate used for ranking; unmeasured backends rank first so they get measured."""
+        with self._lock:
+            if self.latency is None:
+                return 0.0
+            return self.latency / max(1.0 - self.error_rate, 0.05)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "latency_ewma": round(self.latency, 4) if self.latency is not None else None,
+                "error_rate_ewma": round(self.error_rate, 4),
+                "calls": self.calls,
+                "errors": self.errors,
+            }
+
+
+class LLMBackend:
+    """
+    One OpenAI-compatible endpoint.
+
+    Args:
+        name: Backend name; also its provider name in the upstream governor
+        kind: "openai", "azure" or "openai_compatible"
+        api_key: API key (local servers that need none get a placeholder)
+        base_url: API base URL (the Azure endpoint for kind "azure"; the
+            SDK default for kind "openai" if not set)
+        api_version: Azure API version
+        models: Requested model -> model (or Azure deployment) name on this
+            backend; None serves every model under its own name
+        priority: Tie-breaker between backends, lower first
+        alpha: EWMA smoothing factor
+    """
+
+    def __init__(
+        self,
+        name: str,
+        kind: str = KIND_OPENAI,
+        api_key: Optional[str] = None,
+        base_url: Optional[str] = None,
+        api_version: Optional[str] = None,
+        models: Optional[Dict[str, str]] = None,
+        priority: int = 0,
+        alpha: float = 0.2,
+    ):
+        self.name = name
+        self.kind = kind
+        self.api_key = api_key
+        self.base_url = base_url
+        self.api_version = api_version or DEFAULT_AZURE_API_VERSION
+        self.models = models
+        self.priority = priority
+        self.stats = BackendStats(alpha)
+
+        # One SDK client per event loop, like the shared HTTP client
+        self._clients: Dict[asyncio.AbstractEventLoop, Any] = {}
+
+    def serves(self, model: str) -> bool:
+        return self.models is None or model in self.models
+
+    def backend_model(self, model: str) -> str:
+        return model if self.models is None else self.models[model]
+
+    def client(self):
+        """The SDK client for the running loop, or the openai module with the legacy SDK."""
+        if not hasattr(openai, "AsyncOpenAI"):
+            return openai
+
+        loop = asyncio.get_running_loop()
+        http_client = get_http_client()
+        cached = self._clients.get(loop)
+        if cached is not None and cached[1] is http_client:
+            return cached[0]
+
+        # SDK retries are disabled; the upstream governor handles them
+        if self.kind == KIND_AZURE:
+            client = openai.AsyncAzureOpenAI(
+                azure_endpoint=self.base_url,
+                api_version=self.api_version,
+                api_key=self.api_key,
+                http_client=http_client,
+                max_retries=0
+            )
+        else:
+            api_key = self.api_key
+            if not api_key and self.kind == KIND_OPENAI_COMPATIBLE:
+                api_key = "not-needed"
+            client = openai.AsyncOpenAI(
+                api_key=api_key,
+                base_url=self.base_url,
+                http_client=http_client,
+                max_retries=0
+            )
+        self._clients[loop] = (client, http_client)
+        return client
+
+    def _request(self, prompt: str, model: str, temperature: float, max_tokens: int, stream: bool = False):
+        """Start a chat completion call on this backend (new or legacy SDK)."""
+        client = self.client()
+        arguments = {
+            "model": self.backend_model(model),
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+        }
+        if stream:
+            arguments["stream"] = True
+
+        if hasattr(client, "chat") and hasattr(client.chat, "completions"):
+            return client.chat.completions.create(**arguments)
+
+        # Legacy SDK: module-level client configured per call
+        if self.api_key:
+            arguments["api_key"] = self.api_key
+        if self.base_url:
+            arguments["api_base"] = self.base_url
+        return client.ChatCompletion.acreate(**arguments)
+
+    async def acomplete(self, prompt: str, model: str, temperature: float, max_tokens: int) -> Dict[str, Any]:
+        """
+        Generate a completion through the upstream governor.
+
+        Returns:
+            Dictionary with "content", "model" and "usage"
+        """
+        response = await get_governor().call(
+            self.name,
+            lambda: self._request(prompt, model, temperature, max_tokens),
+            api_key=self.api_key
+        )
+        if isinstance(response, dict):
+            return {
+                "content": response["choices"][0]["message"]["content"],
+                "model": response["model"],
+                "usage": usage_dict(response.get("usage")),
+            }
+        return {
+            "content": response.choices[0].message.content,
+            "model": response.model,
+            "usage": usage_dict(response.usage),
+        }
+
+    async def aopen_stream(
+        self,
+        prompt: str,
+        model: str,
+        temperature: float,
+        max_tokens: int,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Open a streamed completion through the upstream governor.
+
+        Only opening the stream is governed; once tokens flow there is
+        nothing to retry.
+
+        Returns:
+            Async iterator of {"content", "model", "usage"} deltas
+        """
+        stream = await get_governor().call(
+            self.name,
+            lambda: self._request(prompt, model, temperature, max_tokens, stream=True),
+            api_key=self.api_key
+        )
+        return self._deltas(stream)
+
+    @staticmethod
+    async def _deltas(stream) -> AsyncIterator[Dict[str, Any]]:
+        async for chunk in stream:
+            if isinstance(chunk, dict):
+                content = chunk["choices"][0]["delta"].get("content") if chunk["choices"] else None
+                usage = usage_dict(chunk.get("usage"))
+                model = chunk["model"]
+            else:
+                content = chunk.choices[0].delta.content if chunk.choices else None
+                usage = usage_dict(getattr(chunk, "usage", None))
+                model = chunk.model
+            if content or usage:
+                yield {"content": content or "", "model": model, "usage": usage}
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "kind": self.kind,
+            "base_url": self.base_url,
+            "models": self.models,
+            "priority": self.priority,
+            "circuit": get_governor().circuit_state(self.name),
+            **self.stats.snapshot(),
+        }
+
+
+def usage_dict(usage: Any) -> Optional[Dict[str, int]]:
+    """Normalize a provider usage report (SDK object or dict) to a plain dict."""
+    if usage is None:
+        return None
+    return {
+        field: int((usage.get(field) if isinstance(usage, dict) else getattr(usage, field, 0)) or 0)
+        for field in ("prompt_tokens", "completion_tokens", "total_tokens")
+    }
+
+
+# ----------------------------------------------------------------
+# Router
+# ----------------------------------------------------------------
+class LLMRouter:
+    """
+    Latency-aware routing, hedging and failover across LLM backends.
+
+    Args:
+        backends: Backends to route between
+        hedge_delay: Seconds after which a still-running completion is
+            duplicated on the next backend (0 disables hedging)
+        explore: Probability of trying the backends in random order, so a
+            backend that was slow once gets measured again
+    """
+
+    def __init__(self, backends: List[LLMBackend], hedge_delay: float = 0.0, explore: float = 0.05):
+        self.backends = backends
+        self.hedge_delay = hedge_delay
+        self.explore = explore
+
+        self.hedges = 0
+        self.hedges_won = 0
+        self.failovers = 0
+
+    def rank(self, model: str) -> List[LLMBackend]:
+        """Backends serving the model, best first."""
+        serving = [backend for backend in self.backends if backend.serves(model)]
+        if not serving:
+            raise NoBackendError(f"No LLM backend serves model {model!r}")
+        if len(serving) > 1 and random.random() < self.explore:
+            random.shuffle(serving)
+            return serving
+
+        governor = get_governor()
+        return sorted(serving, key=lambda backend: (
+            governor.circuit_state(backend.name) == CIRCUIT_OPEN,
+            backend.stats.expected_latency(),
+            backend.priority,
+        ))
+
+    async def _timed(self, backend: LLMBackend, prompt: str, model: str, temperature: float, max_tokens: int):
+        start = time.perf_counter()
+        try:
+            completion = await backend.acomplete(prompt, model, temperature, max_tokens)
+        except asyncio.CancelledError:
+            # Lost a hedge race; says nothing about the backend
+            metrics.LLM_BACKEND_CALLS.inc(backend=backend.name, outcome="cancelled")
+            raise
+        except Exception:
+            backend.stats.record(None, ok=False)
+            metrics.LLM_BACKEND_CALLS.inc(backend=backend.name, outcome="error")
+            raise
+        backend.stats.record(time.perf_counter() - start, ok=True)
+        metrics.LLM_BACKEND_CALLS.inc(backend=backend.name, outcome="ok")
+        return dict(completion, backend=backend.name)
+
+    async def acomplete(self, prompt: str, model: str, temperature: float, max_tokens: int) -> Dict[str, Any]:
+        """
+        Generate a completion on the best backend, hedging and failing over.
+
+        Returns:
+            Dictionary with "content", "model" (as reported by the backend),
+            "usage" and the "backend" that answered
+
+        Raises:
+            NoBackendError: No backend serves the model
+            Exception: The last backend error, once every backend failed
+        """
+        queue = self.rank(model)
+        pending: Dict[asyncio.Task, LLMBackend] = {}
+        hedge_task: Optional[asyncio.Task] = None
+        last_error: Optional[BaseException] = None
+
+        def launch(backend: LLMBackend) -> asyncio.Task:
+            task = asyncio.ensure_future(self._timed(backend, prompt, model, temperature, max_tokens))
+            pending[task] = backend
+            return task
+
+        launch(queue.pop(0))
+        try:
+            while pending:
+                can_hedge = self.hedge_delay > 0 and hedge_task is None
+                done, _ = await asyncio.wait(
+                    pending,
+                    timeout=self.hedge_delay if can_hedge else None,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+
+                if not done:
+                    # Still waiting after the hedge delay: race the next backend
+                    # (or the same one again when it is the only one)
+                    backend = queue.pop(0) if queue else next(iter(pending.values()))
+                    hedge_task = launch(backend)
+                    self.hedges += 1
+                    metrics.LLM_ROUTER_EVENTS.inc(event="hedge")
+                    continue
+
+                for task in done:
+                    pending.pop(task)
+                    if task.exception() is None:
+                        if task is hedge_task:
+                            self.hedges_won += 1
+                            metrics.LLM_ROUTER_EVENTS.inc(event="hedge_won")
+                        return task.result()
+
+                    # Replace the failed attempt with the next backend
+                    last_error = task.exception()
+                    if queue:
+                        self.failovers += 1
+                        metrics.LLM_ROUTER_EVENTS.inc(event="failover")
+                        launch(queue.pop(0))
+
+            raise last_error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def astream(
+        self,
+        prompt: str,
+        model: str,
+        temperature: float,
+        max_tokens: int,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Stream a completion, failing over while the stream is being opened.
+
+        Once tokens have been sent a failure ends the stream, since the
+        output can't be taken back. Streams are not hedged.
+
+        Yields:
+            {"content", "model", "usage", "backend"} deltas
+        """
+        last_error: Optional[Exception] = None
+        for attempt, backend in enumerate(self.rank(model)):
+            if attempt:
+                self.failovers += 1
+                metrics.LLM_ROUTER_EVENTS.inc(event="failover")
+            try:
+                deltas = await backend.aopen_stream(prompt, model, temperature, max_tokens)
+            except Exception as e:
+                backend.stats.record(None, ok=False)
+                metrics.LLM_BACKEND_CALLS.inc(backend=backend.name, outcome="error")
+                last_error = e
+                continue
+
+            async for delta in deltas:
+                yield dict(delta, backend=backend.name)
+            backend.stats.record(None, ok=True)
+            metrics.LLM_BACKEND_CALLS.inc(backend=backend.name, outcome="ok")
+            return
+
+        raise last_error
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "hedge_delay": self.hedge_delay,
+            "explore": self.explore,
+            "hedges": self.hedges,
+            "hedges_won": self.hedges_won,
+            "failovers": self.failovers,
+            "backends": {backend.name: backend.snapshot() for backend in self.backends},
+        }
+
+
+# ----------------------------------------------------------------
+# Shared Router
+# ----------------------------------------------------------------
+router: Optional[LLMRouter] = None
+
+
+def build_llm_router(default_api_key: Optional[str] = None) -> LLMRouter:
+    """
+    Build the router from environment settings.
+
+    LLM_BACKENDS: JSON list of backends, each with "name", "kind", and
+        optionally "base_url", "api_key" or "api_key_env", "api_version",
+        "models" and "priority" (see LLMBackend). Without it, a single
+        OpenAI backend uses default_api_key (or OPENAI_API_KEY).
+    LLM_HEDGE_DELAY: Seconds before a slow completion is hedged (default 0, off)
+    LLM_ROUTER_EXPLORE: Probability of a random backend order (default 0.05)
+    LLM_LATENCY_ALPHA: EWMA smoothing factor (default 0.2)
+    """
+    alpha = float(os.environ.get("LLM_LATENCY_ALPHA", "0.2"))
+    config = os.environ.get("LLM_BACKENDS")
+
+    if config:
+        backends = []
+        for entry in json.loads(config):
+            api_key = entry.get("api_key")
+            if not api_key and entry.get("api_key_env"):
+                api_key = os.environ.get(entry["api_key_env"])
+            backends.append(LLMBackend(
+                name=entry["name"],
+                kind=entry.get("kind", KIND_OPENAI),
+                api_key=api_key,
+                base_url=entry.get("base_url"),
+                api_version=entry.get("api_version"),
+                models=entry.get("models"),
+                priority=int(entry.get("priority", 0)),
+                alpha=alpha,
+            ))
+    else:
+        backends = [LLMBackend(
+            name="openai",
+            api_key=default_api_key or os.environ.get("OPENAI_API_KEY"),
+            alpha=alpha,
+        )]
+
+    return LLMRouter(
+        backends,
+        hedge_delay=float(os.environ.get("LLM_HEDGE_DELAY", "0")),
+        explore=float(os.environ.get("LLM_ROUTER_EXPLORE", "0.05")),
+    )
+
+
+def get_llm_router() -> LLMRouter:
+    """Get the shared router, building the default one on first use."""
+    global router
+    if router is None:
+        router = build_llm_router()
+    return router
+
+
+def set_llm_router(new_router: Optional[LLMRouter]):
+    """Install a differently configured router (None rebuilds it on next use)."""
+    global router
+    router = new_router
@@ -6,44 +6,233 @@ This agent uses Tavily for search capabilities and OpenAI for analysis.
 
 import os
 import json
-import requests
-from typing import Dict, Any, Optional
-from pydantic import BaseModel
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Dict, Any, AsyncIterator, List, Optional, Tuple
+from urllib.parse import urlsplit
+from pydantic import BaseModel, Field, PrivateAttr, model_validator
 import openai
 
+from .http_client import get_http_client, run_sync
+from .cache import CacheBackend, build_cache, make_cache_key
+from .singleflight import SingleFlight
+from .search import merge_results
+from . import prompt_budget
+from .prompt_budget import count_tokens, truncate_tokens, trim_middle
+from .governor import UpstreamError, get_governor, parse_retry_after
+from . import llm_router
+from .llm_router import build_llm_router, get_llm_router, set_llm_router
+from . import metrics
+from .metrics import timed
+from .usage import UsageRecord, get_usage_writer
+from .sessions import Session, SessionNotFoundError, get_session_store
+from .results import StoredResult, asave_result
+from .prewarm import cache_ttl, record_demand
+from .deadline import (
+    DEADLINE_SEARCH_SHARE, DEGRADED_BRIEF, DEGRADED_PARTIAL, DEGRADED_SEARCH, DEGRADED_STALE,
+    Deadline, DeadlineExceeded, tokens_within, until,
+)
+from . import crawler
+from .crawler import acrawl_site, format_pages
+from .search import canonical_url
+from .incremental import (
+    PAGE_KEY_PREFIX, PATH_DELTA, PATH_FULL, PATH_REUSED,
+    afind_previous_result, choose_path, fingerprint, merge_sections, source_hashes,
+)
+
+# Registry key, used to label metrics
+AGENT_ID = "marketing"
+
 # Global variables that will be populated in init()
 openai_client = None
+OPENAI_API_KEY = None
 TAVILY_API_KEY = None
 
+# Completion length cap for the analysis, and for a delta update of an
+# earlier analysis (which only rewrites the sections that change)
+MAX_TOKENS = 2500
+DELTA_MAX_TOKENS = int(os.environ.get("DELTA_MAX_TOKENS", "1200"))
+
+# Tavily API location (overridable to point at a stand-in server, e.g. for benchmarks)
+TAVILY_BASE_URL = os.environ.get("TAVILY_BASE_URL", "https://api.tavily.com").rstrip("/")
+
+# Search parameters sent to Tavily with every query
+TAVILY_SEARCH_PARAMS = {
+    "search_depth": "advanced",
+    "include_domains": [],
+    "exclude_domains": [],
+    "max_results": 5
+}
+
+# Focused sub-queries run concurrently for every analysis, by facet name
+SEARCH_FACETS = {
+    "overview": "{business_name} {website_url} company overview products services",
+    "competitors": "{business_name} competitors market alternatives",
+    "social": "{business_name} social media presence instagram linkedin facebook",
+    "reviews": "{business_name} customer reviews ratings",
+}
+
+# Facets to search (comma-separated), results kept after merging, and the
+# content similarity above which two results count as duplicates
+SEARCH_FACET_NAMES = [
+    name.strip()
+    for name in os.environ.get("SEARCH_FACETS", ",".join(SEARCH_FACETS)).split(",")
+    if name.strip() in SEARCH_FACETS
+] or ["overview"]
+SEARCH_RESULT_BUDGET = int(os.environ.get("SEARCH_RESULT_BUDGET", "10"))
+SEARCH_DEDUP_THRESHOLD = float(os.environ.get("SEARCH_DEDUP_THRESHOLD", "0.8"))
+
+# Smallest search snippet worth keeping when the prompt budget runs out, and
+# slack for counts that shift when the prompt sections are joined
+MIN_SNIPPET_TOKENS = 48
+PROMPT_SLACK_TOKENS = 16
+
+# Prompt tokens the crawled website text may take (at most a third of what
+# is left after the instructions)
+WEBSITE_PROMPT_MAX_TOKENS = int(os.environ.get("WEBSITE_PROMPT_MAX_TOKENS", "1500"))
+
+# Search result cache (see set_search_cache)
+search_cache: Optional[CacheBackend] = None
+
+# Completion cache (see set_completion_cache) and its in-flight deduplication
+completion_cache: Optional[CacheBackend] = None
+completion_flight = SingleFlight()
+
+# Concurrent identical analyses share one run (see arun_analysis)
+analysis_flight = SingleFlight()
+
+# Batch defaults: concurrency per phase and maximum batch size
+BATCH_SEARCH_CONCURRENCY = int(os.environ.get("BATCH_SEARCH_CONCURRENCY", "8"))
+BATCH_LLM_CONCURRENCY = int(os.environ.get("BATCH_LLM_CONCURRENCY", "4"))
+BATCH_MAX_ITEMS = int(os.environ.get("BATCH_MAX_ITEMS", "1000"))
+
+# Cache status values reported in MarketingAgentResponse
+CACHE_HIT = "hit"
+CACHE_MISS = "miss"
+CACHE_SHARED = "shared"
+CACHE_BYPASS = "bypass"
+
 # ----------------------------------------------------------------
 # API Models
 # ----------------------------------------------------------------
 class MarketingAgentRequest(BaseModel):
-    business_name: str
-    website_url: str
+    # Required unless continuing a session, which remembers them
+    business_name: str = ""
+    website_url: str = ""
     previous_response: Optional[str] = ""
     model: str = "gpt-3.5-turbo"
     temperature: float = 0.7
+    # None: cache completions only when temperature is 0; True: always; False: skip all caches
+    use_cache: Optional[bool] = None
+    # Attach phase timings, token usage and cache details to the response
+    debug: bool = False
+    # Owner of the request for usage accounting (token_usage needs exactly one)
+    user_id: Optional[str] = None
+    company_id: Optional[str] = None
+    # Share the result of an identical analysis already in flight; set to
+    # False for requests that must get their own run
+    coalesce: bool = True
+    # Conversation sessions: start one, or continue one with a follow-up question
+    start_session: bool = False
+    session_id: Optional[str] = None
+    question: Optional[str] = None
+    # Keep the finished analysis in the result store (see results)
+    store_result: bool = True
+    # Read the business's own website for the analysis (see crawler)
+    crawl_website: bool = True
+    # Build on the latest stored analysis of the business: return it if the
+    # sources are unchanged, or update it if they changed only slightly
+    # (see incremental; applies to full analyses, not follow-up questions)
+    incremental: bool = False
+    # End-to-end time budget in seconds (also taken from the X-Request-Deadline
+    # header); past it the analysis is shortened or cut off instead of
+    # timing out (see deadline)
+    deadline: Optional[float] = Field(None, gt=0)
+    
+    @model_validator(mode="after")
+    def check_business(self):
+        if not self.session_id and not (self.business_name and self.website_url):
+            raise ValueError("business_name and website_url are required unless session_id is given")
+        return self
     
 class MarketingAgentResponse(BaseModel):
     analysis: str
+    # The primary (first) sub-query; search_queries lists every sub-query that was run
     search_query: str
     model_used: str
+    # LLM backend that generated the analysis (see llm_router)
+    llm_backend: Optional[str] = None
+    search_queries: Optional[List[str]] = None
+    # "hit", "miss", "shared" (joined an identical in-flight call) or "bypass"
+    search_cache_status: str = "bypass"
+    completion_cache_status: str = "bypass"
+    # Set when the analysis could not be generated
+    error: Optional[str] = None
+    # Token usage reported by the provider (None when served from cache or not reported)
+    usage: Optional[Dict[str, int]] = None
+    # Size of the prompt after budgeting (see assemble_prompt)
+    prompt_tokens: Optional[int] = None
+    # Session to pass as session_id for follow-up questions
+    session_id: Optional[str] = None
+    # True if this response was shared from an identical in-flight analysis
+    coalesced: bool = False
+    # Search results the analysis is based on ({"title", "url"})
+    sources: Optional[List[Dict[str, Any]]] = None
+    # Pages of the business's website that were read ({"title", "url"})
+    website_pages: Optional[List[Dict[str, Any]]] = None
+    # ID of the stored result, for GET /results/{result_id}
+    result_id: Optional[str] = None
+    # How the analysis was produced: "full", "reused" (the stored analysis
+    # previous_result_id, sources unchanged) or "delta" (that analysis
+    # updated with the changed sources)
+    analysis_path: str = PATH_FULL
+    previous_result_id: Optional[str] = None
+    # Fingerprint of the sources the analysis is based on
+    source_fingerprint: Optional[str] = None
+    # Shortcuts taken to meet the deadline (see deadline.DEGRADED_*), and
+    # whether the analysis text was cut off at it
+    degraded: Optional[List[str]] = None
+    partial: bool = False
+    # Phase timings and cache details, only when requested with debug=true
+    debug: Optional[Dict[str, Any]] = None
     
     # Configure model to disable protected namespace warnings
     model_config = {
         "protected_namespaces": ()
     }
+    
+    # Content hashes of the sources, kept with the stored result
+    _source_hashes: Dict[str, str] = PrivateAttr(default_factory=dict)
+
+class MarketingBatchRequest(BaseModel):
+    requests: List[MarketingAgentRequest]
+    # Per-phase concurrency limits; None uses the BATCH_*_CONCURRENCY defaults
+    search_concurrency: Optional[int] = Field(None, ge=1, le=64)
+    llm_concurrency: Optional[int] = Field(None, ge=1, le=64)
+
+class MarketingBatchItem(BaseModel):
+    index: int
+    response: Optional[MarketingAgentResponse] = None
+    error: Optional[str] = None
+    # Index of the identical earlier request whose result was reused
+    duplicate_of: Optional[int] = None
+
+class MarketingBatchResponse(BaseModel):
+    results: List[MarketingBatchItem]
+    unique_requests: int
+    errors: int
 
 # ----------------------------------------------------------------
 # Setup / Initialization
 # ----------------------------------------------------------------
 def init(openai_api_key=None, tavily_api_key=None):
     """Initialize the agent with API keys."""
-    global openai_client, TAVILY_API_KEY
+    global openai_client, OPENAI_API_KEY, TAVILY_API_KEY
     
     # Use provided keys or fall back to environment variables
     openai_api_key = openai_api_key or os.environ.get("OPENAI_API_KEY")
+    OPENAI_API_KEY = openai_api_key
     TAVILY_API_KEY = tavily_api_key or os.environ.get("TAVILY_API_KEY")
     
     # Initialize OpenAI client
@@ -55,23 +244,197 @@ def init(openai_api_key=None, tavily_api_key=None):
         openai.api_key = openai_api_key
         openai_client = openai
     
+    # Route completions through the configured backends (default: OpenAI with this key)
+    if llm_router.router is None:
+        set_llm_router(build_llm_router(openai_api_key))
+    
+    # Build the default search cache unless one was installed already
+    if search_cache is None:
+        set_search_cache(build_search_cache())
+    if completion_cache is None:
+        set_completion_cache(build_completion_cache())
+    
     if not openai_api_key:
         print("Warning: OpenAI API key is not set for Marketing Agent.")
     if not TAVILY_API_KEY:
         print("Warning: Tavily API key is not set for Marketing Agent. Search functionality will be limited.")
 
+async def awarm_up():
+    """
+    Prepare for the first request (called by the agent registry on warm-up).
+
+    Opens the shared HTTP client of the running loop and loads the
+    tokenizer of the default model, which are otherwise set up by the
+    first request that needs them.
+    """
+    get_http_client()
+    count_tokens("warm-up", MarketingAgentRequest.model_fields["model"].default)
+
+# ----------------------------------------------------------------
+# Search Result Cache
+# ----------------------------------------------------------------
+def build_search_cache() -> CacheBackend:
+    """
+    Build the search cache from environment settings.
+    
+    SEARCH_CACHE_TTL: Seconds a result stays fresh (default 3600)
+    SEARCH_CACHE_MAX_ENTRIES: Entry cap for the memory tier (default 1024)
+    SEARCH_CACHE_MAX_BYTES: Byte cap for the memory tier (default 64 MB)
+    SEARCH_CACHE_PATH: SQLite file for an on-disk tier (memory only if unset)
+    """
+    return build_cache(
+        max_entries=int(os.environ.get("SEARCH_CACHE_MAX_ENTRIES", "1024")),
+        max_bytes=int(os.environ.get("SEARCH_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+        default_ttl=float(os.environ.get("SEARCH_CACHE_TTL", "3600")),
+        path=os.environ.get("SEARCH_CACHE_PATH"),
+        table="search_cache",
+    )
+
+def set_search_cache(cache: Optional[CacheBackend]):
+    """
+    Install the cache used for Tavily results.
+    
+    Args:
+        cache: Any CacheBackend, or None to disable caching
+    """
+    global search_cache
+    search_cache = cache
+
+def normalize_query(query: str) -> str:
+    """Normalize a search query so trivially different strings share a cache entry."""
+    return " ".join(query.lower().split())
+
+def search_cache_key(query: str, params: Dict[str, Any]) -> str:
+    """Build the cache key for a query and its search parameters."""
+    return make_cache_key("tavily", {"query": normalize_query(query), "params": params})
+
+# ----------------------------------------------------------------
+# Completion Cache
+# ----------------------------------------------------------------
+def build_completion_cache() -> CacheBackend:
+    """
+    Build the completion cache from environment settings.
+    
+    COMPLETION_CACHE_TTL: Seconds a completion stays fresh (default 86400)
+    COMPLETION_CACHE_MAX_ENTRIES: Entry cap for the memory tier (default 512)
+    COMPLETION_CACHE_MAX_BYTES: Byte cap for the memory tier (default 32 MB)
+    COMPLETION_CACHE_PATH: SQLite file for the persistent tier (default
+        completion-cache.db; set it empty to keep completions in memory only)
+    """
+    return build_cache(
+        max_entries=int(os.environ.get("COMPLETION_CACHE_MAX_ENTRIES", "512")),
+        max_bytes=int(os.environ.get("COMPLETION_CACHE_MAX_BYTES", str(32 * 1024 * 1024))),
+        default_ttl=float(os.environ.get("COMPLETION_CACHE_TTL", "86400")),
+        path=os.environ.get("COMPLETION_CACHE_PATH", "completion-cache.db"),
+        table="completion_cache",
+    )
+
+def set_completion_cache(cache: Optional[CacheBackend]):
+    """
+    Install the cache used for LLM completions.
+    
+    Args:
+        cache: Any CacheBackend, or None to disable caching
+    """
+    global completion_cache
+    completion_cache = cache
+
+def completion_cache_key(prompt: str, model: str, temperature: float, max_tokens: int) -> str:
+    """Build the cache key for a completion request."""
+    return make_cache_key("completion", {
+        "prompt": prompt,
+        "model": model,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+    })
+
+def should_cache_completion(request: MarketingAgentRequest) -> bool:
+    """Completions are cached when deterministic (temperature 0) or when the caller opts in."""
+    if request.use_cache is None:
+        return request.temperature == 0
+    return request.use_cache
+
+def get_cache_stats() -> Dict[str, Any]:
+    """Get hit/miss counters for the agent's caches."""
+    return {
+        "search": search_cache.stats() if search_cache is not None else None,
+        "completion": completion_cache.stats() if completion_cache is not None else None,
+        "completion_single_flight": completion_flight.stats(),
+        "analysis_single_flight": analysis_flight.stats(),
+    }
+
 # ----------------------------------------------------------------
 # Tavily AI Search Tool
 # ----------------------------------------------------------------
-def tavily_ai_search(query: str) -> Dict[str, Any]:
+async def _afetch_tavily(query: str) -> Dict[str, Any]:
     """
-    Perform search using Tavily AI search API.
+    Call the Tavily search API, raising on failure.
+    
+    Rate limits, retries and circuit breaking are applied by the upstream
+    governor around this call.
     
     Args:
         query: The search query
         
     Returns:
         Dictionary containing search results
+        
+    Raises:
+        UpstreamError: Tavily answered with an error status
+    """
+    # Try both header formats for Tavily API
+    headers = {
+        "Content-Type": "application/json",
+        "X-API-Key": TAVILY_API_KEY,
+        "Authorization": f"Bearer {TAVILY_API_KEY}"  # Adding Bearer token format as well
+    }
+    
+    payload = {"query": query, **TAVILY_SEARCH_PARAMS}
+    
+    client = get_http_client()
+    response = await client.post(
+        f"{TAVILY_BASE_URL}/search",
+        headers=headers,
+        json=payload
+    )
+    
+    if response.status_code == 404:
+        # Try alternative endpoint format
+        response = await client.post(
+            f"{TAVILY_BASE_URL}/v1/search",
+            headers=headers,
+            json=payload
+        )
+    
+    if response.status_code != 200:
+        raise UpstreamError(
+            f"Tavily API returned status code {response.status_code}: {response.text}",
+            status_code=response.status_code,
+            retry_after=parse_retry_after(response.headers.get("retry-after"))
+        )
+    
+    return response.json()
+
+async def _agoverned_tavily(query: str) -> Dict[str, Any]:
+    """Call Tavily through the upstream governor."""
+    with timed(AGENT_ID, "tavily_request"):
+        return await get_governor().call(
+            "tavily",
+            lambda: _afetch_tavily(query),
+            api_key=TAVILY_API_KEY
+        )
+
+async def asearch(query: str, use_cache: bool = True) -> Tuple[Dict[str, Any], str]:
+    """
+    Perform a Tavily search through the search cache.
+    
+    Args:
+        query: The search query
+        use_cache: Whether to consult the search cache
+        
+    Returns:
+        Tuple of (search results, cache status) where the status is
+        "hit", "miss" or "bypass"
     """
     try:
         if not TAVILY_API_KEY:
@@ -85,50 +448,54 @@ def tavily_ai_search(query: str) -> Dict[str, Any]:
                     }
                 ],
                 "query": query
-            }
+            }, CACHE_BYPASS
         
-        # Try both header formats for Tavily API
-        headers = {
-            "Content-Type": "application/json",
-            "X-API-Key": TAVILY_API_KEY,
-            "Authorization": f"Bearer {TAVILY_API_KEY}"  # Adding Bearer token format as well
-        }
+        if not use_cache or search_cache is None:
+            return await _agoverned_tavily(query), CACHE_BYPASS
         
-        payload = {
-            "query": query,
-            "search_depth": "advanced",
-            "include_domains": [],
-            "exclude_domains": [],
-            "max_results": 5
-        }
+        cache_key = search_cache_key(query, TAVILY_SEARCH_PARAMS)
+        cached = search_cache.get(cache_key)
+        if cached is not None:
+            return cached, CACHE_HIT
         
-        response = requests.post(
-            "https://api.tavily.com/search",
-            headers=headers,
-            json=payload
-        )
-        
-        if response.status_code != 200:
-            # Try alternative endpoint format
-            alt_response = requests.post(
-                "https://api.tavily.com/v1/search",
-                headers=headers,
-                json=payload
-            )
-            if alt_response.status_code == 200:
-                return alt_response.json()
-            raise Exception(f"Tavily API returned status code {response.status_code}: {response.text}")
-        
-        return response.json()
+        # Only successful responses reach the cache
+        results = await _agoverned_tavily(query)
+        search_cache.set(cache_key, results, cache_ttl(search_cache))
+        return results, CACHE_MISS
     
     except Exception as e:
         print(f"Error in Tavily search: {str(e)}")
+        metrics.UPSTREAM_ERRORS.inc(provider="tavily", error=type(e).__name__)
         # Return an error result
         return {
             "error": str(e),
             "results": [],
             "query": query
-        }
+        }, CACHE_MISS if use_cache and search_cache is not None else CACHE_BYPASS
+
+async def atavily_ai_search(query: str, use_cache: bool = True) -> Dict[str, Any]:
+    """
+    Perform search using Tavily AI search API.
+    
+    Successful results are served from and stored in the search cache.
+    
+    Args:
+        query: The search query
+        use_cache: Whether to consult the search cache
+        
+    Returns:
+        Dictionary containing search results
+    """
+    search_results, _ = await asearch(query, use_cache)
+    return search_results
+
+def tavily_ai_search(query: str, use_cache: bool = True) -> Dict[str, Any]:
+    """
+    Perform search using Tavily AI search API (blocking).
+    
+    Thin wrapper around atavily_ai_search() for synchronous callers.
+    """
+    return run_sync(atavily_ai_search(query, use_cache))
 
 def format_tavily_results(search_results: Dict[str, Any]) -> str:
     """
@@ -165,6 +532,8 @@ def build_prompt(
     business_name: str,
     website_url: str,
     search_results: str,
+    question: Optional[str] = None,
+    website_content: str = "",
 ) -> str:
     """
     Build the prompt for the OpenAI model.
@@ -174,12 +543,33 @@ def build_prompt(
         business_name: Name of the business to research
         website_url: Website URL of the business
         search_results: Formatted search results from Tavily
+        question: Follow-up question; asks for an answer instead of a full analysis
+        website_content: Formatted pages of the business's own website (if crawled)
         
     Returns:
         Formatted prompt string
     """
     # Start with any previous context
     context = previous_response + "\n\n" if previous_response else ""
+    website = f"WEBSITE CONTENT (from the business's own site):\n{website_content}\n" if website_content else ""
+    
+    if question:
+        return f"""{context}You are an expert marketing and research agent specializing in business analysis.
+
+TASK:
+Answer a follow-up question about the business: '{business_name}'
+Website: '{website_url}'
+The context above summarizes the conversation so far.
+
+QUESTION:
+{question}
+
+{website}SEARCH RESULTS:
+{search_results}
+
+Answer the question directly, building on the earlier analysis and using the website content and search results as evidence.
+Use ## headings to structure longer answers, and keep the answer actionable and focused on marketing insights.
+"""
     
     # Build the main prompt
     return f"""{context}You are an expert marketing and research agent specializing in business analysis.
@@ -188,13 +578,13 @@ TASK:
 Analyze and provide valuable insights for the business: '{business_name}'
 Website: '{website_url}'
 
-SEARCH RESULTS:
+{website}SEARCH RESULTS:
 {search_results}
 
 ANALYSIS STEPS:
 1. Identify the business sector, target audience, and value proposition
 2. Analyze market positioning based on the search results
-3. Evaluate their online presence and marketing strategy
+3. Evaluate their online presence and marketing strategy, using the website content for how they present themselves
 4. Identify potential strengths, weaknesses, opportunities, and threats
 5. Extract key insights that could help improve their marketing strategy
 
@@ -224,73 +614,1255 @@ FORMAT YOUR RESPONSE AS FOLLOWS:
 Keep your analysis evidence-based, actionable, and focused on marketing insights that provide genuine value.
 """
 
-# ----------------------------------------------------------------
-# Main Agent Logic
-# ----------------------------------------------------------------
-def run_analysis(request: MarketingAgentRequest) -> MarketingAgentResponse:
+def fit_search_results(
+    search_results: Dict[str, Any],
+    max_tokens: int,
+    model: str,
+) -> Tuple[Dict[str, Any], int]:
     """
-    Run the marketing analysis agent.
+    Keep ranked search results, in order, while they fit a token budget.
+    
+    The first result that doesn't fit is shortened if a useful snippet of
+    it still fits; the rest are dropped.
+    
+    Args:
+        search_results: Search response with results in rank order
+        max_tokens: Token budget for the formatted results
+        model: Model name, selects the tokenizer
+        
+    Returns:
+        Tuple of (search response with the kept results, number dropped)
+    """
+    results = search_results.get("results", [])
+    if "error" in search_results or not results:
+        return search_results, 0
+    
+    kept = []
+    used = 0
+    for result in results:
+        entry_tokens = count_tokens(format_tavily_results({"results": [result]}), model)
+        remaining = max_tokens - used
+        if entry_tokens <= remaining:
+            kept.append(result)
+            used += entry_tokens
+            continue
+        
+        content = result.get("content", "")
+        content_budget = remaining - (entry_tokens - count_tokens(content, model))
+        if content_budget >= MIN_SNIPPET_TOKENS:
+            kept.append(dict(result, content=truncate_tokens(content, content_budget - 1, model).rstrip() + " ..."))
+        break
+    
+    return dict(search_results, results=kept), len(results) - len(kept)
+
+def fit_website_pages(
+    pages: List[Dict[str, Any]],
+    max_tokens: int,
+    model: str,
+) -> List[Dict[str, Any]]:
+    """
+    Keep crawled pages, in crawl order, while they fit a token budget.
+    
+    The first page that doesn't fit has its text shortened if a useful
+    snippet of it still fits; the rest are dropped.
+    
+    Args:
+        pages: Crawled pages (see crawler.acrawl_site)
+        max_tokens: Token budget for the formatted pages
+        model: Model name, selects the tokenizer
+        
+    Returns:
+        The kept pages
+    """
+    kept = []
+    used = 0
+    for page in pages:
+        entry_tokens = count_tokens(format_pages([page]), model)
+        remaining = max_tokens - used
+        if entry_tokens <= remaining:
+            kept.append(page)
+            used += entry_tokens
+            continue
+        
+        text = page.get("text", "")
+        text_budget = remaining - (entry_tokens - count_tokens(text, model))
+        if text_budget >= MIN_SNIPPET_TOKENS:
+            kept.append(dict(page, text=truncate_tokens(text, text_budget - 1, model).rstrip() + " ..."))
+        break
+    return kept
+
+def assemble_prompt(
+    request: MarketingAgentRequest,
+    search_results: Dict[str, Any],
+    website_pages: Optional[List[Dict[str, Any]]] = None,
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    Build the prompt within the token budget of the request's model.
+    
+    The fixed instructions are counted first. Previous conversation context
+    gets up to PROMPT_HISTORY_MAX_TOKENS (its middle is cut if longer), the
+    crawled website up to WEBSITE_PROMPT_MAX_TOKENS, and search results fill
+    what is left, best-ranked first.
     
     Args:
         request: The marketing agent request parameters
+        search_results: Ranked search response
+        website_pages: Crawled pages of the business's website, if any
         
     Returns:
-        Marketing agent response with analysis
+        Tuple of (prompt, budget report with the final "prompt_tokens")
     """
-    # Construct search query from business name and website
-    search_query = f"{request.business_name} company business info marketing strategy {request.website_url}"
+    model = request.model
+    budget = prompt_budget.prompt_budget(model, MAX_TOKENS)
     
-    # Perform search using Tavily AI
-    search_results = tavily_ai_search(search_query)
-    formatted_results = format_tavily_results(search_results)
+    template = build_prompt("", request.business_name, request.website_url, "", request.question)
+    available = max(budget - count_tokens(template, model) - PROMPT_SLACK_TOKENS, 0)
+    
+    history = request.previous_response or ""
+    history_budget = min(prompt_budget.PROMPT_HISTORY_MAX_TOKENS, available // 2)
+    history_tokens = count_tokens(history, model)
+    if history_tokens > history_budget:
+        history = trim_middle(history, history_budget, model)
+    
+    website_budget = min(WEBSITE_PROMPT_MAX_TOKENS, available // 3)
+    fitted_pages = fit_website_pages(website_pages or [], website_budget, model)
+    formatted_pages = format_pages(fitted_pages)
+    
+    search_budget = available - count_tokens(history, model) - count_tokens(formatted_pages, model)
+    fitted_results, dropped = fit_search_results(search_results, search_budget, model)
+    formatted_results = format_tavily_results(fitted_results)
     
-    # Build the prompt for OpenAI
     prompt = build_prompt(
-        request.previous_response,
+        history,
         request.business_name,
         request.website_url,
-        formatted_results
+        formatted_results,
+        request.question,
+        website_content=formatted_pages
+    )
+    return prompt, {
+        "prompt_tokens": count_tokens(prompt, model),
+        "budget": budget,
+        "history_tokens": count_tokens(history, model),
+        "history_trimmed": history_tokens > history_budget,
+        "website_tokens": count_tokens(formatted_pages, model),
+        "website_pages_kept": len(fitted_pages),
+        "search_tokens": count_tokens(formatted_results, model),
+        "search_results_kept": len(fitted_results.get("results", [])),
+        "search_results_dropped": dropped,
+        "tokenizer": "tiktoken" if prompt_budget.tiktoken is not None else "estimate",
+    }
+
+def build_delta_prompt(
+    business_name: str,
+    website_url: str,
+    previous_analysis: str,
+    changed_sources: str,
+    removed_sources: str,
+) -> str:
+    """
+    Build the prompt updating an earlier analysis with changed sources.
+    
+    Args:
+        business_name: Name of the business
+        website_url: Website URL of the business
+        previous_analysis: The earlier analysis
+        changed_sources: Formatted website pages and search results that are
+            new or changed since the earlier analysis
+        removed_sources: URLs of search results no longer found, one per line
+        
+    Returns:
+        Formatted prompt string
+    """
+    return f"""You are an expert marketing and research agent specializing in business analysis.
+
+TASK:
+Update your earlier analysis of the business: '{business_name}'
+Website: '{website_url}'
+Some of the sources it was based on have changed since it was written.
+
+EARLIER ANALYSIS:
+{previous_analysis}
+
+NEW OR CHANGED SOURCES:
+{changed_sources}
+
+SOURCES NO LONGER FOUND:
+{removed_sources}
+
+Rewrite only the sections of the earlier analysis that these changes affect. Return each
+rewritten section in full, starting with its exact ## heading from the earlier analysis, and
+leave out every section that doesn't need to change. If no section needs to change, answer
+exactly: NO CHANGES
+"""
+
+# Appended to the prompt when the remaining time only allows a short answer
+BRIEF_INSTRUCTION = """
+TIME LIMIT:
+Keep the whole analysis under {words} words. Cover every section in a few short bullet
+points, most important points first.
+"""
+
+def fit_to_deadline(prompt: str, max_tokens: int, deadline: Optional[Deadline]) -> Tuple[str, int, List[str]]:
+    """
+    Ask for a shorter answer when the time left can't fit max_tokens.
+    
+    Args:
+        prompt: The prompt as assembled
+        max_tokens: Completion cap without a deadline
+        deadline: The request's deadline, if any
+        
+    Returns:
+        Tuple of (prompt, completion cap, degraded reasons)
+    """
+    if deadline is None:
+        return prompt, max_tokens, []
+    fit = tokens_within(deadline, max_tokens)
+    if fit >= max_tokens:
+        return prompt, max_tokens, []
+    # Roughly three words per four tokens, with room to finish the last point
+    return prompt + BRIEF_INSTRUCTION.format(words=int(fit * 0.6)), fit, [DEGRADED_BRIEF]
+
+def assemble_delta_prompt(
+    request: MarketingAgentRequest,
+    previous_analysis: str,
+    prepared: Dict[str, Any],
+    diff: Dict[str, Any],
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    Build the delta update prompt within the model's token budget.
+    
+    The earlier analysis gets up to half of the space left by the
+    instructions (its middle is cut if longer); the changed website pages
+    and search results share the rest like in assemble_prompt.
+    
+    Args:
+        request: The marketing agent request parameters
+        previous_analysis: The analysis being updated
+        prepared: The run's prepared sources (see aprepare_analysis)
+        diff: Changed source keys (see incremental.choose_path)
+        
+    Returns:
+        Tuple of (prompt, budget report with the final "prompt_tokens")
+    """
+    model = request.model
+    budget = prompt_budget.prompt_budget(model, DELTA_MAX_TOKENS)
+    changed = set(diff["added"]) | set(diff["changed"])
+    pages = [
+        page for page in prepared["crawl"]["pages"]
+        if PAGE_KEY_PREFIX + canonical_url(page["url"]) in changed
+    ]
+    results = [
+        result for result in prepared["search_results"].get("results", [])
+        if canonical_url(result.get("url", "")) in changed
+    ]
+    removed = "\n".join(f"- {key}" for key in diff["removed"][:20]) or "None"
+    
+    template = build_delta_prompt(request.business_name, request.website_url, "", "", removed)
+    available = max(budget - count_tokens(template, model) - PROMPT_SLACK_TOKENS, 0)
+    
+    previous_budget = available // 2
+    if count_tokens(previous_analysis, model) > previous_budget:
+        previous_analysis = trim_middle(previous_analysis, previous_budget, model)
+    available -= count_tokens(previous_analysis, model)
+    
+    fitted_pages = fit_website_pages(pages, min(WEBSITE_PROMPT_MAX_TOKENS, available // 3), model)
+    formatted_pages = format_pages(fitted_pages)
+    fitted_results, dropped = fit_search_results(
+        {"results": results}, available - count_tokens(formatted_pages, model), model
+    )
+    changed_sources = "\n".join(
+        part for part in (
+            formatted_pages,
+            format_tavily_results(fitted_results) if fitted_results["results"] else "",
+        ) if part
+    ) or "None"
+    
+    prompt = build_delta_prompt(
+        request.business_name, request.website_url, previous_analysis, changed_sources, removed
+    )
+    return prompt, {
+        "prompt_tokens": count_tokens(prompt, model),
+        "budget": budget,
+        "previous_analysis_tokens": count_tokens(previous_analysis, model),
+        "changed_pages_kept": len(fitted_pages),
+        "changed_results_kept": len(fitted_results["results"]),
+        "changed_results_dropped": dropped,
+        "tokenizer": "tiktoken" if prompt_budget.tiktoken is not None else "estimate",
+    }
+
+# ----------------------------------------------------------------
+# LLM Completion
+# ----------------------------------------------------------------
+async def agenerate_completion(
+    prompt: str,
+    model: str,
+    temperature: float,
+    max_tokens: int = MAX_TOKENS,
+) -> Dict[str, Any]:
+    """
+    Generate a chat completion for the prompt.
+    
+    The LLM router picks the backend, hedges slow calls and fails over
+    when a backend errors.
+    
+    Args:
+        prompt: The full prompt to send as the user message
+        model: Model name
+        temperature: Sampling temperature
+        max_tokens: Maximum number of tokens to generate
+        
+    Returns:
+        Dictionary with the generated "content", the "model" that produced it,
+        the provider's token "usage" (None if not reported) and the "backend"
+        that answered
+    """
+    completion = await get_llm_router().acomplete(prompt, model, temperature, max_tokens)
+    metrics.record_usage(completion["model"], completion["usage"])
+    return completion
+
+def generate_completion(
+    prompt: str,
+    model: str,
+    temperature: float,
+    max_tokens: int = MAX_TOKENS,
+) -> Dict[str, Any]:
+    """
+    Generate a chat completion for the prompt (blocking).
+    
+    Thin wrapper around agenerate_completion() for synchronous callers.
+    """
+    return run_sync(agenerate_completion(prompt, model, temperature, max_tokens))
+
+async def astream_completion(
+    prompt: str,
+    model: str,
+    temperature: float,
+    max_tokens: int = MAX_TOKENS,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Stream a chat completion for the prompt as it is generated.
+    
+    Args:
+        prompt: The full prompt to send as the user message
+        model: Model name
+        temperature: Sampling temperature
+        max_tokens: Maximum number of tokens to generate
+        
+    Yields:
+        Dictionaries with the next "content" delta, the "model" producing it and
+        the "backend" serving it; a chunk carrying the provider's token report
+        also has a "usage" entry
+    """
+    async for delta in get_llm_router().astream(prompt, model, temperature, max_tokens):
+        yield delta
+
+async def acached_completion(
+    prompt: str,
+    model: str,
+    temperature: float,
+    use_cache: bool,
+    max_tokens: int = MAX_TOKENS,
+) -> Tuple[Dict[str, Any], str]:
+    """
+    Generate a completion through the completion cache.
+    
+    Concurrent identical requests share a single upstream call.
+    
+    Args:
+        prompt: The full prompt
+        model: OpenAI model name
+        temperature: Sampling temperature
+        use_cache: Whether this completion may be served from/stored in the cache
+        max_tokens: Maximum number of tokens to generate
+        
+    Returns:
+        Tuple of (completion, cache status)
+    """
+    if not use_cache or completion_cache is None:
+        return await agenerate_completion(prompt, model, temperature, max_tokens), CACHE_BYPASS
+    
+    cache_key = completion_cache_key(prompt, model, temperature, max_tokens)
+    cached = completion_cache.get(cache_key)
+    if cached is not None:
+        return cached, CACHE_HIT
+    
+    async def fetch():
+        completion = await agenerate_completion(prompt, model, temperature, max_tokens)
+        completion_cache.set(cache_key, completion, cache_ttl(completion_cache))
+        return completion
+    
+    completion, shared = await completion_flight.do(cache_key, fetch)
+    return completion, CACHE_SHARED if shared else CACHE_MISS
+
+def estimate_usage(prompt: str, content: str, model: str) -> Dict[str, int]:
+    """Token usage counted locally, for streams the provider didn't report on."""
+    prompt_tokens = count_tokens(prompt, model)
+    completion_tokens = count_tokens(content, model)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+async def acompletion_until(
+    prompt: str,
+    model: str,
+    temperature: float,
+    use_cache: bool,
+    deadline: Optional[Deadline],
+    max_tokens: int = MAX_TOKENS,
+) -> Tuple[Dict[str, Any], str]:
+    """
+    Generate a completion that ends by the deadline.
+    
+    With a deadline the completion is streamed, so that the text generated
+    by then can be returned; such a completion has "partial" set and is
+    not cached. Without one this is acached_completion().
+    
+    Args:
+        prompt: The full prompt
+        model: OpenAI model name
+        temperature: Sampling temperature
+        use_cache: Whether this completion may be served from/stored in the cache
+        deadline: The request's deadline, if any
+        max_tokens: Maximum number of tokens to generate
+        
+    Returns:
+        Tuple of (completion, cache status)
+        
+    Raises:
+        DeadlineExceeded: The deadline passed before any text was generated
+    """
+    if deadline is None:
+        return await acached_completion(prompt, model, temperature, use_cache, max_tokens)
+    
+    use_cache = use_cache and completion_cache is not None
+    cache_key = completion_cache_key(prompt, model, temperature, max_tokens)
+    if use_cache:
+        cached = completion_cache.get(cache_key)
+        if cached is not None:
+            return cached, CACHE_HIT
+    
+    parts = []
+    completion = {"model": model, "usage": None, "backend": None}
+    try:
+        async for delta in until(astream_completion(prompt, model, temperature, max_tokens), deadline):
+            completion["model"] = delta["model"] or completion["model"]
+            completion["backend"] = delta.get("backend") or completion["backend"]
+            completion["usage"] = delta.get("usage") or completion["usage"]
+            parts.append(delta["content"])
+    except DeadlineExceeded:
+        if not "".join(parts):
+            raise
+        completion["partial"] = True
+    completion["content"] = "".join(parts)
+    if completion["usage"] is None:
+        completion["usage"] = estimate_usage(prompt, completion["content"], completion["model"])
+    metrics.record_usage(completion["model"], completion["usage"])
+    
+    if use_cache and not completion.get("partial"):
+        completion_cache.set(cache_key, completion, cache_ttl(completion_cache))
+    return completion, CACHE_MISS if use_cache else CACHE_BYPASS
+
+# ----------------------------------------------------------------
+# Main Agent Logic
+# ----------------------------------------------------------------
+@asynccontextmanager
+async def _limit(semaphore: Optional[asyncio.Semaphore]):
+    """Hold the semaphore for the duration of the block, if one is given."""
+    if semaphore is None:
+        yield
+        return
+    async with semaphore:
+        yield
+
+def normalize_website(website_url: str) -> str:
+    """Reduce a website URL to host + path, e.g. "HTTPS://www.Foo.com/" -> "foo.com"."""
+    url = website_url.strip()
+    if "://" not in url:
+        url = f"http://{url}"
+    parts = urlsplit(url)
+    host = (parts.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    return f"{host}{parts.path.rstrip('/')}"
+
+def request_fingerprint(request: MarketingAgentRequest) -> str:
+    """
+    Key identifying requests that would produce the same analysis for the
+    same caller.
+
+    The owner is part of the key because a shared run records usage and
+    stores its result for one owner only; store_result and debug are part
+    of it because they change what a caller gets back.
+    """
+    return make_cache_key("request", {
+        "business_name": " ".join(request.business_name.casefold().split()),
+        "website": normalize_website(request.website_url),
+        "previous_response": request.previous_response or "",
+        "model": request.model,
+        "temperature": request.temperature,
+        "use_cache": request.use_cache,
+        "session_id": request.session_id,
+        "start_session": request.start_session,
+        "question": request.question,
+        "crawl_website": request.crawl_website,
+        "incremental": request.incremental,
+        "deadline": request.deadline,
+        "user_id": request.user_id,
+        "company_id": request.company_id,
+        "store_result": request.store_result,
+        "debug": request.debug,
+    })
+
+def build_search_queries(request: MarketingAgentRequest) -> Dict[str, str]:
+    """Construct one focused search query per configured facet, plus the follow-up question."""
+    queries = {
+        name: SEARCH_FACETS[name].format(
+            business_name=request.business_name,
+            website_url=request.website_url
+        )
+        for name in SEARCH_FACET_NAMES
+    }
+    if request.question:
+        queries["question"] = f"{request.business_name} {request.question}"
+    return queries
+
+def build_search_query(request: MarketingAgentRequest) -> str:
+    """The primary (first facet) search query for a request."""
+    return next(iter(build_search_queries(request).values()))
+
+def combine_cache_status(statuses: List[str]) -> str:
+    """Summarize sub-query cache statuses: "hit" only if every query hit."""
+    distinct = set(statuses)
+    if len(distinct) == 1:
+        return statuses[0]
+    if distinct <= {CACHE_HIT, CACHE_SHARED}:
+        return CACHE_SHARED
+    return CACHE_MISS if CACHE_MISS in distinct else CACHE_BYPASS
+
+async def asearch_fanout(
+    queries: Dict[str, str],
+    use_cache: bool = True,
+    search_semaphore: Optional[asyncio.Semaphore] = None,
+    timeout: Optional[float] = None,
+) -> Tuple[Dict[str, Any], str]:
+    """
+    Run several search queries concurrently and merge their results.
+    
+    Args:
+        queries: Facet name -> search query
+        use_cache: Whether to consult the search cache
+        search_semaphore: Optional limit on concurrent searches, held per query
+        timeout: Seconds to wait for the searches; those still running are
+            cancelled and the results that arrived are merged
+        
+    Returns:
+        Tuple of (merged search results, combined cache status); the merged
+        results list the cancelled queries under "timed_out"
+    """
+    async def search_one(query: str) -> Tuple[Dict[str, Any], str]:
+        async with _limit(search_semaphore):
+            return await asearch(query, use_cache)
+    
+    tasks = {name: asyncio.ensure_future(search_one(query)) for name, query in queries.items()}
+    try:
+        await asyncio.wait(tasks.values(), timeout=timeout)
+    finally:
+        for task in tasks.values():
+            task.cancel()
+    outcomes = {name: task.result() for name, task in tasks.items() if task.done() and not task.cancelled()}
+    timed_out = [queries[name] for name in queries if name not in outcomes]
+    
+    statuses = [status for _, status in outcomes.values()]
+    statuses += [CACHE_MISS if use_cache and search_cache is not None else CACHE_BYPASS] * len(timed_out)
+    for status in statuses:
+        metrics.CACHE_REQUESTS.inc(cache="search", status=status)
+    
+    merged = merge_results(
+        {name: results for name, (results, _) in outcomes.items()},
+        budget=SEARCH_RESULT_BUDGET,
+        near_duplicate_threshold=SEARCH_DEDUP_THRESHOLD
+    )
+    if timed_out:
+        merged["timed_out"] = timed_out
+    return merged, combine_cache_status(statuses)
+
+async def acrawl_website(request: MarketingAgentRequest, stop: Optional[asyncio.Event] = None) -> Dict[str, Any]:
+    """
+    Read the request's website, unless crawling is disabled.
+    
+    Args:
+        request: The marketing agent request parameters
+        stop: Set to end the crawl (after a short grace period) with the
+            pages read so far
+        
+    Returns:
+        Crawl report (see crawler.acrawl_site); without pages when the
+        crawl is skipped or the site can't be read
+    """
+    if not (crawler.CRAWL_ENABLED and request.crawl_website and request.website_url):
+        return {"pages": [], "errors": [], "blocked": [], "bytes": 0, "seconds": 0.0}
+    with timed(AGENT_ID, "crawl"):
+        crawl = await acrawl_site(request.website_url, stop=stop)
+    for page in crawl["pages"]:
+        metrics.CACHE_REQUESTS.inc(cache="crawl", status=page["cache_status"])
+    if crawl["errors"] and not crawl["pages"]:
+        metrics.UPSTREAM_ERRORS.inc(provider="website", error="CrawlError")
+    return crawl
+
+async def aprepare_analysis(
+    request: MarketingAgentRequest,
+    search_semaphore: Optional[asyncio.Semaphore] = None,
+    deadline: Optional[Deadline] = None,
+) -> Dict[str, Any]:
+    """
+    Run the search phase and build the prompt for a request.
+    
+    Args:
+        request: The marketing agent request parameters
+        search_semaphore: Optional limit on concurrent searches
+        deadline: The request's deadline; searches get DEADLINE_SEARCH_SHARE
+            of it, and the analysis goes ahead with the results that arrived
+        
+    Returns:
+        Dictionary with the primary "search_query", all "search_queries",
+        the merged "search_results", "search_cache_status", the "crawl"
+        report of the website (see crawler.acrawl_site), the content
+        "source_hashes" of both (see incremental.source_hashes), the final
+        "prompt" and its "prompt_report" (see assemble_prompt), and the
+        "degraded" reasons of the phase
+    """
+    search_queries = build_search_queries(request)
+    
+    search_done = asyncio.Event()
+    
+    async def search():
+        # Perform the sub-query searches using Tavily AI; the phase takes as
+        # long as the slowest one
+        try:
+            with timed(AGENT_ID, "search"):
+                return await asearch_fanout(
+                    search_queries,
+                    use_cache=request.use_cache is not False,
+                    search_semaphore=search_semaphore,
+                    timeout=deadline.share(DEADLINE_SEARCH_SHARE) if deadline is not None else None
+                )
+        finally:
+            search_done.set()
+    
+    # The website is read while the searches run and may only briefly
+    # outlast them, so crawling never becomes the slow phase
+    (search_results, search_cache_status), crawl = await asyncio.gather(
+        search(), acrawl_website(request, stop=search_done)
     )
     
+    # Build the prompt for OpenAI, fitted to the model's token budget
+    with timed(AGENT_ID, "prompt"):
+        prompt, prompt_report = assemble_prompt(request, search_results, crawl["pages"])
+    metrics.PROMPT_TOKENS.observe(prompt_report["prompt_tokens"], agent=AGENT_ID)
+    
+    return {
+        "search_query": next(iter(search_queries.values())),
+        "search_queries": list(search_queries.values()),
+        "search_results": search_results,
+        "search_cache_status": search_cache_status,
+        "crawl": crawl,
+        "source_hashes": source_hashes(search_results, crawl["pages"]),
+        "prompt": prompt,
+        "prompt_report": prompt_report,
+        "degraded": [DEGRADED_SEARCH] if search_results.get("timed_out") else [],
+    }
+
+def _record_usage(request: MarketingAgentRequest, completion: Dict[str, Any], duration: float):
+    """Queue a token_usage record for a completion that went upstream."""
+    if not completion.get("usage"):
+        return
+    get_usage_writer().record(UsageRecord.from_usage(
+        completion["model"],
+        completion["usage"],
+        duration_seconds=round(duration, 3),
+        user_id=request.user_id,
+        company_id=request.company_id
+    ))
+
+def resolve_session(request: MarketingAgentRequest) -> Tuple[MarketingAgentRequest, Optional[Session]]:
+    """
+    Load or start the request's session.
+    
+    A continued session fills in the business and puts its rolling summary
+    in front of any previous_response the request carries.
+    
+    Args:
+        request: The marketing agent request parameters
+        
+    Returns:
+        Tuple of (request with the session context applied, session or None)
+        
+    Raises:
+        SessionNotFoundError: session_id is unknown or expired
+    """
+    store = get_session_store()
+    if request.session_id:
+        session = store.get(request.session_id)
+        request = request.model_copy(update={
+            "business_name": request.business_name or session.business_name,
+            "website_url": request.website_url or session.website_url,
+            "previous_response": "\n\n".join(
+                part for part in (session.summary, request.previous_response) if part
+            ),
+        })
+        return request, session
+    if request.start_session:
+        return request, store.create(AGENT_ID, request.business_name, request.website_url)
+    return request, None
+
+def _record_turn(session: Optional[Session], request: MarketingAgentRequest, response: MarketingAgentResponse):
+    """Add a successful answer to the session summary and report the session ID."""
+    if session is None:
+        return
+    if not response.error:
+        get_session_store().record_turn(session, request.question, response.analysis, request.model)
+    response.session_id = session.session_id
+
+# Request fields a pre-warm refresh replays; the rest (sessions, previous
+# responses, debug output, the requesting user and company) belongs to the
+# individual request, so refreshes aren't billed to or stored for a customer
+PREWARM_FIELDS = (
+    "business_name", "website_url", "model", "temperature", "use_cache",
+    "crawl_website", "incremental",
+)
+
+def _record_demand(
+    request: MarketingAgentRequest,
+    session: Optional[Session],
+    response: MarketingAgentResponse,
+):
+    """Count a standalone analysis request toward pre-warming (see prewarm.py)."""
+    if session is not None or request.previous_response:
+        return
+    warm = (
+        response.search_cache_status == CACHE_HIT
+        or response.completion_cache_status == CACHE_HIT
+        or response.analysis_path == PATH_REUSED
+    )
+    payload = request.model_dump(include=set(PREWARM_FIELDS))
+    key = make_cache_key("prewarm", {
+        **payload,
+        "business_name": " ".join(request.business_name.casefold().split()),
+        "website_url": normalize_website(request.website_url),
+    })
+    record_demand(AGENT_ID, key, payload, warm)
+
+def source_list(search_results: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Titles and URLs of the search results (or crawled pages) an analysis was based on."""
+    return [
+        {"title": result.get("title"), "url": result.get("url")}
+        for result in search_results.get("results", [])
+    ]
+
+def _crawl_debug(crawl: Dict[str, Any]) -> Dict[str, Any]:
+    """Crawl details for debug responses (everything but the page text)."""
+    return {
+        "pages": [{"url": page["url"], "cache_status": page["cache_status"]} for page in crawl["pages"]],
+        "errors": crawl["errors"],
+        "blocked": crawl["blocked"],
+        "bytes": crawl["bytes"],
+        "seconds": crawl["seconds"],
+    }
+
+async def _store_result(
+    request: MarketingAgentRequest,
+    response: MarketingAgentResponse,
+    timings: Dict[str, float],
+    duration: float,
+):
+    """Keep a successful analysis in the result store and report its ID."""
+    if response.error or not request.store_result:
+        return
+    response.result_id = await asave_result(StoredResult.new(
+        AGENT_ID,
+        business_name=request.business_name,
+        website_url=request.website_url,
+        user_id=request.user_id,
+        company_id=request.company_id,
+        session_id=response.session_id,
+        model=response.model_used,
+        inputs=request.model_dump(exclude={"previous_response", "debug", "coalesce", "store_result"}),
+        response=response.model_dump(exclude={"sources", "debug", "result_id"}),
+        sources=response.sources or [],
+        timings=timings,
+        prompt_tokens=response.prompt_tokens,
+        usage=response.usage,
+        duration_seconds=round(duration, 3),
+        source_hashes=response._source_hashes,
+        source_fingerprint=response.source_fingerprint,
+    ))
+
+def _debug_info(timings: Dict[str, float], response: MarketingAgentResponse) -> Dict[str, Any]:
+    """Debug details attached to responses for requests with debug=true."""
+    return {
+        "timings": timings,
+        "cache": {
+            "search": response.search_cache_status,
+            "completion": response.completion_cache_status,
+        },
+        # Details the run attached itself, e.g. the prompt budget report
+        **(response.debug or {}),
+    }
+
+async def _arun_analysis(
+    request: MarketingAgentRequest,
+    search_semaphore: Optional[asyncio.Semaphore],
+    llm_semaphore: Optional[asyncio.Semaphore],
+) -> MarketingAgentResponse:
+    """Search, build the prompt and generate the analysis, incrementally if requested (see arun_analysis)."""
+    deadline = Deadline.after(request.deadline)
+    prepared = await aprepare_analysis(request, search_semaphore, deadline)
+    debug = {"prompt": prepared["prompt_report"], "crawl": _crawl_debug(prepared["crawl"])} if request.debug else None
+    
+    response = None
+    if request.incremental and not request.question:
+        response = await _arun_incremental(request, prepared, llm_semaphore, debug, deadline)
+    if response is None:
+        response = await _arun_full(request, prepared, llm_semaphore, debug, deadline)
+    degraded = prepared["degraded"] + (response.degraded or [])
+    for reason in degraded:
+        metrics.DEGRADED_RESPONSES.inc(agent=AGENT_ID, reason=reason)
+    response.degraded = degraded or None
+    response.source_fingerprint = fingerprint(prepared["source_hashes"])
+    response._source_hashes = prepared["source_hashes"]
+    return response
+
+async def _arun_full(
+    request: MarketingAgentRequest,
+    prepared: Dict[str, Any],
+    llm_semaphore: Optional[asyncio.Semaphore],
+    debug: Optional[Dict[str, Any]],
+    deadline: Optional[Deadline] = None,
+) -> MarketingAgentResponse:
+    """Generate the analysis from the full prompt, within the time left before the deadline."""
+    search_query = prepared["search_query"]
+    search_queries = prepared["search_queries"]
+    search_cache_status = prepared["search_cache_status"]
+    prompt_tokens = prepared["prompt_report"]["prompt_tokens"]
+    website_pages = source_list({"results": prepared["crawl"]["pages"]})
+    
     # Use OpenAI to generate the analysis
+    degraded = []
     try:
-        # First try the newer OpenAI client approach
-        if hasattr(openai_client, "chat") and hasattr(openai_client.chat, "completions"):
-            response = openai_client.chat.completions.create(
-                model=request.model,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=request.temperature,
-                max_tokens=2500
-            )
-            
-            # New client returns structured object
-            analysis = response.choices[0].message.content
-            model_used = response.model
-            
-        # Fall back to older OpenAI client approach
-        else:
-            response = openai_client.ChatCompletion.create(
-                model=request.model,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=request.temperature,
-                max_tokens=2500
-            )
-            # Old client returns dict
-            analysis = response["choices"][0]["message"]["content"]
-            model_used = response["model"]
+        async with _limit(llm_semaphore):
+            prompt, max_tokens, degraded = fit_to_deadline(prepared["prompt"], MAX_TOKENS, deadline)
+            completion_start = time.perf_counter()
+            with timed(AGENT_ID, "completion"):
+                completion, completion_cache_status = await acompletion_until(
+                    prompt,
+                    model=request.model,
+                    temperature=request.temperature,
+                    use_cache=should_cache_completion(request),
+                    deadline=deadline,
+                    max_tokens=max_tokens
+                )
+        metrics.CACHE_REQUESTS.inc(cache="completion", status=completion_cache_status)
+        if completion_cache_status in (CACHE_MISS, CACHE_BYPASS):
+            _record_usage(request, completion, time.perf_counter() - completion_start)
         
         # Return the analysis
         return MarketingAgentResponse(
-            analysis=analysis,
+            analysis=completion["content"],
             search_query=search_query,
-            model_used=model_used
+            search_queries=search_queries,
+            sources=source_list(prepared["search_results"]),
+            website_pages=website_pages,
+            model_used=completion["model"],
+            llm_backend=completion.get("backend"),
+            search_cache_status=search_cache_status,
+            completion_cache_status=completion_cache_status,
+            usage=completion.get("usage") if completion_cache_status in (CACHE_MISS, CACHE_BYPASS) else None,
+            prompt_tokens=prompt_tokens,
+            degraded=degraded + ([DEGRADED_PARTIAL] if completion.get("partial") else []),
+            partial=bool(completion.get("partial")),
+            debug=debug
         )
         
     except Exception as e:
-        # Handle OpenAI API errors
+        # Handle OpenAI API errors; a deadline that passed before the first
+        # token is reported as an empty partial analysis
+        if isinstance(e, DeadlineExceeded):
+            degraded = degraded + [DEGRADED_PARTIAL]
+        else:
+            metrics.UPSTREAM_ERRORS.inc(provider="openai", error=type(e).__name__)
         error_message = f"Error generating analysis: {str(e)}"
         return MarketingAgentResponse(
             analysis=error_message,
             search_query=search_query,
-            model_used=request.model
-        ) 
\ No newline at end of file
+            search_queries=search_queries,
+            website_pages=website_pages,
+            model_used=request.model,
+            search_cache_status=search_cache_status,
+            error=str(e),
+            prompt_tokens=prompt_tokens,
+            degraded=degraded,
+            partial=isinstance(e, DeadlineExceeded),
+            debug=debug
+        )
+
+async def _arun_incremental(
+    request: MarketingAgentRequest,
+    prepared: Dict[str, Any],
+    llm_semaphore: Optional[asyncio.Semaphore],
+    debug: Optional[Dict[str, Any]],
+    deadline: Optional[Deadline] = None,
+) -> Optional[MarketingAgentResponse]:
+    """
+    Build on the latest stored analysis of the business (see incremental).
+    
+    A delta update still running at the deadline is abandoned and the
+    earlier analysis is returned, flagged as stale.
+    
+    Returns:
+        The reused or delta-updated analysis, or None when it has to be
+        computed in full (no usable earlier analysis, too many changed
+        sources, or a failed delta update)
+    """
+    previous = await afind_previous_result(
+        AGENT_ID,
+        request.business_name,
+        request.website_url,
+        model=request.model,
+        user_id=request.user_id,
+        company_id=request.company_id
+    )
+    path, diff = choose_path(previous, prepared["source_hashes"])
+    if debug is not None:
+        debug["incremental"] = {
+            "path": path,
+            "previous_result_id": previous.result_id if previous is not None else None,
+            "change_ratio": diff["change_ratio"],
+            "added": len(diff["added"]),
+            "changed": len(diff["changed"]),
+            "removed": len(diff["removed"]),
+        }
+    if path == PATH_FULL:
+        metrics.ANALYSIS_PATHS.inc(agent=AGENT_ID, path=PATH_FULL)
+        return None
+    
+    common = {
+        "search_query": prepared["search_query"],
+        "search_queries": prepared["search_queries"],
+        "sources": source_list(prepared["search_results"]),
+        "website_pages": source_list({"results": prepared["crawl"]["pages"]}),
+        "search_cache_status": prepared["search_cache_status"],
+        "analysis_path": path,
+        "previous_result_id": previous.result_id,
+        "debug": debug,
+    }
+    def reuse(degraded: Optional[List[str]] = None) -> MarketingAgentResponse:
+        metrics.ANALYSIS_PATHS.inc(agent=AGENT_ID, path=PATH_REUSED)
+        return MarketingAgentResponse(
+            analysis=previous.response["analysis"],
+            model_used=previous.model or request.model,
+            llm_backend=previous.response.get("llm_backend"),
+            degraded=degraded,
+            **{**common, "analysis_path": PATH_REUSED}
+        )
+    
+    if path == PATH_REUSED:
+        return reuse()
+    
+    prompt, prompt_report = assemble_delta_prompt(request, previous.response["analysis"], prepared, diff)
+    if debug is not None:
+        debug["delta_prompt"] = prompt_report
+    try:
+        async with _limit(llm_semaphore):
+            completion_start = time.perf_counter()
+            with timed(AGENT_ID, "completion"):
+                completion, completion_cache_status = await asyncio.wait_for(
+                    acached_completion(
+                        prompt,
+                        model=request.model,
+                        temperature=request.temperature,
+                        use_cache=should_cache_completion(request),
+                        max_tokens=DELTA_MAX_TOKENS
+                    ),
+                    timeout=deadline.remaining() if deadline is not None else None
+                )
+    except asyncio.TimeoutError:
+        return reuse([DEGRADED_STALE])
+    except Exception as e:
+        metrics.UPSTREAM_ERRORS.inc(provider="openai", error=type(e).__name__)
+        print(f"Warning: delta update failed, running the full analysis: {type(e).__name__}: {e}")
+        metrics.ANALYSIS_PATHS.inc(agent=AGENT_ID, path=PATH_FULL)
+        return None
+    metrics.CACHE_REQUESTS.inc(cache="completion", status=completion_cache_status)
+    if completion_cache_status in (CACHE_MISS, CACHE_BYPASS):
+        _record_usage(request, completion, time.perf_counter() - completion_start)
+    
+    analysis, rewritten = merge_sections(previous.response["analysis"], completion["content"])
+    if debug is not None:
+        debug["incremental"]["rewritten_sections"] = rewritten
+    metrics.ANALYSIS_PATHS.inc(agent=AGENT_ID, path=PATH_DELTA)
+    return MarketingAgentResponse(
+        analysis=analysis,
+        model_used=completion["model"],
+        llm_backend=completion.get("backend"),
+        completion_cache_status=completion_cache_status,
+        usage=completion.get("usage") if completion_cache_status in (CACHE_MISS, CACHE_BYPASS) else None,
+        prompt_tokens=prompt_report["prompt_tokens"],
+        **common
+    )
+
+async def arun_analysis(
+    request: MarketingAgentRequest,
+    search_semaphore: Optional[asyncio.Semaphore] = None,
+    llm_semaphore: Optional[asyncio.Semaphore] = None,
+) -> MarketingAgentResponse:
+    """
+    Run the marketing analysis agent.
+    
+    Concurrent requests with the same fingerprint (see request_fingerprint)
+    share one run unless they set coalesce=False.
+    
+    Args:
+        request: The marketing agent request parameters
+        search_semaphore: Optional limit on concurrent searches
+        llm_semaphore: Optional limit on concurrent completions
+        
+    Returns:
+        Marketing agent response with analysis
+        
+    Raises:
+        SessionNotFoundError: session_id is unknown or expired
+    """
+    request, session = resolve_session(request)
+    
+    timings_token = metrics.start_request_timings()
+    start = time.perf_counter()
+    try:
+        if request.coalesce:
+            response, coalesced = await analysis_flight.do(
+                request_fingerprint(request),
+                lambda: _arun_analysis(request, search_semaphore, llm_semaphore)
+            )
+            if coalesced:
+                metrics.COALESCED_REQUESTS.inc(agent=AGENT_ID)
+            # Every caller gets its own copy to attach session and debug details to
+            response = response.model_copy(deep=True, update={"coalesced": coalesced})
+        else:
+            response = await _arun_analysis(request, search_semaphore, llm_semaphore)
+    finally:
+        duration = time.perf_counter() - start
+        metrics.record_phase(AGENT_ID, "total", duration)
+        timings = metrics.stop_request_timings(timings_token)
+    
+    _record_turn(session, request, response)
+    _record_demand(request, session, response)
+    await _store_result(request, response, timings, duration)
+    metrics.REQUESTS.inc(agent=AGENT_ID, outcome="error" if response.error else "ok")
+    if request.debug:
+        response.debug = _debug_info(timings, response)
+    return response
+
+async def astream_analysis(request: MarketingAgentRequest) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Run the marketing analysis agent, yielding progress as it happens.
+    
+    Events, in order:
+        "status": {"phase": "search", "query": ...} before searching
+        "search": {"results": n, "sources": [...], "cache_status": ...,
+                   "website_pages": [...], "degraded": [...]} once searching
+                  and crawling finish
+        "status": {"phase": "analysis"} before the completion starts
+        "token":  {"content": ...} for every generated text delta
+        "done":   the MarketingAgentResponse fields except "analysis" ("partial"
+                  when the deadline cut the analysis off)
+        "error":  {"message": ...} if the session is unknown or the completion
+                  fails (ends the stream)
+    
+    Args:
+        request: The marketing agent request parameters
+        
+    Yields:
+        Tuples of (event name, event data)
+    """
+    try:
+        request, session = resolve_session(request)
+    except SessionNotFoundError as e:
+        yield "error", {"message": f"Unknown or expired session: {e.args[0]}"}
+        return
+    
+    timings_token = metrics.start_request_timings()
+    start = time.perf_counter()
+    
+    search_queries = list(build_search_queries(request).values())
+    yield "status", {"phase": "search", "query": search_queries[0], "queries": search_queries}
+    
+    deadline = Deadline.after(request.deadline)
+    prepared = await aprepare_analysis(request, deadline=deadline)
+    search_results = prepared["search_results"]
+    yield "search", {
+        "results": len(search_results.get("results", [])),
+        "sources": [
+            {"title": result.get("title"), "url": result.get("url"), "queries": result.get("queries")}
+            for result in search_results.get("results", [])
+        ],
+        "cache_status": prepared["search_cache_status"],
+        "website_pages": source_list({"results": prepared["crawl"]["pages"]}),
+        "degraded": prepared["degraded"],
+    }
+    
+    yield "status", {"phase": "analysis"}
+    
+    prompt, max_tokens, degraded = fit_to_deadline(prepared["prompt"], MAX_TOKENS, deadline)
+    degraded = prepared["degraded"] + degraded
+    use_cache = should_cache_completion(request) and completion_cache is not None
+    cache_key = completion_cache_key(prompt, request.model, request.temperature, max_tokens)
+    completion = completion_cache.get(cache_key) if use_cache else None
+    usage = None
+    partial = False
+    
+    if completion is not None:
+        completion_cache_status = CACHE_HIT
+        yield "token", {"content": completion["content"]}
+    else:
+        completion_cache_status = CACHE_MISS if use_cache else CACHE_BYPASS
+        parts = []
+        model_used = request.model
+        backend = None
+        completion_start = time.perf_counter()
+        first_token = True
+        try:
+            async for delta in until(astream_completion(
+                prompt,
+                model=request.model,
+                temperature=request.temperature,
+                max_tokens=max_tokens
+            ), deadline):
+                model_used = delta["model"] or model_used
+                backend = delta.get("backend") or backend
+                usage = delta.get("usage") or usage
+                if not delta["content"]:
+                    continue
+                if first_token:
+                    metrics.record_phase(AGENT_ID, "first_token", time.perf_counter() - completion_start)
+                    first_token = False
+                parts.append(delta["content"])
+                yield "token", {"content": delta["content"]}
+        except DeadlineExceeded as e:
+            if not parts:
+                metrics.REQUESTS.inc(agent=AGENT_ID, outcome="error")
+                yield "error", {"message": f"Error generating analysis: {str(e)}"}
+                return
+            partial = True
+            degraded.append(DEGRADED_PARTIAL)
+            usage = estimate_usage(prompt, "".join(parts), model_used)
+        except Exception as e:
+            metrics.UPSTREAM_ERRORS.inc(provider="openai", error=type(e).__name__)
+            metrics.REQUESTS.inc(agent=AGENT_ID, outcome="error")
+            yield "error", {"message": f"Error generating analysis: {str(e)}"}
+            return
+        metrics.record_phase(AGENT_ID, "completion", time.perf_counter() - completion_start)
+        metrics.record_usage(model_used, usage)
+        
+        completion = {"content": "".join(parts), "model": model_used, "usage": usage, "backend": backend}
+        _record_usage(request, completion, time.perf_counter() - completion_start)
+        if use_cache and not partial:
+            completion_cache.set(cache_key, completion, cache_ttl(completion_cache))
+    metrics.CACHE_REQUESTS.inc(cache="completion", status=completion_cache_status)
+    
+    metrics.record_phase(AGENT_ID, "total", time.perf_counter() - start)
+    timings = metrics.stop_request_timings(timings_token)
+    metrics.REQUESTS.inc(agent=AGENT_ID, outcome="ok")
+    
+    response = MarketingAgentResponse(
+        analysis=completion["content"],
+        search_query=prepared["search_query"],
+        search_queries=prepared["search_queries"],
+        sources=source_list(search_results),
+        website_pages=source_list({"results": prepared["crawl"]["pages"]}),
+        model_used=completion["model"],
+        llm_backend=completion.get("backend"),
+        search_cache_status=prepared["search_cache_status"],
+        completion_cache_status=completion_cache_status,
+        usage=usage,
+        prompt_tokens=prepared["prompt_report"]["prompt_tokens"],
+        source_fingerprint=fingerprint(prepared["source_hashes"]),
+        degraded=degraded or None,
+        partial=partial,
+        debug={"prompt": prepared["prompt_report"], "crawl": _crawl_debug(prepared["crawl"])} if request.debug else None
+    )
+    response._source_hashes = prepared["source_hashes"]
+    _record_turn(session, request, response)
+    _record_demand(request, session, response)
+    await _store_result(request, response, timings, time.perf_counter() - start)
+    if request.debug:
+        response.debug = _debug_info(timings, response)
+    yield "done", response.model_dump(exclude={"analysis"})
+
+async def arun_batch(batch: MarketingBatchRequest) -> MarketingBatchResponse:
+    """
+    Run many analyses concurrently.
+    
+    Searches and completions are limited separately, identical requests are
+    analyzed once, and a failing item does not fail the batch.
+    
+    Args:
+        batch: The requests and optional per-phase concurrency limits
+        
+    Returns:
+        One result per request, in input order
+    """
+    search_semaphore = asyncio.Semaphore(batch.search_concurrency or BATCH_SEARCH_CONCURRENCY)
+    llm_semaphore = asyncio.Semaphore(batch.llm_concurrency or BATCH_LLM_CONCURRENCY)
+    
+    # First occurrence of each distinct request
+    first_index: Dict[str, int] = {}
+    duplicate_of: Dict[int, int] = {}
+    for index, request in enumerate(batch.requests):
+        key = request_fingerprint(request)
+        if key in first_index:
+            duplicate_of[index] = first_index[key]
+        else:
+            first_index[key] = index
+    
+    unique_indexes = list(first_index.values())
+    outcomes = await asyncio.gather(
+        *(
+            arun_analysis(batch.requests[index], search_semaphore, llm_semaphore)
+            for index in unique_indexes
+        ),
+        return_exceptions=True
+    )
+    by_index = dict(zip(unique_indexes, outcomes))
+    
+    results = []
+    for index in range(len(batch.requests)):
+        source = duplicate_of.get(index, index)
+        outcome = by_index[source]
+        if isinstance(outcome, BaseException):
+            item = MarketingBatchItem(index=index, error=f"{type(outcome).__name__}: {outcome}")
+        else:
+            item = MarketingBatchItem(index=index, response=outcome, error=outcome.error)
+        item.duplicate_of = duplicate_of.get(index)
+        results.append(item)
+    
+    return MarketingBatchResponse(
+        results=results,
+        unique_requests=len(unique_indexes),
+        errors=sum(1 for item in results if item.error)
+    )
+
+def run_analysis(request: MarketingAgentRequest) -> MarketingAgentResponse:
+    """
+    Run the marketing analysis agent (blocking).
+    
+    Thin wrapper around arun_analysis() for synchronous callers.
+    
+    Args:
+        request: The marketing agent request parameters
+        
+    Returns:
+        Marketing agent response with analysis
+    """
+    return run_sync(arun_analysis(request))
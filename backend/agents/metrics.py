@@ -0,0 +1,334 @@
+"""
+Metrics
+
+A minimal, dependency-free metrics registry that renders the Prometheus
+text exposition format, plus helpers for timing the phases of a request.
+
+Phase timings are recorded twice: into the process-wide histograms served
+at /metrics, and into a per-request dictionary (see start_request_timings)
+that agents can attach to their response for debugging.
+"""
+
+import math
+import time
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Latency buckets in seconds, from cache hits to long completions
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+# Starlette appends "; charset=utf-8" to text responses
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+
+def _escape(value: str) -> str:
+    """Escape a label value for the exposition format."""
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def percentile(values, p: float) -> Optional[float]:
+    """Nearest-rank percentile of a collection of values (None when empty)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(math.ceil(p / 100 * len(ordered)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+class Counter:
+    """Monotonically increasing value per label set."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram per label set."""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> (bucket counts, sum, count)
+        self._values: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = [[0] * len(self.buckets), 0.0, 0]
+                self._values[key] = state
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                for bound, bucket_count in zip(self.buckets, counts):
+                    labels = _format_labels(self.labelnames, key, f'le="{bound}"')
+                    lines.append(f"{self.name}_bucket{labels} {bucket_count}")
+                labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{labels} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class Registry:
+    """Holds metrics and collectors and renders them for scraping."""
+
+    def __init__(self):
+        self._metrics: List = []
+        self._collectors: List[Callable[[], List[str]]] = []
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, documentation, labelnames)
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        metric = Histogram(name, documentation, labelnames, buckets)
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector: Callable[[], List[str]]):
+        """Add a function returning exposition lines computed at scrape time."""
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics)
+            collectors = list(self._collectors)
+
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        for collector in collectors:
+            try:
+                lines.extend(collector())
+            except Exception as e:
+                lines.append(f"# collector error: {type(e).__name__}: {e}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# ----------------------------------------------------------------
+# Agent Metrics
+# ----------------------------------------------------------------
+PHASE_SECONDS = REGISTRY.histogram(
+    "agent_phase_seconds",
+    "Time spent in each phase of an agent request",
+    ["agent", "phase"],
+)
+REQUESTS = REGISTRY.counter(
+    "agent_requests_total",
+    "Agent requests by outcome",
+    ["agent", "outcome"],
+)
+COALESCED_REQUESTS = REGISTRY.counter(
+    "agent_coalesced_requests_total",
+    "Requests served by an identical analysis that was already in flight",
+    ["agent"],
+)
+CACHE_REQUESTS = REGISTRY.counter(
+    "agent_cache_requests_total",
+    "Cache lookups by cache and status (hit, miss, shared, bypass)",
+    ["cache", "status"],
+)
+UPSTREAM_ERRORS = REGISTRY.counter(
+    "upstream_errors_total",
+    "Failed upstream calls after retries, by provider and error type",
+    ["provider", "error"],
+)
+PROMPT_TOKENS = REGISTRY.histogram(
+    "agent_prompt_tokens",
+    "Prompt size in tokens after budgeting",
+    ["agent"],
+    buckets=(250, 500, 1000, 2000, 4000, 8000, 16000, 32000),
+)
+ANALYSIS_PATHS = REGISTRY.counter(
+    "agent_analysis_paths_total",
+    "Incremental analyses by path taken (reused, delta, full)",
+    ["agent", "path"],
+)
+DEGRADED_RESPONSES = REGISTRY.counter(
+    "agent_degraded_responses_total",
+    "Responses degraded to meet their deadline, by reason",
+    ["agent", "reason"],
+)
+PREWARM_RUNS = REGISTRY.counter(
+    "agent_prewarm_runs_total",
+    "Scheduled pre-warm refreshes by outcome (ok, error)",
+    ["agent", "outcome"],
+)
+LLM_TOKENS = REGISTRY.counter(
+    "llm_tokens_total",
+    "Tokens reported by the LLM provider",
+    ["model", "type"],
+)
+LLM_BACKEND_CALLS = REGISTRY.counter(
+    "llm_backend_calls_total",
+    "Completion calls by LLM backend and outcome (ok, error, cancelled)",
+    ["backend", "outcome"],
+)
+LLM_ROUTER_EVENTS = REGISTRY.counter(
+    "llm_router_events_total",
+    "LLM router hedges, hedges won and failovers",
+    ["event"],
+)
+
+# Phase timings of the current request, if it is collecting them
+_request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_timings", default=None)
+
+
+def start_request_timings():
+    """
+    Start collecting phase timings for the current request.
+
+    Returns:
+        A token to pass to stop_request_timings()
+    """
+    return _request_timings.set({})
+
+
+def stop_request_timings(token) -> Dict[str, float]:
+    """
+    Stop collecting and return the timings of the current request.
+
+    Returns:
+        Phase name -> seconds (phases run more than once are summed)
+    """
+    timings = _request_timings.get() or {}
+    _request_timings.reset(token)
+    return timings
+
+
+def current_request_timings() -> Optional[Dict[str, float]]:
+    """Timings collected so far for the current request, if any."""
+    return _request_timings.get()
+
+
+def record_phase(agent: str, phase: str, seconds: float):
+    """Record a phase duration in the histogram and the current request."""
+    PHASE_SECONDS.observe(seconds, agent=agent, phase=phase)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[phase] = round(timings.get(phase, 0.0) + seconds, 6)
+
+
+@contextmanager
+def timed(agent: str, phase: str) -> Iterator[None]:
+    """Time the enclosed block as one phase of an agent request."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_phase(agent, phase, time.perf_counter() - start)
+
+
+def record_usage(model: str, usage: Optional[Dict[str, int]]):
+    """Count prompt/completion tokens from a provider usage report."""
+    if not usage:
+        return
+    for token_type in ("prompt_tokens", "completion_tokens"):
+        if usage.get(token_type):
+            LLM_TOKENS.inc(usage[token_type], model=model, type=token_type.replace("_tokens", ""))
+
+
+# ----------------------------------------------------------------
+# Upstream Governor State
+# ----------------------------------------------------------------
+_CIRCUIT_STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+
+def _governor_collector() -> List[str]:
+    """Expose the upstream governor's limiter, breaker and counter state."""
+    from .governor import get_governor
+
+    snapshot = get_governor().snapshot()
+    lines = [
+        "# HELP upstream_circuit_state Circuit breaker state (0 closed, 1 half-open, 2 open)",
+        "# TYPE upstream_circuit_state gauge",
+    ]
+    for provider, state in snapshot.items():
+        lines.append(f'upstream_circuit_state{{provider="{provider}"}} {_CIRCUIT_STATES[state["circuit"]["state"]]}')
+
+    lines += [
+        "# HELP upstream_rate_limit Current adaptive request rate per second",
+        "# TYPE upstream_rate_limit gauge",
+    ]
+    for provider, state in snapshot.items():
+        lines.append(f'upstream_rate_limit{{provider="{provider}"}} {state["rate_limit"]["rate"]}')
+
+    lines += [
+        "# HELP upstream_rate_limit_tokens Tokens currently available in the provider bucket",
+        "# TYPE upstream_rate_limit_tokens gauge",
+    ]
+    for provider, state in snapshot.items():
+        lines.append(f'upstream_rate_limit_tokens{{provider="{provider}"}} {state["rate_limit"]["tokens"]}')
+
+    lines += [
+        "# HELP upstream_events_total Upstream calls, retries, rejections and statuses",
+        "# TYPE upstream_events_total counter",
+    ]
+    for provider, state in snapshot.items():
+        for event, count in sorted(state["counters"].items()):
+            lines.append(f'upstream_events_total{{provider="{provider}",event="{event}"}} {count}')
+    return lines
+
+
+REGISTRY.register_collector(_governor_collector)
+
+
+def render_metrics() -> str:
+    """Render all metrics in the Prometheus text format."""
+    return REGISTRY.render()
@@ -0,0 +1,478 @@
+"""
+Analysis Pre-Warming
+
+Refreshes the analyses customers ask for most often in the background,
+during off-peak windows, so that peak-hour requests find warm search,
+crawl and completion caches and a fresh stored result instead of running
+cold.
+
+Agents report each request they serve with record_demand(). The scheduler
+keeps an exponentially decaying request count per entry (a business and
+website for the marketing agent). Inside the configured windows it re-runs
+the top entries that weren't requested or refreshed recently, through the
+agent's normal executor pool. Each window has a spend budget (estimated
+USD from the reported token usage) and a run cap, and only a few
+refreshes run at once.
+
+Cache entries written by a refresh are kept for at least
+PREWARM_CACHE_TTL (see cache_ttl), so that they outlive the gap between
+an early-morning window and the peak hours that follow.
+
+A refresh counts as a hit when a request for the entry is served from it
+(a search or completion cache hit, or the stored result reused) before
+the next refresh; the hit rate is reported with the schedule. Demand is
+tracked per process, so with several workers each one pre-warms what it
+served (enable it on one worker to avoid duplicate refreshes).
+"""
+
+import os
+import time
+import asyncio
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from . import metrics
+from .usage import estimate_cost
+
+# Scheduler settings
+PREWARM_ENABLED = os.environ.get("PREWARM_ENABLED", "0") == "1"
+PREWARM_WINDOWS = os.environ.get("PREWARM_WINDOWS", "02:00-06:00")
+PREWARM_TOP_N = int(os.environ.get("PREWARM_TOP_N", "50"))
+PREWARM_CONCURRENCY = int(os.environ.get("PREWARM_CONCURRENCY", "2"))
+PREWARM_INTERVAL = float(os.environ.get("PREWARM_INTERVAL", "300"))
+
+# Spend limits per window: estimated USD and number of refreshes
+PREWARM_BUDGET_USD = float(os.environ.get("PREWARM_BUDGET_USD", "5"))
+PREWARM_MAX_RUNS = int(os.environ.get("PREWARM_MAX_RUNS", "200"))
+
+# Entries requested or refreshed more recently than this are left alone
+PREWARM_REFRESH_AGE = float(os.environ.get("PREWARM_REFRESH_AGE", str(12 * 3600)))
+
+# Minimum seconds cache entries written by a refresh are kept: long enough
+# to last from the window through the next peak
+PREWARM_CACHE_TTL = float(os.environ.get("PREWARM_CACHE_TTL", str(12 * 3600)))
+
+# Demand tracking: half-life of request counts, minimum decayed count worth
+# pre-warming, and entries tracked before the least requested are dropped
+PREWARM_HALF_LIFE = float(os.environ.get("PREWARM_HALF_LIFE", str(7 * 86400)))
+PREWARM_MIN_SCORE = float(os.environ.get("PREWARM_MIN_SCORE", "2"))
+PREWARM_MAX_TRACKED = int(os.environ.get("PREWARM_MAX_TRACKED", "10000"))
+
+# Set while a refresh runs, so its own request isn't counted as demand
+_prewarming: ContextVar[bool] = ContextVar("prewarming", default=False)
+
+
+def cache_ttl(cache: Any) -> Optional[float]:
+    """
+    TTL for a cache write: None (the cache's default) except during a
+    refresh, whose entries are kept for at least PREWARM_CACHE_TTL.
+    """
+    default = getattr(cache, "default_ttl", None)
+    if not _prewarming.get() or not default:
+        return None
+    return max(default, PREWARM_CACHE_TTL)
+
+
+def parse_windows(spec: str) -> List[Tuple[int, int]]:
+    """
+    Parse "HH:MM-HH:MM" windows (comma-separated, server local time).
+
+    A window may wrap past midnight ("22:00-04:00"). Invalid windows are
+    skipped with a warning.
+
+    Returns:
+        List of (start, end) in minutes after midnight
+    """
+    windows = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            start, end = (datetime.strptime(value.strip(), "%H:%M") for value in part.split("-"))
+        except ValueError:
+            print(f"Warning: ignoring invalid pre-warm window {part!r} (expected HH:MM-HH:MM)")
+            continue
+        windows.append((start.hour * 60 + start.minute, end.hour * 60 + end.minute))
+    return windows
+
+
+def current_window_start(windows: List[Tuple[int, int]], now: datetime) -> Optional[datetime]:
+    """Start of the window containing now, or None outside every window."""
+    minute = now.hour * 60 + now.minute
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    for start, end in windows:
+        if start <= end and start <= minute < end:
+            return midnight + timedelta(minutes=start)
+        if start > end and minute >= start:
+            return midnight + timedelta(minutes=start)
+        if start > end and minute < end:
+            return midnight - timedelta(days=1) + timedelta(minutes=start)
+    return None
+
+
+def next_window_start(windows: List[Tuple[int, int]], now: datetime) -> Optional[datetime]:
+    """Start of the next window after now."""
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    starts = [
+        midnight + timedelta(days=day, minutes=start)
+        for day in (0, 1)
+        for start, _ in windows
+    ]
+    upcoming = [start for start in starts if start > now]
+    return min(upcoming) if upcoming else None
+
+
+class DemandEntry:
+    """
+    Request history of one pre-warmable analysis.
+
+    Args:
+        agent_id: Agent serving the analysis
+        key: Identity of the analysis (e.g. business, domain and model)
+        payload: Request payload replayed to refresh it
+    """
+
+    def __init__(self, agent_id: str, key: str, payload: Dict[str, Any]):
+        self.agent_id = agent_id
+        self.key = key
+        self.payload = payload
+        self.score = 0.0
+        self.score_at = time.time()
+        self.requests = 0
+        self.last_requested: Optional[float] = None
+        self.last_warmed: Optional[float] = None
+        self.warm_runs = 0
+        self.hits = 0
+        # Whether the last refresh may still be what serves requests (no
+        # request missed the caches since), and whether it already did
+        self.warm = False
+        self.warm_hit = False
+
+    def decayed_score(self, now: float, half_life: float) -> float:
+        if half_life <= 0:
+            return self.score
+        return self.score * 0.5 ** ((now - self.score_at) / half_life)
+
+    def describe(self, now: float, half_life: float) -> Dict[str, Any]:
+        return {
+            "agent_id": self.agent_id,
+            "key": self.key,
+            "score": round(self.decayed_score(now, half_life), 3),
+            "requests": self.requests,
+            "last_requested": self.last_requested,
+            "last_warmed": self.last_warmed,
+            "warm_runs": self.warm_runs,
+            "hits": self.hits,
+        }
+
+
+async def _default_runner(agent_id: str, payload: Dict[str, Any]):
+    from .executor import arun_agent_payload
+    return await arun_agent_payload(agent_id, payload)
+
+
+class PrewarmScheduler:
+    """
+    Tracks demand and refreshes the most requested analyses off-peak.
+
+    Args:
+        windows: "HH:MM-HH:MM" windows (server local time) refreshes run in
+        top_n: Entries considered per pass, by decayed request count
+        concurrency: Refreshes running at once
+        budget_usd: Estimated spend allowed per window
+        max_runs: Refreshes allowed per window
+        interval: Seconds between scheduler passes
+        refresh_age: Entries requested or refreshed within this many
+            seconds are skipped
+        half_life: Seconds for a request to count half as much
+        min_score: Decayed request count an entry needs to be refreshed
+        max_tracked: Entries tracked before the least requested are dropped
+        runner: async callable(agent_id, payload) -> response; defaults to
+            the executor's arun_agent_payload
+    """
+
+    def __init__(
+        self,
+        windows: str = PREWARM_WINDOWS,
+        top_n: int = PREWARM_TOP_N,
+        concurrency: int = PREWARM_CONCURRENCY,
+        budget_usd: float = PREWARM_BUDGET_USD,
+        max_runs: int = PREWARM_MAX_RUNS,
+        interval: float = PREWARM_INTERVAL,
+        refresh_age: float = PREWARM_REFRESH_AGE,
+        half_life: float = PREWARM_HALF_LIFE,
+        min_score: float = PREWARM_MIN_SCORE,
+        max_tracked: int = PREWARM_MAX_TRACKED,
+        runner: Optional[Callable[[str, Dict[str, Any]], Awaitable[Any]]] = None,
+    ):
+        self.windows_spec = windows
+        self.windows = parse_windows(windows)
+        self.top_n = top_n
+        self.concurrency = concurrency
+        self.budget_usd = budget_usd
+        self.max_runs = max_runs
+        self.interval = interval
+        self.refresh_age = refresh_age
+        self.half_life = half_life
+        self.min_score = min_score
+        self.max_tracked = max_tracked
+        self.runner = runner or _default_runner
+
+        self.entries: Dict[str, DemandEntry] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._pass_lock: Optional[asyncio.Lock] = None
+
+        # Spend of the current window
+        self.window_started: Optional[float] = None
+        self.spent_usd = 0.0
+        self.window_runs = 0
+
+        # Lifetime counters
+        self.runs = 0
+        self.failures = 0
+        self.skipped_budget = 0
+        self.requests = 0
+        self.warm_requests = 0
+        self.refresh_hits = 0
+        self.last_pass: Optional[Dict[str, Any]] = None
+
+    # ------------------------------------------------------------
+    # Demand
+    # ------------------------------------------------------------
+    def record(self, agent_id: str, key: str, payload: Dict[str, Any], warm: bool = False):
+        """
+        Count a request for an analysis (refreshes don't count).
+
+        Args:
+            agent_id: Agent that served the request
+            key: Identity of the analysis
+            payload: Request payload to replay for a refresh
+            warm: The request was served from a cache hit or a reused
+                stored result
+        """
+        if _prewarming.get():
+            return
+        now = time.time()
+        entry = self.entries.get(key)
+        if entry is None:
+            if len(self.entries) >= self.max_tracked:
+                self._evict(now)
+            entry = self.entries[key] = DemandEntry(agent_id, key, payload)
+
+        self.requests += 1
+        if entry.warm and warm:
+            self.warm_requests += 1
+            if not entry.warm_hit:
+                # First request the refresh served
+                entry.warm_hit = True
+                entry.hits += 1
+                self.refresh_hits += 1
+        elif entry.warm:
+            # The refreshed entries expired or didn't match; warm requests
+            # from now on owe it to this request's run
+            entry.warm = False
+
+        entry.score = entry.decayed_score(now, self.half_life) + 1
+        entry.score_at = now
+        entry.requests += 1
+        entry.last_requested = now
+        entry.payload = payload
+
+    def _evict(self, now: float):
+        """Drop the least requested tenth of the entries."""
+        ranked = sorted(self.entries.values(), key=lambda entry: entry.decayed_score(now, self.half_life))
+        for entry in ranked[:max(len(ranked) // 10, 1)]:
+            del self.entries[entry.key]
+
+    def top(self, n: Optional[int] = None) -> List[DemandEntry]:
+        """Most requested entries first."""
+        now = time.time()
+        ranked = sorted(
+            self.entries.values(),
+            key=lambda entry: entry.decayed_score(now, self.half_life),
+            reverse=True
+        )
+        return ranked[:self.top_n if n is None else n]
+
+    def due(self) -> List[DemandEntry]:
+        """Top entries popular enough and not requested or refreshed recently."""
+        now = time.time()
+        cutoff = now - self.refresh_age
+        return [
+            entry for entry in self.top()
+            if entry.decayed_score(now, self.half_life) >= self.min_score
+            and (entry.last_requested or 0) < cutoff
+            and (entry.last_warmed or 0) < cutoff
+        ]
+
+    # ------------------------------------------------------------
+    # Refreshing
+    # ------------------------------------------------------------
+    def in_window(self, now: Optional[datetime] = None) -> bool:
+        return current_window_start(self.windows, now or datetime.now()) is not None
+
+    def _start_window(self, now: datetime):
+        """Reset the spend counters when a new window begins."""
+        start = current_window_start(self.windows, now)
+        started = start.timestamp() if start is not None else None
+        if started is not None and started != self.window_started:
+            self.window_started = started
+            self.spent_usd = 0.0
+            self.window_runs = 0
+
+    def _budget_left(self) -> bool:
+        return self.spent_usd < self.budget_usd and self.window_runs < self.max_runs
+
+    async def _refresh(self, entry: DemandEntry, semaphore: asyncio.Semaphore) -> str:
+        async with semaphore:
+            if not self._budget_left():
+                self.skipped_budget += 1
+                return "skipped_budget"
+            self.window_runs += 1
+            token = _prewarming.set(True)
+            try:
+                response = await self.runner(entry.agent_id, dict(entry.payload))
+            except Exception as e:
+                self.failures += 1
+                metrics.PREWARM_RUNS.inc(agent=entry.agent_id, outcome="error")
+                print(f"Warning: pre-warming {entry.key} failed: {type(e).__name__}: {e}")
+                return "error"
+            finally:
+                _prewarming.reset(token)
+
+            usage = getattr(response, "usage", None) or {}
+            self.spent_usd += estimate_cost(
+                getattr(response, "model_used", None) or entry.payload.get("model", ""),
+                usage.get("prompt_tokens", 0),
+                usage.get("completion_tokens", 0),
+            )
+            if getattr(response, "error", None):
+                self.failures += 1
+                metrics.PREWARM_RUNS.inc(agent=entry.agent_id, outcome="error")
+                return "error"
+            self.runs += 1
+            entry.warm_runs += 1
+            entry.last_warmed = time.time()
+            entry.warm = True
+            entry.warm_hit = False
+            metrics.PREWARM_RUNS.inc(agent=entry.agent_id, outcome="ok")
+            return "ok"
+
+    async def run_once(self, force: bool = False) -> Dict[str, Any]:
+        """
+        Run one scheduler pass: refresh the due entries within the budget.
+
+        Args:
+            force: Run even outside the windows (spend still counts against
+                the current budget)
+
+        Returns:
+            Summary of the pass: entries "due" and the refresh outcomes
+        """
+        now = datetime.now()
+        if not force and not self.in_window(now):
+            return {"ran": False, "reason": "outside the pre-warm windows"}
+        if self._pass_lock is None:
+            self._pass_lock = asyncio.Lock()
+        if self._pass_lock.locked():
+            return {"ran": False, "reason": "a pass is already running"}
+
+        async with self._pass_lock:
+            self._start_window(now)
+            started = time.perf_counter()
+            due = self.due()
+            semaphore = asyncio.Semaphore(self.concurrency)
+            outcomes = await asyncio.gather(*(self._refresh(entry, semaphore) for entry in due))
+            self.last_pass = {
+                "ran": True,
+                "at": time.time(),
+                "due": len(due),
+                "ok": outcomes.count("ok"),
+                "errors": outcomes.count("error"),
+                "skipped_budget": outcomes.count("skipped_budget"),
+                "seconds": round(time.perf_counter() - started, 3),
+            }
+            return self.last_pass
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                print(f"Warning: pre-warm pass failed: {type(e).__name__}: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def start(self):
+        """Start the scheduler loop in the running event loop."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop(), name="prewarm-scheduler")
+
+    async def stop(self):
+        """Stop the scheduler loop (a refresh in progress is cancelled)."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Schedule, budget, hit rate and the top entries."""
+        now = datetime.now()
+        upcoming = next_window_start(self.windows, now)
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "windows": self.windows_spec,
+            "in_window": self.in_window(now),
+            "next_window": upcoming.isoformat(timespec="minutes") if upcoming is not None else None,
+            "interval": self.interval,
+            "top_n": self.top_n,
+            "concurrency": self.concurrency,
+            "budget": {
+                "usd": self.budget_usd,
+                "spent_usd": round(self.spent_usd, 6),
+                "max_runs": self.max_runs,
+                "runs": self.window_runs,
+            },
+            "stats": {
+                "tracked": len(self.entries),
+                "runs": self.runs,
+                "failures": self.failures,
+                "skipped_budget": self.skipped_budget,
+                # Share of refreshes that served a request before their next refresh
+                "hit_rate": round(self.refresh_hits / self.runs, 4) if self.runs else None,
+                # Share of requests served from a refreshed analysis
+                "request_hit_rate": round(self.warm_requests / self.requests, 4) if self.requests else None,
+            },
+            "last_pass": self.last_pass,
+            "due": len(self.due()),
+            "entries": [entry.describe(time.time(), self.half_life) for entry in self.top()],
+        }
+
+
+# ----------------------------------------------------------------
+# Shared Scheduler
+# ----------------------------------------------------------------
+scheduler: Optional[PrewarmScheduler] = None
+
+
+def get_prewarm_scheduler() -> PrewarmScheduler:
+    """Get the shared scheduler, built from the environment on first use."""
+    global scheduler
+    if scheduler is None:
+        scheduler = PrewarmScheduler()
+    return scheduler
+
+
+def set_prewarm_scheduler(new_scheduler: PrewarmScheduler):
+    """Install a differently configured scheduler."""
+    global scheduler
+    scheduler = new_scheduler
+
+
+def record_demand(agent_id: str, key: str, payload: Dict[str, Any], warm: bool = False):
+    """Count a request for an analysis with the shared scheduler."""
+    get_prewarm_scheduler().record(agent_id, key, payload, warm)
@@ -0,0 +1,166 @@
+"""
+Prompt Budgeting
+
+Token counting and trimming used to keep prompts inside a fixed budget, so
+the cost and latency of a request don't grow with the history or search
+content a caller sends.
+
+Tokens are counted with tiktoken when it is installed. Without it, counts
+are estimated at four characters per token, which is close for English
+text with OpenAI tokenizers.
+"""
+
+import os
+import math
+from functools import lru_cache
+from typing import Optional
+
+try:
+    import tiktoken
+except ImportError:  # optional dependency
+    tiktoken = None
+
+# Characters per token used when tiktoken is unavailable
+CHARS_PER_TOKEN = 4
+
+# Context window per model family; the longest matching prefix wins
+MODEL_CONTEXT_WINDOWS = {
+    "gpt-3.5-turbo": 16385,
+    "gpt-3.5-turbo-instruct": 4096,
+    "gpt-4": 8192,
+    "gpt-4-32k": 32768,
+    "gpt-4-turbo": 128000,
+    "gpt-4-1106": 128000,
+    "gpt-4-0125": 128000,
+    "gpt-4o": 128000,
+}
+DEFAULT_CONTEXT_WINDOW = 4096
+
+# Prompt size cap regardless of the model's window, and the share of it
+# previous conversation context may take
+PROMPT_MAX_TOKENS = int(os.environ.get("PROMPT_MAX_TOKENS", "6000"))
+PROMPT_HISTORY_MAX_TOKENS = int(os.environ.get("PROMPT_HISTORY_MAX_TOKENS", "1500"))
+
+# Tokens reserved for chat message framing
+MESSAGE_OVERHEAD_TOKENS = 8
+
+# Marker left where the middle of a long text was cut
+OMITTED_MARKER = "\n\n[... {tokens} tokens omitted ...]\n\n"
+
+
+@lru_cache(maxsize=32)
+def _encoding(model: str):
+    """tiktoken encoding for a model, or None if tiktoken is unavailable."""
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text: str, model: str) -> int:
+    """
+    Count the tokens of a text for a model.
+
+    Args:
+        text: The text to count
+        model: Model name, selects the tokenizer
+
+    Returns:
+        Exact count with tiktoken, otherwise an estimate
+    """
+    if not text:
+        return 0
+    encoding = _encoding(model)
+    if encoding is None:
+        return math.ceil(len(text) / CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text: str, max_tokens: int, model: str, keep_end: bool = False) -> str:
+    """
+    Cut a text to at most max_tokens tokens.
+
+    Args:
+        text: The text to cut
+        max_tokens: Token limit
+        model: Model name, selects the tokenizer
+        keep_end: Keep the end of the text instead of the beginning
+
+    Returns:
+        The text, or the part of it that fits
+    """
+    if max_tokens <= 0:
+        return ""
+    encoding = _encoding(model)
+    if encoding is None:
+        limit = max_tokens * CHARS_PER_TOKEN
+        if len(text) <= limit:
+            return text
+        return text[-limit:] if keep_end else text[:limit]
+
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    kept = tokens[-max_tokens:] if keep_end else tokens[:max_tokens]
+    return encoding.decode(kept)
+
+
+def trim_middle(text: str, max_tokens: int, model: str, head_share: float = 0.25) -> str:
+    """
+    Shorten a text by cutting out its middle.
+
+    The opening (which usually states the subject) and the most recent part
+    are kept, and a marker notes how much was dropped.
+
+    Args:
+        text: The text to shorten
+        max_tokens: Token limit for the result, including the marker
+        model: Model name, selects the tokenizer
+        head_share: Share of the budget given to the beginning
+
+    Returns:
+        The text, unchanged if it already fits
+    """
+    total = count_tokens(text, model)
+    if total <= max_tokens:
+        return text
+
+    marker_tokens = count_tokens(OMITTED_MARKER.format(tokens=total), model)
+    available = max_tokens - marker_tokens
+    if available <= 0:
+        return truncate_tokens(text, max_tokens, model, keep_end=True)
+
+    head_tokens = int(available * head_share)
+    tail_tokens = available - head_tokens
+    head = truncate_tokens(text, head_tokens, model)
+    tail = truncate_tokens(text, tail_tokens, model, keep_end=True)
+    omitted = max(total - head_tokens - tail_tokens, 0)
+    return f"{head.rstrip()}{OMITTED_MARKER.format(tokens=omitted)}{tail.lstrip()}"
+
+
+def context_window(model: str) -> int:
+    """Context window of a model, by longest matching name prefix."""
+    matches = [prefix for prefix in MODEL_CONTEXT_WINDOWS if model.startswith(prefix)]
+    if not matches:
+        return DEFAULT_CONTEXT_WINDOW
+    return MODEL_CONTEXT_WINDOWS[max(matches, key=len)]
+
+
+def prompt_budget(model: str, completion_tokens: int, max_prompt_tokens: Optional[int] = None) -> int:
+    """
+    Tokens a prompt may use for a model.
+
+    Args:
+        model: Model name
+        completion_tokens: Tokens reserved for the completion
+        max_prompt_tokens: Cap regardless of the window (default PROMPT_MAX_TOKENS)
+
+    Returns:
+        The smaller of the cap and what the context window leaves after the
+        completion and message framing
+    """
+    cap = PROMPT_MAX_TOKENS if max_prompt_tokens is None else max_prompt_tokens
+    window_left = context_window(model) - completion_tokens - MESSAGE_OVERHEAD_TOKENS
+    return max(min(cap, window_left), 0)
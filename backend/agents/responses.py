@@ -0,0 +1,235 @@
+"""
+HTTP Response Helpers
+
+Cheaper JSON responses for large agent results, compressed when the client
+accepts it.
+
+- FastJSONResponse renders JSON with orjson when it is installed (falling
+  back to the standard library), and is used as the apps' default
+  response class.
+- json_response() serializes a pydantic model straight to JSON bytes with
+  pydantic's compiled serializer (other content with dumps()), skipping
+  the re-validation and jsonable_encoder pass FastAPI applies to
+  response_model routes. It also tags the response with an ETag and
+  answers conditional GETs with 304.
+- CompressionMiddleware compresses complete responses above a size
+  threshold with brotli (if installed) or gzip, as negotiated through
+  Accept-Encoding. Streamed responses such as Server-Sent Events are
+  passed through untouched so their events aren't held back.
+"""
+
+import os
+import json
+import gzip
+import hashlib
+from typing import Any, Dict, Optional
+
+from pydantic import BaseModel
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+# Compression settings
+RESPONSE_COMPRESSION = os.environ.get("RESPONSE_COMPRESSION", "1") != "0"
+RESPONSE_COMPRESSION_MIN_SIZE = int(os.environ.get("RESPONSE_COMPRESSION_MIN_SIZE", "1024"))
+RESPONSE_GZIP_LEVEL = int(os.environ.get("RESPONSE_GZIP_LEVEL", "5"))
+RESPONSE_BROTLI_QUALITY = int(os.environ.get("RESPONSE_BROTLI_QUALITY", "4"))
+
+# Tag model responses with ETags and answer matching conditional GETs with 304
+RESPONSE_ETAGS = os.environ.get("RESPONSE_ETAGS", "1") != "0"
+
+# Content types that are already compressed or must not be buffered
+_SKIP_CONTENT_TYPES = ("text/event-stream", "image/", "video/", "audio/", "application/zip", "application/gzip")
+
+
+def dumps(content: Any) -> bytes:
+    """Serialize JSON-compatible content to compact UTF-8 bytes."""
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":"), allow_nan=False).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson when available."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def make_etag(body: bytes) -> str:
+    """Strong ETag derived from the response body."""
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """Whether an If-None-Match header matches an ETag (weak comparison, as RFC 9110 asks)."""
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return any(tag.lstrip("W/") == etag for tag in candidates)
+
+
+def json_response(
+    content: Any,
+    request: Optional[Request] = None,
+    status_code: int = 200,
+    headers: Optional[Dict[str, str]] = None,
+    cache_control: Optional[str] = None,
+) -> Response:
+    """
+    Serialize a pydantic model (or JSON-compatible data) into a JSON response.
+
+    Args:
+        content: The response model instance or data
+        request: The incoming request; given for GET routes, it enables the
+            304 answer to a matching If-None-Match
+        status_code: Response status
+        headers: Extra response headers
+        cache_control: Cache-Control header value, if any
+
+    Returns:
+        The JSON response, or an empty 304 if the client's copy is current
+    """
+    if isinstance(content, BaseModel):
+        body = content.__pydantic_serializer__.to_json(content)
+    else:
+        body = dumps(content)
+    headers = dict(headers or {})
+    if cache_control:
+        headers["Cache-Control"] = cache_control
+
+    if RESPONSE_ETAGS and status_code == 200:
+        etag = make_etag(body)
+        headers["ETag"] = etag
+        if request is not None and request.method in ("GET", "HEAD"):
+            if_none_match = request.headers.get("if-none-match")
+            if if_none_match and _etag_matches(if_none_match, etag):
+                return Response(status_code=304, headers=headers)
+
+    return Response(body, status_code=status_code, headers=headers, media_type="application/json")
+
+
+# ----------------------------------------------------------------
+# Compression
+# ----------------------------------------------------------------
+def _accepted_encodings(accept_encoding: str) -> Dict[str, float]:
+    """Parse Accept-Encoding into {coding: q}."""
+    accepted = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding.strip().lower()] = q
+    return accepted
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """
+    Pick the response encoding for an Accept-Encoding header.
+
+    Returns:
+        "br" (when brotli is installed), "gzip", or None for identity
+    """
+    accepted = _accepted_encodings(accept_encoding)
+    wildcard = accepted.get("*", 0.0)
+    options = (["br"] if brotli is not None else []) + ["gzip"]
+    best, best_q = None, 0.0
+    for coding in options:
+        q = accepted.get(coding, wildcard)
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=RESPONSE_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=RESPONSE_GZIP_LEVEL)
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing complete responses above a size threshold.
+
+    Args:
+        app: The ASGI app
+        minimum_size: Bytes below which responses are sent as is
+    """
+
+    def __init__(self, app, minimum_size: int = RESPONSE_COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message: Optional[Dict[str, Any]] = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, passthrough
+            if passthrough:
+                await send(message)
+                return
+
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                content_type = headers.get("content-type", "")
+                if "content-encoding" in headers or content_type.startswith(_SKIP_CONTENT_TYPES):
+                    passthrough = True
+                    await send(message)
+                else:
+                    start_message = message
+                return
+
+            # First body message: compress only complete, large enough bodies;
+            # streamed responses go out as they are
+            body = message.get("body", b"")
+            if message.get("more_body", False) or len(body) < self.minimum_size:
+                passthrough = True
+                await send(start_message)
+                await send(message)
+                return
+
+            compressed = compress(body, encoding)
+            headers = MutableHeaders(raw=start_message["headers"])
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(compressed))
+            headers.add_vary_header("Accept-Encoding")
+            if "etag" in headers and not headers["etag"].startswith("W/"):
+                # The encoded body differs from the identity one
+                headers["ETag"] = "W/" + headers["etag"]
+            await send(start_message)
+            await send({"type": "http.response.body", "body": compressed})
+
+        await self.app(scope, receive, send_compressed)
+
+
+def install(app):
+    """Add response compression to an app (unless RESPONSE_COMPRESSION=0)."""
+    if RESPONSE_COMPRESSION:
+        app.add_middleware(CompressionMiddleware, minimum_size=RESPONSE_COMPRESSION_MIN_SIZE)
@@ -0,0 +1,447 @@
+"""
+Result Store
+
+Keeps every finished analysis together with its inputs, search sources,
+phase timings and token counts, so a report computed once can be listed
+and served again later without re-running the pipeline.
+
+Results are indexed by business, website domain, user, company and time.
+ResultStore is the interface the API depends on; SQLiteResultStore keeps
+results in a local SQLite file and MemoryResultStore in process memory.
+Another backend (Postgres, a document store, ...) can implement the same
+interface and be installed with set_result_store().
+"""
+
+import os
+import json
+import time
+import uuid
+import base64
+import asyncio
+import sqlite3
+import weakref
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from pydantic import BaseModel
+
+# Page size limits of the history API
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# Deleting expired results is done every this many saves
+PURGE_EVERY = 100
+
+
+def business_key(business_name: str) -> str:
+    """Case- and whitespace-insensitive key of a business name."""
+    return " ".join(business_name.casefold().split())
+
+
+def website_domain(website_url: str) -> str:
+    """Host of a website URL without "www.", e.g. "HTTPS://www.Foo.com/a" -> "foo.com"."""
+    url = website_url.strip()
+    if "://" not in url:
+        url = f"http://{url}"
+    host = (urlsplit(url).hostname or "").lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+class StoredResult(BaseModel):
+    result_id: str
+    agent_id: str
+    created_at: float
+    business_name: str = ""
+    website_url: str = ""
+    domain: str = ""
+    user_id: Optional[str] = None
+    company_id: Optional[str] = None
+    session_id: Optional[str] = None
+    model: Optional[str] = None
+    # Request fields the result was computed from
+    inputs: Dict[str, Any] = {}
+    # The agent response as returned to the caller
+    response: Dict[str, Any] = {}
+    # Search results the analysis was based on ({"title", "url"})
+    sources: List[Dict[str, Any]] = []
+    # Phase timings in seconds (see metrics.start_request_timings)
+    timings: Dict[str, float] = {}
+    prompt_tokens: Optional[int] = None
+    usage: Optional[Dict[str, int]] = None
+    duration_seconds: Optional[float] = None
+    # Content hashes of the sources by canonical URL, and their fingerprint
+    # (see incremental)
+    source_hashes: Dict[str, str] = {}
+    source_fingerprint: Optional[str] = None
+
+    @classmethod
+    def new(cls, agent_id: str, **fields) -> "StoredResult":
+        """Build a result with a fresh ID and timestamp, deriving the domain."""
+        fields.setdefault("domain", website_domain(fields.get("website_url") or ""))
+        return cls(result_id=uuid.uuid4().hex, agent_id=agent_id, created_at=time.time(), **fields)
+
+    def summary(self) -> Dict[str, Any]:
+        """The listing fields of the result (everything but inputs, response, sources, hashes and timings)."""
+        return self.model_dump(exclude={"inputs", "response", "sources", "source_hashes", "timings"})
+
+
+class ResultOwner(BaseModel):
+    """
+    The caller the history API is scoped to: a user or a company.
+
+    Set from the X-User-Id / X-Company-Id headers, which the authenticating
+    proxy in front of the backend fills in for the signed-in caller.
+    """
+    user_id: Optional[str] = None
+    company_id: Optional[str] = None
+
+    def owns(self, result: StoredResult) -> bool:
+        if self.user_id is not None:
+            return result.user_id == self.user_id
+        return self.company_id is not None and result.company_id == self.company_id
+
+    def scope(self, query: "ResultQuery") -> "ResultQuery":
+        """
+        Restrict a query to the owner's results.
+
+        Raises:
+            PermissionError: The query filters on another owner
+        """
+        for field in ("user_id", "company_id"):
+            own, requested = getattr(self, field), getattr(query, field)
+            if own is not None and requested is not None and requested != own:
+                raise PermissionError("Results of other users or companies are not accessible")
+        return query.model_copy(update={
+            "user_id": self.user_id or query.user_id,
+            "company_id": self.company_id or query.company_id,
+        })
+
+
+class ResultQuery(BaseModel):
+    """Filters of a history lookup; unset fields match everything."""
+    agent_id: Optional[str] = None
+    business_name: Optional[str] = None
+    domain: Optional[str] = None
+    user_id: Optional[str] = None
+    company_id: Optional[str] = None
+    # Only results stored without a user or company
+    unowned: bool = False
+    since: Optional[float] = None
+    until: Optional[float] = None
+
+
+def encode_cursor(result: StoredResult) -> str:
+    """Opaque cursor pointing after a result in newest-first order."""
+    raw = json.dumps([result.created_at, result.result_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[float, str]:
+    """Inverse of encode_cursor. Raises ValueError for malformed cursors."""
+    try:
+        created_at, result_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return float(created_at), str(result_id)
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+
+
+# ----------------------------------------------------------------
+# Store Interface
+# ----------------------------------------------------------------
+class ResultStore:
+    """
+    Interface for result storage. Methods are blocking; async callers run
+    them in a thread (see asave_result).
+    """
+
+    def save(self, result: StoredResult):
+        raise NotImplementedError
+
+    def get(self, result_id: str) -> Optional[StoredResult]:
+        raise NotImplementedError
+
+    def list(
+        self,
+        query: ResultQuery,
+        limit: int = DEFAULT_PAGE_SIZE,
+        cursor: Optional[str] = None,
+    ) -> Tuple[List[StoredResult], Optional[str]]:
+        """
+        Results matching a query, newest first.
+
+        Args:
+            query: Filters
+            limit: Page size
+            cursor: next_cursor of the previous page
+
+        Returns:
+            Tuple of (page of results, cursor of the next page or None)
+        """
+        raise NotImplementedError
+
+    def delete(self, result_id: str) -> bool:
+        """Forget a result. Returns False if it didn't exist."""
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class MemoryResultStore(ResultStore):
+    """Results kept in process memory, up to max_entries (oldest dropped first)."""
+
+    def __init__(self, max_entries: int = 10000, retention: Optional[float] = None):
+        self.max_entries = max_entries
+        self.retention = retention
+        self._results: Dict[str, StoredResult] = {}
+        self._lock = threading.Lock()
+
+    def save(self, result: StoredResult):
+        with self._lock:
+            self._results[result.result_id] = result
+            while len(self._results) > self.max_entries:
+                del self._results[next(iter(self._results))]
+
+    def get(self, result_id: str) -> Optional[StoredResult]:
+        result = self._results.get(result_id)
+        if result is None or self._expired(result):
+            return None
+        return result
+
+    def _expired(self, result: StoredResult) -> bool:
+        return self.retention is not None and result.created_at < time.time() - self.retention
+
+    def _matches(self, result: StoredResult, query: ResultQuery) -> bool:
+        return (
+            not self._expired(result)
+            and (query.agent_id is None or result.agent_id == query.agent_id)
+            and (query.business_name is None or business_key(result.business_name) == business_key(query.business_name))
+            and (query.domain is None or result.domain == website_domain(query.domain))
+            and (query.user_id is None or result.user_id == query.user_id)
+            and (query.company_id is None or result.company_id == query.company_id)
+            and (not query.unowned or (result.user_id is None and result.company_id is None))
+            and (query.since is None or result.created_at >= query.since)
+            and (query.until is None or result.created_at < query.until)
+        )
+
+    def list(self, query, limit=DEFAULT_PAGE_SIZE, cursor=None):
+        with self._lock:
+            results = [result for result in self._results.values() if self._matches(result, query)]
+        results.sort(key=lambda result: (result.created_at, result.result_id), reverse=True)
+        if cursor:
+            after = decode_cursor(cursor)
+            results = [result for result in results if (result.created_at, result.result_id) < after]
+        page = results[:limit]
+        return page, encode_cursor(page[-1]) if len(results) > limit else None
+
+    def delete(self, result_id: str) -> bool:
+        with self._lock:
+            return self._results.pop(result_id, None) is not None
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "memory", "results": len(self._results), "max_entries": self.max_entries}
+
+
+class SQLiteResultStore(ResultStore):
+    """
+    Results stored in a SQLite file.
+
+    The full result is kept as JSON, next to indexed columns for the
+    lookups of the history API.
+
+    Args:
+        path: Database file
+        retention: Seconds results are kept (None keeps them forever)
+    """
+
+    def __init__(self, path: str, retention: Optional[float] = None):
+        self.path = path
+        self.retention = retention
+        self._saves = 0
+        self._connect()
+        _sqlite_stores.add(self)
+
+    def _connect(self):
+        """Open the database connection and create the table if needed."""
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "result_id TEXT PRIMARY KEY, "
+            "agent_id TEXT NOT NULL, "
+            "created_at REAL NOT NULL, "
+            "business_key TEXT, "
+            "domain TEXT, "
+            "user_id TEXT, "
+            "company_id TEXT, "
+            "data TEXT NOT NULL)"
+        )
+        for columns in ("created_at", "business_key, created_at", "domain, created_at",
+                        "user_id, created_at", "company_id, created_at"):
+            name = "results_" + columns.replace(", ", "_")
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON results ({columns})")
+        self._conn.commit()
+
+    def save(self, result: StoredResult):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results "
+                "(result_id, agent_id, created_at, business_key, domain, user_id, company_id, data) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    result.result_id,
+                    result.agent_id,
+                    result.created_at,
+                    business_key(result.business_name),
+                    result.domain,
+                    result.user_id,
+                    result.company_id,
+                    result.model_dump_json(),
+                ),
+            )
+            self._saves += 1
+            if self.retention is not None and self._saves % PURGE_EVERY == 0:
+                self._conn.execute("DELETE FROM results WHERE created_at < ?", (time.time() - self.retention,))
+            self._conn.commit()
+
+    def get(self, result_id: str) -> Optional[StoredResult]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data, created_at FROM results WHERE result_id = ?", (result_id,)
+            ).fetchone()
+        if row is None or (self.retention is not None and row[1] < time.time() - self.retention):
+            return None
+        return StoredResult.model_validate_json(row[0])
+
+    def list(self, query, limit=DEFAULT_PAGE_SIZE, cursor=None):
+        conditions, params = [], []
+        filters = (
+            ("agent_id = ?", query.agent_id),
+            ("business_key = ?", business_key(query.business_name) if query.business_name is not None else None),
+            ("domain = ?", website_domain(query.domain) if query.domain is not None else None),
+            ("user_id = ?", query.user_id),
+            ("company_id = ?", query.company_id),
+            ("created_at >= ?", query.since),
+            ("created_at < ?", query.until),
+        )
+        for condition, value in filters:
+            if value is not None:
+                conditions.append(condition)
+                params.append(value)
+        if query.unowned:
+            conditions.append("user_id IS NULL AND company_id IS NULL")
+        if self.retention is not None:
+            conditions.append("created_at >= ?")
+            params.append(time.time() - self.retention)
+        if cursor:
+            # Keyset pagination: stable while new results arrive
+            created_at, result_id = decode_cursor(cursor)
+            conditions.append("(created_at < ? OR (created_at = ? AND result_id < ?))")
+            params += [created_at, created_at, result_id]
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT data FROM results {where} ORDER BY created_at DESC, result_id DESC LIMIT ?",
+                params + [limit + 1],
+            ).fetchall()
+        results = [StoredResult.model_validate_json(row[0]) for row in rows]
+        page = results[:limit]
+        return page, encode_cursor(page[-1]) if len(results) > limit else None
+
+    def delete(self, result_id: str) -> bool:
+        with self._lock:
+            deleted = self._conn.execute("DELETE FROM results WHERE result_id = ?", (result_id,)).rowcount
+            self._conn.commit()
+        return deleted > 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            count = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        return {"backend": "sqlite", "path": self.path, "results": count, "retention": self.retention}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# SQLite connections must not be shared with forked workers
+_sqlite_stores: "weakref.WeakSet[SQLiteResultStore]" = weakref.WeakSet()
+
+
+def _reconnect_after_fork():
+    for store in list(_sqlite_stores):
+        store._connect()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reconnect_after_fork)
+
+
+# ----------------------------------------------------------------
+# Shared Store
+# ----------------------------------------------------------------
+result_store: Optional[ResultStore] = None
+_store_configured = False
+
+
+def build_result_store() -> Optional[ResultStore]:
+    """
+    Build the result store from environment settings.
+
+    RESULT_STORE: "sqlite" (default), "memory", or "off" to keep no results
+    RESULT_STORE_PATH: SQLite file (default analysis-results.db)
+    RESULT_RETENTION_DAYS: Days results are kept (default 90, 0 keeps them forever)
+    RESULT_STORE_MAX_ENTRIES: Results kept by the memory store (default 10000)
+    """
+    kind = os.environ.get("RESULT_STORE", "sqlite").lower()
+    days = float(os.environ.get("RESULT_RETENTION_DAYS", "90"))
+    retention = days * 86400 if days > 0 else None
+
+    if kind == "off":
+        return None
+    if kind == "memory":
+        return MemoryResultStore(int(os.environ.get("RESULT_STORE_MAX_ENTRIES", "10000")), retention=retention)
+    return SQLiteResultStore(os.environ.get("RESULT_STORE_PATH", "analysis-results.db"), retention=retention)
+
+
+def get_result_store() -> Optional[ResultStore]:
+    """Get the shared result store (None when disabled), building it on first use."""
+    global result_store, _store_configured
+    if not _store_configured:
+        result_store = build_result_store()
+        _store_configured = True
+    return result_store
+
+
+def set_result_store(store: Optional[ResultStore]):
+    """Install a different result store (None disables storing results)."""
+    global result_store, _store_configured
+    result_store = store
+    _store_configured = True
+
+
+async def asave_result(result: StoredResult) -> Optional[str]:
+    """
+    Store a result without blocking the event loop.
+
+    A failing store is reported and otherwise ignored: losing the history
+    entry must not fail the request that produced it.
+
+    Returns:
+        The result ID, or None if nothing was stored
+    """
+    store = get_result_store()
+    if store is None:
+        return None
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, store.save, result)
+    except Exception as e:
+        print(f"Warning: could not store result {result.result_id}: {type(e).__name__}: {e}")
+        return None
+    return result.result_id
@@ -0,0 +1,155 @@
+"""
+Search Result Merging
+
+Helpers for agents that fan a search out over several sub-queries: the
+result lists are merged, duplicates are dropped (same canonical URL, or
+near-identical content under different URLs), and the merged set is ranked
+and cut to a result budget before it goes into a prompt.
+
+Results are Tavily-style dictionaries with "title", "url", "content" and an
+optional relevance "score".
+"""
+
+import re
+from typing import Any, Dict, List, Optional, Sequence, Set
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+# Query parameters that only track the visitor and never change the page
+TRACKING_PARAMS = {"fbclid", "gclid", "dclid", "msclkid", "mc_cid", "mc_eid", "ref", "ref_src", "igshid"}
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def canonical_url(url: str) -> str:
+    """
+    Reduce a URL to a key shared by its trivial variants.
+
+    Scheme, "www.", default ports, fragments, trailing slashes and tracking
+    parameters are dropped and the remaining query parameters are sorted,
+    e.g. "https://www.Foo.com/a/?utm_source=x&b=1#top" -> "foo.com/a?b=1".
+    """
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    if parts.port and parts.port not in (80, 443):
+        host = f"{host}:{parts.port}"
+
+    query = sorted(
+        (name, value)
+        for name, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not name.lower().startswith("utm_") and name.lower() not in TRACKING_PARAMS
+    )
+    path = parts.path.rstrip("/")
+    return f"{host}{path}?{urlencode(query)}" if query else f"{host}{path}"
+
+
+def shingles(text: str, size: int = 3) -> Set[str]:
+    """Word n-grams of a text, used to spot near-duplicate content."""
+    words = _WORD_RE.findall(text.casefold())
+    if len(words) <= size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def similarity(a: Set[str], b: Set[str]) -> float:
+    """Jaccard similarity of two shingle sets."""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def merge_results(
+    result_sets: Dict[str, Dict[str, Any]],
+    budget: int = 10,
+    near_duplicate_threshold: float = 0.8,
+) -> Dict[str, Any]:
+    """
+    Merge the results of several sub-queries into one ranked list.
+
+    Duplicates keep the copy with the best score and remember every
+    sub-query that returned them. Results seen by more sub-queries rank
+    higher; each sub-query's best result is placed first so truncating to
+    the budget never drops a whole facet.
+
+    Args:
+        result_sets: Sub-query name -> search response ({"results": [...]})
+        budget: Maximum number of results to keep
+        near_duplicate_threshold: Content similarity (0-1) above which two
+            results with different URLs count as duplicates
+
+    Returns:
+        A search response with the merged "results"; each result carries
+        the "queries" it came from. "error" is set only if every
+        sub-query failed.
+    """
+    merged: List[Dict[str, Any]] = []
+    by_url: Dict[str, Dict[str, Any]] = {}
+    content_shingles: List[Set[str]] = []
+    errors: List[str] = []
+
+    for name, response in result_sets.items():
+        if "error" in response:
+            errors.append(f"{name}: {response['error']}")
+            continue
+
+        for result in response.get("results", []):
+            candidate = dict(result, queries=[name])
+            candidate_shingles = shingles(result.get("content", ""))
+            url_key = canonical_url(result["url"]) if result.get("url") else None
+
+            existing = by_url.get(url_key) if url_key else None
+            if existing is None:
+                for i, other in enumerate(merged):
+                    if similarity(candidate_shingles, content_shingles[i]) >= near_duplicate_threshold:
+                        existing = other
+                        break
+
+            if existing is None:
+                merged.append(candidate)
+                content_shingles.append(candidate_shingles)
+                if url_key:
+                    by_url[url_key] = candidate
+                continue
+
+            if name not in existing["queries"]:
+                existing["queries"].append(name)
+            if _score(candidate) > _score(existing):
+                queries = existing["queries"]
+                existing.clear()
+                existing.update(candidate, queries=queries)
+            if url_key:
+                by_url.setdefault(url_key, existing)
+
+    if errors and len(errors) == len(result_sets):
+        return {"error": "; ".join(errors), "results": []}
+
+    ranked = sorted(merged, key=lambda result: (len(result["queries"]), _score(result)), reverse=True)
+    results = _lead_with_each_query(ranked, list(result_sets))[:budget]
+
+    response: Dict[str, Any] = {"results": results, "candidates": len(merged)}
+    if errors:
+        response["partial_errors"] = errors
+    return response
+
+
+def _score(result: Dict[str, Any]) -> float:
+    try:
+        return float(result.get("score") or 0.0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _lead_with_each_query(ranked: List[Dict[str, Any]], names: Sequence[str]) -> List[Dict[str, Any]]:
+    """Move the best result of every sub-query to the front, in query order."""
+    leaders: List[Dict[str, Any]] = []
+    taken: Set[int] = set()
+    for name in names:
+        best: Optional[Dict[str, Any]] = next(
+            (result for result in ranked if name in result["queries"] and id(result) not in taken),
+            None,
+        )
+        if best is not None:
+            leaders.append(best)
+            taken.add(id(best))
+    return leaders + [result for result in ranked if id(result) not in taken]
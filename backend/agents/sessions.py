@@ -0,0 +1,225 @@
+"""
+Conversation Sessions
+
+Keeps the context of multi-turn conversations on the server, so follow-up
+requests carry a session ID and a new question instead of re-sending the
+whole previous analysis.
+
+Each session holds a compact rolling summary of its turns rather than the
+full transcripts: every answer is reduced to its section headings and
+leading sentences, and the oldest turns are cut once the summary outgrows
+its token budget. Sessions are stored in a CacheBackend, so they get the
+same LRU cap and TTL as the result caches; each turn refreshes the TTL.
+"""
+
+import os
+import re
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel
+
+from .cache import CacheBackend, MemoryCache, SQLiteCache
+from .prompt_budget import trim_middle
+
+# Token budget of a session's rolling summary
+SESSION_SUMMARY_MAX_TOKENS = int(os.environ.get("SESSION_SUMMARY_MAX_TOKENS", "800"))
+
+# Sentences kept from each section of an answer
+SUMMARY_SENTENCES_PER_SECTION = 1
+
+_HEADING_RE = re.compile(r"^#{1,6}\s+(.*\S)\s*$")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+class SessionNotFoundError(KeyError):
+    """Raised for unknown or expired session IDs."""
+
+
+class Session(BaseModel):
+    session_id: str
+    agent_id: str
+    business_name: str
+    website_url: str
+    # Rolling summary of previous turns, used as the prompt context
+    summary: str = ""
+    turns: int = 0
+    created_at: float
+    updated_at: float
+
+
+def summarize_answer(text: str, sentences_per_section: int = SUMMARY_SENTENCES_PER_SECTION) -> str:
+    """
+    Reduce a Markdown answer to its headings and leading sentences.
+
+    Args:
+        text: The answer to summarize
+        sentences_per_section: Sentences kept after each heading
+
+    Returns:
+        One line per section, e.g. "BUSINESS OVERVIEW: Acme sells anvils."
+    """
+    sections: List[List[str]] = [["", ""]]
+    for line in text.splitlines():
+        heading = _HEADING_RE.match(line)
+        if heading:
+            sections.append([heading.group(1), ""])
+        elif line.strip():
+            sections[-1][1] += " " + line.strip().lstrip("-*").strip()
+
+    lines = []
+    for heading, body in sections:
+        sentences = _SENTENCE_RE.split(body.strip())
+        lead = " ".join(sentences[:sentences_per_section]).strip()
+        if heading and lead:
+            lines.append(f"{heading}: {lead}")
+        elif lead:
+            lines.append(lead)
+    return "\n".join(lines)
+
+
+def append_turn(
+    summary: str,
+    turn: int,
+    question: Optional[str],
+    answer: str,
+    model: str,
+    max_tokens: int = SESSION_SUMMARY_MAX_TOKENS,
+) -> str:
+    """
+    Add a turn to a rolling summary, keeping it within a token budget.
+
+    The first turn (which establishes the subject) and the latest turns
+    are kept; turns in between are cut first.
+
+    Args:
+        summary: The summary so far
+        turn: Number of the turn being added (1-based)
+        question: Follow-up question of the turn, if any
+        answer: The answer given
+        model: Model name, selects the tokenizer
+        max_tokens: Token budget of the summary
+
+    Returns:
+        The updated summary
+    """
+    entry = f"Turn {turn}" + (f" - Q: {question}" if question else " - initial analysis")
+    entry += f"\n{summarize_answer(answer)}"
+    updated = f"{summary}\n\n{entry}" if summary else entry
+    return trim_middle(updated, max_tokens, model)
+
+
+# ----------------------------------------------------------------
+# Session Store
+# ----------------------------------------------------------------
+class SessionStore:
+    """
+    Sessions kept in a CacheBackend, keyed by session ID.
+
+    Args:
+        backend: Cache holding the sessions (sets the LRU cap and storage)
+        ttl: Seconds a session lives after its last turn
+    """
+
+    def __init__(self, backend: CacheBackend, ttl: Optional[float] = 86400):
+        self.backend = backend
+        self.ttl = ttl
+
+        self.created = 0
+        self.not_found = 0
+
+    def _key(self, session_id: str) -> str:
+        return f"session:{session_id}"
+
+    def create(self, agent_id: str, business_name: str, website_url: str) -> Session:
+        """Start a new, empty session."""
+        now = time.time()
+        session = Session(
+            session_id=uuid.uuid4().hex,
+            agent_id=agent_id,
+            business_name=business_name,
+            website_url=website_url,
+            created_at=now,
+            updated_at=now,
+        )
+        self.save(session)
+        self.created += 1
+        return session
+
+    def get(self, session_id: str) -> Session:
+        """Look up a session. Raises SessionNotFoundError."""
+        data = self.backend.get(self._key(session_id))
+        if data is None:
+            self.not_found += 1
+            raise SessionNotFoundError(session_id)
+        return Session.model_validate(data)
+
+    def save(self, session: Session):
+        """Store a session, restarting its TTL."""
+        session.updated_at = time.time()
+        self.backend.set(self._key(session.session_id), session.model_dump(), ttl=self.ttl)
+
+    def delete(self, session_id: str):
+        """Forget a session. Raises SessionNotFoundError."""
+        self.get(session_id)
+        self.backend.delete(self._key(session_id))
+
+    def record_turn(self, session: Session, question: Optional[str], answer: str, model: str) -> Session:
+        """Fold a finished turn into the session summary and store it."""
+        session.turns += 1
+        session.summary = append_turn(session.summary, session.turns, question, answer, model)
+        self.save(session)
+        return session
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "ttl": self.ttl,
+            "created": self.created,
+            "not_found": self.not_found,
+            "summary_max_tokens": SESSION_SUMMARY_MAX_TOKENS,
+            "backend": self.backend.stats(),
+        }
+
+
+session_store: Optional[SessionStore] = None
+
+
+def build_session_store() -> SessionStore:
+    """
+    Build the session store from environment settings.
+
+    SESSION_TTL: Seconds a session lives after its last turn (default 86400)
+    SESSION_MAX_ENTRIES: Sessions kept before the least recently used are dropped (default 10000)
+    SESSION_MAX_BYTES: Byte cap for in-memory sessions (default 64 MB)
+    SESSION_STORE_PATH: SQLite file to store sessions in instead of memory, which
+        also shares them between worker processes
+    """
+    ttl = float(os.environ.get("SESSION_TTL", "86400"))
+    max_entries = int(os.environ.get("SESSION_MAX_ENTRIES", "10000"))
+    path = os.environ.get("SESSION_STORE_PATH")
+
+    # No memory tier in front of SQLite: another worker may have updated the session
+    if path:
+        backend: CacheBackend = SQLiteCache(path, max_entries=max_entries, default_ttl=ttl, table="sessions")
+    else:
+        backend = MemoryCache(
+            max_entries=max_entries,
+            max_bytes=int(os.environ.get("SESSION_MAX_BYTES", str(64 * 1024 * 1024))),
+            default_ttl=ttl,
+        )
+    return SessionStore(backend, ttl=ttl)
+
+
+def get_session_store() -> SessionStore:
+    """Get the shared session store, building the default one on first use."""
+    global session_store
+    if session_store is None:
+        session_store = build_session_store()
+    return session_store
+
+
+def set_session_store(store: SessionStore):
+    """Install a different session store."""
+    global session_store
+    session_store = store
@@ -0,0 +1,84 @@
+"""
+Single-Flight Call Deduplication
+
+Concurrent callers asking for the same key share one in-flight computation
+instead of each issuing their own upstream call. Only callers on the same
+event loop are merged; a call from another loop simply runs on its own.
+"""
+
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+
+class SingleFlight:
+    """
+    Deduplicate concurrent async calls by key.
+
+    The shared computation runs as its own task, so a caller that is
+    cancelled (e.g. a disconnected client) does not cancel it for the others.
+    """
+
+    def __init__(self):
+        # key -> (loop, task)
+        self._inflight: Dict[str, Tuple[asyncio.AbstractEventLoop, asyncio.Task]] = {}
+        self._lock = threading.Lock()
+
+        self.calls = 0
+        self.executions = 0
+        self.shared = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Run fn() once for all concurrent callers with the same key.
+
+        Args:
+            key: Deduplication key
+            fn: Zero-argument coroutine function producing the result
+
+        Returns:
+            Tuple of (result, shared) where shared is True if this caller
+            joined a computation started by another caller
+        """
+        loop = asyncio.get_running_loop()
+
+        with self._lock:
+            self.calls += 1
+            inflight = self._inflight.get(key)
+            if inflight is not None and inflight[0] is loop and not inflight[1].done():
+                self.shared += 1
+                task = inflight[1]
+                shared = True
+            else:
+                self.executions += 1
+                task = loop.create_task(fn())
+                task.add_done_callback(lambda t: self._forget(key, t))
+                self._inflight[key] = (loop, task)
+                shared = False
+
+        return await asyncio.shield(task), shared
+
+    def in_flight(self) -> int:
+        """Number of computations currently running."""
+        with self._lock:
+            return len(self._inflight)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return call counters."""
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "executions": self.executions,
+                "shared": self.shared,
+                "in_flight": len(self._inflight),
+            }
+
+    def _forget(self, key: str, task: asyncio.Task):
+        """Drop a finished task and mark its exception as retrieved."""
+        with self._lock:
+            inflight = self._inflight.get(key)
+            if inflight is not None and inflight[1] is task:
+                del self._inflight[key]
+
+        if not task.cancelled():
+            task.exception()
@@ -0,0 +1,43 @@
+"""
+Server-Sent Events Helpers
+
+Formats agent event streams as text/event-stream frames.
+"""
+
+import json
+from typing import Any, AsyncIterator, Dict, Tuple
+
+# Headers that keep proxies from buffering the stream
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no",
+}
+
+
+def format_sse(event: str, data: Any) -> str:
+    """
+    Format one Server-Sent Event frame.
+
+    Args:
+        event: Event name
+        data: JSON-serializable payload
+
+    Returns:
+        The encoded frame, terminated by a blank line
+    """
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+async def encode_events(events: AsyncIterator[Tuple[str, Dict[str, Any]]]) -> AsyncIterator[str]:
+    """
+    Encode an agent event stream as SSE frames.
+
+    Args:
+        events: Async iterator of (event name, data) tuples
+
+    Yields:
+        Encoded SSE frames
+    """
+    async for event, data in events:
+        yield format_sse(event, data)
@@ -0,0 +1,491 @@
+"""
+Token Usage Accounting
+
+Captures model, token counts, cost and duration for every upstream LLM
+completion and writes them to the token_usage table (database-schema.sql)
+without adding a database round trip to the request path:
+
+- UsageWriter buffers records in memory and flushes them in bulk when the
+  buffer reaches max_batch records or every flush_interval seconds.
+- If the sink fails (database down), the batch is appended to a local
+  JSONL spill file and replayed after the next successful flush.
+- Records the sink rejects for good (constraint violations, unreadable
+  spill lines) go to a quarantine file (<spill file>.rejected) instead of
+  being retried forever.
+- Sinks are pluggable: SQLiteUsageSink for local runs and tests,
+  PostgresUsageSink for production.
+"""
+
+import os
+import time
+import uuid
+import asyncio
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel, Field
+
+# USD per 1K tokens as (prompt, completion); matched by longest model prefix
+MODEL_PRICES = {
+    "gpt-3.5-turbo": (0.0005, 0.0015),
+    "gpt-3.5-turbo-16k": (0.003, 0.004),
+    "gpt-4": (0.03, 0.06),
+    "gpt-4-32k": (0.06, 0.12),
+    "gpt-4-turbo": (0.01, 0.03),
+    "gpt-4-1106-preview": (0.01, 0.03),
+    "gpt-4o": (0.005, 0.015),
+    "gpt-4o-mini": (0.00015, 0.0006),
+}
+
+# Columns written to token_usage, in insert order
+USAGE_COLUMNS = (
+    "id", "user_id", "company_id", "model", "prompt_tokens", "completion_tokens",
+    "total_tokens", "created_at", "cost_usd", "duration_seconds", "request_id", "session_id",
+)
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    """
+    Estimate the cost of a completion in USD.
+
+    Unknown models are priced at 0.
+    """
+    matches = [name for name in MODEL_PRICES if model.startswith(name)]
+    if not matches:
+        return 0.0
+    prompt_price, completion_price = MODEL_PRICES[max(matches, key=len)]
+    return round(prompt_tokens / 1000 * prompt_price + completion_tokens / 1000 * completion_price, 6)
+
+
+class UsageRecord(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    model: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    total_tokens: int = 0
+    cost_usd: float = 0.0
+    duration_seconds: Optional[float] = None
+    created_at: float = Field(default_factory=time.time)
+    request_id: Optional[str] = None
+    session_id: Optional[str] = None
+    user_id: Optional[str] = None
+    company_id: Optional[str] = None
+
+    # Configure model to disable protected namespace warnings
+    model_config = {
+        "protected_namespaces": ()
+    }
+
+    @classmethod
+    def from_usage(cls, model: str, usage: Dict[str, int], **fields) -> "UsageRecord":
+        """Build a record from a provider usage report, filling in cost."""
+        prompt_tokens = usage.get("prompt_tokens", 0)
+        completion_tokens = usage.get("completion_tokens", 0)
+        return cls(
+            model=model,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            total_tokens=usage.get("total_tokens") or prompt_tokens + completion_tokens,
+            cost_usd=estimate_cost(model, prompt_tokens, completion_tokens),
+            **fields,
+        )
+
+
+def as_uuid(value: Optional[str]) -> Optional[str]:
+    """The value as a canonical UUID string, or None if it isn't one."""
+    if value is None:
+        return None
+    try:
+        return str(uuid.UUID(str(value)))
+    except ValueError:
+        return None
+
+
+# ----------------------------------------------------------------
+# Sinks
+# ----------------------------------------------------------------
+class UsageSink:
+    """
+    Interface for usage storage.
+
+    write_batch is blocking. It raises when the sink is unavailable (the
+    batch is retried later) and returns the records it rejected for good,
+    e.g. for violating a constraint (they are quarantined).
+    """
+
+    def write_batch(self, records: List[UsageRecord]) -> List[UsageRecord]:
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class SQLiteUsageSink(UsageSink):
+    """Writes usage to a local SQLite token_usage table."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS token_usage ("
+            "id TEXT PRIMARY KEY, "
+            "user_id TEXT, "
+            "company_id TEXT, "
+            "model TEXT NOT NULL, "
+            "prompt_tokens INTEGER NOT NULL DEFAULT 0, "
+            "completion_tokens INTEGER NOT NULL DEFAULT 0, "
+            "total_tokens INTEGER NOT NULL DEFAULT 0, "
+            "created_at REAL NOT NULL, "
+            "cost_usd REAL NOT NULL DEFAULT 0, "
+            "duration_seconds REAL, "
+            "request_id TEXT, "
+            "session_id TEXT)"
+        )
+        self._conn.commit()
+
+    def write_batch(self, records: List[UsageRecord]) -> List[UsageRecord]:
+        rows = [tuple(getattr(record, column) for column in USAGE_COLUMNS) for record in records]
+        with self._lock:
+            self._conn.executemany(
+                f"INSERT OR IGNORE INTO token_usage ({', '.join(USAGE_COLUMNS)}) "
+                f"VALUES ({', '.join('?' for _ in USAGE_COLUMNS)})",
+                rows,
+            )
+            self._conn.commit()
+        return []
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class PostgresUsageSink(UsageSink):
+    """
+    Writes usage to the Postgres token_usage table.
+
+    Requires psycopg (v3) or psycopg2. user_id and company_id are UUID
+    foreign keys there: owners that aren't UUIDs are written as NULL, and
+    as the table requires exactly one owner, records left without one (or
+    with two) are skipped and counted in `skipped`. When a batch violates a
+    constraint (e.g. an unknown owner), its rows are inserted one at a time
+    and the failing ones are returned as rejected.
+    """
+
+    def __init__(self, dsn: str):
+        self.dsn = dsn
+        self.skipped = 0
+        self._conn = None
+        self._lock = threading.Lock()
+
+        try:
+            import psycopg as driver
+        except ImportError:
+            try:
+                import psycopg2 as driver
+            except ImportError:
+                raise ImportError("PostgresUsageSink requires psycopg or psycopg2 to be installed")
+        self._driver = driver
+        # Errors caused by the rows themselves; anything else means the database is unavailable
+        self._data_errors = (driver.DataError, driver.IntegrityError)
+
+    def write_batch(self, records: List[UsageRecord]) -> List[UsageRecord]:
+        owned = []
+        for record in records:
+            user_id, company_id = as_uuid(record.user_id), as_uuid(record.company_id)
+            if (user_id is None) == (company_id is None):
+                self.skipped += 1
+                continue
+            owned.append((record, self._row(record, user_id=user_id, company_id=company_id)))
+        if not owned:
+            return []
+
+        insert = (
+            f"INSERT INTO token_usage ({', '.join(USAGE_COLUMNS)}) "
+            f"VALUES ({', '.join('%s' for _ in USAGE_COLUMNS)}) "
+            "ON CONFLICT (id) DO NOTHING"
+        )
+        with self._lock:
+            try:
+                if self._conn is None or self._conn.closed:
+                    self._conn = self._driver.connect(self.dsn)
+                try:
+                    with self._conn.cursor() as cursor:
+                        cursor.executemany(insert, [row for _, row in owned])
+                    self._conn.commit()
+                    return []
+                except self._data_errors:
+                    self._conn.rollback()
+
+                # Some row is bad: insert them one by one to keep the good ones
+                rejected = []
+                for record, row in owned:
+                    try:
+                        with self._conn.cursor() as cursor:
+                            cursor.execute(insert, row)
+                        self._conn.commit()
+                    except self._data_errors:
+                        self._conn.rollback()
+                        rejected.append(record)
+                return rejected
+            except Exception:
+                # Drop the connection so the next flush reconnects
+                if self._conn is not None:
+                    try:
+                        self._conn.close()
+                    except Exception:
+                        pass
+                    self._conn = None
+                raise
+
+    @staticmethod
+    def _row(record: UsageRecord, **values) -> tuple:
+        values["created_at"] = time.strftime("%Y-%m-%dT%H:%M:%S+00:00", time.gmtime(record.created_at))
+        return tuple(values[column] if column in values else getattr(record, column) for column in USAGE_COLUMNS)
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+# ----------------------------------------------------------------
+# Buffered Writer
+# ----------------------------------------------------------------
+class UsageWriter:
+    """
+    Buffers usage records and flushes them to a sink in bulk.
+
+    record() never blocks on I/O. Flushing runs on a background task
+    started with start(); stop() flushes whatever is left.
+    """
+
+    def __init__(
+        self,
+        sink: Optional[UsageSink],
+        max_batch: int = 100,
+        flush_interval: float = 5.0,
+        max_buffer: int = 10000,
+        spill_path: str = "usage-spill.jsonl",
+    ):
+        self.sink = sink
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.spill_path = spill_path
+
+        self._buffer: List[UsageRecord] = []
+        self._lock = threading.Lock()
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self._sink_healthy = True
+
+        self.recorded = 0
+        self.written = 0
+        self.spilled = 0
+        self.replayed = 0
+        self.rejected = 0
+        self.flush_errors = 0
+
+    def record(self, record: UsageRecord):
+        """Queue a record for the next flush. Safe to call from any thread."""
+        with self._lock:
+            self.recorded += 1
+            if self.sink is None:
+                return
+            self._buffer.append(record)
+            size = len(self._buffer)
+
+            # Nobody is flushing and memory is capped: go straight to disk
+            overflow = None
+            if size > self.max_buffer:
+                overflow, self._buffer = self._buffer, []
+
+        if overflow:
+            self._spill(overflow)
+        elif size >= self.max_batch and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def start(self):
+        """Start the background flush task on the running loop."""
+        if self._task is not None or self.sink is None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = asyncio.create_task(self._run(), name="usage-writer")
+
+    async def stop(self):
+        """Stop the flush task and flush the remaining records."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+        self._wakeup = None
+
+    async def flush(self):
+        """Write buffered records (and any spilled ones) to the sink."""
+        if self.sink is None:
+            return
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+
+        async with self._flush_lock:
+            with self._lock:
+                batch, self._buffer = self._buffer, []
+
+            for start in range(0, len(batch), self.max_batch):
+                chunk = batch[start:start + self.max_batch]
+                try:
+                    rejected = await asyncio.to_thread(self.sink.write_batch, chunk) or []
+                except Exception as e:
+                    self._sink_failed(e)
+                    await asyncio.to_thread(self._spill, batch[start:])
+                    return
+                self.written += len(chunk) - len(rejected)
+                if rejected:
+                    await asyncio.to_thread(self._quarantine, [record.model_dump_json() for record in rejected])
+
+            # With nothing new to write, replaying the spill doubles as a health probe
+            await self._replay_spill()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            buffered = len(self._buffer)
+        return {
+            "sink": type(self.sink).__name__ if self.sink is not None else None,
+            "buffered": buffered,
+            "recorded": self.recorded,
+            "written": self.written,
+            "spilled": self.spilled,
+            "replayed": self.replayed,
+            "rejected": self.rejected,
+            "flush_errors": self.flush_errors,
+            "spill_pending": os.path.exists(self.spill_path) or os.path.exists(f"{self.spill_path}.replay"),
+        }
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def _sink_failed(self, error: Exception):
+        """Count a sink failure, warning once per outage."""
+        self.flush_errors += 1
+        if self._sink_healthy:
+            print(f"Warning: usage sink unavailable ({error}); spilling to {self.spill_path}")
+        self._sink_healthy = False
+
+    def _spill(self, records: List[UsageRecord]):
+        """Append records to the local spill file."""
+        with self._lock:
+            with open(self.spill_path, "a", encoding="utf-8") as spill:
+                for record in records:
+                    spill.write(record.model_dump_json() + "\n")
+            self.spilled += len(records)
+
+    def _quarantine(self, lines: List[str]):
+        """Set aside records (JSON lines) the sink will never accept, for inspection."""
+        with self._lock:
+            if not os.path.exists(f"{self.spill_path}.rejected"):
+                print(f"Warning: usage sink rejected records; moving them to {self.spill_path}.rejected")
+            with open(f"{self.spill_path}.rejected", "a", encoding="utf-8") as rejected:
+                for line in lines:
+                    rejected.write(line.rstrip("\n") + "\n")
+            self.rejected += len(lines)
+
+    async def _replay_spill(self):
+        """Write spilled records to the sink once it is reachable again."""
+        replay_path = f"{self.spill_path}.replay"
+        if not os.path.exists(self.spill_path) and not os.path.exists(replay_path):
+            self._sink_healthy = True
+            return
+
+        # Move the file aside so new spills don't interleave with the replay;
+        # a replay file left by an earlier failed attempt is finished first
+        with self._lock:
+            if not os.path.exists(replay_path):
+                os.replace(self.spill_path, replay_path)
+
+        def write(chunk: List[UsageRecord]):
+            rejected = self.sink.write_batch(chunk) or []
+            if rejected:
+                self._quarantine([record.model_dump_json() for record in rejected])
+            self.replayed += len(chunk) - len(rejected)
+
+        def replay():
+            with open(replay_path, encoding="utf-8") as spilled:
+                chunk = []
+                for line in spilled:
+                    if not line.strip():
+                        continue
+                    try:
+                        chunk.append(UsageRecord.model_validate_json(line))
+                    except ValueError:
+                        # A torn or corrupt line would fail every replay
+                        self._quarantine([line])
+                    if len(chunk) >= self.max_batch:
+                        write(chunk)
+                        chunk = []
+                if chunk:
+                    write(chunk)
+            os.remove(replay_path)
+
+        try:
+            # Sinks ignore duplicate ids, so a partially replayed file is safe to retry
+            await asyncio.to_thread(replay)
+        except Exception as e:
+            self._sink_failed(e)
+            return
+        self._sink_healthy = True
+
+
+# ----------------------------------------------------------------
+# Shared Writer
+# ----------------------------------------------------------------
+usage_writer: Optional[UsageWriter] = None
+
+
+def build_usage_sink() -> Optional[UsageSink]:
+    """
+    Build the usage sink from environment settings.
+
+    USAGE_DATABASE_URL: Postgres DSN (production)
+    USAGE_SQLITE_PATH: SQLite file (local runs and tests)
+    With neither set, usage is counted but not stored.
+    """
+    dsn = os.environ.get("USAGE_DATABASE_URL")
+    if dsn:
+        return PostgresUsageSink(dsn)
+    path = os.environ.get("USAGE_SQLITE_PATH")
+    if path:
+        return SQLiteUsageSink(path)
+    return None
+
+
+def get_usage_writer() -> UsageWriter:
+    """Get the shared usage writer, building it from the environment on first use."""
+    global usage_writer
+    if usage_writer is None:
+        usage_writer = UsageWriter(
+            build_usage_sink(),
+            max_batch=int(os.environ.get("USAGE_FLUSH_BATCH", "100")),
+            flush_interval=float(os.environ.get("USAGE_FLUSH_INTERVAL", "5")),
+            spill_path=os.environ.get("USAGE_SPILL_PATH", "usage-spill.jsonl"),
+        )
+    return usage_writer
+
+
+def set_usage_writer(writer: UsageWriter):
+    """Install a differently configured usage writer."""
+    global usage_writer
+    usage_writer = writer
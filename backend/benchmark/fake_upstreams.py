@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+"""
+Stand-in Tavily and OpenAI servers for benchmarks.
+
+Serves the Tavily search endpoint and the OpenAI chat completions endpoint
+(plain and streamed) from one local app, with configurable latency, error
+rate and token generation speed, so the backend can be load tested without
+paid upstream calls or their variance.
+
+Point the backend at it with:
+    TAVILY_BASE_URL=http://127.0.0.1:<port>
+    OPENAI_BASE_URL=http://127.0.0.1:<port>/v1
+"""
+
+import json
+import time
+import random
+import asyncio
+import argparse
+from typing import Any, Dict
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+class FakeSettings:
+    """Behaviour of the stand-in upstreams."""
+
+    def __init__(
+        self,
+        search_latency: float = 0.3,
+        completion_latency: float = 0.5,
+        jitter: float = 0.2,
+        error_rate: float = 0.0,
+        tokens_per_second: float = 50.0,
+        completion_tokens: int = 300,
+        results_per_search: int = 5,
+    ):
+        self.search_latency = search_latency
+        self.completion_latency = completion_latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.tokens_per_second = tokens_per_second
+        self.completion_tokens = completion_tokens
+        self.results_per_search = results_per_search
+
+    def delay(self, base: float) -> float:
+        """Base latency with +/- jitter (as a fraction of the base)."""
+        return max(base * (1 + random.uniform(-self.jitter, self.jitter)), 0.0)
+
+    def should_fail(self) -> bool:
+        return random.random() < self.error_rate
+
+
+def _error_response() -> JSONResponse:
+    """A transient upstream failure, alternating between overload and server error."""
+    if random.random() < 0.5:
+        return JSONResponse({"error": "rate limited (fake)"}, status_code=429, headers={"Retry-After": "0.1"})
+    return JSONResponse({"error": "upstream error (fake)"}, status_code=503)
+
+
+def create_app(settings: FakeSettings) -> FastAPI:
+    """Build the stand-in upstream app."""
+    app = FastAPI(title="Fake Upstreams")
+    app.state.calls = {"search": 0, "completion": 0, "stream": 0, "errors": 0}
+
+    async def search(request: Request):
+        app.state.calls["search"] += 1
+        body = await request.json()
+        await asyncio.sleep(settings.delay(settings.search_latency))
+        if settings.should_fail():
+            app.state.calls["errors"] += 1
+            return _error_response()
+
+        query = body.get("query", "")
+        results = [
+            {
+                "title": f"Result {i} for {query}",
+                "url": f"https://example.com/{abs(hash(query)) % 100000}/{i}",
+                "content": f"Stand-in content {i} about {query}. " * 8,
+                "score": round(1 - i / 10, 2),
+            }
+            for i in range(settings.results_per_search)
+        ]
+        return {"query": query, "results": results}
+
+    app.post("/search")(search)
+    app.post("/v1/search")(search)
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        model = body.get("model", "gpt-3.5-turbo")
+        prompt = body["messages"][-1]["content"]
+        prompt_tokens = len(prompt) // 4
+        max_tokens = body.get("max_tokens") or settings.completion_tokens
+        completion_tokens = min(settings.completion_tokens, max_tokens)
+
+        await asyncio.sleep(settings.delay(settings.completion_latency))
+        if settings.should_fail():
+            app.state.calls["errors"] += 1
+            return _error_response()
+
+        created = int(time.time())
+        if body.get("stream"):
+            app.state.calls["stream"] += 1
+            return StreamingResponse(
+                _stream_tokens(model, created, completion_tokens, settings.tokens_per_second),
+                media_type="text/event-stream",
+            )
+
+        app.state.calls["completion"] += 1
+        if settings.tokens_per_second > 0:
+            await asyncio.sleep(completion_tokens / settings.tokens_per_second)
+        return {
+            "id": f"chatcmpl-fake-{created}",
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": _analysis_text(completion_tokens)},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    @app.get("/stats")
+    def stats():
+        return app.state.calls
+
+    return app
+
+
+def _analysis_text(tokens: int) -> str:
+    """Markdown shaped like a real analysis, about one word per token."""
+    words = ["insight"] * max(tokens - 4, 1)
+    return "## BUSINESS OVERVIEW\n" + " ".join(words) + "."
+
+
+async def _stream_tokens(model: str, created: int, tokens: int, tokens_per_second: float):
+    """OpenAI-style chat.completion.chunk events, one token at a time."""
+    interval = 1 / tokens_per_second if tokens_per_second > 0 else 0
+
+    def chunk(delta: Dict[str, Any], finish_reason=None) -> str:
+        payload = {
+            "id": f"chatcmpl-fake-{created}",
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        return f"data: {json.dumps(payload)}\n\n"
+
+    yield chunk({"role": "assistant", "content": "## BUSINESS OVERVIEW\n"})
+    for _ in range(max(tokens - 4, 1)):
+        if interval:
+            await asyncio.sleep(interval)
+        yield chunk({"content": "insight "})
+    yield chunk({}, finish_reason="stop")
+    yield "data: [DONE]\n\n"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run stand-in Tavily and OpenAI servers")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--search-latency", type=float, default=0.3, help="Seconds per Tavily search")
+    parser.add_argument("--completion-latency", type=float, default=0.5,
+                        help="Seconds before a completion starts generating")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Latency variation as a fraction (0-1)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of calls failing with 429/503")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0,
+                        help="Generation speed (0 returns completions instantly)")
+    parser.add_argument("--completion-tokens", type=int, default=300, help="Tokens per completion")
+    return parser.parse_args(argv)
+
+
+def settings_from_args(args) -> FakeSettings:
+    return FakeSettings(
+        search_latency=args.search_latency,
+        completion_latency=args.completion_latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        tokens_per_second=args.tokens_per_second,
+        completion_tokens=args.completion_tokens,
+    )
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    uvicorn.run(create_app(settings_from_args(args)), host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,446 @@
+#!/usr/bin/env python
+"""
+Latency and throughput benchmark for the Productivity Engines API.
+
+Starts the stand-in upstreams (fake_upstreams.py) and the backend (run.py)
+on localhost, drives an agent endpoint either at a fixed request rate or
+at a fixed concurrency, and reports latency percentiles, throughput and
+error rates. Results are written as JSON; pass an earlier result file as
+--baseline to fail the run when it regresses.
+
+Examples:
+    python backend/benchmark/run_benchmark.py --mode concurrency --concurrency 32 --duration 30
+    python backend/benchmark/run_benchmark.py --mode rps --rps 20 --duration 60 --error-rate 0.05
+    python backend/benchmark/run_benchmark.py --url http://localhost:8000 --mode rps --rps 5
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCHMARK_DIR)
+ROOT_DIR = os.path.dirname(BACKEND_DIR)
+
+# Percentiles are computed the same way as the backend's own statistics
+sys.path.insert(0, BACKEND_DIR)
+from agents.metrics import percentile
+
+# Result fields compared against a baseline: (path, higher is better)
+COMPARED_METRICS = [
+    (("latency", "p50"), False),
+    (("latency", "p95"), False),
+    (("latency", "p99"), False),
+    (("throughput_rps",), True),
+]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Productivity Engines API")
+    load = parser.add_argument_group("load")
+    load.add_argument("--mode", choices=["rps", "concurrency"], default="concurrency",
+                      help="Open-loop fixed request rate, or closed-loop fixed concurrency")
+    load.add_argument("--rps", type=float, default=10.0, help="Requests per second (rps mode)")
+    load.add_argument("--concurrency", type=int, default=16, help="Concurrent clients (concurrency mode)")
+    load.add_argument("--duration", type=float, default=30.0, help="Seconds to generate load")
+    load.add_argument("--warmup", type=int, default=5, help="Requests sent before measuring")
+    load.add_argument("--max-in-flight", type=int, default=1000,
+                      help="Cap on outstanding requests in rps mode")
+    load.add_argument("--endpoint", default="/run_agent",
+                      help="Endpoint to drive; a path ending in /stream also measures time to first token")
+    load.add_argument("--distinct", type=int, default=0,
+                      help="Distinct businesses to cycle through (0: every request is unique)")
+    load.add_argument("--no-cache", action="store_true", help="Send use_cache=false with every request")
+    load.add_argument("--timeout", type=float, default=120.0, help="Per-request timeout in seconds")
+
+    app = parser.add_argument_group("app")
+    app.add_argument("--url", help="Benchmark an already running server instead of starting one")
+    app.add_argument("--port", type=int, default=0, help="Port for the started app (default: free port)")
+    app.add_argument("--workers", type=int, default=1, help="Worker processes for the started app")
+    app.add_argument("--keep-rate-limits", action="store_true",
+                     help="Keep the upstream governor's default rate limits (lifted by default)")
+
+    upstreams = parser.add_argument_group("stand-in upstreams")
+    upstreams.add_argument("--search-latency", type=float, default=0.3)
+    upstreams.add_argument("--completion-latency", type=float, default=0.5)
+    upstreams.add_argument("--jitter", type=float, default=0.2)
+    upstreams.add_argument("--error-rate", type=float, default=0.0)
+    upstreams.add_argument("--tokens-per-second", type=float, default=50.0)
+    upstreams.add_argument("--completion-tokens", type=int, default=300)
+
+    output = parser.add_argument_group("output")
+    output.add_argument("--output", help="Result file (default benchmark-results/<mode>-<time>.json)")
+    output.add_argument("--baseline", help="Earlier result file to compare against")
+    output.add_argument("--max-regression", type=float, default=0.15,
+                        help="Allowed relative regression against the baseline (default 0.15)")
+    return parser.parse_args(argv)
+
+
+# ----------------------------------------------------------------
+# Processes
+# ----------------------------------------------------------------
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(url: str, timeout: float = 30.0):
+    """Poll a URL until it answers 200."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout:.0f}s")
+
+
+def start_upstreams(args, port: int) -> subprocess.Popen:
+    command = [
+        sys.executable, os.path.join(BENCHMARK_DIR, "fake_upstreams.py"),
+        "--port", str(port),
+        "--search-latency", str(args.search_latency),
+        "--completion-latency", str(args.completion_latency),
+        "--jitter", str(args.jitter),
+        "--error-rate", str(args.error_rate),
+        "--tokens-per-second", str(args.tokens_per_second),
+        "--completion-tokens", str(args.completion_tokens),
+    ]
+    process = subprocess.Popen(command)
+    wait_for(f"http://127.0.0.1:{port}/stats")
+    return process
+
+
+def start_app(args, port: int, upstream_port: int, data_dir: str) -> subprocess.Popen:
+    """
+    Start the backend against the stand-in upstreams.
+
+    Settings set here win over the developer's environment and .env (run.py
+    doesn't override variables that are already set): stores and caches
+    live in data_dir, usage isn't written to a database and the pre-warm
+    scheduler stays off.
+    """
+    env = dict(os.environ)
+    env.update({
+        "TAVILY_BASE_URL": f"http://127.0.0.1:{upstream_port}",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{upstream_port}/v1",
+        "TAVILY_API_KEY": "benchmark",
+        "OPENAI_API_KEY": "benchmark",
+        # The generated business websites don't exist
+        "CRAWL_ENABLED": "0",
+        "RESULT_STORE_PATH": os.path.join(data_dir, "analysis-results.db"),
+        "SEARCH_CACHE_PATH": os.path.join(data_dir, "search-cache.db"),
+        "COMPLETION_CACHE_PATH": os.path.join(data_dir, "completion-cache.db"),
+        "CRAWL_CACHE_PATH": os.path.join(data_dir, "crawl-cache.db"),
+        "SESSION_STORE_PATH": os.path.join(data_dir, "sessions.db"),
+        "USAGE_SPILL_PATH": os.path.join(data_dir, "usage-spill.jsonl"),
+        "USAGE_DATABASE_URL": "",
+        "USAGE_SQLITE_PATH": "",
+        "PREWARM_ENABLED": "0",
+    })
+    if not args.keep_rate_limits:
+        for provider in ("TAVILY", "OPENAI"):
+            env[f"{provider}_RATE_LIMIT"] = "100000"
+            env[f"{provider}_BURST"] = "100000"
+
+    command = [
+        sys.executable, os.path.join(ROOT_DIR, "run.py"),
+        "--host", "127.0.0.1",
+        "--port", str(port),
+        "--workers", str(args.workers),
+        "--log-level", "warning",
+    ]
+    process = subprocess.Popen(command, env=env)
+    wait_for(f"http://127.0.0.1:{port}/health")
+    return process
+
+
+def stop(process: Optional[subprocess.Popen]):
+    if process is None or process.poll() is not None:
+        return
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+# ----------------------------------------------------------------
+# Load Generation
+# ----------------------------------------------------------------
+def make_payload(args, i: int) -> Dict[str, Any]:
+    n = i % args.distinct if args.distinct else i
+    payload = {
+        "business_name": f"Benchmark Business {n}",
+        "website_url": f"https://business{n}.example.com",
+    }
+    if args.no_cache:
+        payload["use_cache"] = False
+    return payload
+
+
+async def send(client: httpx.AsyncClient, url: str, payload: Dict[str, Any], started: float) -> Dict[str, Any]:
+    """
+    Send one request and time it.
+
+    Latency is measured from `started`, the time the request was due, so a
+    backed-up client in rps mode shows up as latency rather than a lower rate.
+    """
+    sample: Dict[str, Any] = {"start": started, "status": None, "error": None, "first_token": None}
+    try:
+        if url.endswith("/stream"):
+            async with client.stream("POST", url, json=payload) as response:
+                sample["status"] = response.status_code
+                async for line in response.aiter_lines():
+                    if line == "event: token" and sample["first_token"] is None:
+                        sample["first_token"] = time.perf_counter() - started
+                    elif line == "event: error":
+                        sample["error"] = "stream error event"
+        else:
+            response = await client.post(url, json=payload)
+            sample["status"] = response.status_code
+            if response.status_code == 200 and response.json().get("error"):
+                sample["error"] = "agent error: " + str(response.json()["error"])[:200]
+        if sample["status"] != 200 and sample["error"] is None:
+            sample["error"] = f"HTTP {sample['status']}"
+    except Exception as e:
+        sample["error"] = f"{type(e).__name__}: {e}"
+    sample["latency"] = time.perf_counter() - started
+    return sample
+
+
+async def run_concurrency(args, client: httpx.AsyncClient, url: str, offset: int) -> List[Dict[str, Any]]:
+    """Closed loop: each client sends its next request when the previous one returns."""
+    samples: List[Dict[str, Any]] = []
+    deadline = time.perf_counter() + args.duration
+    counter = iter(range(offset, offset + 10 ** 9))
+
+    async def client_loop():
+        while time.perf_counter() < deadline:
+            samples.append(await send(client, url, make_payload(args, next(counter)), time.perf_counter()))
+
+    await asyncio.gather(*(client_loop() for _ in range(args.concurrency)))
+    return samples
+
+
+async def run_rps(args, client: httpx.AsyncClient, url: str, offset: int) -> List[Dict[str, Any]]:
+    """Open loop: requests are due at a fixed rate regardless of how fast they return."""
+    samples: List[Dict[str, Any]] = []
+    in_flight = asyncio.Semaphore(args.max_in_flight)
+    tasks = []
+    total = int(args.duration * args.rps)
+    begin = time.perf_counter()
+
+    async def one(i: int, due: float):
+        async with in_flight:
+            samples.append(await send(client, url, make_payload(args, offset + i), due))
+
+    for i in range(total):
+        due = begin + i / args.rps
+        delay = due - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(one(i, due)))
+    await asyncio.gather(*tasks)
+    return samples
+
+
+async def generate_load(args, base_url: str) -> Dict[str, Any]:
+    url = f"{base_url.rstrip('/')}{args.endpoint}"
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+        for i in range(args.warmup):
+            await send(client, url, make_payload(args, i), time.perf_counter())
+
+        begin = time.perf_counter()
+        runner = run_rps if args.mode == "rps" else run_concurrency
+        samples = await runner(args, client, url, args.warmup)
+        elapsed = time.perf_counter() - begin
+    return summarize(samples, elapsed)
+
+
+# ----------------------------------------------------------------
+# Reporting
+# ----------------------------------------------------------------
+def distribution(values: List[float]) -> Optional[Dict[str, float]]:
+    if not values:
+        return None
+    return {
+        "min": round(min(values), 4),
+        "mean": round(sum(values) / len(values), 4),
+        "p50": round(percentile(values, 50), 4),
+        "p95": round(percentile(values, 95), 4),
+        "p99": round(percentile(values, 99), 4),
+        "max": round(max(values), 4),
+    }
+
+
+def summarize(samples: List[Dict[str, Any]], elapsed: float) -> Dict[str, Any]:
+    errors = [sample for sample in samples if sample["error"]]
+    status_counts: Dict[str, int] = {}
+    for sample in samples:
+        key = str(sample["status"])
+        status_counts[key] = status_counts.get(key, 0) + 1
+
+    error_kinds: Dict[str, int] = {}
+    for sample in errors:
+        kind = sample["error"].split(":")[0]
+        error_kinds[kind] = error_kinds.get(kind, 0) + 1
+
+    ok_latencies = [sample["latency"] for sample in samples if not sample["error"]]
+    first_tokens = [sample["first_token"] for sample in samples if sample["first_token"] is not None]
+    return {
+        "requests": len(samples),
+        "succeeded": len(samples) - len(errors),
+        "errors": len(errors),
+        "error_rate": round(len(errors) / len(samples), 4) if samples else 0.0,
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_rps": round((len(samples) - len(errors)) / elapsed, 3) if elapsed else 0.0,
+        "latency": distribution(ok_latencies),
+        "first_token": distribution(first_tokens),
+        "status_counts": status_counts,
+        "error_kinds": error_kinds,
+        "error_examples": sorted({sample["error"] for sample in errors})[:5],
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=ROOT_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], max_regression: float) -> List[str]:
+    """Return a description of every metric that regressed beyond the allowance."""
+    regressions = []
+    for path, higher_is_better in COMPARED_METRICS:
+        current, previous = results, baseline
+        for key in path:
+            current = (current or {}).get(key)
+            previous = (previous or {}).get(key)
+        if current is None or not previous:
+            continue
+
+        change = (current - previous) / previous
+        name = ".".join(path)
+        print(f"  {name:<16} {previous:>10.4f} -> {current:>10.4f} ({change:+.1%})")
+        if (higher_is_better and change < -max_regression) or (not higher_is_better and change > max_regression):
+            regressions.append(f"{name} changed {change:+.1%}")
+
+    error_change = results["error_rate"] - baseline.get("error_rate", 0.0)
+    print(f"  {'error_rate':<16} {baseline.get('error_rate', 0.0):>10.4f} -> {results['error_rate']:>10.4f}")
+    if error_change > 0.01:
+        regressions.append(f"error_rate rose by {error_change:.2%}")
+    return regressions
+
+
+def print_summary(results: Dict[str, Any]):
+    print(f"\nRequests: {results['requests']}  succeeded: {results['succeeded']}  "
+          f"errors: {results['errors']} ({results['error_rate']:.2%})")
+    print(f"Throughput: {results['throughput_rps']} req/s over {results['elapsed_seconds']}s")
+    for name in ("latency", "first_token"):
+        dist = results[name]
+        if dist:
+            print(f"{name:>12}: p50 {dist['p50']:.3f}s  p95 {dist['p95']:.3f}s  "
+                  f"p99 {dist['p99']:.3f}s  max {dist['max']:.3f}s")
+    if results["error_kinds"]:
+        print(f"Errors: {results['error_kinds']}")
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    upstreams = app = data_dir = None
+    started_at = datetime.now(timezone.utc)
+
+    try:
+        if args.url:
+            base_url = args.url
+        else:
+            upstream_port = free_port()
+            upstreams = start_upstreams(args, upstream_port)
+            port = args.port or free_port()
+            data_dir = tempfile.mkdtemp(prefix="benchmark-")
+            app = start_app(args, port, upstream_port, data_dir)
+            base_url = f"http://127.0.0.1:{port}"
+
+        load = f"{args.rps} req/s" if args.mode == "rps" else f"{args.concurrency} concurrent clients"
+        print(f"Benchmarking {base_url}{args.endpoint} with {load} for {args.duration:.0f}s...")
+        results = asyncio.run(generate_load(args, base_url))
+    finally:
+        stop(app)
+        stop(upstreams)
+        if data_dir is not None:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    print_summary(results)
+
+    report = {
+        "benchmark": {
+            "mode": args.mode,
+            "endpoint": args.endpoint,
+            "rps": args.rps if args.mode == "rps" else None,
+            "concurrency": args.concurrency if args.mode == "concurrency" else None,
+            "duration": args.duration,
+            "warmup": args.warmup,
+            "distinct": args.distinct,
+            "no_cache": args.no_cache,
+        },
+        "app": {"url": args.url, "workers": None if args.url else args.workers},
+        "upstreams": None if args.url else {
+            "search_latency": args.search_latency,
+            "completion_latency": args.completion_latency,
+            "jitter": args.jitter,
+            "error_rate": args.error_rate,
+            "tokens_per_second": args.tokens_per_second,
+            "completion_tokens": args.completion_tokens,
+        },
+        "environment": {
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "started_at": started_at.isoformat(),
+        "results": results,
+    }
+
+    output = args.output or os.path.join(
+        "benchmark-results", f"{args.mode}-{started_at.strftime('%Y%m%dT%H%M%SZ')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        print(f"\nCompared with {args.baseline}:")
+        regressions = compare(results, baseline, args.max_regression)
+        if regressions:
+            print("Regressions: " + "; ".join(regressions))
+            return 1
+        print("No regressions beyond the allowance.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
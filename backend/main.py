@@ -10,17 +10,49 @@ It serves as a gateway to various AI agents and services.
 
 import os
 import sys
+import time
+import asyncio
 import importlib
-from fastapi import FastAPI, Body, HTTPException, Depends, Request
+from fastapi import FastAPI, Body, HTTPException, Depends, Header, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, Response, StreamingResponse
 from dotenv import load_dotenv
+from pydantic import ValidationError
+from typing import Any, Dict, Optional
 
 # Fix imports to use proper relative imports
-from .agents import AVAILABLE_AGENTS, get_agent_info, initialize_all
-from .agents import marketing
+from .agents import awarm_up, configure, discover, get_agent_info, warmup_agent_ids
+from .agents import http_client
+from .agents.governor import get_governor
+from .agents.llm_router import get_llm_router
+from .agents import metrics
+from .agents import responses
+from .agents.responses import FastJSONResponse, json_response
+from .agents.usage import get_usage_writer
+from .agents.sessions import Session, SessionNotFoundError, get_session_store
+from .agents.deadline import parse_deadline_header, with_deadline
+from .agents.prewarm import PREWARM_ENABLED, get_prewarm_scheduler
+from .agents.results import (
+    DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE,
+    ResultOwner,
+    ResultQuery,
+    StoredResult,
+    get_result_store,
+)
+from .agents.sse import SSE_HEADERS, encode_events
+from .agents.executor import (
+    AgentBusyError,
+    AgentTimeoutError,
+    agent_run_stats,
+    aget_agent,
+    arun_agent,
+    arun_agent_payload,
+    shutdown as shutdown_agent_pools,
+)
+from .agents.jobs import JOB_SUCCEEDED, JobInfo, JobNotFoundError, QueueFullError, get_job_queue
 
 # Load environment variables from .env file if it exists
 load_dotenv()
@@ -29,9 +61,13 @@ load_dotenv()
 app = FastAPI(
     title="Productivity Engines API",
     description="Gateway to AI-powered productivity agents and services",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=FastJSONResponse
 )
 
+# Compress large responses (analyses, batch results) for clients that accept it
+responses.install(app)
+
 # Add CORS middleware to allow cross-origin requests
 app.add_middleware(
     CORSMiddleware,
@@ -55,12 +91,30 @@ templates = Jinja2Templates(directory=templates_dir)
 # Mount static files
 app.mount("/static", StaticFiles(directory=static_dir), name="static")
 
-# Initialize all agents
-initialize_all(
+# Agents are loaded and initialized with these keys on first use
+configure(
     openai_api_key=os.environ.get("OPENAI_API_KEY"),
     tavily_api_key=os.environ.get("TAVILY_API_KEY")
 )
 
+async def marketing_agent() -> Dict[str, Any]:
+    """The marketing agent's registry entry, imported and initialized on its first request."""
+    return await aget_agent("marketing")
+
+def validate_request(model, payload: Dict[str, Any]):
+    """Validate a request body against an agent's model, answering 422 if it doesn't fit."""
+    try:
+        return model.model_validate(payload)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_context=False))
+
+def request_deadline(x_request_deadline: Optional[str] = Header(None)) -> Optional[float]:
+    """Time budget in seconds from the X-Request-Deadline header, if sent."""
+    try:
+        return parse_deadline_header(x_request_deadline)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid X-Request-Deadline header: {e}")
+
 # ----------------------------------------------------------------
 # API Routes
 # ----------------------------------------------------------------
@@ -75,37 +129,454 @@ def list_agents():
     """
     return get_agent_info()
 
+# Agent load state
+@app.get("/agents/stats")
+def list_agent_stats():
+    """Load state, concurrency, queue depth and latency of every registered agent."""
+    return agent_run_stats()
+
+# Load an agent ahead of its first request
+@app.post("/agents/{agent_id}/warmup")
+async def warm_up_agent(agent_id: str):
+    """
+    Import and initialize an agent and run its warm-up hook.
+    
+    Returns the agent's load state.
+    """
+    try:
+        return await awarm_up([agent_id])
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown agent: {agent_id}")
+
+# Generic Agent Endpoint
+@app.post("/agents/{agent_id}/run")
+async def run_agent(
+    agent_id: str,
+    payload: Dict[str, Any] = Body(...),
+    deadline: Optional[float] = Depends(request_deadline),
+):
+    """
+    Run any registered agent on a request for its request model.
+    
+    The agent runs within its own concurrency pool: responds 429 when the
+    agent's queue is full and 504 when the run exceeds the agent's timeout.
+    An X-Request-Deadline header sets the request's "deadline" field.
+    """
+    if deadline is not None:
+        payload = {**payload, "deadline": deadline}
+    try:
+        return json_response(await arun_agent_payload(agent_id, payload))
+    except SessionNotFoundError as e:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired session: {e.args[0]}")
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown agent: {agent_id}")
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_context=False))
+    except AgentBusyError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+    except AgentTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+
 # Marketing Agent Endpoint - Legacy URL for compatibility
-@app.post("/run_agent", response_model=marketing.MarketingAgentResponse)
-def run_marketing_agent_legacy(request: marketing.MarketingAgentRequest = Body(...)):
+@app.post("/run_agent")
+async def run_marketing_agent_legacy(
+    payload: Dict[str, Any] = Body(...),
+    agent: Dict[str, Any] = Depends(marketing_agent),
+    deadline: Optional[float] = Depends(request_deadline),
+):
     """
     Run the marketing research agent to analyze a business (legacy endpoint).
     
     This endpoint is maintained for backwards compatibility.
     """
-    return run_marketing_agent(request)
+    return await run_marketing_agent(payload, agent, deadline)
 
 # Marketing Agent Endpoint - New URL format
-@app.post("/agents/marketing", response_model=marketing.MarketingAgentResponse)
-def run_marketing_agent(request: marketing.MarketingAgentRequest = Body(...)):
+@app.post("/agents/marketing")
+async def run_marketing_agent(
+    payload: Dict[str, Any] = Body(...),
+    agent: Dict[str, Any] = Depends(marketing_agent),
+    deadline: Optional[float] = Depends(request_deadline),
+):
     """
     Run the marketing research agent to analyze a business.
     
     This endpoint takes business details and returns a marketing analysis.
+    With a deadline (X-Request-Deadline header or "deadline" field) the
+    analysis may come back shortened or partial, as flagged in the response.
     """
+    request = validate_request(agent["request_model"], payload)
     try:
-        return marketing.run_analysis(request)
+        return json_response(await arun_agent("marketing", with_deadline(request, deadline)))
+    except SessionNotFoundError:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Unknown or expired session: {request.session_id}"
+        )
+    except AgentBusyError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+    except AgentTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Error running marketing agent: {str(e)}"
         )
 
+# Marketing Agent Batch Endpoints
+@app.post("/run_agent/batch")
+async def run_marketing_agent_batch_legacy(
+    payload: Dict[str, Any] = Body(...),
+    agent: Dict[str, Any] = Depends(marketing_agent),
+):
+    """
+    Run the marketing research agent for many businesses (legacy URL).
+    """
+    return await run_marketing_agent_batch(payload, agent)
+
+@app.post("/agents/marketing/batch")
+async def run_marketing_agent_batch(
+    payload: Dict[str, Any] = Body(...),
+    agent: Dict[str, Any] = Depends(marketing_agent),
+):
+    """
+    Run the marketing research agent for many businesses at once.
+    
+    Results are returned in input order; failures are reported per item.
+    """
+    marketing = agent["module"]
+    batch = validate_request(marketing.MarketingBatchRequest, payload)
+    if len(batch.requests) > marketing.BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch too large: {len(batch.requests)} requests (maximum {marketing.BATCH_MAX_ITEMS})"
+        )
+    return json_response(await marketing.arun_batch(batch))
+
+# Marketing Agent Streaming Endpoints
+@app.post("/run_agent/stream")
+async def stream_marketing_agent_legacy(
+    payload: Dict[str, Any] = Body(...),
+    agent: Dict[str, Any] = Depends(marketing_agent),
+    deadline: Optional[float] = Depends(request_deadline),
+):
+    """
+    Stream the marketing research agent (legacy URL).
+    
+    See stream_marketing_agent for the event format.
+    """
+    return await stream_marketing_agent(payload, agent, deadline)
+
+@app.post("/agents/marketing/stream")
+async def stream_marketing_agent(
+    payload: Dict[str, Any] = Body(...),
+    agent: Dict[str, Any] = Depends(marketing_agent),
+    deadline: Optional[float] = Depends(request_deadline),
+):
+    """
+    Run the marketing research agent, streaming results as Server-Sent Events.
+    
+    Sends search progress first, then analysis tokens as they are generated,
+    and finally a "done" event with the response metadata.
+    """
+    request = validate_request(agent["request_model"], payload)
+    return StreamingResponse(
+        encode_events(agent["module"].astream_analysis(with_deadline(request, deadline))),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
+# ----------------------------------------------------------------
+# Conversation Sessions
+# ----------------------------------------------------------------
+@app.get("/sessions")
+def session_stats():
+    """
+    Session store counters.
+    """
+    return get_session_store().stats()
+
+@app.get("/sessions/{session_id}", response_model=Session)
+def get_session(session_id: str, http_request: Request):
+    """
+    Get a conversation session and its rolling summary.
+    
+    Supports conditional GET through If-None-Match.
+    """
+    try:
+        return json_response(get_session_store().get(session_id), http_request)
+    except SessionNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired session: {session_id}")
+
+@app.delete("/sessions/{session_id}", status_code=204)
+def delete_session(session_id: str):
+    """
+    End a conversation session.
+    """
+    try:
+        get_session_store().delete(session_id)
+    except SessionNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired session: {session_id}")
+    return Response(status_code=204)
+
+# ----------------------------------------------------------------
+# Stored Results
+# ----------------------------------------------------------------
+def _result_store():
+    """The result store, or 503 when storing results is disabled."""
+    store = get_result_store()
+    if store is None:
+        raise HTTPException(status_code=503, detail="The result store is disabled (RESULT_STORE=off)")
+    return store
+
+def result_owner(
+    x_user_id: Optional[str] = Header(None),
+    x_company_id: Optional[str] = Header(None),
+) -> ResultOwner:
+    """The caller from the X-User-Id or X-Company-Id header; stored results are only served to their owner."""
+    if not x_user_id and not x_company_id:
+        raise HTTPException(status_code=401, detail="X-User-Id or X-Company-Id header is required")
+    if x_user_id and x_company_id:
+        raise HTTPException(status_code=400, detail="Send only one of X-User-Id and X-Company-Id")
+    return ResultOwner(user_id=x_user_id or None, company_id=x_company_id or None)
+
+def _owned_result(result_id: str, owner: ResultOwner) -> StoredResult:
+    """A stored result of the caller, or 404 (also for other owners' results)."""
+    result = _result_store().get(result_id)
+    if result is None or not owner.owns(result):
+        raise HTTPException(status_code=404, detail=f"Unknown result: {result_id}")
+    return result
+
+@app.get("/results")
+def list_results(
+    business_name: Optional[str] = None,
+    domain: Optional[str] = None,
+    user_id: Optional[str] = None,
+    company_id: Optional[str] = None,
+    agent_id: Optional[str] = None,
+    since: Optional[float] = None,
+    until: Optional[float] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    owner: ResultOwner = Depends(result_owner),
+):
+    """Stored analyses matching the filters, newest first; pass next_cursor to get the next page."""
+    store = _result_store()
+    query = ResultQuery(
+        agent_id=agent_id, business_name=business_name, domain=domain,
+        user_id=user_id, company_id=company_id, since=since, until=until
+    )
+    try:
+        query = owner.scope(query)
+    except PermissionError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    try:
+        results, next_cursor = store.list(query, limit=limit, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"results": [result.summary() for result in results], "next_cursor": next_cursor}
+
+@app.get("/results/stats")
+def result_stats():
+    """Result store backend and size."""
+    return _result_store().stats()
+
+@app.get("/results/lookup")
+def lookup_result(
+    http_request: Request,
+    business_name: Optional[str] = None,
+    website_url: Optional[str] = None,
+    agent_id: str = "marketing",
+    max_age: Optional[float] = Query(None, gt=0),
+    owner: ResultOwner = Depends(result_owner),
+):
+    """Latest stored analysis of a business and/or website, optionally no older than max_age seconds."""
+    if not business_name and not website_url:
+        raise HTTPException(status_code=400, detail="business_name or website_url is required")
+    query = ResultQuery(
+        agent_id=agent_id,
+        business_name=business_name,
+        domain=website_url,
+        since=time.time() - max_age if max_age else None
+    )
+    results, _ = _result_store().list(owner.scope(query), limit=1)
+    if not results:
+        raise HTTPException(status_code=404, detail="No stored result matches")
+    return json_response(results[0], http_request)
+
+@app.get("/results/{result_id}", response_model=StoredResult)
+def get_result(result_id: str, http_request: Request, owner: ResultOwner = Depends(result_owner)):
+    """A stored analysis with its inputs, sources, timings and token counts (supports If-None-Match)."""
+    result = _owned_result(result_id, owner)
+    # Stored results never change
+    return json_response(result, http_request, cache_control="private, max-age=86400")
+
+@app.delete("/results/{result_id}", status_code=204)
+def delete_result(result_id: str, owner: ResultOwner = Depends(result_owner)):
+    """Delete a stored analysis."""
+    _owned_result(result_id, owner)
+    if not _result_store().delete(result_id):
+        raise HTTPException(status_code=404, detail=f"Unknown result: {result_id}")
+    return Response(status_code=204)
+
+# ----------------------------------------------------------------
+# Background Jobs
+# ----------------------------------------------------------------
+@app.post("/jobs/{agent_id}", response_model=JobInfo, status_code=202)
+async def submit_job(agent_id: str, payload: Dict[str, Any] = Body(...)):
+    """
+    Queue a request for any registered agent.
+    
+    Returns the job ID immediately; poll /jobs/{job_id} for progress.
+    Responds 429 when the queue is full.
+    """
+    try:
+        job = await get_job_queue().submit(agent_id, payload)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown agent: {agent_id}")
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_context=False))
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "5"})
+    return job.info()
+
+@app.get("/jobs")
+def job_stats():
+    """Job queue depth and job counts by status."""
+    return get_job_queue().stats()
+
+@app.get("/jobs/{job_id}", response_model=JobInfo)
+async def get_job(job_id: str):
+    """Poll the status of a job."""
+    try:
+        return (await get_job_queue().get(job_id)).info()
+    except JobNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str, http_request: Request):
+    """
+    Get the result of a job.
+    
+    Responds 409 with the job status if the job has not succeeded, and 304
+    when the client's If-None-Match matches the result's ETag.
+    """
+    try:
+        job = await get_job_queue().get(job_id)
+    except JobNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    if job.status != JOB_SUCCEEDED:
+        raise HTTPException(status_code=409, detail=job.info().model_dump())
+    return json_response(job.result, http_request)
+
+@app.delete("/jobs/{job_id}", response_model=JobInfo)
+async def cancel_job(job_id: str):
+    """Cancel a queued or running job."""
+    try:
+        return (await get_job_queue().cancel(job_id)).info()
+    except JobNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+
+# Prometheus metrics
+@app.get("/metrics")
+def prometheus_metrics():
+    """Phase latencies, cache, upstream and token counters in Prometheus text format."""
+    return Response(content=metrics.render_metrics(), media_type=metrics.CONTENT_TYPE)
+
+# Token usage accounting state
+@app.get("/usage/stats")
+def usage_stats():
+    """Buffered, written and spilled token usage records."""
+    return get_usage_writer().stats()
+
+# Upstream governor state
+@app.get("/upstreams")
+def upstream_state():
+    """Rate limiter, retry and circuit breaker state per upstream provider."""
+    return get_governor().snapshot()
+
+# LLM backend routing state
+@app.get("/llm/backends")
+def llm_backends():
+    """Latency, error rate and circuit state per LLM backend, plus hedge and failover counts."""
+    return get_llm_router().snapshot()
+
+# Cache statistics
+@app.get("/cache/stats")
+def cache_stats():
+    """Hit/miss counters for the marketing agent caches (empty until the agent has loaded)."""
+    spec = discover().get("marketing")
+    return spec.entry["module"].get_cache_stats() if spec is not None and spec.loaded else {}
+
+@app.get("/prewarm")
+def prewarm_schedule():
+    """Pre-warm windows, budget, hit rate and the most requested analyses."""
+    return {"enabled": PREWARM_ENABLED, **get_prewarm_scheduler().snapshot()}
+
+@app.post("/prewarm/run")
+async def run_prewarm():
+    """Refresh the due analyses now, inside the current window budget."""
+    return await get_prewarm_scheduler().run_once(force=True)
+
 # Health check endpoint
 @app.get("/health")
 def health_check():
     """Health check endpoint to verify the API is running."""
-    return {"status": "healthy", "version": app.version, "agents": len(AVAILABLE_AGENTS)}
+    return {"status": "healthy", "version": app.version, "agents": len(discover())}
+
+# Warm up the agents listed in AGENT_WARMUP without delaying startup
+@app.on_event("startup")
+async def start_agent_warmup():
+    """Load the configured agents in the background."""
+    agent_ids = warmup_agent_ids()
+    if agent_ids is None or agent_ids:
+        app.state.agent_warmup = asyncio.create_task(awarm_up(agent_ids))
+
+# Start and stop the background job workers with the app
+@app.on_event("startup")
+async def start_job_queue():
+    """Start the job workers."""
+    await get_job_queue().start()
+
+@app.on_event("shutdown")
+async def stop_job_queue():
+    """Cancel running jobs and stop the workers."""
+    await get_job_queue().stop()
+
+# Refresh popular analyses off-peak when PREWARM_ENABLED=1
+@app.on_event("startup")
+async def start_prewarm_scheduler():
+    """Start the pre-warm scheduler."""
+    if PREWARM_ENABLED:
+        await get_prewarm_scheduler().start()
+
+@app.on_event("shutdown")
+async def stop_prewarm_scheduler():
+    """Stop the pre-warm scheduler."""
+    await get_prewarm_scheduler().stop()
+
+# Flush token usage records in the background
+@app.on_event("startup")
+async def start_usage_writer():
+    """Start the usage flush task."""
+    await get_usage_writer().start()
+
+@app.on_event("shutdown")
+async def stop_usage_writer():
+    """Flush remaining usage records."""
+    await get_usage_writer().stop()
+
+# Stop the thread pools of synchronous agents
+@app.on_event("shutdown")
+async def stop_agent_pools():
+    """Shut down per-agent executors."""
+    shutdown_agent_pools()
+
+# Release pooled upstream connections on shutdown
+@app.on_event("shutdown")
+async def close_http_client():
+    """Close the shared HTTP client."""
+    await http_client.aclose()
 
 # Home page
 @app.get("/", response_class=HTMLResponse)
@@ -124,7 +595,7 @@ if __name__ == "__main__":
     port = int(os.environ.get("PORT", 8000))
     
     print(f"Starting Productivity Engines API on {host}:{port}")
-    print(f"Available agents: {len(AVAILABLE_AGENTS)}")
+    print(f"Available agents: {len(discover())}")
     for agent in get_agent_info():
         print(f"  - {agent['name']} (v{agent['version']})")
     
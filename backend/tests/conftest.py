@@ -0,0 +1,132 @@
+"""
+Shared fixtures for the backend tests.
+
+The agents are imported the way adaptor.py imports them (backend/ on
+sys.path). Settings the agent modules read from the environment at import
+time are pinned here, before any of them is imported: upstream calls go to
+the stand-in servers of benchmark/fake_upstreams.py, and every store, cache
+and spill file lives in a temporary directory, so tests never touch real
+APIs or the developer's databases.
+"""
+
+import os
+import sys
+import socket
+import tempfile
+import threading
+import time
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ROOT_DIR = os.path.dirname(BACKEND_DIR)  # run.py and analyze.py
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.join(BACKEND_DIR, "benchmark"))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+UPSTREAM_PORT = free_port()
+DATA_DIR = tempfile.mkdtemp(prefix="agents-tests-")
+
+os.environ.update({
+    "OPENAI_API_KEY": "sk-test",
+    "TAVILY_API_KEY": "test",
+    "TAVILY_BASE_URL": f"http://127.0.0.1:{UPSTREAM_PORT}",
+    "OPENAI_BASE_URL": f"http://127.0.0.1:{UPSTREAM_PORT}/v1",
+    "TAVILY_RATE_LIMIT": "100000",
+    "TAVILY_BURST": "100000",
+    "OPENAI_RATE_LIMIT": "100000",
+    "OPENAI_BURST": "100000",
+    "RESULT_STORE": "memory",
+    "RESULT_STORE_PATH": os.path.join(DATA_DIR, "analysis-results.db"),
+    "SEARCH_CACHE_PATH": os.path.join(DATA_DIR, "search-cache.db"),
+    "COMPLETION_CACHE_PATH": os.path.join(DATA_DIR, "completion-cache.db"),
+    "CRAWL_CACHE_PATH": "",
+    "SESSION_STORE_PATH": "",
+    "USAGE_DATABASE_URL": "",
+    "USAGE_SQLITE_PATH": "",
+    "USAGE_SPILL_PATH": os.path.join(DATA_DIR, "usage-spill.jsonl"),
+    "CRAWL_ENABLED": "0",
+    "PREWARM_ENABLED": "0",
+    "AGENT_WARMUP": "",
+})
+
+
+class ServerThread:
+    """Serve an ASGI app with uvicorn on a background thread."""
+
+    def __init__(self, app, port: int):
+        import uvicorn
+
+        config = uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning")
+        self.server = uvicorn.Server(config)
+        self.server.install_signal_handlers = lambda: None
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        deadline = time.monotonic() + 10
+        while not self.server.started:
+            if time.monotonic() > deadline:
+                raise RuntimeError("test server did not start")
+            time.sleep(0.02)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join(timeout=5)
+
+
+@pytest.fixture(scope="session")
+def upstream_server():
+    """The stand-in Tavily and OpenAI servers, shared by the whole session."""
+    from fake_upstreams import FakeSettings, create_app
+
+    settings = FakeSettings(
+        search_latency=0, completion_latency=0, jitter=0, tokens_per_second=0, completion_tokens=60
+    )
+    app = create_app(settings)
+    with ServerThread(app, UPSTREAM_PORT):
+        yield app, settings
+
+
+@pytest.fixture
+def upstreams(upstream_server):
+    """
+    The stand-in upstreams with fast default behaviour; tests may change the
+    returned FakeSettings, which are restored afterwards. app.state.calls
+    counts the calls made.
+    """
+    app, settings = upstream_server
+    saved = dict(vars(settings))
+    for name in app.state.calls:
+        app.state.calls[name] = 0
+    yield app
+    vars(settings).update(saved)
+
+
+@pytest.fixture
+def fake_settings(upstream_server):
+    return upstream_server[1]
+
+
+@pytest.fixture
+def marketing(upstreams):
+    """The initialized marketing agent with empty caches, flights and result store."""
+    from agents import get_agent, marketing as module
+    from agents import results
+    from agents.cache import MemoryCache
+
+    get_agent("marketing")
+    module.set_search_cache(MemoryCache())
+    module.set_completion_cache(MemoryCache())
+    results.set_result_store(results.MemoryResultStore())
+    yield module
+    module.set_search_cache(MemoryCache())
+    module.set_completion_cache(MemoryCache())
@@ -0,0 +1,128 @@
+import json
+import asyncio
+
+import pytest
+
+import analyze
+from analyze import BulkRun, Meter, Progress, load_checkpoint, read_rows, recover_output, save_checkpoint
+
+
+def write_input(tmp_path, rows):
+    path = tmp_path / "businesses.jsonl"
+    path.write_text("".join(
+        json.dumps({"id": f"b{i}", "business_name": f"Business {i}", "website_url": f"https://b{i}.example"}) + "\n"
+        for i in range(rows)
+    ))
+    return str(path)
+
+
+def output_rows(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_csv_rows_leave_out_empty_cells(tmp_path):
+    path = tmp_path / "businesses.csv"
+    path.write_text("﻿id,business_name,website_url,model\n1,Acme,https://acme.example,\n", encoding="utf-8")
+
+    assert list(read_rows(str(path), "csv")) == [
+        (0, {"id": "1", "business_name": "Acme", "website_url": "https://acme.example"})
+    ]
+    assert analyze.count_rows(str(path), "csv") == 1
+
+
+def test_bad_jsonl_lines_become_row_errors(tmp_path):
+    path = tmp_path / "businesses.jsonl"
+    path.write_text('{"id": 1}\n\nnot json\n[1, 2]\n')
+
+    rows = list(read_rows(str(path), "jsonl"))
+
+    assert [row for row, _ in rows] == [0, 1, 2]
+    assert rows[0][1] == {"id": 1}
+    assert rows[1][1].startswith("Invalid JSON")
+    assert rows[2][1] == "Expected a JSON object, got list"
+
+
+def test_progress_keeps_a_watermark_of_finished_rows():
+    progress = Progress()
+    for row, ok in ((1, True), (2, False), (0, True), (2, True)):
+        progress.add(row, ok)
+
+    assert progress.next_row == 3 and progress.done == set()
+    assert (progress.ok, progress.errors) == (2, 1)
+    progress.add(5, True)
+    assert progress.is_done(5) and not progress.is_done(4)
+
+
+def test_recovery_reads_past_the_checkpoint_and_cuts_a_torn_line(tmp_path):
+    input_path = write_input(tmp_path, 5)
+    output_path = tmp_path / "results.jsonl"
+    checkpoint_path = str(tmp_path / "results.jsonl.checkpoint")
+
+    with open(output_path, "ab") as output:
+        output.write(b'{"row": 0, "status": "ok"}\n')
+        progress = Progress()
+        progress.add(0, True)
+        save_checkpoint(checkpoint_path, input_path, progress, output)
+        output.write(b'{"row": 2, "status": "error"}\n{"row": 1, "sta')
+
+    progress, offset = load_checkpoint(checkpoint_path, input_path)
+    recover_output(str(output_path), offset, progress)
+
+    assert progress.next_row == 1 and progress.done == {2}
+    assert (progress.ok, progress.errors) == (1, 1)
+    assert output_path.read_bytes().endswith(b'"status": "error"}\n')
+
+
+def test_changed_input_refuses_to_resume(tmp_path):
+    input_path = write_input(tmp_path, 2)
+    checkpoint_path = str(tmp_path / "checkpoint")
+    with open(tmp_path / "results.jsonl", "ab") as output:
+        save_checkpoint(checkpoint_path, input_path, Progress(), output)
+    write_input(tmp_path, 3)
+
+    with pytest.raises(SystemExit):
+        load_checkpoint(checkpoint_path, input_path)
+
+
+def test_interrupted_run_resumes_with_every_row_once(tmp_path, marketing, fake_settings):
+    rows = 12
+    input_path = write_input(tmp_path, rows)
+    output_path = str(tmp_path / "results.jsonl")
+    options = analyze.parse_args([
+        input_path, "-o", output_path, "--concurrency", "3", "--retries", "0",
+        "--progress-interval", "0.05", "--checkpoint-interval", "0",
+    ])
+    checkpoint_path = output_path + ".checkpoint"
+    fake_settings.completion_latency = 0.05
+
+    async def interrupted():
+        progress, _ = load_checkpoint(checkpoint_path, input_path)
+        with open(output_path, "ab") as output:
+            run = BulkRun(options, progress, output, checkpoint_path)
+
+            async def press_ctrl_c():
+                while progress.completed < 4:
+                    await asyncio.sleep(0.01)
+                run.interrupt()
+                run.interrupt()
+
+            asyncio.ensure_future(press_ctrl_c())
+            finished = await run.run(Meter(rows, progress))
+        return finished, progress.completed
+
+    finished, completed = asyncio.run(interrupted())
+    assert not finished
+    assert 4 <= completed < rows
+
+    # A crash mid-write leaves a torn line behind
+    with open(output_path, "ab") as output:
+        output.write(b'{"row": 11, "status"')
+
+    fake_settings.completion_latency = 0
+    assert asyncio.run(analyze.amain(options)) == 0
+
+    results = output_rows(output_path)
+    assert sorted(result["row"] for result in results) == list(range(rows))
+    assert all(result["status"] == "ok" for result in results)
+    assert {result["id"] for result in results} == {f"b{i}" for i in range(rows)}
@@ -0,0 +1,52 @@
+import time
+import asyncio
+
+from agents import http_client
+
+
+def test_one_pooled_client_per_event_loop():
+    async def clients():
+        return http_client.get_http_client(), http_client.get_http_client()
+
+    first, again = asyncio.run(clients())
+    assert first is again
+
+    other, _ = asyncio.run(clients())
+    assert other is not first
+
+
+def test_run_sync_keeps_its_client_between_calls():
+    async def client():
+        return http_client.get_http_client()
+
+    assert http_client.run_sync(client()) is http_client.run_sync(client())
+
+
+def test_concurrent_analyses_overlap(marketing, upstreams, fake_settings):
+    fake_settings.search_latency = 0.3
+    fake_settings.completion_latency = 0.3
+
+    async def analyze(n):
+        return await marketing.arun_analysis(marketing.MarketingAgentRequest(
+            business_name=f"Business {n}", website_url=f"https://business{n}.example", crawl_website=False
+        ))
+
+    async def scenario():
+        started = time.perf_counter()
+        responses = await asyncio.gather(*(analyze(n) for n in range(5)))
+        return responses, time.perf_counter() - started
+
+    responses, elapsed = asyncio.run(scenario())
+
+    assert all(response.analysis and not response.error for response in responses)
+    # Run one after another, 5 analyses would take at least 5 * (0.3 + 0.3) seconds
+    assert elapsed < 2.0
+    assert upstreams.state.calls["completion"] == 5
+
+
+def test_sync_wrapper_runs_the_async_agent(marketing, upstreams):
+    response = marketing.run_analysis(marketing.MarketingAgentRequest(
+        business_name="Acme Bakery", website_url="https://acme.example"
+    ))
+    assert response.analysis and not response.error
+    assert response.search_cache_status == marketing.CACHE_MISS
@@ -0,0 +1,82 @@
+import asyncio
+
+import httpx
+import pytest
+
+import run_benchmark
+from run_benchmark import compare, generate_load, percentile, summarize
+
+from conftest import UPSTREAM_PORT, ServerThread, free_port
+
+UPSTREAM_URL = f"http://127.0.0.1:{UPSTREAM_PORT}"
+
+
+def sample(latency, error=None, status=200, first_token=None):
+    return {"start": 0, "latency": latency, "error": error, "status": status, "first_token": first_token}
+
+
+def test_percentiles_use_the_nearest_rank():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile(list(range(1, 11)), 95) == 10
+    assert percentile([3.0], 95) == 3.0
+    assert percentile([], 50) is None
+
+
+def test_summary_counts_errors_and_their_kinds():
+    samples = [sample(0.1), sample(0.2), sample(0.9, error="HTTP 429", status=429), sample(5, error="ReadTimeout: x")]
+
+    summary = summarize(samples, elapsed=2.0)
+
+    assert (summary["requests"], summary["succeeded"], summary["errors"]) == (4, 2, 2)
+    assert summary["throughput_rps"] == 1.0
+    assert summary["latency"]["max"] == 0.2
+    assert summary["status_counts"] == {"200": 3, "429": 1}
+    assert summary["error_kinds"] == {"HTTP 429": 1, "ReadTimeout": 1}
+
+
+def test_regressions_against_a_baseline_are_reported():
+    baseline = {"latency": {"p50": 1.0, "p95": 2.0, "p99": 3.0}, "throughput_rps": 10.0, "error_rate": 0.0}
+    same = dict(baseline)
+    slower = {"latency": {"p50": 1.0, "p95": 2.5, "p99": 3.0}, "throughput_rps": 8.0, "error_rate": 0.05}
+
+    assert compare(same, baseline, 0.15) == []
+    assert compare(slower, baseline, 0.15) == [
+        "latency.p95 changed +25.0%", "throughput_rps changed -20.0%", "error_rate rose by 5.00%",
+    ]
+
+
+def test_stand_in_upstreams_inject_errors_and_stream_tokens(upstreams, fake_settings):
+    fake_settings.error_rate = 1
+    response = httpx.post(f"{UPSTREAM_URL}/search", json={"query": "acme"})
+    assert response.status_code in (429, 503)
+    assert upstreams.state.calls["errors"] == 1
+
+    fake_settings.error_rate = 0
+    fake_settings.completion_tokens = 8
+    body = {"model": "gpt-4o-mini", "messages": [{"role": "user", "content": "hi"}], "stream": True}
+    with httpx.stream("POST", f"{UPSTREAM_URL}/v1/chat/completions", json=body) as response:
+        events = [line for line in response.iter_lines() if line.startswith("data: ")]
+    assert events[-1] == "data: [DONE]"
+    assert len(events) == 1 + 4 + 1 + 1  # role, one event per token, stop, done
+    assert upstreams.state.calls["stream"] == 1
+
+
+@pytest.mark.parametrize("mode, endpoint", [("concurrency", "/run_agent"), ("rps", "/run_agent/stream")])
+def test_load_generation_against_the_app(marketing, mode, endpoint):
+    import adaptor
+
+    args = run_benchmark.parse_args([
+        "--mode", mode, "--endpoint", endpoint, "--duration", "0.5",
+        "--concurrency", "4", "--rps", "10", "--warmup", "1", "--distinct", "3",
+    ])
+    port = free_port()
+    with ServerThread(adaptor.app, port):
+        results = asyncio.run(generate_load(args, f"http://127.0.0.1:{port}"))
+
+    assert results["requests"] >= 4
+    assert results["errors"] == 0, results["error_examples"]
+    assert results["latency"]["p50"] > 0
+    if endpoint.endswith("/stream"):
+        assert results["first_token"] is not None
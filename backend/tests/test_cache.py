@@ -0,0 +1,115 @@
+import time
+import sqlite3
+import threading
+
+from agents.cache import MemoryCache, SQLiteCache, TieredCache, build_cache, make_cache_key
+
+
+def rows(path, table="cache"):
+    with sqlite3.connect(path) as conn:
+        return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+def test_cache_key_ignores_parameter_order():
+    assert make_cache_key("t", {"a": 1, "b": 2}) == make_cache_key("t", {"b": 2, "a": 1})
+    assert make_cache_key("t", {"a": 1}) != make_cache_key("u", {"a": 1})
+
+
+def test_memory_cache_expires_and_evicts():
+    cache = MemoryCache(max_entries=2, default_ttl=0.05)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None  # least recently used
+    assert cache.get("a") == 1
+    time.sleep(0.06)
+    assert cache.get("a") is None
+
+
+def test_sqlite_writes_happen_off_the_calling_thread(tmp_path, monkeypatch):
+    cache = SQLiteCache(str(tmp_path / "cache.db"))
+    writers = set()
+    apply = cache._apply
+
+    def tracked(conn, ops):
+        writers.add(threading.get_ident())
+        apply(conn, ops)
+
+    monkeypatch.setattr(cache, "_apply", tracked)
+    cache.set("key", {"value": 1})
+    # Readable right away, before the writer got to it
+    assert cache.get("key") == {"value": 1}
+    cache.flush()
+
+    assert writers and threading.get_ident() not in writers
+    assert rows(cache.path) == 1
+
+
+def test_sqlite_entries_survive_a_restart(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = SQLiteCache(path, default_ttl=None)
+    cache.set("key", [1, 2, 3])
+    cache.flush()
+
+    reopened = SQLiteCache(path)
+    value, ttl = reopened.get_with_ttl("key")
+    assert value == [1, 2, 3] and ttl is None
+    assert reopened.stats()["entries"] == 1
+
+
+def test_sqlite_entry_count_tracks_writes_without_counting(tmp_path):
+    cache = SQLiteCache(str(tmp_path / "cache.db"), max_entries=5)
+    for i in range(8):
+        cache.set(f"key{i}", i)
+    cache.set("key7", "replaced")
+    cache.flush()
+
+    assert cache.stats()["entries"] == rows(cache.path) == 5
+    assert cache.evictions == 3
+    # The least recently written entries went first
+    assert cache.get("key0") is None and cache.get("key7") == "replaced"
+
+    cache.delete("key7")
+    assert cache.stats()["entries"] == rows(cache.path) == 4
+    cache.clear()
+    assert cache.stats()["entries"] == rows(cache.path) == 0
+
+
+def test_sqlite_expired_entries_are_purged(tmp_path):
+    cache = SQLiteCache(str(tmp_path / "cache.db"))
+    cache.set("short", 1, ttl=0.05)
+    cache.set("long", 2, ttl=60)
+    cache.flush()
+    time.sleep(0.06)
+
+    assert cache.get("short") is None
+    cache.set("other", 3)
+    cache.flush()
+    assert cache.stats()["entries"] == rows(cache.path) == 2
+
+
+def test_tiered_cache_promotes_persistent_hits(tmp_path):
+    path = str(tmp_path / "cache.db")
+    first = build_cache(path=path, default_ttl=60)
+    first.set("key", "value")
+    first.persistent.flush()
+
+    second = build_cache(path=path, default_ttl=60)
+    assert isinstance(second, TieredCache)
+    assert second.default_ttl == 60
+    assert second.get("key") == "value"
+    assert second.memory.get("key") == "value"
+
+
+def test_completion_cache_persists_by_default(tmp_path, monkeypatch):
+    from agents import marketing
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv("COMPLETION_CACHE_PATH", raising=False)
+    cache = marketing.build_completion_cache()
+    assert isinstance(cache, TieredCache)
+    assert cache.persistent.path == "completion-cache.db"
+
+    monkeypatch.setenv("COMPLETION_CACHE_PATH", "")
+    assert isinstance(marketing.build_completion_cache(), MemoryCache)
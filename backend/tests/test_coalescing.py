@@ -0,0 +1,73 @@
+import uuid
+import asyncio
+
+from agents import results
+
+
+def request(marketing, **fields):
+    values = dict(business_name="Acme Bakery", website_url="https://acme.example", temperature=0)
+    values.update(fields)
+    return marketing.MarketingAgentRequest(**values)
+
+
+def test_concurrent_identical_requests_share_one_run(marketing, upstreams, fake_settings):
+    fake_settings.completion_latency = 0.2
+
+    async def scenario():
+        return await asyncio.gather(*(marketing.arun_analysis(request(marketing)) for _ in range(4)))
+
+    responses = asyncio.run(scenario())
+
+    assert all(not response.error for response in responses)
+    assert sorted(response.coalesced for response in responses) == [False, True, True, True]
+    assert upstreams.state.calls["completion"] == 1
+    assert len({response.analysis for response in responses}) == 1
+
+
+def test_requests_of_different_owners_are_not_coalesced(marketing, upstreams, fake_settings):
+    fake_settings.completion_latency = 0.2
+    owners = [str(uuid.uuid4()), str(uuid.uuid4())]
+
+    async def scenario():
+        return await asyncio.gather(*(marketing.arun_analysis(request(marketing, user_id=owner)) for owner in owners))
+
+    responses = asyncio.run(scenario())
+
+    assert not any(response.coalesced for response in responses)
+    # Each owner's run is stored under that owner
+    stored = [results.get_result_store().get(response.result_id) for response in responses]
+    assert [result.user_id for result in stored] == owners
+
+
+def test_fingerprint_covers_owner_storage_and_debug(marketing):
+    base = marketing.request_fingerprint(request(marketing))
+
+    assert marketing.request_fingerprint(request(marketing, business_name="  ACME   bakery ")) == base
+    assert marketing.request_fingerprint(request(marketing, website_url="http://www.acme.example/")) == base
+    for change in (
+        {"user_id": str(uuid.uuid4())},
+        {"company_id": str(uuid.uuid4())},
+        {"store_result": False},
+        {"debug": True},
+        {"model": "gpt-4o-mini"},
+        {"deadline": 5},
+    ):
+        assert marketing.request_fingerprint(request(marketing, **change)) != base, change
+
+
+def test_batch_analyzes_identical_requests_once(marketing, upstreams):
+    batch = marketing.MarketingBatchRequest(requests=[
+        request(marketing),
+        request(marketing, business_name="Other Shop", website_url="https://other.example"),
+        request(marketing, business_name="acme bakery", website_url="acme.example/"),
+        request(marketing, debug=True),
+    ])
+
+    result = asyncio.run(marketing.arun_batch(batch))
+
+    assert result.unique_requests == 3
+    assert [item.duplicate_of for item in result.results] == [None, None, 0, None]
+    assert result.results[2].response.analysis == result.results[0].response.analysis
+    assert result.results[3].response.debug is not None
+    assert result.results[0].response.debug is None
+    assert result.errors == 0
@@ -0,0 +1,77 @@
+import gzip
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from agents import crawler
+from agents.cache import MemoryCache
+
+HOMEPAGE = b"""<html><head><title>Gzip Bakery</title>
+<meta name="description" content="Fresh bread every morning"></head>
+<body><nav><a href="/about">About us</a></nav>
+<p>Fresh sourdough baked daily in small batches.</p></body></html>"""
+
+ABOUT = b"""<html><head><title>About Gzip Bakery</title></head>
+<body><p>Family owned since 1987.</p></body></html>"""
+
+# Highly compressible, so its decoded size is far above its gzip size
+LARGE = b"<html><head><title>Large</title></head><body>" + b"<p>filler text line</p>\n" * 40000 + b"</body></html>"
+
+
+class SiteHandler(BaseHTTPRequestHandler):
+    pages = {"/": HOMEPAGE, "/about": ABOUT, "/large": LARGE}
+
+    def do_GET(self):
+        body = self.pages.get(self.path)
+        if body is None:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        encoded = gzip.compress(body)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(encoded)))
+        self.end_headers()
+        self.wfile.write(encoded)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def gzip_site(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SiteHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(crawler, "CRAWL_ALLOW_PRIVATE", True)
+    crawler.set_crawl_cache(MemoryCache())
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_gzip_encoded_pages_are_decoded(gzip_site):
+    report = asyncio.run(crawler.acrawl_site(gzip_site + "/", max_pages=2))
+
+    assert not report["errors"]
+    home, about = report["pages"]
+    assert home["title"] == "Gzip Bakery"
+    assert home["description"] == "Fresh bread every morning"
+    assert "Fresh sourdough baked daily" in home["text"]
+    assert about["title"] == "About Gzip Bakery"
+    assert "Family owned since 1987." in about["text"]
+
+
+def test_page_cap_applies_to_decoded_bytes(gzip_site, monkeypatch):
+    monkeypatch.setattr(crawler, "CRAWL_MAX_PAGE_BYTES", 4096)
+    monkeypatch.setattr(crawler, "CRAWL_MAX_PAGE_CHARS", 10 ** 6)
+
+    report = asyncio.run(crawler.acrawl_site(gzip_site + "/large", max_pages=1))
+
+    page = report["pages"][0]
+    assert page["title"] == "Large"
+    assert "filler text line" in page["text"]
+    assert report["bytes"] <= 4096
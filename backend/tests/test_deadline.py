@@ -0,0 +1,132 @@
+import time
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from agents import deadline as deadline_module
+from agents.deadline import (
+    DEGRADED_BRIEF,
+    DEGRADED_PARTIAL,
+    DEGRADED_SEARCH,
+    Deadline,
+    DeadlineExceeded,
+    parse_deadline_header,
+    resolve_budget,
+    until,
+)
+
+
+def test_budgets_default_and_are_capped(monkeypatch):
+    monkeypatch.setattr(deadline_module, "REQUEST_DEADLINE", 0)
+    monkeypatch.setattr(deadline_module, "REQUEST_DEADLINE_MAX", 30)
+    assert resolve_budget(None) is None
+    assert resolve_budget(10) == 10
+    assert resolve_budget(600) == 30
+
+    monkeypatch.setattr(deadline_module, "REQUEST_DEADLINE", 20)
+    assert resolve_budget(None) == 20
+
+
+def test_header_values_must_be_positive_seconds():
+    assert parse_deadline_header(None) is None
+    assert parse_deadline_header(" ") is None
+    assert parse_deadline_header("2.5") == 2.5
+    for value in ("0", "-1", "soon", "nan"):
+        with pytest.raises(ValueError):
+            parse_deadline_header(value)
+
+
+def test_deadline_keeps_a_reserve_and_shares_its_budget():
+    deadline = Deadline(2, reserve=0.25)
+
+    assert deadline.reserve == 0.25
+    assert 1.7 < deadline.remaining() <= 1.75
+    assert deadline.share(0.4) == pytest.approx(0.8)
+    assert Deadline(0.4, reserve=0.25).reserve == 0.1
+
+
+def test_until_cuts_a_slow_iterator_off_and_closes_it():
+    closed = []
+
+    async def ticks():
+        try:
+            while True:
+                await asyncio.sleep(0.02)
+                yield "tick"
+        finally:
+            closed.append(True)
+
+    async def collect():
+        received = []
+        with pytest.raises(DeadlineExceeded):
+            async for item in until(ticks(), Deadline(0.2, reserve=0)):
+                received.append(item)
+        return received
+
+    start = time.monotonic()
+    received = asyncio.run(collect())
+    assert time.monotonic() - start < 0.5
+    assert 3 <= len(received) <= 10
+    assert closed == [True]
+
+
+def test_little_time_left_asks_for_a_brief_answer(marketing):
+    prompt, max_tokens, degraded = marketing.fit_to_deadline("Analyze Acme", 1500, Deadline(5, reserve=0))
+
+    assert max_tokens < 1500
+    assert degraded == [DEGRADED_BRIEF]
+    assert prompt.startswith("Analyze Acme") and len(prompt) > len("Analyze Acme")
+    assert marketing.fit_to_deadline("Analyze Acme", 1500, None) == ("Analyze Acme", 1500, [])
+
+
+def analyze(marketing, seconds):
+    request = marketing.MarketingAgentRequest(
+        business_name="Acme Bakery", website_url="https://acme.example", deadline=seconds, use_cache=True
+    )
+    return asyncio.run(marketing.arun_analysis(request))
+
+
+def test_slow_searches_are_left_behind(marketing, fake_settings):
+    fake_settings.search_latency = 2
+
+    start = time.monotonic()
+    response = analyze(marketing, 2)
+
+    assert time.monotonic() - start < 2
+    assert DEGRADED_SEARCH in response.degraded
+    assert response.analysis and not response.partial
+
+
+def test_slow_completion_is_returned_partial(marketing, upstreams, fake_settings):
+    fake_settings.tokens_per_second = 20  # 60 tokens take 3 seconds
+
+    start = time.monotonic()
+    response = analyze(marketing, 1)
+
+    assert time.monotonic() - start < 1.5
+    assert response.partial
+    assert DEGRADED_PARTIAL in response.degraded
+    assert response.analysis.startswith("## BUSINESS OVERVIEW")
+
+    # Partial answers are not cached
+    fake_settings.tokens_per_second = 0
+    response = analyze(marketing, 10)
+    assert response.completion_cache_status == "miss"
+    assert not response.partial
+
+
+def test_deadline_header_is_validated_and_applied(marketing, fake_settings):
+    import adaptor
+
+    client = TestClient(adaptor.app)
+    body = {"business_name": "Acme Bakery", "website_url": "https://acme.example"}
+
+    response = client.post("/run_agent", json=body, headers={"X-Request-Deadline": "soon"})
+    assert response.status_code == 400
+    assert "X-Request-Deadline" in response.json()["detail"]
+
+    fake_settings.tokens_per_second = 20
+    response = client.post("/run_agent", json={**body, "deadline": 60}, headers={"X-Request-Deadline": "1"})
+    assert response.status_code == 200
+    assert response.json()["partial"]
@@ -0,0 +1,134 @@
+import asyncio
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+from pydantic import BaseModel
+
+from agents import executor
+from agents.executor import AgentBusyError, AgentPool, AgentTimeoutError
+
+
+class Nap(BaseModel):
+    seconds: float = 0.05
+
+
+def make_runner():
+    state = {"running": 0, "peak": 0}
+
+    async def runner(request: Nap):
+        state["running"] += 1
+        state["peak"] = max(state["peak"], state["running"])
+        try:
+            await asyncio.sleep(request.seconds)
+        finally:
+            state["running"] -= 1
+        return request
+
+    return runner, state
+
+
+def test_pool_limits_concurrent_runs():
+    pool = AgentPool("test", max_concurrency=2, max_queue=10, timeout=None)
+    runner, state = make_runner()
+
+    async def scenario():
+        await asyncio.gather(*(pool.run(runner, Nap()) for _ in range(6)))
+
+    asyncio.run(scenario())
+    assert state["peak"] == 2
+    stats = pool.stats()
+    assert stats["completed"] == 6
+    assert stats["queue_wait"]["p95"] > 0.05
+    assert (stats["running"], stats["queue_depth"]) == (0, 0)
+
+
+def test_pool_rejects_when_the_queue_is_full():
+    pool = AgentPool("test", max_concurrency=1, max_queue=1, timeout=None)
+    runner, _ = make_runner()
+
+    async def scenario():
+        return await asyncio.gather(*(pool.run(runner, Nap()) for _ in range(3)), return_exceptions=True)
+
+    outcomes = asyncio.run(scenario())
+    assert sum(isinstance(outcome, AgentBusyError) for outcome in outcomes) == 1
+    assert pool.rejected == 1 and pool.completed == 2
+
+
+def test_pool_cancels_runs_over_the_timeout():
+    pool = AgentPool("test", max_concurrency=1, max_queue=1, timeout=0.05)
+    runner, state = make_runner()
+
+    with pytest.raises(AgentTimeoutError):
+        asyncio.run(pool.run(runner, Nap(seconds=1)))
+    assert pool.timeouts == 1 and pool.failed == 1
+    assert state["running"] == 0
+
+
+def test_sync_runners_use_the_agent_thread_pool():
+    pool = AgentPool("sync", max_concurrency=2, max_queue=10, timeout=None)
+
+    def runner(request):
+        return threading.current_thread().name
+
+    name = asyncio.run(pool.run(runner, Nap()))
+    assert name.startswith("agent-sync")
+    pool.executor().shutdown()
+
+
+def test_pool_stats_use_nearest_rank_percentiles():
+    pool = AgentPool("test", max_concurrency=1, max_queue=1, timeout=None)
+    pool._latencies.extend(float(value) for value in range(100, 0, -1))
+    pool._waits.extend(float(value) for value in range(1, 11))
+
+    stats = pool.stats()
+    assert stats["latency"] == {"p50": 50.0, "p95": 95.0, "max": 100.0}
+    assert stats["queue_wait"] == {"p50": 5.0, "p95": 10.0}
+    assert executor.percentile([0.123456], 99) == 0.1235
+    assert executor.percentile([], 50) is None
+
+
+def test_pool_settings_come_from_the_environment_first(monkeypatch):
+    monkeypatch.setenv("AGENT_ECHO_MAX_QUEUE", "7")
+
+    assert executor._setting("echo", "MAX_QUEUE", 3, 100, int) == 7
+    assert executor._setting("echo", "TIMEOUT", 30, 120.0, float) == 30.0
+    assert executor._setting("echo", "MAX_CONCURRENCY", None, 16, int) == 16
+
+
+@pytest.fixture
+def client(marketing):
+    import adaptor
+
+    return TestClient(adaptor.app)
+
+
+def test_generic_run_endpoint_validates_and_runs(client):
+    response = client.post("/agents/marketing/run", json={
+        "business_name": "Acme Bakery", "website_url": "https://acme.example",
+    })
+    assert response.status_code == 200
+    assert response.json()["analysis"]
+
+    assert client.post("/agents/marketing/run", json={"website_url": "x"}).status_code == 422
+    assert client.post("/agents/missing/run", json={}).status_code == 404
+
+    stats = client.get("/agents/stats").json()["marketing"]["pool"]
+    assert stats["completed"] >= 1
+
+
+def test_full_pool_rejects_payload_runs(marketing, monkeypatch):
+    pool = AgentPool("marketing", max_concurrency=1, max_queue=0, timeout=None)
+    monkeypatch.setitem(executor._pools, "marketing", pool)
+
+    async def hold():
+        semaphore = pool._semaphore()
+        await semaphore.acquire()
+        try:
+            with pytest.raises(AgentBusyError):
+                await executor.arun_agent_payload("marketing", {"business_name": "Acme", "website_url": "x"})
+        finally:
+            semaphore.release()
+
+    asyncio.run(hold())
+    assert pool.rejected == 1
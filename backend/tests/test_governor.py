@@ -0,0 +1,182 @@
+import asyncio
+
+import pytest
+
+from agents.governor import (
+    CIRCUIT_CLOSED,
+    CIRCUIT_HALF_OPEN,
+    CIRCUIT_OPEN,
+    CircuitOpenError,
+    ProviderLimits,
+    UpstreamError,
+    UpstreamGovernor,
+)
+
+
+def make_governor(**overrides) -> UpstreamGovernor:
+    settings = dict(rate=1000, burst=1000, max_retries=0, failure_threshold=2, reset_timeout=0.05)
+    settings.update(overrides)
+    return UpstreamGovernor({"test": ProviderLimits(**settings)})
+
+
+async def fail():
+    raise UpstreamError("upstream unavailable", status_code=503)
+
+
+async def succeed():
+    return "ok"
+
+
+async def bad_request():
+    raise UpstreamError("bad request", status_code=400)
+
+
+async def open_circuit(governor: UpstreamGovernor):
+    for _ in range(2):
+        with pytest.raises(UpstreamError):
+            await governor.call("test", fail)
+    assert governor.circuit_state("test") == CIRCUIT_OPEN
+
+
+def test_breaker_opens_rejects_and_recovers():
+    async def scenario():
+        governor = make_governor()
+        await open_circuit(governor)
+
+        calls = []
+
+        async def tracked():
+            calls.append(1)
+            return "ok"
+
+        with pytest.raises(CircuitOpenError):
+            await governor.call("test", tracked)
+        assert not calls
+
+        await asyncio.sleep(0.06)
+        assert await governor.call("test", tracked) == "ok"
+        assert governor.circuit_state("test") == CIRCUIT_CLOSED
+
+    asyncio.run(scenario())
+
+
+def test_failed_probe_reopens_the_circuit():
+    async def scenario():
+        governor = make_governor()
+        await open_circuit(governor)
+        await asyncio.sleep(0.06)
+
+        with pytest.raises(UpstreamError):
+            await governor.call("test", fail)
+        assert governor.circuit_state("test") == CIRCUIT_OPEN
+
+    asyncio.run(scenario())
+
+
+def test_only_one_probe_while_half_open():
+    async def scenario():
+        governor = make_governor()
+        await open_circuit(governor)
+        await asyncio.sleep(0.06)
+
+        release = asyncio.Event()
+
+        async def slow():
+            await release.wait()
+            return "ok"
+
+        probe = asyncio.create_task(governor.call("test", slow))
+        await asyncio.sleep(0)
+        assert governor.circuit_state("test") == CIRCUIT_HALF_OPEN
+        with pytest.raises(CircuitOpenError):
+            await governor.call("test", succeed)
+
+        release.set()
+        assert await probe == "ok"
+        assert governor.circuit_state("test") == CIRCUIT_CLOSED
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_probe_frees_the_half_open_slot():
+    async def scenario():
+        governor = make_governor()
+        await open_circuit(governor)
+        await asyncio.sleep(0.06)
+
+        async def hang():
+            await asyncio.Event().wait()
+
+        probe = asyncio.create_task(governor.call("test", hang))
+        await asyncio.sleep(0)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+        # The circuit is still half-open, and the next call gets to probe
+        assert governor.circuit_state("test") == CIRCUIT_HALF_OPEN
+        assert await governor.call("test", succeed) == "ok"
+        assert governor.circuit_state("test") == CIRCUIT_CLOSED
+
+    asyncio.run(scenario())
+
+
+def test_probe_cancelled_while_waiting_for_a_token():
+    async def scenario():
+        governor = make_governor(rate=1, burst=1)
+        await open_circuit(governor)
+        await asyncio.sleep(0.06)
+
+        # The bucket is empty after the failed calls: the probe waits for a token
+        probe = asyncio.create_task(governor.call("test", succeed))
+        await asyncio.sleep(0.01)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+        breaker = governor._breaker("test")
+        assert breaker.state == CIRCUIT_HALF_OPEN
+        assert breaker.allow()
+
+    asyncio.run(scenario())
+
+
+def test_client_errors_do_not_open_the_circuit():
+    async def scenario():
+        governor = make_governor()
+
+        for _ in range(5):
+            with pytest.raises(UpstreamError):
+                await governor.call("test", bad_request)
+        assert governor.circuit_state("test") == CIRCUIT_CLOSED
+
+    asyncio.run(scenario())
+
+
+def test_client_errors_between_failures_do_not_reset_them():
+    async def scenario():
+        governor = make_governor()
+        for call in (fail, bad_request, fail):
+            with pytest.raises(UpstreamError):
+                await governor.call("test", call)
+        assert governor.circuit_state("test") == CIRCUIT_OPEN
+
+    asyncio.run(scenario())
+
+
+def test_client_error_probe_leaves_the_circuit_half_open():
+    async def scenario():
+        governor = make_governor()
+        await open_circuit(governor)
+        await asyncio.sleep(0.06)
+
+        with pytest.raises(UpstreamError):
+            await governor.call("test", bad_request)
+        assert governor.circuit_state("test") == CIRCUIT_HALF_OPEN
+        assert governor.snapshot()["test"]["circuit"]["consecutive_failures"] == 2
+
+        # The slot is free again: the next call probes and closes the circuit
+        assert await governor.call("test", succeed) == "ok"
+        assert governor.circuit_state("test") == CIRCUIT_CLOSED
+
+    asyncio.run(scenario())
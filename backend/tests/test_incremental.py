@@ -0,0 +1,151 @@
+import asyncio
+
+from agents import results
+from agents.incremental import (
+    PATH_DELTA,
+    PATH_FULL,
+    PATH_REUSED,
+    choose_path,
+    fingerprint,
+    merge_sections,
+    source_hashes,
+)
+from agents.results import StoredResult
+
+ANALYSIS = "Intro\n\n## BUSINESS OVERVIEW\nBakes bread.\n\n## SWOT ANALYSIS\n- Strengths: Bread."
+
+
+def sources(*contents):
+    return {"results": [
+        {"title": f"Page {i}", "url": f"https://acme.example/{i}", "content": content}
+        for i, content in enumerate(contents)
+    ]}
+
+
+def stored(hashes):
+    return StoredResult.new(
+        "marketing", business_name="Acme Bakery", website_url="https://acme.example",
+        model="gpt-4o-mini", inputs={}, response={"analysis": ANALYSIS}, source_hashes=hashes,
+    )
+
+
+def test_source_hashes_ignore_formatting_and_order():
+    a = source_hashes(sources("Fresh bread daily", "Open on Sundays"), [])
+    b = source_hashes({"results": list(reversed(sources("fresh  BREAD daily", "Open on Sundays")["results"]))}, [])
+
+    assert a == b
+    assert fingerprint(a) == fingerprint(b)
+    assert "site:acme.example/about" in source_hashes(
+        {"results": []}, [{"url": "https://www.acme.example/about/", "text": "About us"}]
+    )
+
+
+def test_path_follows_the_share_of_changed_sources():
+    previous = stored(source_hashes(sources("a", "b", "c", "d"), []))
+
+    assert choose_path(None, previous.source_hashes)[0] == PATH_FULL
+    assert choose_path(previous, source_hashes(sources("a", "b", "c", "d"), []))[0] == PATH_REUSED
+
+    path, diff = choose_path(previous, source_hashes(sources("a", "b", "c", "changed"), []))
+    assert path == PATH_DELTA
+    assert diff["changed"] == ["acme.example/3"] and diff["change_ratio"] == 0.25
+
+    assert choose_path(previous, source_hashes(sources("w", "x", "y", "z"), []))[0] == PATH_FULL
+
+
+def test_missing_crawled_pages_do_not_count_as_removed():
+    pages = [{"url": f"https://acme.example/p{i}", "text": "page"} for i in range(3)]
+    previous = stored(source_hashes(sources("a"), pages))
+
+    assert choose_path(previous, source_hashes(sources("a"), pages[:1]))[0] == PATH_REUSED
+
+
+def test_delta_updates_replace_and_add_sections():
+    update = "## swot analysis\n- Strengths: Bread and cakes.\n\n## KEY MARKETING INSIGHTS\nSell cakes."
+
+    merged, touched = merge_sections(ANALYSIS, update)
+
+    assert merged.startswith("Intro\n\n## BUSINESS OVERVIEW\nBakes bread.")
+    assert merged.count("Strengths") == 1 and "Bread and cakes." in merged
+    assert merged.endswith("## KEY MARKETING INSIGHTS\nSell cakes.")
+    assert touched == ["## swot analysis", "## KEY MARKETING INSIGHTS"]
+    assert merge_sections(ANALYSIS, "NO CHANGES") == (ANALYSIS, [])
+
+
+def run(marketing, **fields):
+    request = marketing.MarketingAgentRequest(
+        business_name="Acme Bakery", website_url="https://acme.example", incremental=True, **fields
+    )
+    return asyncio.run(marketing.arun_analysis(request))
+
+
+def test_unchanged_sources_reuse_the_stored_analysis(marketing, upstreams):
+    first = run(marketing)
+    assert first.analysis_path == PATH_FULL
+    completions = upstreams.state.calls["completion"]
+
+    second = run(marketing, use_cache=False)
+
+    assert second.analysis_path == PATH_REUSED
+    assert second.previous_result_id == first.result_id
+    assert second.analysis == first.analysis
+    assert upstreams.state.calls["completion"] == completions
+
+
+def test_few_changed_sources_get_a_delta_update(marketing, upstreams):
+    first = run(marketing)
+    store = results.get_result_store()
+    previous = store.get(first.result_id)
+    dropped = sorted(previous.source_hashes)[0]
+    previous.source_hashes = {key: value for key, value in previous.source_hashes.items() if key != dropped}
+    store.save(previous)
+
+    second = run(marketing, use_cache=False, debug=True)
+
+    assert second.analysis_path == PATH_DELTA
+    assert second.previous_result_id == first.result_id
+    assert second.debug["incremental"]["added"] == 1
+    assert second.analysis.startswith("## BUSINESS OVERVIEW")
+    assert upstreams.state.calls["completion"] == 2
+
+
+def test_degraded_results_are_not_built_on(marketing, upstreams):
+    first = run(marketing)
+    store = results.get_result_store()
+    previous = store.get(first.result_id)
+    previous.response["degraded"] = ["partial"]
+    store.save(previous)
+
+    assert run(marketing, use_cache=False).analysis_path == PATH_FULL
+
+
+def test_anonymous_requests_do_not_build_on_owned_results(marketing, upstreams):
+    owned = run(marketing, user_id="3f8a2c1e-0000-4000-8000-000000000001")
+    assert owned.analysis_path == PATH_FULL
+
+    anonymous = run(marketing, use_cache=False)
+
+    assert anonymous.analysis_path == PATH_FULL
+    assert anonymous.previous_result_id is None
+    assert run(marketing, use_cache=False).analysis_path == PATH_REUSED
+
+
+def test_session_answers_are_not_built_on(marketing, upstreams):
+    first = run(marketing)
+    store = results.get_result_store()
+    previous = store.get(first.result_id)
+    previous.inputs["session_id"] = "a-private-session"
+    store.save(previous)
+
+    assert run(marketing, use_cache=False).analysis_path == PATH_FULL
+
+
+def test_sqlite_store_lists_unowned_results(tmp_path):
+    store = results.SQLiteResultStore(str(tmp_path / "results.db"))
+    for owner in ({}, {"user_id": "alice"}, {"company_id": "acme"}):
+        store.save(StoredResult.new("marketing", business_name="Acme Bakery", **owner))
+
+    listed, _ = store.list(results.ResultQuery(unowned=True))
+
+    assert [(r.user_id, r.company_id) for r in listed] == [(None, None)]
+    store.close()
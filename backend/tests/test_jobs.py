@@ -0,0 +1,120 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+from pydantic import ValidationError
+
+from agents.jobs import (
+    JOB_CANCELLED,
+    JOB_SUCCEEDED,
+    InProcessJobQueue,
+    JobNotFoundError,
+    QueueFullError,
+)
+
+PAYLOAD = {"business_name": "Acme Bakery", "website_url": "https://acme.example"}
+
+
+async def wait_for(queue, job_id, timeout=10):
+    async def finished():
+        while True:
+            job = await queue.get(job_id)
+            if job.finished_at is not None:
+                return job
+            await asyncio.sleep(0.02)
+    return await asyncio.wait_for(finished(), timeout)
+
+
+def test_submitted_job_runs_and_keeps_its_result(marketing, upstreams):
+    async def scenario():
+        queue = InProcessJobQueue(workers=2)
+        try:
+            job = await queue.submit("marketing", PAYLOAD)
+            assert job.job_id
+            return await wait_for(queue, job.job_id), queue.stats()
+        finally:
+            await queue.stop()
+
+    job, stats = asyncio.run(scenario())
+
+    assert job.status == JOB_SUCCEEDED
+    assert job.result["analysis"]
+    assert stats["submitted"] == 1 and stats["jobs"][JOB_SUCCEEDED] == 1
+
+
+def test_invalid_submissions_fail_up_front(marketing):
+    async def scenario():
+        queue = InProcessJobQueue()
+        with pytest.raises(KeyError):
+            await queue.submit("no-such-agent", PAYLOAD)
+        with pytest.raises(ValidationError):
+            await queue.submit("marketing", {"temperature": "hot"})
+        with pytest.raises(JobNotFoundError):
+            await queue.get("missing")
+        assert queue.stats()["submitted"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_full_queue_rejects_submissions(marketing, fake_settings):
+    fake_settings.completion_latency = 1
+
+    async def scenario():
+        queue = InProcessJobQueue(workers=1, max_queue_depth=1)
+        try:
+            await queue.submit("marketing", PAYLOAD)
+            await asyncio.sleep(0.05)  # the worker takes the first job
+            await queue.submit("marketing", dict(PAYLOAD, business_name="Second"))
+            with pytest.raises(QueueFullError):
+                await queue.submit("marketing", dict(PAYLOAD, business_name="Third"))
+            assert queue.stats()["rejected"] == 1
+        finally:
+            await queue.stop()
+
+    asyncio.run(scenario())
+
+
+def test_cancelling_a_running_job(marketing, fake_settings):
+    fake_settings.completion_latency = 5
+
+    async def scenario():
+        queue = InProcessJobQueue(workers=1)
+        try:
+            job = await queue.submit("marketing", PAYLOAD)
+            await asyncio.sleep(0.2)
+            await queue.cancel(job.job_id)
+            job = await wait_for(queue, job.job_id, timeout=2)
+            assert job.status == JOB_CANCELLED and job.result is None
+
+            # The worker is free for the next job
+            fake_settings.completion_latency = 0
+            follow_up = await queue.submit("marketing", dict(PAYLOAD, business_name="Next"))
+            assert (await wait_for(queue, follow_up.job_id)).status == JOB_SUCCEEDED
+        finally:
+            await queue.stop()
+
+    asyncio.run(scenario())
+
+
+def test_finished_jobs_expire(marketing, upstreams):
+    async def scenario():
+        queue = InProcessJobQueue(result_ttl=0.1)
+        try:
+            job = await queue.submit("marketing", PAYLOAD)
+            await wait_for(queue, job.job_id)
+            await asyncio.sleep(0.15)
+            with pytest.raises(JobNotFoundError):
+                await queue.get(job.job_id)
+        finally:
+            await queue.stop()
+
+    asyncio.run(scenario())
+
+
+def test_invalid_payloads_are_422_over_http(marketing):
+    import adaptor
+
+    response = TestClient(adaptor.app).post("/jobs/marketing", json={"website_url": "https://acme.example"})
+
+    assert response.status_code == 422
+    assert "business_name and website_url are required" in response.json()["detail"][0]["msg"]
@@ -0,0 +1,154 @@
+import asyncio
+
+import pytest
+
+from agents import governor as governor_module
+from agents import llm_router
+from agents.governor import CIRCUIT_OPEN, ProviderLimits, UpstreamError, UpstreamGovernor
+from agents.llm_router import LLMBackend, LLMRouter, NoBackendError
+
+from conftest import UPSTREAM_PORT, free_port
+
+MODEL = "gpt-4o-mini"
+
+
+@pytest.fixture
+def governor():
+    """A governor without retries, so failing backends fail at once."""
+    saved = governor_module.governor
+    governor = UpstreamGovernor({
+        name: ProviderLimits(rate=1000, burst=1000, max_retries=0, failure_threshold=2, reset_timeout=60)
+        for name in ("down", "up", "slow", "fast")
+    })
+    governor_module.set_governor(governor)
+    yield governor
+    governor_module.governor = saved
+
+
+def fake_backend(name: str, priority: int = 0) -> LLMBackend:
+    return LLMBackend(
+        name, llm_router.KIND_OPENAI_COMPATIBLE,
+        base_url=f"http://127.0.0.1:{UPSTREAM_PORT}/v1", priority=priority,
+    )
+
+
+def dead_backend(name: str = "down", priority: int = 0) -> LLMBackend:
+    return LLMBackend(
+        name, llm_router.KIND_OPENAI_COMPATIBLE,
+        base_url=f"http://127.0.0.1:{free_port()}/v1", priority=priority,
+    )
+
+
+class SleepyBackend(LLMBackend):
+    """A backend that answers after a fixed delay."""
+
+    def __init__(self, name: str, delay: float, priority: int = 0):
+        super().__init__(name, priority=priority)
+        self.delay = delay
+        self.cancelled = 0
+
+    async def acomplete(self, prompt, model, temperature, max_tokens):
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return {"content": self.name, "model": model, "usage": None}
+
+
+def test_failed_backend_fails_over_to_the_next(governor, upstreams):
+    router = LLMRouter([dead_backend(), fake_backend("up", priority=1)], explore=0)
+
+    completion = asyncio.run(router.acomplete("Analyze Acme", MODEL, 0.7, 100))
+
+    assert completion["backend"] == "up"
+    assert completion["content"]
+    assert router.failovers == 1
+    assert router.backends[0].stats.errors == 1
+    assert upstreams.state.calls["completion"] == 1
+
+
+def test_every_backend_failing_raises_the_last_error(governor):
+    async def fail(*args):
+        raise UpstreamError("unavailable", status_code=503)
+
+    backends = [SleepyBackend("down", 0), SleepyBackend("up", 0)]
+    for backend in backends:
+        backend.acomplete = fail
+    router = LLMRouter(backends, explore=0)
+
+    with pytest.raises(UpstreamError):
+        asyncio.run(router.acomplete("Analyze Acme", MODEL, 0.7, 100))
+    assert router.failovers == 1
+
+
+def test_slow_completion_is_hedged_on_the_next_backend(governor):
+    slow, fast = SleepyBackend("slow", 1.0), SleepyBackend("fast", 0.01, priority=1)
+    router = LLMRouter([slow, fast], hedge_delay=0.05, explore=0)
+
+    completion = asyncio.run(router.acomplete("Analyze Acme", MODEL, 0.7, 100))
+
+    assert completion["backend"] == "fast"
+    assert (router.hedges, router.hedges_won) == (1, 1)
+    assert slow.cancelled == 1
+
+
+def test_ranking_prefers_fast_backends_with_closed_circuits(governor):
+    slow, fast = SleepyBackend("slow", 0), SleepyBackend("fast", 0)
+    slow.stats.record(1.0, ok=True)
+    fast.stats.record(0.1, ok=True)
+    router = LLMRouter([slow, fast], explore=0)
+    assert [backend.name for backend in router.rank(MODEL)] == ["fast", "slow"]
+
+    async def trip():
+        for _ in range(2):
+            with pytest.raises(UpstreamError):
+                await governor.call("fast", _unavailable)
+
+    asyncio.run(trip())
+    assert governor.circuit_state("fast") == CIRCUIT_OPEN
+    assert [backend.name for backend in router.rank(MODEL)] == ["slow", "fast"]
+
+
+async def _unavailable():
+    raise UpstreamError("unavailable", status_code=503)
+
+
+def test_models_are_routed_to_the_backends_serving_them(governor):
+    azure = LLMBackend("azure", llm_router.KIND_AZURE, models={MODEL: "my-deployment"})
+    router = LLMRouter([azure], explore=0)
+
+    assert azure.backend_model(MODEL) == "my-deployment"
+    with pytest.raises(NoBackendError):
+        router.rank("gpt-4")
+
+
+def test_stream_fails_over_while_opening(governor, upstreams):
+    router = LLMRouter([dead_backend(), fake_backend("up", priority=1)], explore=0)
+
+    async def collect():
+        return [delta async for delta in router.astream("Analyze Acme", MODEL, 0.7, 100)]
+
+    deltas = asyncio.run(collect())
+
+    assert deltas and {delta["backend"] for delta in deltas} == {"up"}
+    assert "".join(delta["content"] for delta in deltas)
+    assert router.failovers == 1
+
+
+def test_backends_are_configured_from_the_environment(monkeypatch):
+    monkeypatch.setenv("LOCAL_LLM_KEY", "secret")
+    monkeypatch.setenv("LLM_HEDGE_DELAY", "1.5")
+    monkeypatch.setenv("LLM_BACKENDS", """[
+        {"name": "azure", "kind": "azure", "base_url": "https://example.openai.azure.com",
+         "models": {"gpt-4o-mini": "mini"}, "priority": 1},
+        {"name": "local", "kind": "openai_compatible", "base_url": "http://localhost:8000/v1",
+         "api_key_env": "LOCAL_LLM_KEY"}
+    ]""")
+
+    router = llm_router.build_llm_router()
+
+    assert [backend.name for backend in router.backends] == ["azure", "local"]
+    assert router.backends[0].models == {"gpt-4o-mini": "mini"}
+    assert router.backends[1].api_key == "secret"
+    assert router.hedge_delay == 1.5
@@ -0,0 +1,76 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+
+from agents import metrics
+from agents.metrics import Registry
+
+
+def test_counters_and_histograms_render_in_exposition_format():
+    registry = Registry()
+    requests = registry.counter("test_requests_total", "Requests", ["outcome"])
+    latency = registry.histogram("test_seconds", "Latency", ["phase"], buckets=(0.1, 1))
+    requests.inc(outcome="ok")
+    requests.inc(2, outcome='we"ird')
+    latency.observe(0.05, phase="search")
+    latency.observe(0.5, phase="search")
+    registry.register_collector(lambda: ["test_gauge 3"])
+
+    lines = registry.render().splitlines()
+
+    assert "# TYPE test_requests_total counter" in lines
+    assert 'test_requests_total{outcome="ok"} 1' in lines
+    assert 'test_requests_total{outcome="we\\"ird"} 2' in lines
+    assert 'test_seconds_bucket{phase="search",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{phase="search",le="1"} 2' in lines
+    assert 'test_seconds_bucket{phase="search",le="+Inf"} 2' in lines
+    assert 'test_seconds_count{phase="search"} 2' in lines
+    assert "test_gauge 3" in lines
+
+
+def test_failing_collector_does_not_break_the_scrape():
+    registry = Registry()
+
+    def broken():
+        raise RuntimeError("boom")
+
+    registry.register_collector(broken)
+    assert "# collector error: RuntimeError: boom" in registry.render()
+
+
+def test_phase_timings_are_collected_per_request():
+    async def request(name, seconds):
+        token = metrics.start_request_timings()
+        with metrics.timed("test", "work"):
+            await asyncio.sleep(seconds)
+        metrics.record_phase("test", "work", 0.5)
+        return name, metrics.stop_request_timings(token)
+
+    async def scenario():
+        return dict(await asyncio.gather(request("fast", 0.01), request("slow", 0.1)))
+
+    timings = asyncio.run(scenario())
+    assert 0.5 < timings["fast"]["work"] < timings["slow"]["work"] < 0.7
+    assert metrics.current_request_timings() is None
+
+
+def test_debug_requests_report_their_phases(marketing, upstreams):
+    response = asyncio.run(marketing.arun_analysis(marketing.MarketingAgentRequest(
+        business_name="Acme Bakery", website_url="https://acme.example", debug=True
+    )))
+
+    assert {"search", "completion", "total"} <= set(response.debug["timings"])
+
+
+def test_metrics_endpoint_exposes_agent_metrics(marketing, upstreams):
+    import adaptor
+
+    asyncio.run(marketing.arun_analysis(marketing.MarketingAgentRequest(
+        business_name="Acme Bakery", website_url="https://acme.example"
+    )))
+    response = TestClient(adaptor.app).get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'agent_phase_seconds_count{agent="marketing",phase="total"}' in response.text
+    assert 'agent_requests_total{agent="marketing",outcome="ok"}' in response.text
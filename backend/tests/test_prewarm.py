@@ -0,0 +1,143 @@
+import time
+import types
+import asyncio
+from datetime import datetime
+
+from agents import prewarm, results, usage
+from agents.cache import MemoryCache
+from agents.prewarm import PrewarmScheduler, cache_ttl, current_window_start, parse_windows
+
+PAYLOAD = {"business_name": "Acme Bakery", "website_url": "https://acme.example", "temperature": 0}
+
+
+async def fake_runner(agent_id, payload):
+    return types.SimpleNamespace(usage={"prompt_tokens": 1000, "completion_tokens": 500}, model_used="gpt-4o-mini", error=None)
+
+
+def scheduler(**settings) -> PrewarmScheduler:
+    values = dict(min_score=0.5, refresh_age=0, runner=fake_runner)
+    values.update(settings)
+    return PrewarmScheduler(**values)
+
+
+def test_hit_needs_a_request_served_from_the_refresh():
+    prewarmer = scheduler()
+    prewarmer.record("marketing", "acme", PAYLOAD)
+    asyncio.run(prewarmer.run_once(force=True))
+    assert prewarmer.runs == 1
+
+    prewarmer.record("marketing", "acme", PAYLOAD, warm=True)
+    prewarmer.record("marketing", "acme", PAYLOAD, warm=True)
+
+    stats = prewarmer.snapshot()["stats"]
+    assert stats["hit_rate"] == 1.0
+    assert prewarmer.entries["acme"].hits == 1
+    assert prewarmer.warm_requests == 2
+
+
+def test_cold_request_after_a_refresh_is_no_hit():
+    prewarmer = scheduler()
+    prewarmer.record("marketing", "acme", PAYLOAD)
+    asyncio.run(prewarmer.run_once(force=True))
+
+    # The refreshed entries had expired: this request ran cold, and the
+    # warm request after it was served by that run, not the refresh
+    prewarmer.record("marketing", "acme", PAYLOAD, warm=False)
+    prewarmer.record("marketing", "acme", PAYLOAD, warm=True)
+
+    assert prewarmer.snapshot()["stats"]["hit_rate"] == 0.0
+    assert prewarmer.warm_requests == 0
+
+
+def test_warm_requests_without_a_refresh_are_no_hits():
+    prewarmer = scheduler()
+    prewarmer.record("marketing", "acme", PAYLOAD, warm=True)
+    assert prewarmer.warm_requests == 0
+    assert prewarmer.snapshot()["stats"]["hit_rate"] is None
+
+
+def test_budget_caps_refreshes_per_window():
+    prewarmer = scheduler(concurrency=1, budget_usd=0.0004)
+    for key in ("a", "b", "c"):
+        prewarmer.record("marketing", key, PAYLOAD)
+
+    result = asyncio.run(prewarmer.run_once(force=True))
+
+    assert result["ok"] == 1
+    assert result["skipped_budget"] == 2
+
+
+def test_windows_may_wrap_midnight():
+    windows = parse_windows("22:00-04:00, 13:00-14:00, bogus")
+    assert windows == [(22 * 60, 4 * 60), (13 * 60, 14 * 60)]
+    assert current_window_start(windows, datetime(2024, 5, 2, 3, 0)) == datetime(2024, 5, 1, 22, 0)
+    assert current_window_start(windows, datetime(2024, 5, 2, 13, 30)) == datetime(2024, 5, 2, 13, 0)
+    assert current_window_start(windows, datetime(2024, 5, 2, 12, 0)) is None
+
+
+def test_refresh_writes_outlive_the_cache_default(monkeypatch):
+    monkeypatch.setattr(prewarm, "PREWARM_CACHE_TTL", 600)
+    cache = MemoryCache(default_ttl=60)
+
+    assert cache_ttl(cache) is None
+    token = prewarm._prewarming.set(True)
+    try:
+        assert cache_ttl(cache) == 600
+        assert cache_ttl(MemoryCache(default_ttl=3600)) == 3600
+        assert cache_ttl(MemoryCache(default_ttl=None)) is None
+    finally:
+        prewarm._prewarming.reset(token)
+
+
+def test_prewarmed_analysis_serves_the_next_request(marketing, upstreams, monkeypatch):
+    monkeypatch.setattr(prewarm, "PREWARM_CACHE_TTL", 60)
+    prewarmer = PrewarmScheduler(min_score=0.5, refresh_age=0)
+    prewarm.set_prewarm_scheduler(prewarmer)
+    # Entries written outside a refresh expire after a second
+    marketing.set_search_cache(MemoryCache(default_ttl=1))
+
+    async def analyze():
+        return await marketing.arun_analysis(marketing.MarketingAgentRequest(**PAYLOAD))
+
+    try:
+        first = asyncio.run(analyze())
+        assert first.search_cache_status == marketing.CACHE_MISS
+        time.sleep(1.1)
+
+        result = asyncio.run(prewarmer.run_once(force=True))
+        assert result["ok"] == 1
+        time.sleep(1.1)
+
+        searches = upstreams.state.calls["search"]
+        second = asyncio.run(analyze())
+        assert second.search_cache_status == marketing.CACHE_HIT
+        assert upstreams.state.calls["search"] == searches
+        assert prewarmer.snapshot()["stats"]["hit_rate"] == 1.0
+    finally:
+        prewarm.set_prewarm_scheduler(None)
+
+
+def test_refresh_is_not_billed_to_the_requesting_user(marketing, upstreams, tmp_path):
+    prewarmer = PrewarmScheduler(min_score=0.5, refresh_age=0)
+    prewarm.set_prewarm_scheduler(prewarmer)
+    writer = usage.UsageWriter(usage.SQLiteUsageSink(str(tmp_path / "usage.db")))
+    usage.set_usage_writer(writer)
+    request = marketing.MarketingAgentRequest(**PAYLOAD, user_id="user-a", company_id="company-a")
+
+    try:
+        asyncio.run(marketing.arun_analysis(request))
+        assert [record.user_id for record in writer._buffer] == ["user-a"]
+        writer._buffer.clear()
+        # The refresh calls the model again instead of reusing the cached answer
+        marketing.set_completion_cache(MemoryCache())
+
+        result = asyncio.run(prewarmer.run_once(force=True))
+        assert result["ok"] == 1
+        assert writer._buffer
+        assert all(record.user_id is None and record.company_id is None for record in writer._buffer)
+
+        owned, _ = results.get_result_store().list(results.ResultQuery(user_id="user-a"))
+        assert len(owned) == 1
+    finally:
+        prewarm.set_prewarm_scheduler(None)
+        usage.set_usage_writer(None)
@@ -0,0 +1,88 @@
+import asyncio
+
+from agents import prompt_budget
+from agents.prompt_budget import context_window, count_tokens, trim_middle, truncate_tokens
+
+MODEL = "gpt-4o-mini"
+
+
+def test_context_window_uses_the_longest_matching_prefix():
+    assert context_window("gpt-4-32k-0613") == 32768
+    assert context_window("gpt-4-0613") == 8192
+    assert context_window("some-local-model") == prompt_budget.DEFAULT_CONTEXT_WINDOW
+
+
+def test_prompt_budget_is_capped_by_the_window_and_the_completion():
+    assert prompt_budget.prompt_budget("gpt-4o", 1000, max_prompt_tokens=6000) == 6000
+    assert prompt_budget.prompt_budget("gpt-4-0613", 4000, max_prompt_tokens=6000) == 8192 - 4000 - 8
+    assert prompt_budget.prompt_budget("gpt-4-0613", 9000) == 0
+
+
+def test_truncate_keeps_the_requested_end():
+    text = " ".join(f"word{i}" for i in range(400))
+    head = truncate_tokens(text, 20, MODEL)
+    tail = truncate_tokens(text, 20, MODEL, keep_end=True)
+
+    assert count_tokens(head, MODEL) <= 20 and text.startswith(head)
+    assert count_tokens(tail, MODEL) <= 20 and text.endswith(tail)
+    assert truncate_tokens("short", 20, MODEL) == "short"
+
+
+def test_trim_middle_keeps_both_ends_within_the_limit():
+    text = "OPENING " + "filler text " * 500 + " CLOSING"
+    trimmed = trim_middle(text, 100, MODEL)
+
+    assert count_tokens(trimmed, MODEL) <= 100
+    assert trimmed.startswith("OPENING") and trimmed.endswith("CLOSING")
+    assert "tokens omitted" in trimmed
+    assert trim_middle("short", 100, MODEL) == "short"
+
+
+def search_results(count, words):
+    return {"results": [
+        {"title": f"Result {i}", "url": f"https://example.com/{i}", "content": "bakery " * words, "score": 1 - i / count}
+        for i in range(count)
+    ]}
+
+
+def test_assembled_prompt_stays_within_the_budget(marketing, monkeypatch):
+    monkeypatch.setattr(prompt_budget, "PROMPT_MAX_TOKENS", 1500)
+    monkeypatch.setattr(prompt_budget, "PROMPT_HISTORY_MAX_TOKENS", 300)
+    request = marketing.MarketingAgentRequest(
+        business_name="Acme Bakery",
+        website_url="https://acme.example",
+        previous_response="Earlier analysis. " * 2000,
+    )
+
+    prompt, report = marketing.assemble_prompt(request, search_results(20, 200))
+
+    assert report["prompt_tokens"] <= report["budget"] == 1500
+    assert report["history_trimmed"] and report["history_tokens"] <= 300
+    assert report["search_results_dropped"] > 0
+    assert report["search_results_kept"] > 0
+    assert "Result 0" in prompt  # the best-ranked results are kept
+
+
+def test_small_inputs_are_not_trimmed(marketing):
+    request = marketing.MarketingAgentRequest(business_name="Acme Bakery", website_url="https://acme.example")
+
+    _, report = marketing.assemble_prompt(request, search_results(3, 20))
+
+    assert report["search_results_kept"] == 3
+    assert report["search_results_dropped"] == 0
+    assert not report["history_trimmed"]
+
+
+def test_long_history_still_gets_an_answer(marketing, upstreams, monkeypatch):
+    monkeypatch.setattr(prompt_budget, "PROMPT_MAX_TOKENS", 1500)
+    request = marketing.MarketingAgentRequest(
+        business_name="Acme Bakery",
+        website_url="https://acme.example",
+        previous_response="Earlier analysis. " * 5000,
+        debug=True,
+    )
+
+    response = asyncio.run(marketing.arun_analysis(request))
+
+    assert response.error is None and response.analysis
+    assert response.debug["prompt"]["prompt_tokens"] <= 1500
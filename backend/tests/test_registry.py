@@ -0,0 +1,143 @@
+import os
+import sys
+import json
+import asyncio
+import subprocess
+
+import pytest
+
+import agents
+from agents import get_agent, get_agent_info
+
+from conftest import BACKEND_DIR, ROOT_DIR
+
+ECHO_AGENT = '''
+from pydantic import BaseModel
+
+calls = []
+
+
+class EchoRequest(BaseModel):
+    text: str
+
+
+class EchoResponse(BaseModel):
+    text: str
+
+
+def init(openai_api_key=None, tavily_api_key=None):
+    calls.append(("init", openai_api_key))
+
+
+async def awarm_up():
+    calls.append(("warm_up", None))
+
+
+async def arun(request):
+    return EchoResponse(text=request.text)
+'''
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    """The registry with an extra "echo" agent declared in a manifest file."""
+    (tmp_path / "echo_agent_module.py").write_text(ECHO_AGENT)
+    (tmp_path / "broken_agent_module.py").write_text("raise RuntimeError('cannot load')\n")
+    manifest = {
+        agent_id: {
+            "name": f"{agent_id.title()} Agent",
+            "module": f"{agent_id}_agent_module",
+            "request_model": "EchoRequest",
+            "response_model": "EchoResponse",
+            "runner": "arun",
+        }
+        for agent_id in ("echo", "broken")
+    }
+    (tmp_path / "manifest.json").write_text(json.dumps(manifest))
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.setenv("AGENT_MANIFEST", str(tmp_path / "manifest.json"))
+
+    saved_agents, saved_kwargs = dict(agents.AVAILABLE_AGENTS), dict(agents._init_kwargs)
+    agents.discover(refresh=True)
+    yield agents
+    agents.AVAILABLE_AGENTS.clear()
+    agents.AVAILABLE_AGENTS.update(saved_agents)
+    agents._init_kwargs.clear()
+    agents._init_kwargs.update(saved_kwargs)
+    for name in ("echo_agent_module", "broken_agent_module"):
+        sys.modules.pop(name, None)
+
+
+def test_listing_agents_imports_none_of_them(registry):
+    info = {agent["id"]: agent for agent in get_agent_info()}
+
+    assert {"marketing", "echo", "broken"} <= set(info)
+    assert info["echo"] == {"id": "echo", "name": "Echo Agent", "description": "", "version": "", "loaded": False}
+    assert "echo_agent_module" not in sys.modules
+
+
+def test_agents_load_on_first_use_with_the_configured_keys(registry):
+    registry.configure(openai_api_key="sk-echo")
+
+    entry = get_agent("echo")
+    assert get_agent("echo") is entry
+    assert entry["module"].calls == [("init", "sk-echo")]
+
+    response = asyncio.run(entry["runner"](entry["request_model"](text="hi")))
+    assert response.text == "hi"
+    assert registry.agent_stats()["echo"]["loaded"]
+    assert registry.agent_stats()["echo"]["source"] == "manifest"
+
+
+def test_unknown_and_broken_agents(registry):
+    with pytest.raises(KeyError):
+        get_agent("missing")
+
+    with pytest.raises(RuntimeError):
+        get_agent("broken")
+    assert registry.agent_stats()["broken"] == dict(
+        registry.agent_stats()["broken"], loaded=False, error="RuntimeError: cannot load"
+    )
+
+
+def test_warm_up_runs_the_agent_hook_and_reports_failures(registry):
+    stats = asyncio.run(registry.awarm_up(["echo", "broken"]))
+
+    assert stats["echo"]["warmed_up"] and stats["echo"]["load_seconds"] is not None
+    assert get_agent("echo")["module"].calls[-1] == ("warm_up", None)
+    assert not stats["broken"]["warmed_up"]
+    assert stats["broken"]["error"] == "RuntimeError: cannot load"
+
+    with pytest.raises(KeyError):
+        asyncio.run(registry.awarm_up(["missing"]))
+
+
+def test_warmup_agent_ids_from_the_environment(registry, monkeypatch):
+    monkeypatch.setenv("AGENT_WARMUP", "all")
+    assert registry.warmup_agent_ids() is None
+
+    monkeypatch.setenv("AGENT_WARMUP", "echo, missing")
+    assert registry.warmup_agent_ids() == ["echo"]
+
+
+def test_rediscovery_keeps_loaded_agents(registry):
+    entry = get_agent("echo")
+
+    registry.discover(refresh=True)
+
+    assert registry.AVAILABLE_AGENTS["echo"].entry is entry
+
+
+@pytest.mark.parametrize("app_module", ["adaptor", "backend.main"])
+def test_importing_the_app_imports_no_agent(app_module):
+    code = (
+        f"import sys, importlib; importlib.import_module({app_module!r}); "
+        "print(sorted(name for name in sys.modules if name.endswith('agents.marketing')))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=ROOT_DIR, capture_output=True, text=True, timeout=60,
+        env={**os.environ, "PYTHONPATH": os.pathsep.join([BACKEND_DIR, ROOT_DIR])},
+    )
+
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip().splitlines()[-1] == "[]"
@@ -0,0 +1,111 @@
+import uuid
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+from pydantic import BaseModel
+
+from agents import responses
+from agents.responses import CompressionMiddleware, FastJSONResponse, json_response, negotiate_encoding
+
+LARGE = {"analysis": "Acme Bakery marketing analysis. " * 200}
+
+
+class Report(BaseModel):
+    analysis: str
+
+
+@pytest.fixture
+def client():
+    app = FastAPI(default_response_class=FastJSONResponse)
+    app.add_middleware(CompressionMiddleware, minimum_size=1024)
+
+    @app.get("/large")
+    def large(request: Request):
+        return json_response(Report(**LARGE), request)
+
+    @app.get("/small")
+    def small(request: Request):
+        return json_response({"status": "ok"}, request)
+
+    @app.get("/plain")
+    def plain():
+        return {"unicode": "Café ☕", "large": LARGE["analysis"]}
+
+    @app.get("/events")
+    def events():
+        return StreamingResponse(iter([b"data: " + b"x" * 2000 + b"\n\n"]), media_type="text/event-stream")
+
+    return TestClient(app)
+
+
+def test_encoding_negotiation_honours_q_values(monkeypatch):
+    monkeypatch.setattr(responses, "brotli", None)
+    assert negotiate_encoding("gzip, deflate") == "gzip"
+    assert negotiate_encoding("gzip;q=0") is None
+    assert negotiate_encoding("*") == "gzip"
+    assert negotiate_encoding("identity") is None
+    assert negotiate_encoding("") is None
+
+
+def test_large_responses_are_compressed(client):
+    response = client.get("/large", headers={"Accept-Encoding": "gzip"})
+
+    assert response.headers["content-encoding"] in ("gzip", "br")
+    assert int(response.headers["content-length"]) < len(LARGE["analysis"]) // 10
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert response.headers["etag"].startswith('W/"')
+    assert response.json() == LARGE
+
+
+def test_small_and_unaccepted_responses_are_sent_as_is(client):
+    assert "content-encoding" not in client.get("/small", headers={"Accept-Encoding": "gzip"}).headers
+
+    response = client.get("/large", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
+    assert response.headers["etag"].startswith('"')
+
+
+def test_event_streams_are_not_compressed(client):
+    response = client.get("/events", headers={"Accept-Encoding": "gzip"})
+
+    assert "content-encoding" not in response.headers
+    assert response.text.startswith("data: xxx")
+
+
+def test_default_response_class_renders_compact_json(client):
+    response = client.get("/plain", headers={"Accept-Encoding": "identity"})
+
+    assert response.content.startswith('{"unicode":"Café ☕","large":'.encode("utf-8"))
+
+
+def test_conditional_gets_are_answered_with_304(client):
+    for encoding in ("identity", "gzip"):
+        first = client.get("/large", headers={"Accept-Encoding": encoding})
+        again = client.get("/large", headers={"Accept-Encoding": encoding, "If-None-Match": first.headers["etag"]})
+
+        assert again.status_code == 304
+        assert again.content == b""
+
+    stale = client.get("/large", headers={"If-None-Match": '"something-else"'})
+    assert stale.status_code == 200
+
+
+def test_stored_results_are_compressed_and_cacheable(marketing):
+    import adaptor
+
+    client = TestClient(adaptor.app)
+    owner = {"X-User-Id": str(uuid.uuid4())}
+    result_id = client.post("/run_agent", json={
+        "business_name": "Acme Bakery", "website_url": "https://acme.example", "user_id": owner["X-User-Id"],
+    }).json()["result_id"]
+
+    response = client.get(f"/results/{result_id}", headers={**owner, "Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["cache-control"] == "private, max-age=86400"
+    assert response.json()["result_id"] == result_id
+
+    again = client.get(f"/results/{result_id}", headers={**owner, "If-None-Match": response.headers["etag"]})
+    assert again.status_code == 304
@@ -0,0 +1,69 @@
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+
+from agents import results
+from agents.results import MemoryResultStore, StoredResult
+
+ALICE = str(uuid.uuid4())
+BOB = str(uuid.uuid4())
+ACME = str(uuid.uuid4())
+
+
+@pytest.fixture
+def client():
+    import adaptor
+
+    store = MemoryResultStore()
+    results.set_result_store(store)
+    for owner in ({"user_id": ALICE}, {"user_id": BOB}, {"company_id": ACME}):
+        store.save(StoredResult.new(
+            "marketing", business_name="Acme Bakery", website_url="https://acme.example",
+            model="gpt-4o-mini", inputs={}, response={"analysis": "..."}, **owner
+        ))
+    return TestClient(adaptor.app)
+
+
+def as_user(user_id):
+    return {"X-User-Id": user_id}
+
+
+def listed(client, headers, **params):
+    response = client.get("/results", headers=headers, params=params)
+    assert response.status_code == 200
+    return response.json()["results"]
+
+
+def test_listing_requires_a_caller(client):
+    assert client.get("/results").status_code == 401
+    assert client.get("/results/lookup", params={"business_name": "Acme Bakery"}).status_code == 401
+    both = {"X-User-Id": ALICE, "X-Company-Id": ACME}
+    assert client.get("/results", headers=both).status_code == 400
+
+
+def test_listing_is_scoped_to_the_caller(client):
+    assert [r["user_id"] for r in listed(client, as_user(ALICE))] == [ALICE]
+    assert [r["company_id"] for r in listed(client, {"X-Company-Id": ACME})] == [ACME]
+    assert listed(client, as_user(str(uuid.uuid4()))) == []
+
+    response = client.get("/results", headers=as_user(ALICE), params={"user_id": BOB})
+    assert response.status_code == 403
+
+
+def test_lookup_is_scoped_to_the_caller(client):
+    response = client.get("/results/lookup", headers=as_user(BOB), params={"business_name": "acme bakery"})
+    assert response.status_code == 200
+    assert response.json()["user_id"] == BOB
+
+
+def test_results_of_other_owners_are_not_found(client):
+    result_id = listed(client, as_user(ALICE))[0]["result_id"]
+
+    assert client.get(f"/results/{result_id}", headers=as_user(ALICE)).status_code == 200
+    assert client.get(f"/results/{result_id}", headers=as_user(BOB)).status_code == 404
+    assert client.get(f"/results/{result_id}").status_code == 401
+
+    assert client.delete(f"/results/{result_id}", headers=as_user(BOB)).status_code == 404
+    assert client.delete(f"/results/{result_id}", headers=as_user(ALICE)).status_code == 204
+    assert listed(client, as_user(ALICE)) == []
@@ -0,0 +1,52 @@
+import run
+
+
+def write(path, text):
+    path.write_text(text)
+    return str(path)
+
+
+def limit_host(monkeypatch, cpus):
+    monkeypatch.setattr(run.os, "cpu_count", lambda: cpus)
+    monkeypatch.setattr(run.os, "sched_getaffinity", lambda pid: set(range(cpus)), raising=False)
+
+
+def test_workers_default_to_one(monkeypatch):
+    monkeypatch.delenv("WEB_CONCURRENCY", raising=False)
+    assert run.parse_args([]).workers == 1
+
+
+def test_cgroup_v2_quota_limits_auto_workers(tmp_path, monkeypatch):
+    limit_host(monkeypatch, 64)
+    monkeypatch.setattr(run, "CGROUP_CPU_QUOTAS", ((write(tmp_path / "cpu.max", "150000 100000\n"), None),))
+
+    assert run.parse_args(["--workers", "auto"]).workers == 2
+
+
+def test_cgroup_v1_quota_limits_auto_workers(tmp_path, monkeypatch):
+    limit_host(monkeypatch, 64)
+    quota = write(tmp_path / "cpu.cfs_quota_us", "400000\n")
+    period = write(tmp_path / "cpu.cfs_period_us", "100000\n")
+    monkeypatch.setattr(run, "CGROUP_CPU_QUOTAS", (("/nonexistent/cpu.max", None), (quota, period)))
+
+    assert run.available_cpus() == 4
+
+
+def test_unlimited_cgroup_uses_the_cpu_count(tmp_path, monkeypatch):
+    limit_host(monkeypatch, 6)
+    monkeypatch.setattr(run, "CGROUP_CPU_QUOTAS", ((write(tmp_path / "cpu.max", "max 100000\n"), None),))
+
+    assert run.available_cpus() == 6
+
+
+def test_several_workers_warn_without_a_shared_job_backend(monkeypatch, capsys):
+    monkeypatch.delenv("SHARED_JOB_BACKEND", raising=False)
+    run.warn_about_process_state(1)
+    assert capsys.readouterr().out == ""
+
+    run.warn_about_process_state(4)
+    assert "Warning" in capsys.readouterr().out
+
+    monkeypatch.setenv("SHARED_JOB_BACKEND", "1")
+    run.warn_about_process_state(4)
+    assert capsys.readouterr().out == ""
@@ -0,0 +1,80 @@
+import asyncio
+
+from agents.search import canonical_url, merge_results
+
+
+def result(url, content, score=0.5):
+    return {"title": url, "url": url, "content": content, "score": score}
+
+
+def test_canonical_url_drops_trivial_variants():
+    assert canonical_url("https://www.Foo.com/a/?utm_source=x&b=1&fbclid=z#top") == "foo.com/a?b=1"
+    assert canonical_url("http://foo.com:80/a") == canonical_url("https://foo.com/a/")
+    assert canonical_url("https://foo.com:8443/a") == "foo.com:8443/a"
+
+
+def test_merge_drops_duplicate_urls_and_keeps_the_best_copy():
+    merged = merge_results({
+        "products": {"results": [result("https://www.acme.com/", "Bakery products", 0.4)]},
+        "reviews": {"results": [result("https://acme.com/?utm_medium=ad", "Bakery reviews", 0.9)]},
+    })
+
+    assert merged["candidates"] == 1
+    [only] = merged["results"]
+    assert only["score"] == 0.9
+    assert only["queries"] == ["products", "reviews"]
+
+
+def test_merge_drops_near_identical_content_under_other_urls():
+    text = "Acme Bakery bakes sourdough bread and pastries every morning in Springfield"
+    merged = merge_results({
+        "a": {"results": [result("https://acme.com/about", text)]},
+        "b": {"results": [result("https://mirror.example/acme", text + " today")]},
+    })
+
+    assert merged["candidates"] == 1
+
+
+def test_merge_keeps_every_facet_within_the_budget():
+    popular = [result(f"https://shared.example/{i}", f"shared page number {i} words", 0.9) for i in range(5)]
+    merged = merge_results({
+        "a": {"results": popular},
+        "b": {"results": popular},
+        "c": {"results": [result("https://niche.example/", "a lone niche page", 0.1)]},
+    }, budget=3)
+
+    assert len(merged["results"]) == 3
+    assert any("c" in r["queries"] for r in merged["results"])
+
+
+def test_merge_reports_failed_sub_queries():
+    ok = {"results": [result("https://acme.com/", "content")]}
+    partial = merge_results({"a": ok, "b": {"error": "timeout"}})
+    assert partial["partial_errors"] == ["b: timeout"]
+    assert len(partial["results"]) == 1
+
+    failed = merge_results({"a": {"error": "x"}, "b": {"error": "y"}})
+    assert failed == {"error": "a: x; b: y", "results": []}
+
+
+def test_fanout_searches_every_facet_once(marketing, upstreams):
+    request = marketing.MarketingAgentRequest(business_name="Acme Bakery", website_url="https://acme.example")
+    queries = marketing.build_search_queries(request)
+
+    merged, status = asyncio.run(marketing.asearch_fanout(queries))
+    assert upstreams.state.calls["search"] == len(queries)
+    assert status == "miss"
+    assert {name for r in merged["results"] for name in r["queries"]} == set(queries)
+
+    _, status = asyncio.run(marketing.asearch_fanout(queries))
+    assert upstreams.state.calls["search"] == len(queries)
+    assert status == "hit"
+
+
+def test_fanout_merges_what_arrived_before_the_timeout(marketing, upstreams, fake_settings):
+    fake_settings.search_latency = 1.0
+    queries = {"slow": "Acme Bakery products"}
+
+    merged, _ = asyncio.run(marketing.asearch_fanout(queries, timeout=0.05))
+    assert merged["results"] == []
+    assert merged["timed_out"] == ["Acme Bakery products"]
@@ -0,0 +1,96 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from agents import sessions
+from agents.cache import MemoryCache
+from agents.sessions import SessionNotFoundError, SessionStore, append_turn, summarize_answer
+
+MODEL = "gpt-4o-mini"
+
+ANSWER = """## BUSINESS OVERVIEW
+Acme sells bread. It opened in 1990.
+
+## SWOT ANALYSIS
+- Strengths: Loyal customers. Good prices.
+"""
+
+
+@pytest.fixture
+def store():
+    store = SessionStore(MemoryCache())
+    sessions.set_session_store(store)
+    yield store
+    sessions.set_session_store(SessionStore(MemoryCache()))
+
+
+@pytest.fixture
+def client(marketing, store):
+    import adaptor
+
+    return TestClient(adaptor.app)
+
+
+def test_answers_are_summarized_to_headings_and_lead_sentences():
+    assert summarize_answer(ANSWER) == (
+        "BUSINESS OVERVIEW: Acme sells bread.\nSWOT ANALYSIS: Strengths: Loyal customers."
+    )
+
+
+def test_rolling_summary_keeps_the_first_and_latest_turns():
+    summary = ""
+    for turn in range(1, 41):
+        summary = append_turn(summary, turn, f"question {turn}" if turn > 1 else None, ANSWER, MODEL, max_tokens=200)
+
+    assert summary.startswith("Turn 1 - initial analysis")
+    assert "Q: question 40" in summary
+    assert "Q: question 20\n" not in summary
+    assert "tokens omitted" in summary
+
+
+def test_store_records_turns_and_forgets_deleted_sessions(store):
+    session = store.create("marketing", "Acme Bakery", "https://acme.example")
+    store.record_turn(session, None, ANSWER, MODEL)
+
+    assert store.get(session.session_id).turns == 1
+    store.delete(session.session_id)
+    with pytest.raises(SessionNotFoundError):
+        store.get(session.session_id)
+    assert store.not_found == 1
+
+
+def test_expired_sessions_are_not_found():
+    store = SessionStore(MemoryCache(), ttl=-1)
+    session = store.create("marketing", "Acme Bakery", "https://acme.example")
+
+    with pytest.raises(SessionNotFoundError):
+        store.get(session.session_id)
+
+
+def test_follow_up_questions_continue_the_session(client, store):
+    first = client.post("/run_agent", json={
+        "business_name": "Acme Bakery", "website_url": "https://acme.example", "start_session": True,
+    })
+    assert first.status_code == 200
+    session_id = first.json()["session_id"]
+    assert session_id
+
+    follow_up = client.post("/run_agent", json={
+        "business_name": "", "website_url": "", "session_id": session_id, "question": "Who are the competitors?",
+    })
+    assert follow_up.status_code == 200
+    assert follow_up.json()["session_id"] == session_id
+    assert any("competitors" in query for query in follow_up.json()["search_queries"])
+
+    session = client.get(f"/sessions/{session_id}").json()
+    assert session["business_name"] == "Acme Bakery"
+    assert session["turns"] == 2
+    assert "Q: Who are the competitors?" in session["summary"]
+
+
+def test_unknown_sessions_are_404(client):
+    response = client.post("/run_agent", json={
+        "business_name": "", "website_url": "", "session_id": "missing", "question": "Why?",
+    })
+    assert response.status_code == 404
+    assert client.get("/sessions/missing").status_code == 404
+    assert client.delete("/sessions/missing").status_code == 404
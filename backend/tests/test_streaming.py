@@ -0,0 +1,54 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from agents.sse import format_sse
+
+
+@pytest.fixture
+def client(marketing):
+    import adaptor
+
+    return TestClient(adaptor.app)
+
+
+def parse_events(body: str):
+    events = []
+    for frame in body.split("\n\n"):
+        if not frame.strip():
+            continue
+        fields = dict(line.split(": ", 1) for line in frame.splitlines())
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+def test_format_sse_frames_json():
+    assert format_sse("token", {"content": "hi"}) == 'event: token\ndata: {"content": "hi"}\n\n'
+
+
+def test_stream_sends_phases_tokens_and_done(client, upstreams):
+    response = client.post("/run_agent/stream", json={
+        "business_name": "Acme Bakery", "website_url": "https://acme.example"
+    })
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert response.headers["cache-control"] == "no-cache"
+
+    events = parse_events(response.text)
+    names = [name for name, _ in events]
+    assert names[:3] == ["status", "search", "status"]
+    assert names[-1] == "done"
+    assert set(names[3:-1]) == {"token"}
+    assert events[1][1]["results"] > 0
+    assert "".join(data["content"] for name, data in events if name == "token")
+    assert "analysis" not in events[-1][1]
+    assert upstreams.state.calls["stream"] == 1
+
+
+def test_stream_of_an_unknown_session_ends_with_an_error(client):
+    response = client.post("/run_agent/stream", json={"session_id": "missing", "question": "Why?"})
+
+    events = parse_events(response.text)
+    assert events == [("error", {"message": "Unknown or expired session: missing"})]
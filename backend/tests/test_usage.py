@@ -0,0 +1,215 @@
+import sys
+import json
+import types
+import uuid
+import asyncio
+
+import pytest
+
+from agents import usage
+from agents.usage import PostgresUsageSink, SQLiteUsageSink, UsageRecord, UsageWriter
+
+KNOWN_USER = str(uuid.uuid4())
+KNOWN_COMPANY = str(uuid.uuid4())
+
+
+class OperationalError(Exception):
+    pass
+
+
+class DataError(Exception):
+    pass
+
+
+class IntegrityError(Exception):
+    pass
+
+
+class FakeDatabase:
+    """token_usage with its UUID, foreign key and single-owner constraints."""
+
+    def __init__(self):
+        self.rows = {}
+        self.available = True
+        self.batches = 0
+
+    def insert(self, pending, row):
+        record = dict(zip(usage.USAGE_COLUMNS, row))
+        for column in ("id", "user_id", "company_id"):
+            if record[column] is not None:
+                try:
+                    uuid.UUID(record[column])
+                except ValueError:
+                    raise DataError(f"invalid input syntax for type uuid: {record[column]!r}")
+        if (record["user_id"] is None) == (record["company_id"] is None):
+            raise IntegrityError("token_usage_check")
+        if record["user_id"] not in (None, KNOWN_USER) or record["company_id"] not in (None, KNOWN_COMPANY):
+            raise IntegrityError("foreign key violation")
+        pending.setdefault(record["id"], record)
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def execute(self, sql, row):
+        self.conn.db.insert(self.conn.pending, row)
+
+    def executemany(self, sql, rows):
+        self.conn.db.batches += 1
+        for row in rows:
+            self.execute(sql, row)
+
+
+class FakeConnection:
+    def __init__(self, db):
+        self.db = db
+        self.closed = False
+        self.pending = {}
+
+    def cursor(self):
+        if not self.db.available:
+            raise OperationalError("server closed the connection")
+        return FakeCursor(self)
+
+    def commit(self):
+        for key, record in self.pending.items():
+            self.db.rows.setdefault(key, record)
+        self.pending = {}
+
+    def rollback(self):
+        self.pending = {}
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def database(monkeypatch):
+    db = FakeDatabase()
+
+    def connect(dsn):
+        if not db.available:
+            raise OperationalError("connection refused")
+        return FakeConnection(db)
+
+    driver = types.SimpleNamespace(
+        connect=connect, DataError=DataError, IntegrityError=IntegrityError, OperationalError=OperationalError
+    )
+    monkeypatch.setitem(sys.modules, "psycopg", driver)
+    return db
+
+
+def record(**owner) -> UsageRecord:
+    return UsageRecord(model="gpt-4o-mini", prompt_tokens=10, completion_tokens=5, total_tokens=15, **owner)
+
+
+def test_non_uuid_owners_are_written_as_null_or_skipped(database):
+    sink = PostgresUsageSink("postgresql://test")
+    records = [
+        record(user_id=KNOWN_USER),
+        record(user_id="alice", company_id=KNOWN_COMPANY),  # user_id isn't a UUID: NULL
+        record(user_id="alice"),  # no valid owner left
+        record(user_id=KNOWN_USER, company_id=KNOWN_COMPANY),  # two owners
+    ]
+
+    assert sink.write_batch(records) == []
+    assert set(database.rows) == {records[0].id, records[1].id}
+    assert database.rows[records[1].id]["user_id"] is None
+    assert sink.skipped == 2
+
+
+def test_bad_rows_are_rejected_without_losing_the_batch(database):
+    sink = PostgresUsageSink("postgresql://test")
+    unknown = record(user_id=str(uuid.uuid4()))
+    good = [record(user_id=KNOWN_USER), record(company_id=KNOWN_COMPANY)]
+
+    rejected = sink.write_batch([good[0], unknown, good[1]])
+
+    assert [r.id for r in rejected] == [unknown.id]
+    assert set(database.rows) == {r.id for r in good}
+
+
+def test_unavailable_database_raises(database):
+    sink = PostgresUsageSink("postgresql://test")
+    database.available = False
+    with pytest.raises(OperationalError):
+        sink.write_batch([record(user_id=KNOWN_USER)])
+
+
+def test_spill_and_replay_after_an_outage(database, tmp_path):
+    async def scenario():
+        writer = UsageWriter(PostgresUsageSink("postgresql://test"), spill_path=str(tmp_path / "spill.jsonl"))
+        database.available = False
+        writer.record(record(user_id=KNOWN_USER))
+        writer.record(record(company_id=KNOWN_COMPANY))
+        await writer.flush()
+        assert writer.spilled == 2 and not database.rows
+
+        database.available = True
+        await writer.flush()
+        assert writer.replayed == 2
+        assert len(database.rows) == 2
+        assert not writer.stats()["spill_pending"]
+
+    asyncio.run(scenario())
+
+
+def test_permanently_failing_spill_entries_are_quarantined(database, tmp_path):
+    async def scenario():
+        spill = tmp_path / "spill.jsonl"
+        unknown = record(user_id=str(uuid.uuid4()))
+        good = record(user_id=KNOWN_USER)
+        spill.write_text(good.model_dump_json() + "\n" + unknown.model_dump_json() + "\n" + '{"model": "gpt-4o-mi\n')
+
+        writer = UsageWriter(PostgresUsageSink("postgresql://test"), spill_path=str(spill))
+        await writer.flush()
+
+        assert set(database.rows) == {good.id}
+        assert writer.replayed == 1
+        assert writer.rejected == 2
+        assert not writer.stats()["spill_pending"]
+        lines = (tmp_path / "spill.jsonl.rejected").read_text().splitlines()
+        assert '{"model": "gpt-4o-mi' in lines
+        assert [json.loads(line)["id"] for line in lines if line != '{"model": "gpt-4o-mi'] == [unknown.id]
+
+        # Nothing is left to replay on the next flush
+        await writer.flush()
+        assert writer.replayed == 1 and writer.flush_errors == 0
+
+    asyncio.run(scenario())
+
+
+def test_rejected_records_of_a_flush_are_quarantined_not_spilled(database, tmp_path):
+    async def scenario():
+        writer = UsageWriter(PostgresUsageSink("postgresql://test"), spill_path=str(tmp_path / "spill.jsonl"))
+        writer.record(record(user_id=KNOWN_USER))
+        writer.record(record(company_id=str(uuid.uuid4())))
+        await writer.flush()
+
+        assert writer.written == 1 and writer.rejected == 1 and writer.spilled == 0
+        assert not (tmp_path / "spill.jsonl").exists()
+
+    asyncio.run(scenario())
+
+
+def test_sqlite_sink_batches_and_ignores_duplicates(tmp_path):
+    async def scenario():
+        sink = SQLiteUsageSink(str(tmp_path / "usage.db"))
+        writer = UsageWriter(sink, max_batch=2, spill_path=str(tmp_path / "spill.jsonl"))
+        records = [record(user_id="alice") for _ in range(5)]
+        for r in records + records[:2]:
+            writer.record(r)
+        await writer.flush()
+
+        count = sink._conn.execute("SELECT COUNT(*) FROM token_usage").fetchone()[0]
+        assert count == 5
+        sink.close()
+
+    asyncio.run(scenario())
@@ -5,80 +5,344 @@ Run script for Productivity Engines Backend
 This is the main entry point for running the backend server.
 It handles:
 1. Environment loading
-2. Port management (detecting and clearing used ports)
-3. Running the backend adaptor
+2. Binding the listening socket once, in the launcher process
+3. Running a pool of uvicorn worker processes that share that socket
+
+The backend app (adaptor.py) is imported once in the launcher and the
+workers are forked from it, so agent modules are loaded a single time.
+Upstream clients are created lazily inside each worker after the fork.
+
+Signals (POSIX):
+- SIGTERM / SIGINT: graceful shutdown; workers finish in-flight requests
+- SIGHUP: graceful reload; new workers start before the old ones retire.
+  With --no-preload the new workers also pick up code changes.
+
+On platforms without fork() (Windows), uvicorn's own worker manager is used.
 """
 
 import os
 import sys
-import subprocess
-import socket
+import math
 import time
+import socket
 import signal
+import argparse
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
-# Get the path to the backend adaptor script
+# Get the path to the backend adaptor module
 backend_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend")
-adaptor_script = os.path.join(backend_path, "adaptor.py")
 
-def is_port_in_use(port):
-    """Check if a port is in use."""
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        return s.connect_ex(('localhost', port)) == 0
+# CPU quota files: cgroup v2 ("<quota> <period>" in one file), then v1
+CGROUP_CPU_QUOTAS = (
+    ("/sys/fs/cgroup/cpu.max", None),
+    ("/sys/fs/cgroup/cpu/cpu.cfs_quota_us", "/sys/fs/cgroup/cpu/cpu.cfs_period_us"),
+)
+
+
+def available_cpus():
+    """
+    CPUs this process may actually use.
+
+    os.cpu_count() reports the host's CPUs; containers are usually limited
+    by a CPU affinity mask or a cgroup quota (cpu.max in cgroup v2,
+    cpu.cfs_quota_us in v1), so the smallest of these is used.
+    """
+    counts = [os.cpu_count() or 1]
+    if hasattr(os, "sched_getaffinity"):
+        counts.append(len(os.sched_getaffinity(0)))
+
+    for quota_path, period_path in CGROUP_CPU_QUOTAS:
+        try:
+            with open(quota_path) as f:
+                fields = f.read().split()
+            if period_path is not None:
+                with open(period_path) as f:
+                    fields.append(f.read().strip())
+        except OSError:
+            continue
+        if len(fields) >= 2 and fields[0] not in ("max", "-1"):
+            counts.append(math.ceil(int(fields[0]) / int(fields[1])))
+        break
+
+    return max(1, min(counts))
+
+
+def worker_count(value):
+    """Parse --workers: a number, or "auto" for one worker per available CPU."""
+    if value.strip().lower() == "auto":
+        return available_cpus()
+    return int(value)
+
+
+def parse_args(argv=None):
+    """Parse command line options, defaulting to environment settings."""
+    parser = argparse.ArgumentParser(description="Run the Productivity Engines Backend")
+    parser.add_argument("--host", default=os.environ.get("HOST", "0.0.0.0"),
+                        help="Interface to bind (HOST, default 0.0.0.0)")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", "8000")),
+                        help="Port to bind (PORT, default 8000)")
+    parser.add_argument("--workers", type=worker_count, default=os.environ.get("WEB_CONCURRENCY", "1"),
+                        help="Worker processes, or auto for one per available CPU (WEB_CONCURRENCY, default 1)")
+    parser.add_argument("--keepalive", type=float, default=float(os.environ.get("KEEPALIVE_TIMEOUT", "5")),
+                        help="Seconds idle client connections are kept open (KEEPALIVE_TIMEOUT, default 5)")
+    parser.add_argument("--backlog", type=int, default=int(os.environ.get("BACKLOG", "2048")),
+                        help="Pending connection queue size (BACKLOG, default 2048)")
+    parser.add_argument("--graceful-timeout", type=float, default=float(os.environ.get("GRACEFUL_TIMEOUT", "30")),
+                        help="Seconds workers get to finish requests on shutdown (GRACEFUL_TIMEOUT, default 30)")
+    parser.add_argument("--no-preload", dest="preload", action="store_false",
+                        default=os.environ.get("PRELOAD_APP", "1") != "0",
+                        help="Import the app in each worker instead of once in the launcher (PRELOAD_APP=0)")
+    parser.add_argument("--log-level", default=os.environ.get("LOG_LEVEL", "info"),
+                        help="Uvicorn log level (LOG_LEVEL, default info)")
+    return parser.parse_args(argv)
+
+
+def warn_about_process_state(workers):
+    """
+    Warn when several workers would each keep their own in-memory state.
 
-def kill_process_on_port(port):
-    """Kill any process using the specified port."""
+    The job queue and the prewarm demand tracker live in the worker's
+    memory: with more than one worker a job polled through another worker
+    is not found, and demand is split across the workers. Set
+    SHARED_JOB_BACKEND=1 once a shared job backend is installed
+    (agents.jobs.set_job_queue).
+    """
+    if workers > 1 and os.environ.get("SHARED_JOB_BACKEND", "0") != "1":
+        print(f"Warning: running {workers} workers with the in-process job queue. Jobs are only "
+              "visible to the worker that accepted them, and prewarm demand is tracked per worker; "
+              "use 1 worker or set SHARED_JOB_BACKEND=1 with a shared job backend.")
+
+
+def load_app():
+    """Import the backend app (adaptor.py)."""
+    if backend_path not in sys.path:
+        sys.path.insert(0, backend_path)
+    import adaptor
+    return adaptor.app
+
+
+def bind_socket(host, port, backlog):
+    """
+    Bind the listening socket shared by all workers.
+
+    Exits with a message if the port is taken, rather than killing
+    whatever is holding it.
+    """
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     try:
-        # This approach works on macOS, Linux, and Windows with WSL
-        if sys.platform == 'win32':
-            subprocess.run(f"taskkill /F /PID $(netstat -ano | findstr :{port} | awk '{{print $5}}') > nul 2>&1", shell=True)
-        else:
-            subprocess.run(f"lsof -i :{port} | awk 'NR>1 {{print $2}}' | xargs kill -9 > /dev/null 2>&1", shell=True)
-        time.sleep(1)  # Give the OS time to release the port
-    except Exception as e:
-        print(f"Warning: Could not kill process on port {port}: {e}")
+        sock.bind((host, port))
+    except OSError as e:
+        print(f"Could not bind {host}:{port}: {e}")
+        print("Please close any application using the port, or set PORT, and try again.")
+        sys.exit(1)
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def uvicorn_config(app, options):
+    """Build the uvicorn settings shared by every worker."""
+    import uvicorn
+
+    return uvicorn.Config(
+        app,
+        host=options.host,
+        port=options.port,
+        backlog=options.backlog,
+        timeout_keep_alive=options.keepalive,
+        timeout_graceful_shutdown=options.graceful_timeout,
+        log_level=options.log_level,
+    )
+
+
+# ----------------------------------------------------------------
+# Worker Process
+# ----------------------------------------------------------------
+def run_worker(sock, app, options):
+    """Serve requests from the shared socket until told to stop (runs in the child)."""
+    import uvicorn
+
+    class WorkerServer(uvicorn.Server):
+        def install_signal_handlers(self):
+            # Ctrl+C reaches the whole process group; the launcher turns it
+            # into a single SIGTERM so workers shut down gracefully, once
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            signal.signal(signal.SIGTERM, self.handle_exit)
+
+    signal.signal(signal.SIGHUP, signal.SIG_DFL)
+
+    if app is None:
+        os.chdir(backend_path)
+        app = load_app()
+
+    WorkerServer(uvicorn_config(app, options)).run(sockets=[sock])
+
+
+# ----------------------------------------------------------------
+# Launcher
+# ----------------------------------------------------------------
+class Launcher:
+    """Forks and supervises the worker processes."""
+
+    # Minimum seconds between restarts of crashed workers
+    RESPAWN_DELAY = 1.0
+
+    def __init__(self, options):
+        self.options = options
+        self.sock = None
+        self.app = None
+        self.workers = {}  # pid -> start time
+        self.retiring = {}  # pid -> time SIGTERM was sent
+        self.signals = []
+        self.last_respawn = 0.0
+
+    def run(self):
+        self.sock = bind_socket(self.options.host, self.options.port, self.options.backlog)
+        if self.options.preload:
+            self.app = load_app()
+
+        for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+            signal.signal(sig, self.handle_signal)
+
+        print(f"Launcher {os.getpid()} starting {self.options.workers} worker(s)")
+        self.spawn_workers(self.options.workers)
+
+        while True:
+            self.reap_workers()
+            while self.signals:
+                sig = self.signals.pop(0)
+                if sig == signal.SIGHUP:
+                    self.reload()
+                else:
+                    self.shutdown()
+                    return
+            self.maintain_workers()
+            self.kill_stuck_workers()
+            time.sleep(0.2)
+
+    def handle_signal(self, sig, frame):
+        self.signals.append(sig)
+
+    def spawn_worker(self):
+        pid = os.fork()
+        if pid == 0:
+            exit_code = 0
+            try:
+                run_worker(self.sock, self.app, self.options)
+            except BaseException as e:
+                print(f"Worker {os.getpid()} failed: {e}")
+                exit_code = 1
+            finally:
+                # Never fall back into the launcher's loop
+                os._exit(exit_code)
+
+        self.workers[pid] = time.monotonic()
+        return pid
+
+    def spawn_workers(self, count):
+        for _ in range(count):
+            self.spawn_worker()
+
+    def reap_workers(self):
+        """Collect exited workers."""
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+
+            if self.retiring.pop(pid, None) is None and self.workers.pop(pid, None) is not None:
+                print(f"Warning: worker {pid} exited unexpectedly (status {status})")
+
+    def maintain_workers(self):
+        """Replace crashed workers, rate limited so a failing boot doesn't spin."""
+        missing = self.options.workers - len(self.workers)
+        if missing > 0 and time.monotonic() - self.last_respawn >= self.RESPAWN_DELAY:
+            self.last_respawn = time.monotonic()
+            self.spawn_workers(missing)
+
+    def retire(self, pids):
+        """Ask workers to stop accepting connections and finish what they have."""
+        for pid in pids:
+            self.workers.pop(pid, None)
+            self.retiring[pid] = time.monotonic()
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                self.retiring.pop(pid, None)
+
+    def kill_stuck_workers(self):
+        """Force-stop retiring workers that outlive the graceful timeout."""
+        deadline = time.monotonic() - self.options.graceful_timeout - 5
+        for pid, retired_at in list(self.retiring.items()):
+            if retired_at < deadline:
+                print(f"Warning: worker {pid} did not stop in time, killing it")
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    self.retiring.pop(pid, None)
+
+    def reload(self):
+        """Start a fresh set of workers, then retire the old ones."""
+        print("Reloading workers...")
+        old = list(self.workers)
+        self.spawn_workers(self.options.workers)
+        self.retire(old)
+
+    def shutdown(self):
+        """Stop all workers gracefully and wait for them to exit."""
+        print("\nShutting down server...")
+        self.retire(list(self.workers))
+        while self.retiring:
+            self.reap_workers()
+            self.kill_stuck_workers()
+            time.sleep(0.1)
+        self.sock.close()
+
+
+def run_without_fork(options):
+    """Fallback for platforms without fork(): uvicorn spawns and manages the workers."""
+    import uvicorn
+
+    sys.path.insert(0, backend_path)
+    uvicorn.run(
+        "adaptor:app",
+        host=options.host,
+        port=options.port,
+        workers=options.workers,
+        backlog=options.backlog,
+        timeout_keep_alive=options.keepalive,
+        log_level=options.log_level,
+    )
+
 
 if __name__ == "__main__":
-    # Define port
-    port = int(os.environ.get("PORT", "8000"))
-    
-    print(f"Starting Productivity Engines Backend on port {port}...")
-    
-    # Check if port is in use and kill any process using it
-    if is_port_in_use(port):
-        print(f"Port {port} is already in use. Attempting to free it...")
-        kill_process_on_port(port)
-        
-        if is_port_in_use(port):
-            print(f"Failed to free port {port}. Please close any application using it and try again.")
-            sys.exit(1)
-    
-    print(f"Loading adaptor script from: {adaptor_script}")
-    
-    # Make the adaptor script executable
-    try:
-        os.chmod(adaptor_script, 0o755)
-    except Exception as e:
-        print(f"Warning: Could not make adaptor script executable: {e}")
-    
-    # Run the backend adaptor in a subprocess
+    options = parse_args()
+    options.workers = max(1, options.workers)
+    warn_about_process_state(options.workers)
+
+    print(f"Starting Productivity Engines Backend on port {options.port}...")
+
+    # Relative paths in the backend (cache and spill files) resolve from here
+    os.chdir(backend_path)
+
+    # Print helpful information
+    print(f"Server will be available at: http://localhost:{options.port}")
+    print(f"Health check endpoint: http://localhost:{options.port}/health")
+    print(f"Agent endpoint: http://localhost:{options.port}/run_agent")
+    print("\nPress CTRL+C to stop the server...")
+
     try:
-        # Change working directory to backend
-        os.chdir(backend_path)
-        
-        # Print helpful information
-        print(f"Server will be available at: http://localhost:{port}")
-        print(f"Health check endpoint: http://localhost:{port}/health")
-        print(f"Agent endpoint: http://localhost:{port}/run_agent")
-        print("\nPress CTRL+C to stop the server...")
-        
-        # Use sys.executable to use the same Python interpreter as this script
-        subprocess.run([sys.executable, "adaptor.py"], check=True)
+        if hasattr(os, "fork"):
+            Launcher(options).run()
+        else:
+            run_without_fork(options)
     except KeyboardInterrupt:
         print("\nShutting down server...")
-    except Exception as e:
-        print(f"Error running server: {e}")
-        sys.exit(1) 
\ No newline at end of file